@@ -33,42 +33,117 @@
 # than passing variables up and down code paths which doesn't seem any better.
 #
 # So we'll give this a try...
+#
+# Lookups happen in per-frame code so find() is just a dictionary lookup.
+# A callable registered is treated as a factory - it is called the first
+# time the key is looked up and the result is kept until the key is
+# registered again.
+#
+# Code holding on to a looked up object can subscribe() to a key to be told
+# when the registration is replaced.
+#
+# Tracing where keys are registered and looked up from is expensive and
+# off unless the environment variable PYASTROIMAGEVIEW_TRACE_APPCONTAINER
+# is set or set_trace(True) is called.
+import os
 import sys
 import logging
 import traceback
 
+TRACE_ENV_VAR = 'PYASTROIMAGEVIEW_TRACE_APPCONTAINER'
+
+
 class ApplicationContainer(object):
-    __debug = True
 
     def __init__(self):
         super().__setattr__('_values', {})
+        super().__setattr__('_resolved', {})
+        super().__setattr__('_subscribers', {})
+        super().__setattr__('_trace', bool(os.environ.get(TRACE_ENV_VAR)))
+
+    def set_trace(self, trace):
+        """Turn on/off logging of where keys are registered and looked up"""
+        super().__setattr__('_trace', trace)
 
     def register(self, key, value):
+        replaced = key in self._values
+
         self._values[key] = value
+        self._resolved.pop(key, None)
 
-        if self.__debug:
-            stack = sys._getframe(1)
-            f = traceback.extract_stack(stack)[-1]
+        if self._trace:
+            f = traceback.extract_stack(sys._getframe(1), limit=1)[-1]
             logging.info(f'AppContainer: key \'{key}\' registered to {value} from {f}')
+        else:
+            logging.debug(f'AppContainer: key \'{key}\' registered')
 
-    def find(self, key):
-        if key not in self._values:
-            raise AttributeError(f'\'{key}\' is not registered.')
+        if replaced:
+            for callback in list(self._subscribers.get(key, [])):
+                try:
+                    callback(key, self.find(key))
+                except Exception:
+                    logging.error(f'AppContainer: exception in subscriber for {key}',
+                                  exc_info=True)
 
-        attribute = self._values[key]
+    def find(self, key, expected_type=None):
+        """
+        Return object registered for key.
 
-        value = attribute(self) if callable(attribute) else attribute
+        Parameters
+        ----------
+        key : str
+            Key object was registered with.
+        expected_type : type
+            If given raise TypeError unless the object is of this type.
 
-        if self.__debug:
-            stack = sys._getframe(1)
-            f = traceback.extract_stack(stack)[-1]
+        Raises
+        ------
+        AttributeError
+            If key is not registered.
+        """
+        try:
+            value = self._resolved[key]
+        except KeyError:
+            if key not in self._values:
+                raise AttributeError(f'\'{key}\' is not registered.')
+
+            attribute = self._values[key]
+            value = attribute(self) if callable(attribute) else attribute
+            self._resolved[key] = value
+
+        if self._trace:
+            f = traceback.extract_stack(sys._getframe(1), limit=1)[-1]
             logging.info(f'AppContainer: key \'{key}\' referenced from {f} '
                          f'and has value {value}')
 
+        if expected_type is not None and not isinstance(value, expected_type):
+            raise TypeError(f'\'{key}\' is {type(value).__name__} not '
+                            f'{expected_type.__name__}')
+
         return value
 
+    def get(self, key, default=None, expected_type=None):
+        """Return object registered for key or default if not registered"""
+        if key not in self._values:
+            return default
+        return self.find(key, expected_type=expected_type)
+
+    def is_registered(self, key):
+        return key in self._values
+
+    def subscribe(self, key, callback):
+        """
+        Call callback(key, value) whenever the registration for key is
+        replaced.
+        """
+        self._subscribers.setdefault(key, []).append(callback)
+
+    def unsubscribe(self, key, callback):
+        callbacks = self._subscribers.get(key, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
     def __setattr__(self, key, value):
-        print(key, value)
         self.register(key, value)
 
 #    def __getattr__(self, key):
@@ -27,6 +27,7 @@ from pyastroimageview.uic.camera_settings_uic import Ui_camera_settings_widget
 from pyastroimageview.CameraSetROIControlUI import CameraSetROIDialog
 from pyastroimageview.ApplicationContainer import AppContainer
 from pyastroimageview.DeviceConfigurationUI import device_setup_ui
+from pyastroimageview.DeviceControlUI import PanelPollSubscription
 
 # FIXME Come up with better states for camera
 # FIXME Use enum?
@@ -37,6 +38,9 @@ EXPOSURE_STATE_CANCEL = 2
 class CameraControlUI(QtWidgets.QWidget):
     new_camera_image = QtCore.pyqtSignal(object)
 
+    # device this panel controls
+    DEVICE_NAME = 'camera'
+
     def __init__(self):
         super().__init__()
 
@@ -71,15 +75,16 @@ class CameraControlUI(QtWidgets.QWidget):
         self.current_exposure = None
 
         # under INDI it is expensive to check things like
-        # camera temperature
-        # so make it so we do it less frequently
-        self.temperature_poll_interval = 5
-        self.temperature_poll_last = None
-#        self.temperature_current_last = None
-#        self.temperature_target_last = None
+        # camera temperature so poller does it less frequently
+        self.cooler_poll = PanelPollSubscription(self, 'camera_cooler',
+                                                 self.camera_cooler_poll)
 
         self.set_widget_states()
 
+        # devices can be connected before the panel is first shown
+        if self.camera_manager.is_connected():
+            self.device_connected()
+
     def update_manager(self):
         self.camera_manager = AppContainer.find('/dev/camera')
         self.camera_manager.signals.status.connect(self.camera_status_poll)
@@ -92,7 +97,7 @@ class CameraControlUI(QtWidgets.QWidget):
                 self.ui.camera_setting_coolersetpt.setValue(int(settemp))
             else:
                 logging.warning('camera_connect: settemp is None!')
-            maxbin = self.camera_managerget_max_binning()
+            maxbin = self.camera_manager.get_max_binning()
             # FIXME need better way to handle maxbin being unavailable!
             if maxbin is None:
                 logging.debug('Forcing max bin to 4')
@@ -130,6 +135,10 @@ class CameraControlUI(QtWidgets.QWidget):
         self.ui.camera_setting_continuous.setEnabled(enable)
 
     def camera_status_poll(self, status):
+        # panel collapsed so skip updating it (and reading temperatures)
+        if not self.isVisible():
+            return
+
         status_string = ''
         if status.connected:
             status_string += 'CONNECTED'
@@ -157,23 +166,23 @@ class CameraControlUI(QtWidgets.QWidget):
 
             self.ui.camera_setting_progress.setText(perc_string)
 
-            if (self.temperature_poll_last is None
-                or (time.time() - self.temperature_poll_last) > self.temperature_poll_interval):
-                curtemp = self.camera_manager.get_current_temperature()
-                curpower = self.camera_manager.get_cooler_power()
-                if curpower is None:
-                    #logging.warning('camera_status_poll: curpower is None!')
-                    curpower = 0
-                self.ui.camera_setting_coolercur.setText(f'{curtemp:5.1f}C '
-                                                         f'@ {curpower:.0f}%')
+        self.ui.camera_setting_status.setText(status_string)
+#        logging.debug('camera poll end')
 
-                cooler_state = self.camera_manager.get_cooler_state()
-                self.ui.camera_setting_cooleronoff.setChecked(cooler_state)
+    def camera_cooler_poll(self, cooler):
+        if cooler is None:
+            return
 
-                self.temperature_poll_last = time.time()
+        curtemp = cooler['temperature']
+        curpower = cooler['power']
+        if curpower is None:
+            #logging.warning('camera_cooler_poll: curpower is None!')
+            curpower = 0
+        if curtemp is not None:
+            self.ui.camera_setting_coolercur.setText(f'{curtemp:5.1f}C '
+                                                     f'@ {curpower:.0f}%')
 
-        self.ui.camera_setting_status.setText(status_string)
-#        logging.debug('camera poll end')
+        self.ui.camera_setting_cooleronoff.setChecked(cooler['state'])
 
     def camera_exposure_complete(self, result):
         logging.debug(f'CameraControlUI:cam_exp_comp: result={result} '
@@ -194,7 +203,7 @@ class CameraControlUI(QtWidgets.QWidget):
             # all done
             self.state = EXPOSURE_STATE_IDLE
             self.set_widget_states()
-            self.camera_manager.release_lock()
+            self.camera_manager.release_lock('camera_control')
 
             # set button back to 'expose'
             self.set_exposestop_state(False)
@@ -283,71 +292,80 @@ class CameraControlUI(QtWidgets.QWidget):
     def camera_connect(self):
         logging.debug(f'camera_connect: camera_driver = {self.settings.camera_driver}')
         if self.settings.camera_driver:
-            if not self.camera_manager.get_lock():
+            if not self.camera_manager.get_lock('camera_control'):
                 logging.warning('CCUI: camera_connect: could not get lock!')
                 return
 
-            maxbin = self.camera_manager.get_max_binning()
-
-            # FIXME need better way to handle maxbin being unavailable!
-            if maxbin is None:
-                logging.debug('Forcing max bin to 4')
-                maxbin = 4
-            self.ui.camera_setting_binning_spinbox.setMaximum(maxbin)
-            self.ui.camera_setting_binning_spinbox.setMinimum(1)
-
-            result = self.camera_manager.connect(self.settings.camera_driver)
-            if not result:
-                QtWidgets.QMessageBox.critical(None, 'Error',
-                                               'Unable to connect to camera!',
-                                               QtWidgets.QMessageBox.Ok)
-                self.camera_manager.release_lock()
-                return
+            # panel is set up in camera_connected() once the driver is done
+            self.ui.camera_setting_connect.setEnabled(False)
+            AppContainer.find('/dev').connect_device('camera', self.camera_connected)
 
+    def camera_connected(self, result):
+        if not result:
             self.set_widget_states()
+            QtWidgets.QMessageBox.critical(None, 'Error',
+                                           'Unable to connect to camera!',
+                                           QtWidgets.QMessageBox.Ok)
+            self.camera_manager.release_lock('camera_control')
+            return
 
-            # setup UI based on camera settings
-            settings = self.camera_manager.get_camera_settings()
+        self.device_connected()
 
-            logging.debug(f'settings={settings}')
+        self.camera_manager.release_lock('camera_control')
 
-            logging.debug(f'settings.binning={settings.binning}')
+    def device_connected(self):
+        """Set up panel from the camera once it is connected"""
+        self.set_widget_states()
 
-            self.ui.camera_setting_binning_spinbox.setValue(settings.binning)
-            self.reset_roi()
+        maxbin = self.camera_manager.get_max_binning()
 
-            if settings.camera_gain is not None:
-                self.ui.camera_setting_gain_spinbox.setValue(settings.camera_gain)
-                self.ui.camera_setting_gain_spinbox.setEnabled(True)
-            else:
-                self.ui.camera_setting_gain_spinbox.setEnabled(False)
+        # FIXME need better way to handle maxbin being unavailable!
+        if maxbin is None:
+            logging.debug('Forcing max bin to 4')
+            maxbin = 4
+        self.ui.camera_setting_binning_spinbox.setMaximum(maxbin)
+        self.ui.camera_setting_binning_spinbox.setMinimum(1)
 
-            exp_range = self.camera_manager.get_min_max_exposure()
-            if exp_range is not None:
-                exp_min, exp_max = exp_range
-                logging.debug(f'exposure min/max = {exp_min} {exp_max}')
+        # setup UI based on camera settings
+        settings = self.camera_manager.get_camera_settings()
 
-                # if exp_min isnt 0 but less than 0.001s just set to 0.001s
-                if exp_min > 0 and exp_min < 0.001:
-                    exp_min = 0.001
-                    logging.debug(f'Bumping exp_min to {exp_min}')
-                self.ui.camera_setting_exposure_spinbox.setMinimum(exp_min)
-                self.ui.camera_setting_exposure_spinbox.setMaximum(exp_max)
+        logging.debug(f'settings={settings}')
 
-            cooler_state = self.camera_manager.get_cooler_state()
-            self.ui.camera_setting_cooleronoff.setChecked(cooler_state)
-            self.camera_manager.get_current_temperature()  # TEMP!!
-            settemp = self.camera_manager.get_target_temperature()
-            if settemp is not None:
-                self.ui.camera_setting_coolersetpt.setValue(int(settemp))
-            else:
-                logging.warning('camera_connect: settemp is None!')
+        logging.debug(f'settings.binning={settings.binning}')
 
-            self.camera_manager.release_lock()
+        self.ui.camera_setting_binning_spinbox.setValue(settings.binning)
+        self.reset_roi()
+
+        if settings.camera_gain is not None:
+            self.ui.camera_setting_gain_spinbox.setValue(settings.camera_gain)
+            self.ui.camera_setting_gain_spinbox.setEnabled(True)
+        else:
+            self.ui.camera_setting_gain_spinbox.setEnabled(False)
+
+        exp_range = self.camera_manager.get_min_max_exposure()
+        if exp_range is not None:
+            exp_min, exp_max = exp_range
+            logging.debug(f'exposure min/max = {exp_min} {exp_max}')
+
+            # if exp_min isnt 0 but less than 0.001s just set to 0.001s
+            if exp_min > 0 and exp_min < 0.001:
+                exp_min = 0.001
+                logging.debug(f'Bumping exp_min to {exp_min}')
+            self.ui.camera_setting_exposure_spinbox.setMinimum(exp_min)
+            self.ui.camera_setting_exposure_spinbox.setMaximum(exp_max)
+
+        cooler_state = self.camera_manager.get_cooler_state()
+        self.ui.camera_setting_cooleronoff.setChecked(cooler_state)
+        self.camera_manager.get_current_temperature()  # TEMP!!
+        settemp = self.camera_manager.get_target_temperature()
+        if settemp is not None:
+            self.ui.camera_setting_coolersetpt.setValue(int(settemp))
+        else:
+            logging.warning('camera_connect: settemp is None!')
 
     def camera_disconnect(self):
         # get lock
-        if not self.camera_manager.get_lock():
+        if not self.camera_manager.get_lock('camera_control'):
             logging.error('CameraControlUI: camera_disconnect : could not get lock!')
             QtWidgets.QMessageBox.critical(None, 'Error', 'Camera is busy',
                                            QtWidgets.QMessageBox.Ok)
@@ -365,7 +383,7 @@ class CameraControlUI(QtWidgets.QWidget):
         self.xsize = None
         self.ysize = None
 
-        self.camera_manager.release_lock()
+        self.camera_manager.release_lock('camera_control')
 
     def camera_expose(self):
 
@@ -378,7 +396,7 @@ class CameraControlUI(QtWidgets.QWidget):
             return
 
         # try to lock camera
-        if not self.camera_manager.get_lock():
+        if not self.camera_manager.get_lock('camera_control'):
             logging.error('CameraControlUI: camera_expose : could not get lock!')
             QtWidgets.QMessageBox.critical(None, 'Error', 'Camera is busy',
                                            QtWidgets.QMessageBox.Ok)
@@ -388,7 +406,7 @@ class CameraControlUI(QtWidgets.QWidget):
         if CameraState(status.state) != CameraState.IDLE:
             logging.error('CameraControlUI: camera_expose : '
                           f'camera not IDLE state = {status.state}')
-            self.camera_manager.release_lock()
+            self.camera_manager.release_lock('camera_control')
             return
 
         settings = CameraSettings()
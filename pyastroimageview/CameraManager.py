@@ -17,16 +17,16 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
-import sys
-import traceback
 import time
 import logging
-from functools import wraps
 from enum import Enum, unique
 
 from PyQt5 import QtCore
 
 from pyastroimageview.FITSImage import FITSImage
+from pyastroimageview.ImageConversion import convert_image_data, bit_depth_from_max_adu
+from pyastroimageview.DeviceLock import DeviceLock, DeviceLockMixin, checklock
+from pyastroimageview.DeviceExecutor import submit_device_call, LONG_CALL_TIMEOUTS
 
 @unique
 class CameraState(Enum):
@@ -93,7 +93,7 @@ class CameraManagerSignals(QtCore.QObject):
     status = QtCore.pyqtSignal(CameraStatus)
 
 
-class CameraManager:
+class CameraManager(DeviceLockMixin):
 
     """The CameraManager class acts as an arbiter of requests to the camera device.
 
@@ -107,34 +107,37 @@ class CameraManager:
         Given periodically returning status of camera
     """
 
-    def checklock(method):
-        @wraps(method)
-        def wrapped(self, *args, **kwargs):
-            if self.lock.available() != 0:
-                logging.warning(f'CameraManager: {method.__name__} called without a lock!')
-            return method(self, *args, **kwargs)
-        return wrapped
-
     def __init__(self, backend):
         super().__init__(backend)
 
-        self.lock = QtCore.QSemaphore(1)
+        self.lock = DeviceLock('camera')
         self.signals = CameraManagerSignals()
 
         self.watch_for_exposure_end = False
+        # driver calls to start an exposure and read its image which are
+        # still running on the executor thread
+        self.start_future = None
+        self.read_future = None
         self.exposure_start_time = None
         self.current_exposure_length = None
         self.exposure_camera_settings = None
 
+        # read from driver on first image
+        self.sensor_bit_depth = None
+
         # timer if we have to maintain progress
         self.exposure_timer = None
 
-        # polling camera status
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.camera_status_poll)
-        self.timer.start(1000)
-
     def camera_status_poll(self):
+        """
+        Get camera status and handle end of exposure.
+
+        Called periodically by the DevicePoller.
+
+        Returns
+        -------
+        status : CameraStatus
+        """
         # logging.debug('camera_manager:camera_status_poll()')
         status = self.get_status()
         self.signals.status.emit(status)
@@ -154,119 +157,162 @@ class CameraManager:
                 progress = self.get_exposure_progress()
                 remaining = (self.current_exposure_length * progress) / 100.0
                 complete = progress >= 98 or remaining < 1
-                logging.debug(f'{self.get_exposure_progress()} {progress} '
-                              f'{self.current_exposure_length} { remaining} {complete}')
-
-                # FIXME Assumes exposure length was equal to requested - should
-                # check backend to see if actual exposure length is available
-                # FIXME Need to check status var 'complete' and set image data
-                # to None if image failed!
-
-                # put together a FITS document with image data
-                logging.debug('get_image_data')
-                image_data = super().get_image_data()
-
-                #
-                # FIXME INDIBackend returns a FITS image
-                #       ASCOMBackend returns a numpy array
-                #       This is a temporary HACK to address this
-                #       but needs to be better handled!
-                #
-                try:
-                    pri_header = image_data[0].header
-                    fits_image = FITSImage(image_data[0].data)
-
-                    # must be FITS so munge into a FITSImage() object
-                    logging.debug('get_image_data() returned a FITS object')
-                    for key, val in pri_header.items():
-                        fits_image.set_header_keyvalue(key, val)
-
-                except:
-                    # FIXME need better way to determine the return image type
-                    # must be numpy array
-                    logging.debug('get_image_data() returned numpy array')
-                    logging.debug('FITSImage()')
-                    fits_image = FITSImage(image_data)
-                    logging.debug('FITSimage data xfer done')
-
-                fits_image.set_exposure(self.current_exposure_length)
-                fits_image.set_dateobs(self.exposure_start_time)
-                xsize, ysize = super().get_pixelsize()
-                fits_image.set_camera_pixelsize(xsize, ysize)
-                camera_binning = self.exposure_camera_settings.binning
-                fits_image.set_camera_binning(camera_binning, camera_binning)
-                camera_tempnow = super().get_current_temperature()
-                camera_tempset = super().get_target_temperature()
-                if camera_tempnow is not None:
-                    fits_image.set_temperature_current(camera_tempnow)
-                if camera_tempset is not None:
-                    fits_image.set_temperature_target(camera_tempset)
-
-                # FIXME not sure all backends will have this
-                egain = super().get_egain()
-                if egain is not None:
-                    fits_image.set_electronic_gain(egain)
-
-                # FIXME not all backends handle this - seems to be ASI specific??
-                ccd_gain = super().get_camera_gain()
-                if ccd_gain is not None:
-                    fits_image.set_header_keyvalue('CCD_GAIN', ccd_gain)
-                ccd_offset = super().get_camera_offset()
-                if ccd_offset is not None:
-                    fits_image.set_header_keyvalue('CCD_OFFSET', ccd_offset)
-                ccd_usb = super().get_camera_usbbandwidth()
-                if ccd_usb is not None:
-                    fits_image.set_header_keyvalue('CCD_USBBANDWIDTH', ccd_usb)
-
-                logging.debug('cameramanager: image ready about to clean state vars')
-                self.exposure_start_time = None
-                self.current_exposure_length = None
-                self.exposure_camera_settings = None
-                self.exposure_timer = None
-
-                # HAVE to do this last - if signal handler is something like the
-                # sequence controller it might start up a new exposure as
-                # soon as it gets this signal so we have to be done handling
-                # the new image on this side first.
-
-                logging.warning('sequence image complete forcing complete to TRUE!!!')
-                complete = True
-
-                self.signals.exposure_complete.emit((complete, fits_image))
-
-                logging.debug('poll image handling complete')
-
-    def get_lock(self):
-        logging.debug(f'camera get_lock before: {self.lock.available()}')
-
-        stack = sys._getframe(1)
-        f = traceback.extract_stack(stack)[-1]
-        logging.debug(f'get_lock: called from {f}')
-
-        rc = self.lock.tryAcquire(1)
-        logging.debug(f'camera get_lock after: {rc} {self.lock.available()}')
-        if rc:
-            self.signals.lock.emit(True)
-        return rc
-
-    def release_lock(self):
-        logging.debug(f'camera release lock before: {self.lock.available()}')
-
-        stack = sys._getframe(1)
-        f = traceback.extract_stack(stack)  # [-1]
-        logging.debug(f'release_lock: called from {f}')
-
-        # if we release when resources are available it ADDS more resources
-        if self.lock.available() == 0:
-            self.lock.release(1)
+                logging.debug(f'{progress} {self.current_exposure_length} '
+                              f'{remaining} {complete}')
+
+                # download on the executor thread - exposure_complete is
+                # emitted from image_read() once it is done
+                self.read_future = submit_device_call(self, self.read_image,
+                                                      callback=self.image_read,
+                                                      timeout=LONG_CALL_TIMEOUTS['get_image_data'])
+
+        return status
+
+    def read_image(self):
+        """
+        Download image of finished exposure and make a FITSImage of it.
+
+        Runs on the executor thread of the camera.
+
+        Returns
+        -------
+        fits_image : FITSImage
+            None if the image could not be read.
+        """
+        try:
+            # FIXME Assumes exposure length was equal to requested - should
+            # check backend to see if actual exposure length is available
+            # FIXME Need to check status var 'complete' and set image data
+            # to None if image failed!
+
+            # put together a FITS document with image data
+            logging.debug('get_image_data')
+            image_data = super().get_image_data()
+            if image_data is None:
+                logging.error('cameramanager: unable to read image data!')
+                return None
+
+            #
+            # FIXME INDIBackend returns a FITS image
+            #       ASCOMBackend returns a numpy array
+            #       This is a temporary HACK to address this
+            #       but needs to be better handled!
+            #
+            bit_depth = self.get_sensor_bit_depth()
+            try:
+                pri_header = image_data[0].header
+                fits_image = FITSImage(convert_image_data(image_data[0].data,
+                                                          bit_depth=bit_depth))
+
+                # must be FITS so munge into a FITSImage() object
+                logging.debug('get_image_data() returned a FITS object')
+                for key, val in pri_header.items():
+                    # data may have been narrowed so let astropy set these
+                    if key in ['BITPIX', 'BZERO', 'BSCALE']:
+                        continue
+                    fits_image.set_header_keyvalue(key, val)
+
+            except:
+                # FIXME need better way to determine the return image type
+                # must be numpy array
+                logging.debug('get_image_data() returned numpy array')
+                # ASCOM and Alpaca ImageArray is indexed [x][y]
+                image_data = convert_image_data(image_data, column_major=True,
+                                                bit_depth=bit_depth)
+                logging.debug('FITSImage()')
+                fits_image = FITSImage(image_data)
+                logging.debug('FITSimage data xfer done')
+
+            fits_image.set_exposure(self.current_exposure_length)
+            fits_image.set_dateobs(self.exposure_start_time)
+
+            # short exposures can finish before the poll sees EXPOSING
+            start_time = self.exposure_start_time
+            if start_time is None:
+                start_time = time.time() - self.current_exposure_length
+            fits_image.exposure_window = (start_time,
+                                          start_time + self.current_exposure_length)
+            xsize, ysize = super().get_pixelsize()
+            fits_image.set_camera_pixelsize(xsize, ysize)
+            camera_binning = self.exposure_camera_settings.binning
+            fits_image.set_camera_binning(camera_binning, camera_binning)
+            camera_tempnow = super().get_current_temperature()
+            camera_tempset = super().get_target_temperature()
+            if camera_tempnow is not None:
+                fits_image.set_temperature_current(camera_tempnow)
+            if camera_tempset is not None:
+                fits_image.set_temperature_target(camera_tempset)
+
+            # FIXME not sure all backends will have this
+            egain = super().get_egain()
+            if egain is not None:
+                fits_image.set_electronic_gain(egain)
+
+            # FIXME not all backends handle this - seems to be ASI specific??
+            ccd_gain = super().get_camera_gain()
+            if ccd_gain is not None:
+                fits_image.set_header_keyvalue('CCD_GAIN', ccd_gain)
+            ccd_offset = super().get_camera_offset()
+            if ccd_offset is not None:
+                fits_image.set_header_keyvalue('CCD_OFFSET', ccd_offset)
+            ccd_usb = super().get_camera_usbbandwidth()
+            if ccd_usb is not None:
+                fits_image.set_header_keyvalue('CCD_USBBANDWIDTH', ccd_usb)
+
+            return fits_image
+        except Exception:
+            # FIXME need more specific exception
+            logging.error('cameramanager: unable to read image!', exc_info=True)
+            return None
+
+    def image_read(self, future):
+        """Emit exposure_complete once read_image() is done"""
+        if future is not self.read_future:
+            # exposure was stopped while downloading
+            return
+        self.read_future = None
+
+        if future.exception() is not None:
+            logging.error(f'cameramanager: unable to read image - {future.exception()}')
+            fits_image = None
         else:
-            # FIXME Shouldnt import here but its mostly for debugging...
-            logging.error('lock was already released!')
-            raise Exception
+            fits_image = future.result()
 
-        logging.debug(f'camera release lock after: {self.lock.available()}')
-        self.signals.lock.emit(False)
-        return True
+        logging.debug('cameramanager: image ready about to clean state vars')
+        self.exposure_start_time = None
+        self.current_exposure_length = None
+        self.exposure_camera_settings = None
+        self.exposure_timer = None
+
+        # HAVE to do this last - if signal handler is something like the
+        # sequence controller it might start up a new exposure as
+        # soon as it gets this signal so we have to be done handling
+        # the new image on this side first.
+        self.signals.exposure_complete.emit((fits_image is not None, fits_image))
+
+        logging.debug('poll image handling complete')
+
+    def get_sensor_bit_depth(self):
+        """
+        Return bit depth of the camera sensor or None if unknown.
+
+        Read from the driver once per connection.
+        """
+        if self.sensor_bit_depth is None:
+            # FIXME not all backends have this
+            get_max_adu = getattr(super(), 'get_max_adu', None)
+            if get_max_adu is not None:
+                try:
+                    self.sensor_bit_depth = bit_depth_from_max_adu(get_max_adu())
+                except Exception:
+                    logging.debug('get_sensor_bit_depth: unable to read max ADU',
+                                  exc_info=True)
+        return self.sensor_bit_depth
+
+    def is_busy(self):
+        """Return True if an exposure is being started, watched for or read"""
+        return (self.watch_for_exposure_end or self.start_future is not None
+                or self.read_future is not None)
 
     @checklock
     def disconnect(self):
@@ -289,6 +335,7 @@ class CameraManager:
                 logging.error('CameraManager:connect() Exception ->', exc_info=True)
                 return False
 
+            self.sensor_bit_depth = None
             self.signals.connect.emit(True)
 
         return True
@@ -340,25 +387,51 @@ class CameraManager:
 
     @checklock
     def start_exposure(self, expose):
+        """
+        Start an exposure without waiting on the driver.
+
+        exposure_start is emitted once the driver has started the exposure
+        and exposure_complete with (False, None) if it could not.
+        """
         if super().is_connected():
             logging.info('cameramanager: starting exposure')
-            super().start_exposure(expose)
-
-            if not super().supports_progress():
-                logging.debug('camera_manager:start_exposure() started timer')
-                self.exposure_timer = QtCore.QTimer()
-                self.exposure_timer.start(expose * 1000)
 
-            self.watch_for_exposure_end = True
             self.exposure_start_time = None
             self.current_exposure_length = expose
             self.exposure_camera_settings = self.get_camera_settings()
             logging.debug(f'exposure_camera_settings = {self.exposure_camera_settings}')
-            self.signals.exposure_start.emit(False)
+
+            self.start_future = submit_device_call(self, super().start_exposure, expose,
+                                                   callback=self.exposure_started)
+
+    def exposure_started(self, future):
+        """Start watching for the end of the exposure once the driver started it"""
+        if future is not self.start_future:
+            # exposure was stopped before the driver started it
+            return
+        self.start_future = None
+
+        if future.exception() is not None:
+            logging.error(f'cameramanager: unable to start exposure - {future.exception()}')
+            self.current_exposure_length = None
+            self.exposure_camera_settings = None
+            self.signals.exposure_complete.emit((False, None))
+            return
+
+        if not super().supports_progress():
+            logging.debug('camera_manager:start_exposure() started timer')
+            self.exposure_timer = QtCore.QTimer()
+            self.exposure_timer.start(int(self.current_exposure_length * 1000))
+
+        self.watch_for_exposure_end = True
+        self.signals.exposure_start.emit(False)
 
     @checklock
     def stop_exposure(self):
         if super().is_connected():
+            # forget a start or download still running on the driver
+            self.start_future = None
+            self.read_future = None
             super().stop_exposure()
             self.signals.exposure_complete.emit((False, None))
             self.watch_for_exposure_end = False
@@ -19,23 +19,189 @@
 #
 import logging
 
-from PyQt5 import QtWidgets
+from PyQt5 import QtCore, QtWidgets
+
+from pyastroimageview.ApplicationContainer import AppContainer
+
+
+class PanelPollSubscription(QtCore.QObject):
+    """
+    Connects a device control panel to an entry of the DevicePoller.
+
+    The panel is subscribed to the entry only while it is visible so
+    nothing is polled for a collapsed panel.  The poller only queries a
+    device while it is connected.
+
+    Parameters
+    ----------
+    panel : QWidget
+        Panel the subscription belongs to.
+    name : str
+        Name of poll entry.
+    callback : callable
+        Called with the latest result of the entry whenever it is polled.
+        The result is None if the device is not connected.
+    """
+
+    def __init__(self, panel, name, callback):
+        super().__init__(panel)
+
+        self.panel = panel
+        self.name = name
+        self.callback = callback
+        self.subscribed = False
+
+        self.poller = AppContainer.find('/dev/poller')
+        self.poller.snapshot.connect(self.snapshot)
+
+        panel.installEventFilter(self)
+
+        if panel.isVisible():
+            self.subscribe()
+
+    def eventFilter(self, obj, event):
+        if event.type() == QtCore.QEvent.Show:
+            self.subscribe()
+        elif event.type() == QtCore.QEvent.Hide:
+            self.unsubscribe()
+        return False
+
+    def subscribe(self):
+        if not self.subscribed:
+            self.subscribed = self.poller.subscribe(self.name, self)
+
+    def unsubscribe(self):
+        if self.subscribed:
+            self.poller.unsubscribe(self.name, self)
+            self.subscribed = False
+
+    def refresh(self):
+        """Ask for a new result right away - call after connect/disconnect"""
+        self.poller.request(self.name)
+
+    def snapshot(self, snapshot):
+        if self.subscribed and self.name in snapshot.updated:
+            self.callback(snapshot.get(self.name))
+
+
+class LazyPanel(QtWidgets.QWidget):
+    """
+    Placeholder which creates the real panel the first time it is shown.
+
+    Creating the panel is deferred to the event loop so the windows appear
+    before any panel is built.
+
+    Signals
+    -------
+    built : QWidget
+        Emitted with the panel once it has been created.
+    """
+    built = QtCore.pyqtSignal(object)
+
+    def __init__(self, factory):
+        super().__init__()
+
+        self.factory = factory
+        self.panel = None
+        self.build_pending = False
+
+        self.vbox = QtWidgets.QVBoxLayout()
+        self.vbox.setContentsMargins(0, 0, 0, 0)
+        self.vbox.setSpacing(0)
+        self.setLayout(self.vbox)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+
+        if self.panel is None and not self.build_pending:
+            self.build_pending = True
+            QtCore.QTimer.singleShot(0, self.build)
+
+    def build(self):
+        """Create panel now if it hasn't been already and return it"""
+        if self.panel is None:
+            logging.debug(f'LazyPanel: building {self.factory}')
+            self.panel = self.factory()
+            self.vbox.addWidget(self.panel)
+            self.built.emit(self.panel)
+
+        return self.panel
+
 
 class DeviceControlUI(QtWidgets.QMainWindow):
 
     def add_ui_element(self, ui, name):
+        """
+        Add a device control panel.
+
+        Parameters
+        ----------
+        ui : QWidget or callable
+            Panel or function which creates the panel.  A function is only
+            called the first time the panel is shown.
+        name : str
+            Title for the group box.
+
+        Returns
+        -------
+        LazyPanel
+            Container for the panel.
+        """
+        if isinstance(ui, QtWidgets.QWidget):
+            panel = LazyPanel(lambda: ui)
+        else:
+            panel = LazyPanel(ui)
+
         vbox = QtWidgets.QVBoxLayout()
-        vbox.addWidget(ui)
+        vbox.addWidget(panel)
         vbox.setSpacing(0)
         gbox = QtWidgets.QGroupBox(name)
         gbox.setLayout(vbox)
         gbox.setCheckable(True)
+
+        # collapsed panels stay collapsed between runs and aren't built
+        # until they are opened
+        if name in self.settings.device_control_collapsed:
+            gbox.setChecked(False)
+            panel.setVisible(False)
+
         gbox.clicked.connect(self.handle_groupbox_show_hide)
         self.form.addWidget(gbox)
 
+        self.panels[name] = panel
+
+        return panel
+
+    def connect_devices(self, callback):
+        """
+        Connect all devices which have a driver configured at the same time.
+
+        Panels which are already built are set up for the devices which
+        connected - the others do it themselves when first shown.
+
+        Parameters
+        ----------
+        callback : callable
+            Called with success keyed by device name once all devices
+            are done.
+        """
+        def connected(results):
+            for lazy_panel in self.panels.values():
+                panel = lazy_panel.panel
+                if panel is not None and results.get(getattr(panel, 'DEVICE_NAME', None)):
+                    panel.device_connected()
+
+            callback(results)
+
+        AppContainer.find('/dev').connect_devices(callback=connected)
+
     def __init__(self):
         super().__init__()
 
+        self.settings = AppContainer.find('/program_settings')
+
+        # LazyPanel for each ui element by name
+        self.panels = {}
         self.form = QtWidgets.QFormLayout()
         self.form.setHorizontalSpacing(0)
         self.form.setVerticalSpacing(4)
@@ -64,6 +230,13 @@ class DeviceControlUI(QtWidgets.QMainWindow):
         # FIXME Consider using QSignalMapper or individual handlers
         self.sender().children()[1].setVisible(checked)
 
+        name = self.sender().title()
+        collapsed = [n for n in self.settings.device_control_collapsed if n != name]
+        if not checked:
+            collapsed.append(name)
+        self.settings.device_control_collapsed = collapsed
+        self.settings.write()
+
         # FIXME This seems to be needed so some callbacks occur to render/hide
         # widgets and so then adjustSize() reduces/increases size appropriately
         # Otherwise there is 'ghost' space left when you hide a control
@@ -0,0 +1,392 @@
+#
+# Per-device command executor
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Each device gets a DeviceExecutor with its own worker thread and command
+# queue and every call into the backend driver runs on that thread.  A slow
+# driver call then only holds up other calls to the same device.
+#
+# The device managers are unchanged - make_executor_class() creates a
+# subclass of the backend device class where each public method hands the
+# call to the executor and waits for the result.  That is fine for the
+# quick calls which read or set a property.  Nothing on the GUI thread
+# waits on a slow call (connect, starting an exposure, downloading an
+# image, moving the filter wheel) - these are started with submit() and
+# the caller carries on in a callback run on the GUI thread when the call
+# is done.  No local event loop is run while waiting so a slot is never
+# entered again before it has returned.
+#
+# A driver call which times out returns a failure value (False for
+# connect/is_*/check_*/supports_* and None for everything else) like the
+# drivers do when they fail instead of raising into a Qt slot.  The
+# callback of a submitted call which times out gets a future failed with
+# DeviceTimeoutError and the call is left to finish on the worker thread.
+#
+import time
+import queue
+import inspect
+import logging
+import threading
+from functools import wraps
+from concurrent import futures
+
+from PyQt5 import QtCore
+
+# ASCOM drivers are COM objects so each worker needs COM initialized
+try:
+    import pythoncom
+except ImportError:
+    pythoncom = None
+
+# default seconds to wait for a driver call
+DEFAULT_TIMEOUT = 30
+
+# calls which are expected to take a long time
+LONG_CALL_TIMEOUTS = {'connect': 120,
+                      'get_image_data': 300}
+
+# methods which must stay on the calling thread (they may show dialogs)
+CALLER_THREAD_METHODS = ['has_chooser', 'show_chooser']
+
+# driver methods which return False instead of None when they fail
+FALSE_ON_FAILURE_PREFIXES = ('connect', 'is_', 'check_', 'supports_')
+
+
+class DeviceTimeoutError(Exception):
+    """Raised when a device call doesn't finish within its timeout"""
+
+
+class DeviceExecutorSignals(QtCore.QObject):
+    """
+    Signals for completed calls.
+
+    done - Emitted with (PendingCallback, future) when a submitted call
+           with a callback finishes.  Delivered on the GUI thread.
+    """
+    done = QtCore.pyqtSignal(object)
+
+
+class PendingCallback:
+    """
+    Callback for a submitted call which is called once on the GUI thread.
+
+    It is called with the future of the call when the call is done or with
+    a future failed with DeviceTimeoutError if that takes longer than
+    timeout seconds.  Must be created on the GUI thread.
+    """
+
+    def __init__(self, executor, fn, callback, timeout=None):
+        self.executor = executor
+        self.fname = getattr(fn, '__name__', str(fn))
+        self.callback = callback
+
+        self.timer = None
+        if timeout is not None:
+            self.timer = QtCore.QTimer()
+            self.timer.setSingleShot(True)
+            self.timer.timeout.connect(self.timed_out)
+            self.timer.start(int(timeout * 1000))
+
+    def finish(self, future):
+        if self.callback is None:
+            # already timed out
+            return
+
+        callback = self.callback
+        self.callback = None
+        if self.timer is not None:
+            self.timer.stop()
+
+        try:
+            callback(future)
+        except Exception:
+            logging.error(f'DeviceExecutor {self.executor.name}: exception in '
+                          f'callback for {self.fname}', exc_info=True)
+
+    def timed_out(self):
+        if self.callback is None:
+            return
+
+        self.executor.count_timeout(self.fname, self.timer.interval() / 1000)
+        future = futures.Future()
+        future.set_exception(DeviceTimeoutError(f'{self.executor.name} '
+                                                f'{self.fname} timed out'))
+        self.finish(future)
+
+
+class DeviceExecutor:
+    """
+    Runs calls for one device on a dedicated worker thread.
+
+    Parameters
+    ----------
+    name : str
+        Name of device - used for thread name and logging.
+    timeout : float
+        Default seconds to wait for a call.
+    """
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+
+        self.queue = queue.Queue()
+
+        # True while worker is running a call
+        self.running = False
+
+        self.signals = DeviceExecutorSignals()
+        self.signals.done.connect(self.call_done_callback)
+
+        # statistics - protected by stats_lock
+        self.stats_lock = threading.Lock()
+        self.num_calls = 0
+        self.num_errors = 0
+        self.num_timeouts = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0
+        self.max_wait = 0
+        self.total_run = 0
+        self.max_run = 0
+        self.slowest_call = None
+
+        self.thread = threading.Thread(target=self.run,
+                                       name=f'DeviceExecutor-{name}',
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self):
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            future, fn, args, kwargs, submit_time = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            start_time = time.perf_counter()
+            self.running = True
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                error = True
+            else:
+                future.set_result(result)
+                error = False
+            finally:
+                self.running = False
+
+            end_time = time.perf_counter()
+            wait = start_time - submit_time
+            run = end_time - start_time
+
+            with self.stats_lock:
+                self.num_calls += 1
+                if error:
+                    self.num_errors += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.total_run += run
+                if run > self.max_run:
+                    self.max_run = run
+                    self.slowest_call = getattr(fn, '__name__', str(fn))
+
+        if pythoncom is not None:
+            pythoncom.CoUninitialize()
+
+    def stop(self):
+        """Stop worker thread once queued calls are done"""
+        self.queue.put(None)
+
+    def on_worker_thread(self):
+        return threading.current_thread() is self.thread
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def busy(self):
+        """Return True if a call is running or waiting to run"""
+        return self.running or not self.queue.empty()
+
+    def submit(self, fn, *args, callback=None, timeout=None, **kwargs):
+        """
+        Queue a call to run on the worker thread.
+
+        Parameters
+        ----------
+        fn : callable
+            Function to call.
+        callback : callable
+            If given called on the GUI thread with the future once the call
+            is done.  Must then be called from the GUI thread.
+        timeout : float
+            Seconds after which callback is called with a future failed
+            with DeviceTimeoutError if the call isn't done.
+
+        Returns
+        -------
+        concurrent.futures.Future
+        """
+        future = futures.Future()
+
+        if callback is not None:
+            pending = PendingCallback(self, fn, callback, timeout)
+            future.add_done_callback(lambda f: self.signals.done.emit((pending, f)))
+
+        self.queue.put((future, fn, args, kwargs, time.perf_counter()))
+
+        depth = self.queue.qsize()
+        with self.stats_lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+        return future
+
+    def call_done_callback(self, item):
+        pending, future = item
+        pending.finish(future)
+
+    def count_timeout(self, fname, timeout):
+        with self.stats_lock:
+            self.num_timeouts += 1
+        logging.error(f'DeviceExecutor {self.name}: {fname} timed out '
+                      f'after {timeout} s queue depth = {self.queue_depth()}')
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        """
+        Run a call on the worker thread and return its result.
+
+        The caller is blocked until the call is done so this is only for
+        quick calls.  Calls made from the worker thread itself run
+        directly.
+
+        Parameters
+        ----------
+        fn : callable
+            Function to call.
+        timeout : float
+            Seconds to wait - defaults to executor timeout.
+
+        Raises
+        ------
+        DeviceTimeoutError
+            If the call doesn't finish in time.  The call is still queued or
+            running on the worker thread.
+        """
+        if self.on_worker_thread():
+            return fn(*args, **kwargs)
+
+        if timeout is None:
+            timeout = self.timeout
+
+        future = self.submit(fn, *args, **kwargs)
+
+        try:
+            return future.result(timeout=timeout)
+        except futures.TimeoutError:
+            future.cancel()
+            fname = getattr(fn, '__name__', str(fn))
+            self.count_timeout(fname, timeout)
+            raise DeviceTimeoutError(f'{self.name} {fname} timed out')
+
+    def get_stats(self):
+        """Return dictionary of call statistics"""
+        with self.stats_lock:
+            ncalls = max(self.num_calls, 1)
+            return {'calls': self.num_calls,
+                    'errors': self.num_errors,
+                    'timeouts': self.num_timeouts,
+                    'queue_depth': self.queue_depth(),
+                    'max_queue_depth': self.max_queue_depth,
+                    'mean_wait_ms': self.total_wait / ncalls * 1000,
+                    'max_wait_ms': self.max_wait * 1000,
+                    'mean_run_ms': self.total_run / ncalls * 1000,
+                    'max_run_ms': self.max_run * 1000,
+                    'slowest_call': self.slowest_call}
+
+
+def submit_device_call(dev, fn, *args, callback=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Run fn(*args) on the executor of device manager dev without waiting.
+
+    See DeviceExecutor.submit().  Without an executor fn is called right
+    away and then callback.
+
+    Returns
+    -------
+    concurrent.futures.Future
+    """
+    executor = getattr(dev, 'device_executor', None)
+    if executor is not None:
+        return executor.submit(fn, *args, callback=callback, timeout=timeout)
+
+    future = futures.Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    if callback is not None:
+        callback(future)
+    return future
+
+
+def _executor_method(name, method):
+    if name in LONG_CALL_TIMEOUTS:
+        timeout = LONG_CALL_TIMEOUTS[name]
+    else:
+        timeout = None
+
+    failure = False if name.startswith(FALSE_ON_FAILURE_PREFIXES) else None
+
+    @wraps(method)
+    def wrapped(self, *args, **kwargs):
+        executor = getattr(self, 'device_executor', None)
+        if executor is None:
+            return method(self, *args, **kwargs)
+        try:
+            return executor.call(method, self, *args, timeout=timeout, **kwargs)
+        except DeviceTimeoutError:
+            # already logged by call()
+            return failure
+
+    return wrapped
+
+
+def make_executor_class(dev_class):
+    """
+    Return subclass of a backend device class which runs its methods on
+    the DeviceExecutor stored in the device_executor attribute.
+    """
+    attrs = {}
+    for name in dir(dev_class):
+        if name.startswith('_') or name in CALLER_THREAD_METHODS:
+            continue
+
+        static = inspect.getattr_static(dev_class, name)
+        if isinstance(static, (staticmethod, classmethod, property)):
+            continue
+
+        method = getattr(dev_class, name)
+        if inspect.isfunction(method):
+            attrs[name] = _executor_method(name, method)
+
+    return type(f'Executor{dev_class.__name__}', (dev_class,), attrs)
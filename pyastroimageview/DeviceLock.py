@@ -0,0 +1,265 @@
+#
+# Device locks
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# A device is locked by whoever is using it for a while (the sequence, an
+# RPC client, a control panel) so nobody else changes its state underneath
+# them.  The lock remembers who holds it and keeps statistics on how often
+# it is contended and for how long it is held.
+#
+# Checking the lock is just an attribute test so it is cheap enough to do
+# on every device call.  Stacks of the code taking the lock are only
+# recorded when lock debugging is turned on by setting the environment
+# variable PYASTROIMAGEVIEW_DEBUG_LOCKS=1.
+#
+import os
+import time
+import logging
+import threading
+import traceback
+from collections import deque
+from functools import wraps
+
+DEBUG_ENV_VAR = 'PYASTROIMAGEVIEW_DEBUG_LOCKS'
+
+
+class DeviceLock:
+    """
+    Exclusive lock on a device with owner tracking.
+
+    Parameters
+    ----------
+    name : str
+        Name of device - used for logging.
+    """
+
+    # record stacks of lock holders
+    debug = bool(os.environ.get(DEBUG_ENV_VAR))
+
+    def __init__(self, name):
+        self.name = name
+
+        self.cond = threading.Condition()
+
+        # owner is None when lock is free
+        self.owner = None
+        self.acquired_time = None
+        self.acquired_stack = None
+
+        # blocking acquire() callers waiting in order of arrival
+        self.waiters = deque()
+
+        # statistics - protected by cond
+        self.num_acquires = 0
+        self.num_busy = 0
+        self.num_timeouts = 0
+        self.total_hold = 0
+        self.max_hold = 0
+        self.total_wait = 0
+        self.max_wait = 0
+
+    def locked(self):
+        return self.owner is not None
+
+    def available(self):
+        """Return 1 if lock is free and 0 if held (same as QSemaphore)"""
+        return 0 if self.owner is not None else 1
+
+    def held_by(self, owner):
+        return self.owner is not None and self.owner == owner
+
+    def _take(self, owner):
+        if owner is None:
+            owner = threading.current_thread().name
+        self.owner = owner
+        self.acquired_time = time.monotonic()
+        self.num_acquires += 1
+        if self.debug:
+            self.acquired_stack = traceback.extract_stack()[:-2]
+
+    def try_acquire(self, owner=None):
+        """
+        Take the lock if it is free.
+
+        Parameters
+        ----------
+        owner : str
+            Name of the new holder - defaults to the thread name.
+
+        Returns
+        -------
+        bool
+            True if lock was taken.
+        """
+        with self.cond:
+            if self.owner is None and not self.waiters:
+                self._take(owner)
+                return True
+
+            self.num_busy += 1
+            holder = self.owner
+
+        logging.debug(f'DeviceLock {self.name}: busy - held by {holder}')
+        if self.debug and self.acquired_stack is not None:
+            logging.debug(f'DeviceLock {self.name}: taken at\n'
+                          + ''.join(traceback.format_list(self.acquired_stack)))
+
+        return False
+
+    def acquire(self, owner=None, timeout=None):
+        """
+        Wait for the lock.
+
+        Waiters get the lock in the order they asked for it.  Must not be
+        called on the GUI thread if the holder releases the lock from the
+        GUI thread.
+
+        Parameters
+        ----------
+        owner : str
+            Name of the new holder - defaults to the thread name.
+        timeout : float
+            Seconds to wait - None waits forever.
+
+        Returns
+        -------
+        bool
+            True if lock was taken.
+        """
+        with self.cond:
+            if self.owner is None and not self.waiters:
+                self._take(owner)
+                return True
+
+            self.num_busy += 1
+            ticket = object()
+            self.waiters.append(ticket)
+            t0 = time.monotonic()
+            try:
+                rc = self.cond.wait_for(lambda: (self.owner is None
+                                                 and self.waiters[0] is ticket),
+                                        timeout)
+            finally:
+                self.waiters.remove(ticket)
+                # next waiter may be at the head now
+                self.cond.notify_all()
+
+            wait = time.monotonic() - t0
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+            if not rc:
+                self.num_timeouts += 1
+                logging.warning(f'DeviceLock {self.name}: timed out after '
+                                f'{timeout} s waiting on {self.owner}')
+                return False
+
+            self._take(owner)
+            return True
+
+    def release(self, owner=None):
+        """
+        Release the lock.
+
+        Parameters
+        ----------
+        owner : str
+            Name the lock was taken with.  If given the lock is only
+            released if it is held by this owner.
+
+        Returns
+        -------
+        bool
+            False if the lock was not held (by owner).
+        """
+        with self.cond:
+            if self.owner is None:
+                logging.error(f'DeviceLock {self.name}: lock was already released!')
+                return False
+
+            if owner is not None and self.owner != owner:
+                logging.error(f'DeviceLock {self.name}: {owner} tried to release '
+                              f'lock held by {self.owner}!')
+                if self.debug and self.acquired_stack is not None:
+                    logging.error(f'DeviceLock {self.name}: taken at\n'
+                                  + ''.join(traceback.format_list(self.acquired_stack)))
+                return False
+
+            hold = time.monotonic() - self.acquired_time
+            self.total_hold += hold
+            self.max_hold = max(self.max_hold, hold)
+
+            self.owner = None
+            self.acquired_time = None
+            self.acquired_stack = None
+
+            self.cond.notify_all()
+
+        return True
+
+    def get_stats(self):
+        """Return dictionary of lock statistics"""
+        with self.cond:
+            nacq = max(self.num_acquires, 1)
+            held = 0 if self.acquired_time is None \
+                else time.monotonic() - self.acquired_time
+            return {'owner': self.owner,
+                    'held_s': held,
+                    'acquires': self.num_acquires,
+                    'busy': self.num_busy,
+                    'timeouts': self.num_timeouts,
+                    'waiters': len(self.waiters),
+                    'mean_hold_s': self.total_hold / nacq,
+                    'max_hold_s': self.max_hold,
+                    'total_wait_s': self.total_wait,
+                    'max_wait_s': self.max_wait}
+
+
+def checklock(method):
+    """Warn if a device method is called while its device is not locked"""
+    @wraps(method)
+    def wrapped(self, *args, **kwargs):
+        if self.lock.owner is None:
+            logging.warning(f'{self.lock.name}: {method.__name__} called without a lock!')
+        return method(self, *args, **kwargs)
+    return wrapped
+
+
+class DeviceLockMixin:
+    """
+    get_lock()/release_lock() for device managers.
+
+    The manager must set self.lock to a DeviceLock.  If it has a signals
+    object with a lock signal it is emitted when the lock changes.
+    """
+
+    def get_lock(self, owner=None):
+        rc = self.lock.try_acquire(owner)
+        if rc:
+            signals = getattr(self, 'signals', None)
+            if signals is not None:
+                signals.lock.emit(True)
+        return rc
+
+    def release_lock(self, owner=None):
+        rc = self.lock.release(owner)
+        if rc:
+            signals = getattr(self, 'signals', None)
+            if signals is not None:
+                signals.lock.emit(False)
+        return rc
@@ -17,7 +17,10 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import time
 import logging
+from types import MethodType
+from concurrent import futures
 
 from pyastrobackend.BackendConfig import get_backend
 
@@ -25,62 +28,73 @@ from pyastroimageview.CameraManager import CameraManager
 from pyastroimageview.FilterWheelManager import FilterWheelManager
 from pyastroimageview.MountManager import MountManager
 from pyastroimageview.FocuserManager import FocuserManager
+from pyastroimageview.DevicePoller import DevicePoller
+from pyastroimageview.DeviceExecutor import (DeviceExecutor, DeviceTimeoutError,
+                                             make_executor_class, LONG_CALL_TIMEOUTS)
 
 from pyastroimageview.ApplicationContainer import AppContainer
 
-class DeviceProxy(object):
+# seconds to wait for a newly connected device to report a sane state
+READY_TIMEOUT = 10
+
+# seconds between readiness probes
+READY_PROBE_INTERVAL = 0.1
+
+
+class _CachingProxy(object):
     """
-    Acts as a proxy object for actual device object which will set using
-    the `set_device` method.
+    Forwards attribute access to a target object.
+
+    Bound methods of the target are stored in the proxy the first time they
+    are looked up so later lookups are found by normal attribute lookup
+    without going through any Python code.  That matters for the device
+    calls made on every status poll and header fill.  Other attributes are
+    always looked up on the target since they can change.  The stored
+    methods are dropped when the target is replaced.
     """
 
-    __slots__ = ['_obj', 'weakref']
+    def __init__(self):
+        object.__setattr__(self, '_obj', None)
 
-    def __getattribute__(self, name):
-        #logging.debug(f'DeviceProxy __getattribute__ {name}')
-        if name == 'set_device':
-            return object.__getattribute__(self, '_set_device')
-        else:
-            return getattr(object.__getattribute__(self, '_obj'), name)
+    def __getattr__(self, name):
+        # only called if name isn't already stored in the proxy
+        value = getattr(object.__getattribute__(self, '_obj'), name)
+        if type(value) is MethodType:
+            self.__dict__[name] = value
+        return value
 
     def __delattr__(self, name):
-        #logging.debug(f'DeviceProxy __delattr__ {name}')
-        delattr(object.__getattribute__(self, '_obj'), name)
+        self.__dict__.pop(name, None)
+        delattr(self._obj, name)
 
     def __setattr__(self, name, value):
-        #logging.debug(f'DeviceProxy __setattr__ {name} {value}')
-        setattr(object.__getattribute__(self, '_obj'), name, value)
+        self.__dict__.pop(name, None)
+        setattr(self._obj, name, value)
+
+    def _set_target(self, obj):
+        attrs = self.__dict__
+        attrs.clear()
+        attrs['_obj'] = obj
 
-    def _set_device(self, dev):
-        #logging.debug(f'DeviceProxy _set_device {dev}')
-        object.__setattr__(self, '_obj', dev)
 
-class BackendProxy(object):
+class DeviceProxy(_CachingProxy):
     """
-    Acts as a proxy object for actual backend object which will set using
+    Acts as a proxy object for actual device object which will set using
     the `set_device` method.
     """
 
-    __slots__ = ['_obj', 'weakref']
+    def set_device(self, dev):
+        self._set_target(dev)
 
-    def __getattribute__(self, name):
-        #logging.debug(f'DeviceProxy __getattribute__ {name}')
-        if name == 'set_backend':
-            return object.__getattribute__(self, '_set_backend')
-        else:
-            return getattr(object.__getattribute__(self, '_obj'), name)
-
-    def __delattr__(self, name):
-        #logging.debug(f'DeviceProxy __delattr__ {name}')
-        delattr(object.__getattribute__(self, '_obj'), name)
 
-    def __setattr__(self, name, value):
-        #logging.debug(f'DeviceProxy __setattr__ {name} {value}')
-        setattr(object.__getattribute__(self, '_obj'), name, value)
+class BackendProxy(_CachingProxy):
+    """
+    Acts as a proxy object for actual backend object which will set using
+    the `set_backend` method.
+    """
 
-    def _set_backend(self, dev):
-        #logging.debug(f'DeviceProxy _set_device {dev}')
-        object.__setattr__(self, '_obj', dev)
+    def set_backend(self, backend):
+        self._set_target(backend)
 
 
 class DeviceManager:
@@ -102,6 +116,24 @@ class DeviceManager:
         self.settings = AppContainer.find('/program_settings')
         logging.debug(f'DeviceManager init(): self.settings = {self.settings}')
 
+        # all periodic status queries go through the poller
+        self.poller = DevicePoller()
+
+        # driver calls for each device run on its own thread
+        self.executors = {'camera': DeviceExecutor('camera'),
+                          'focuser': DeviceExecutor('focuser'),
+                          'filterwheel': DeviceExecutor('filterwheel'),
+                          'mount': DeviceExecutor('mount')}
+
+        # checks that a newly connected device is ready to use
+        self.ready_probes = {'camera': lambda: self.camera.is_connected(),
+                             'focuser': self.probe_focuser,
+                             'filterwheel': self.probe_filterwheel,
+                             'mount': self.probe_mount}
+
+        # seconds taken by last connect of each backend and device
+        self.connect_times = {}
+
         # set proxy backend objects that will never change
         self.camera_backend = BackendProxy()
         self.focuser_backend = BackendProxy()
@@ -133,8 +165,127 @@ class DeviceManager:
         AppContainer.register('/dev/filterwheel_backend', self.filterwheel_backend)
         AppContainer.register('/dev/mount_backend', self.mount_backend)
 
+        AppContainer.register('/dev/poller', self.poller)
+
+        self.add_poll_entries()
+
         logging.debug('DeviceManager registration complete')
 
+    def add_poll_entries(self):
+        """
+        Add status queries for all devices to the poller.
+
+        The camera status is always polled since the camera manager relies
+        on it to notice when an exposure is done.  Other entries are only
+        polled while something subscribes to them.
+        """
+        self.poller.add_entry('camera', lambda: self.camera.camera_status_poll(),
+                              is_busy=lambda s: (s.state.exposure_in_progress()
+                                                 or self.camera.is_busy()),
+                              fast=500, slow=2000,
+                              executor=self.executors['camera'])
+        self.poller.add_entry('camera_cooler', self.query_camera_cooler,
+                              is_connected=lambda: self.camera.is_connected(),
+                              fast=5000, slow=5000,
+                              executor=self.executors['camera'])
+        self.poller.add_entry('focuser', self.query_focuser,
+                              is_connected=lambda: self.focuser.is_connected(),
+                              is_busy=lambda s: s['moving'],
+                              fast=250, slow=2000,
+                              executor=self.executors['focuser'])
+        self.poller.add_entry('filterwheel', self.query_filterwheel,
+                              is_connected=lambda: self.filterwheel.is_connected(),
+                              is_busy=lambda s: s['moving'],
+                              fast=250, slow=2000,
+                              executor=self.executors['filterwheel'])
+        self.poller.add_entry('mount', self.query_mount,
+                              is_connected=lambda: self.mount.is_connected(),
+                              is_busy=lambda s: s['slewing'],
+                              fast=500, slow=2000,
+                              executor=self.executors['mount'])
+
+        self.poller.subscribe('camera', self)
+
+    def camera_activity(self, *args):
+        """Poll camera right away when it starts or stops something"""
+        self.poller.request('camera')
+        self.poller.request('camera_cooler')
+
+    def filterwheel_activity(self, *args):
+        self.poller.request('filterwheel')
+
+    def query_camera_cooler(self):
+        return {'temperature': self.camera.get_current_temperature(),
+                'power': self.camera.get_cooler_power(),
+                'state': self.camera.get_cooler_state()}
+
+    def query_focuser(self):
+        # maximum position only needs to be read once per connection
+        last = self.poller.get('focuser')
+        if last is not None:
+            max_position = last['max_position']
+        else:
+            max_position = self.focuser.get_max_absolute_position()
+
+        return {'position': self.focuser.get_absolute_position(),
+                'max_position': max_position,
+                'temperature': self.focuser.get_current_temperature(),
+                'moving': self.focuser.is_moving()}
+
+    def query_filterwheel(self):
+        return {'position': self.filterwheel.get_position(),
+                'moving': self.filterwheel.is_moving()}
+
+    def query_mount(self):
+        return {'radec': self.mount.get_position_radec(),
+                'altaz': self.mount.get_position_altaz(),
+                'slewing': self.mount.is_slewing()}
+
+    def get_backend(self, backend_name):
+        """
+        Create backend object for the named backend.
+
+        Can be overridden to supply a different backend implementation such
+        as simulated devices for testing.
+
+        :param backend_name: Name of the backend.
+        :type backend_name: str
+        """
+        return get_backend(backend_name)
+
+    def attach_executor(self, dev, name):
+        """
+        Make driver calls for a device run on its executor thread.
+
+        :param dev: Device manager object.
+        :param name: Name of executor.
+        :return: Device manager object.
+        """
+        dev.device_executor = self.executors[name]
+        return dev
+
+    def get_executor_stats(self):
+        """
+        Return call statistics for each device executor.
+
+        :return: Dictionary of statistics keyed by device name.
+        :rtype: dict
+        """
+        return {name: executor.get_stats() for name, executor in self.executors.items()}
+
+    def get_lock_stats(self):
+        """
+        Return lock statistics for each device.
+
+        :return: Dictionary of statistics keyed by device name.
+        :rtype: dict
+        """
+        return {name: getattr(self, name).lock.get_stats() for name in self.executors}
+
+    def stop_executors(self):
+        for executor in self.executors.values():
+            executor.stop()
+
     # FIXME Following can be used to change backend/driver on the fly after
     #       first connecting devices BUT probably leaks objects and leaves
     #       devices connected when things change!
@@ -151,14 +302,18 @@ class DeviceManager:
 
         #FIXME Need error checking!
         logging.debug(f'set_camera_backend to {backend_name}')
-        self.camera_backend.set_backend(get_backend(backend_name))
+        self.camera_backend.set_backend(self.get_backend(backend_name))
         camera_dev = self.camera_backend.newCamera()
         CameraManagerClass = type('CameraManager', (CameraManager,
-                                                    type(camera_dev)), {})
+                                                    make_executor_class(type(camera_dev))), {})
         logging.debug(f'type(camera_dev)={type(camera_dev)}')
         logging.debug(f'camera_dev={dir(camera_dev)} '
                       f'CameraManagerClass={dir(CameraManagerClass)}')
-        self.camera.set_device(CameraManagerClass(self.camera_backend))
+        self.camera.set_device(self.attach_executor(CameraManagerClass(self.camera_backend),
+                                                    'camera'))
+        self.camera.signals.connect.connect(self.camera_activity)
+        self.camera.signals.exposure_start.connect(self.camera_activity)
+        self.camera.signals.exposure_complete.connect(self.camera_activity)
         logging.debug(f'set_camera_backend: self.camera = {vars(self.camera)}')
 
     def set_focuser_backend(self, backend_name):
@@ -171,13 +326,14 @@ class DeviceManager:
 
         #FIXME Need error checking!
         logging.debug(f'set_focuser_backend to {backend_name}')
-        self.focuser_backend.set_backend(get_backend(backend_name))
+        self.focuser_backend.set_backend(self.get_backend(backend_name))
         focuser_dev = self.focuser_backend.newFocuser()
         FocuserManagerClass = type('FocuserManager', (FocuserManager,
-                                                      type(focuser_dev)), {})
+                                                      make_executor_class(type(focuser_dev))), {})
         logging.debug(f'focuser_dev={focuser_dev} '
                       f'FocuserManagerClass={FocuserManagerClass}')
-        self.focuser.set_device(FocuserManagerClass(self.focuser_backend))
+        self.focuser.set_device(self.attach_executor(FocuserManagerClass(self.focuser_backend),
+                                                     'focuser'))
         logging.debug(f'set_focuser_backend: self.focuser = {self.focuser}')
         logging.debug(f'set_focuser_backend: self.focuser.has_chooser '
                       f'= {self.focuser.has_chooser}')
@@ -191,13 +347,16 @@ class DeviceManager:
         """
 
         #FIXME Need error checking!
-        self.filterwheel_backend.set_backend(get_backend(backend_name))
+        self.filterwheel_backend.set_backend(self.get_backend(backend_name))
         wheel_dev = self.filterwheel_backend.newFilterWheel()
         FilterWheelManagerClass = type('FilterWheelManager',
-                                       (FilterWheelManager, type(wheel_dev)), {})
+                                       (FilterWheelManager,
+                                        make_executor_class(type(wheel_dev))), {})
         logging.debug(f'wheel_dev={wheel_dev} '
                       f'FilterWheelManagerClass={FilterWheelManagerClass}')
-        self.filterwheel.set_device(FilterWheelManagerClass(self.filterwheel_backend))
+        self.filterwheel.set_device(self.attach_executor(FilterWheelManagerClass(self.filterwheel_backend),
+                                                         'filterwheel'))
+        self.filterwheel.signals.connect.connect(self.filterwheel_activity)
         logging.debug(f'set_filterwheel_backend: '
                       f'self.filterwheel = {self.filterwheel}')
         logging.debug(f'set_filterwheel_backend: self.filterwheel.has_chooser '
@@ -212,13 +371,14 @@ class DeviceManager:
         """
 
         #FIXME Need error checking!
-        self.mount_backend.set_backend(get_backend(backend_name))
+        self.mount_backend.set_backend(self.get_backend(backend_name))
         mount_dev = self.mount_backend.newMount()
         MountManagerClass = type('MountManager', (MountManager,
-                                                  type(mount_dev)), {})
+                                                  make_executor_class(type(mount_dev))), {})
         logging.debug(f'mount_dev={mount_dev} '
                       f'MountManagerClass={MountManagerClass}')
-        self.mount.set_device(MountManagerClass(self.mount_backend))
+        self.mount.set_device(self.attach_executor(MountManagerClass(self.mount_backend),
+                                                   'mount'))
         logging.debug(f'set_mount_backend: self.mount = {self.mount}')
         logging.debug(f'set_mount_backend: self.mount.has_chooser = '
                       f'{self.mount.has_chooser}')
@@ -227,36 +387,219 @@ class DeviceManager:
         """
         Connect all device backends.
 
+        The backends are connected at the same time, each on the executor
+        thread of its device, so startup takes as long as the slowest one
+        instead of the sum of all of them.  Waits for them so it is only
+        called at startup before any window is shown.
+
         :return: True is successful.
         :rtype: bool
         """
 
-        logging.debug('Connected camera backend')
-        rc = self.camera_backend.connect()
-        if not rc:
-            logging.error('Error connecting to camera backend')
-            return rc
+        backends = {'camera': self.camera_backend,
+                    'focuser': self.focuser_backend,
+                    'filterwheel': self.filterwheel_backend,
+                    'mount': self.mount_backend}
+
+        t0 = time.perf_counter()
+        pending = {}
+        for name, backend in backends.items():
+            pending[name] = self.executors[name].submit(self.timed_call,
+                                                        f'{name}_backend',
+                                                        backend.connect)
+
+        _, late = futures.wait(list(pending.values()), LONG_CALL_TIMEOUTS['connect'])
+
+        rc = True
+        for name, future in pending.items():
+            if future in late:
+                logging.error(f'Timed out connecting to {name} backend')
+                rc = False
+            elif future.exception() is not None:
+                logging.error(f'Error connecting to {name} backend',
+                              exc_info=future.exception())
+                rc = False
+            elif not future.result():
+                logging.error(f'Error connecting to {name} backend')
+                rc = False
+
+        logging.info(f'Backends connected rc={rc} in '
+                     f'{time.perf_counter()-t0:.2f} s {self.format_connect_times()}')
 
-        logging.debug('Connected focuser backend')
-        rc = self.focuser_backend.connect()
-        if not rc:
-            logging.error('Error connecting to focuser backend')
-            return rc
+        return rc
 
-        logging.debug('Connected filterwheel backend')
-        rc = self.filterwheel_backend.connect()
-        if not rc:
-            logging.error('Error connecting to filter wheel backend')
-            return rc
+    def connect_devices(self, names=None, ready_timeout=READY_TIMEOUT, callback=None):
+        """
+        Connect devices to their configured drivers at the same time.
+
+        Each device is connected on its executor thread and then probed
+        until it reports a sane state so callers don't need fixed delays
+        waiting for drivers to settle.  Devices without a driver configured
+        are skipped.
+
+        :param names: Devices to connect - defaults to all.
+        :type names: list
+        :param ready_timeout: Seconds to wait for a device to become ready.
+        :type ready_timeout: float
+        :param callback: Called on the GUI thread with the results once all
+                         devices are done.  Without a callback the call
+                         waits for the devices which holds up the GUI so
+                         that is only for scripts and tests.
+        :type callback: callable
+        :return: Dictionary of success keyed by device name or None if
+                 callback is given.
+        :rtype: dict
+        """
+        if names is None:
+            names = list(self.executors.keys())
 
-        logging.debug('Connected mount backend')
-        rc = self.mount_backend.connect()
-        if not rc:
-            logging.error('Error connecting to mount backend')
+        t0 = time.perf_counter()
+        timeout = LONG_CALL_TIMEOUTS['connect'] + ready_timeout
+        results = {}
+        pending = {}
 
-        logging.debug('Backends connected')
+        def device_done(name, future):
+            results[name] = self.connect_result(name, future)
+            self.poller.request(name)
 
-        return rc
+            if len(results) == len(pending):
+                logging.info(f'Devices connected {results} in '
+                             f'{time.perf_counter()-t0:.2f} s {self.format_connect_times()}')
+                callback(results)
+
+        for name in names:
+            driver = getattr(self.settings, f'{name}_driver')
+            if not driver:
+                logging.info(f'connect_devices: no driver set for {name}')
+                continue
+
+            done = None
+            if callback is not None:
+                done = lambda f, name=name: device_done(name, f)
+
+            pending[name] = self.executors[name].submit(self.timed_call, name,
+                                                        self.connect_and_wait,
+                                                        name, driver, ready_timeout,
+                                                        callback=done, timeout=timeout)
+
+        if callback is not None:
+            if not pending:
+                callback(results)
+            return None
+
+        futures.wait(list(pending.values()), timeout)
+
+        for name, future in pending.items():
+            results[name] = self.connect_result(name, future)
+            self.poller.request(name)
+
+        logging.info(f'Devices connected {results} in '
+                     f'{time.perf_counter()-t0:.2f} s {self.format_connect_times()}')
+
+        return results
+
+    def connect_device(self, name, callback):
+        """
+        Connect one device to its configured driver without waiting.
+
+        :param name: Device name.
+        :type name: str
+        :param callback: Called on the GUI thread with True if the device
+                         connected.
+        :type callback: callable
+        """
+        self.connect_devices([name], callback=lambda results: callback(results.get(name, False)))
+
+    def connect_result(self, name, future):
+        """Return True if the connect future of a device succeeded"""
+        if not future.done() or isinstance(future.exception(), DeviceTimeoutError):
+            logging.error(f'connect_devices: timed out connecting {name}')
+            return False
+
+        if future.exception() is not None:
+            logging.error(f'connect_devices: error connecting {name}',
+                          exc_info=future.exception())
+            return False
+
+        return future.result()
+
+    def connect_and_wait(self, name, driver, ready_timeout):
+        # runs on the executor thread of the device
+        dev = getattr(self, name)
+
+        # camera and filter wheel insist on being locked for connect
+        locked = dev.get_lock('connect')
+        try:
+            if not dev.connect(driver):
+                return False
+        finally:
+            if locked:
+                dev.release_lock('connect')
+
+        return self.wait_ready(name, ready_timeout)
+
+    def wait_ready(self, name, timeout=READY_TIMEOUT):
+        """
+        Wait until a newly connected device reports a sane state.
+
+        Some drivers (INDI in particular) report being connected before
+        properties like the filter position are available.  Rather than
+        sleeping a fixed time the device is probed until it is ready.
+        Runs on the executor thread of the device.
+
+        :param name: Device name.
+        :type name: str
+        :param timeout: Seconds to wait.
+        :type timeout: float
+        :return: True if device became ready.
+        :rtype: bool
+        """
+        probe = self.ready_probes[name]
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if probe():
+                    return True
+            except Exception:
+                # FIXME need more specific exception
+                logging.debug(f'wait_ready: {name} probe failed', exc_info=True)
+
+            if time.monotonic() > deadline:
+                logging.warning(f'wait_ready: {name} not ready after {timeout} s')
+                return False
+
+            time.sleep(READY_PROBE_INTERVAL)
+
+    def probe_focuser(self):
+        return (self.focuser.get_absolute_position() is not None
+                and not self.focuser.is_moving())
+
+    def probe_filterwheel(self):
+        pos = self.filterwheel.get_position()
+        return pos is not None and pos >= 0 and not self.filterwheel.is_moving()
+
+    def probe_mount(self):
+        return self.mount.get_position_radec() is not None
+
+    def timed_call(self, name, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.connect_times[name] = time.perf_counter() - t0
+
+    def format_connect_times(self):
+        return ' '.join(f'{name}={dt:.2f}s' for name, dt in self.connect_times.items())
+
+    def get_connect_times(self):
+        """
+        Return seconds taken by the most recent connect of each backend
+        and device.
+
+        :return: Dictionary of seconds keyed by name.
+        :rtype: dict
+        """
+        return dict(self.connect_times)
 
     def clear_device_driver_settings(self):
         self.settings.camera_driver = ''
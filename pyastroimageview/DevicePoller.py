@@ -0,0 +1,297 @@
+#
+# Device status polling scheduler
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# All periodic device status queries go through a single DevicePoller so
+# there is one timer for the whole program instead of one per widget.
+#
+# Each kind of query is a poll entry (camera status, focuser position, etc)
+# which is only run while something is subscribed to it.  Entries due at
+# about the same time are run together in one tick and the results are
+# published as a single DeviceSnapshot.  The poll interval of an entry
+# depends on the device state - fast while the device is busy (exposing,
+# moving, slewing), slow while it is idle and slower still while it is not
+# connected.
+#
+# An entry whose device is busy with a slow call (connect, image download)
+# is skipped until it is done instead of waiting behind the call.
+#
+import time
+import logging
+
+from PyQt5 import QtCore
+
+
+class DeviceSnapshot:
+    """
+    Latest results of all poll entries.
+
+    Attributes
+    ----------
+    timestamp : float
+        Time of the tick which produced the snapshot.
+    values : dict
+        Latest query result for each entry - None if device not connected.
+    connected : dict
+        Connection state for each entry.
+    updated : set
+        Names of entries which were queried in this tick.
+    """
+
+    def __init__(self, timestamp, values, connected, updated):
+        self.timestamp = timestamp
+        self.values = values
+        self.connected = connected
+        self.updated = updated
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def __str__(self):
+        return f'timestamp = {self.timestamp} updated = {self.updated} ' \
+               + f'values = {self.values}'
+
+
+class PollEntry:
+    """
+    A single status query run by the DevicePoller.
+
+    Parameters
+    ----------
+    name : str
+        Name of entry.
+    query : callable
+        Called with no arguments to get the current status.
+    is_connected : callable
+        Returns True if the device is connected.  If None the query is
+        always run.
+    is_busy : callable
+        Called with the query result and returns True if the device is
+        busy and should be polled at the fast interval.
+    fast : int
+        Poll interval in ms while busy.
+    slow : int
+        Poll interval in ms while idle.
+    offline : int
+        Interval in ms to check if the device has been connected.
+    executor : DeviceExecutor
+        Executor the device calls of the query run on.
+    """
+
+    def __init__(self, name, query, is_connected=None, is_busy=None,
+                 fast=500, slow=2000, offline=5000, executor=None):
+        self.name = name
+        self.query = query
+        self.is_connected = is_connected
+        self.is_busy = is_busy
+        self.executor = executor
+        self.fast = fast
+        self.slow = slow
+        self.offline = offline
+
+        self.users = set()
+        self.next_due = 0
+        self.value = None
+        self.connected = False
+        self.busy = False
+
+        # statistics
+        self.num_queries = 0
+        self.num_errors = 0
+
+    def poll(self):
+        """Run query and return interval in ms until it is due again"""
+        # try again soon rather than wait for the device to finish
+        if self.executor is not None and self.executor.busy():
+            return self.fast
+
+        if self.is_connected is not None:
+            self.connected = self.is_connected()
+            if not self.connected:
+                self.value = None
+                self.busy = False
+                return self.offline
+        else:
+            self.connected = True
+
+        self.num_queries += 1
+        try:
+            self.value = self.query()
+        except Exception:
+            # FIXME need more specific exception
+            logging.error(f'DevicePoller: query {self.name} failed!', exc_info=True)
+            self.num_errors += 1
+            self.value = None
+            self.busy = False
+            return self.slow
+
+        if self.is_busy is not None:
+            self.busy = bool(self.is_busy(self.value))
+
+        return self.fast if self.busy else self.slow
+
+
+class DevicePoller(QtCore.QObject):
+    """
+    Runs device status queries for all subscribers from a single timer.
+
+    Signals
+    -------
+    snapshot : DeviceSnapshot
+        Emitted after each tick with the latest results of all entries.
+    """
+    snapshot = QtCore.pyqtSignal(object)
+
+    # entries due within this many seconds of each other run in the same tick
+    BATCH_WINDOW = 0.1
+
+    # shortest time between ticks in ms
+    MIN_TICK = 20
+
+    def __init__(self):
+        super().__init__()
+
+        self.entries = {}
+
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.tick)
+
+        self.num_ticks = 0
+
+    def add_entry(self, name, query, is_connected=None, is_busy=None,
+                  fast=500, slow=2000, offline=5000, executor=None):
+        """
+        Add a poll entry.  See PollEntry for parameters.
+
+        Returns
+        -------
+        PollEntry
+        """
+        if name in self.entries:
+            logging.warning(f'DevicePoller: replacing entry {name}')
+
+        entry = PollEntry(name, query, is_connected=is_connected,
+                          is_busy=is_busy, fast=fast, slow=slow, offline=offline,
+                          executor=executor)
+        self.entries[name] = entry
+
+        return entry
+
+    def set_intervals(self, name, fast=None, slow=None, offline=None):
+        """Change the poll intervals in ms of an entry"""
+        entry = self.entries[name]
+        if fast is not None:
+            entry.fast = fast
+        if slow is not None:
+            entry.slow = slow
+        if offline is not None:
+            entry.offline = offline
+
+    def subscribe(self, name, user):
+        """
+        Start polling an entry on behalf of user.
+
+        An entry is polled once no matter how many users subscribe to it.
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            logging.error(f'DevicePoller: subscribe to unknown entry {name}')
+            return False
+
+        if not entry.users:
+            # poll right away so new user gets a value quickly
+            entry.next_due = 0
+            self.schedule(0)
+
+        entry.users.add(user)
+
+        return True
+
+    def unsubscribe(self, name, user):
+        entry = self.entries.get(name)
+        if entry is None:
+            return
+
+        entry.users.discard(user)
+
+    def request(self, name):
+        """
+        Poll an entry on the next tick.
+
+        Used when a device is known to have changed (connected, moved, etc).
+        Repeated requests before the tick are coalesced into one query.
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return
+
+        entry.next_due = 0
+        if entry.users:
+            self.schedule(0)
+
+    def get(self, name):
+        """Return latest result for an entry"""
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        return entry.value
+
+    def schedule(self, delay_ms):
+        delay_ms = max(self.MIN_TICK, int(delay_ms))
+        if self.timer.isActive() and self.timer.remainingTime() <= delay_ms:
+            return
+        self.timer.start(delay_ms)
+
+    def tick(self):
+        now = time.monotonic()
+        updated = set()
+
+        for entry in list(self.entries.values()):
+            if not entry.users or entry.next_due > now + self.BATCH_WINDOW:
+                continue
+
+            interval = entry.poll()
+            entry.next_due = now + interval / 1000.0
+            updated.add(entry.name)
+
+        self.num_ticks += 1
+
+        if updated:
+            values = {}
+            connected = {}
+            for name, entry in self.entries.items():
+                values[name] = entry.value
+                connected[name] = entry.connected
+
+            self.snapshot.emit(DeviceSnapshot(time.time(), values, connected, updated))
+
+        # sleep until next entry is due
+        next_due = [e.next_due for e in self.entries.values() if e.users]
+        if next_due:
+            self.schedule((min(next_due) - time.monotonic()) * 1000)
+
+    def get_stats(self):
+        """Return dictionary of tick and query counts"""
+        stats = {'ticks': self.num_ticks, 'entries': {}}
+        for name, entry in self.entries.items():
+            stats['entries'][name] = {'queries': entry.num_queries,
+                                      'errors': entry.num_errors,
+                                      'users': len(entry.users),
+                                      'busy': entry.busy}
+        return stats
@@ -0,0 +1,242 @@
+#
+# Earth orientation data and sidereal time
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# astropy will try to download IERS tables whenever it needs earth
+# orientation data for a recent date.  On an observatory PC with no network
+# this can hang for a long time so instead we never download automatically
+# and use the tables bundled with astropy plus a local copy of the IERS-A
+# table which is only updated when explicitly requested.
+#
+# Importing astropy time and coordinates is slow so configure_offline() is
+# not called at startup but by the code about to use them (mount alt/az
+# and refresh_cache()).  Anything new which uses astropy time or
+# coordinate transforms must call it first too.
+#
+# For FITS headers a low precision sidereal time which doesn't need any
+# tables at all is used.
+#
+import os
+import math
+import time
+import logging
+import tempfile
+import urllib.request
+
+IERS_A_FILENAME = 'finals2000A.all'
+
+IERS_A_URLS = ['https://datacenter.iers.org/data/9/finals2000A.all',
+               'https://maia.usno.navy.mil/ser7/finals2000A.all']
+
+_configured = False
+
+
+def get_cache_dir():
+    """Return directory the IERS tables are cached in"""
+    homedir = os.path.expanduser('~')
+    return os.path.join(homedir, '.config', 'pyastroimageview', 'iers')
+
+
+def get_cache_filename(cache_dir=None):
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    return os.path.join(cache_dir, IERS_A_FILENAME)
+
+
+def get_cache_age(cache_dir=None):
+    """Return age of cached IERS-A table in days or None if not cached"""
+    fname = get_cache_filename(cache_dir)
+    if not os.path.isfile(fname):
+        return None
+    return (time.time() - os.path.getmtime(fname)) / 86400.0
+
+
+def load_cached_table(cache_dir=None):
+    """
+    Make astropy use the cached IERS-A table if there is one.
+
+    Returns
+    -------
+    bool
+        True if cached table was loaded.
+    """
+    fname = get_cache_filename(cache_dir)
+    if not os.path.isfile(fname):
+        logging.info(f'EarthOrientation: no cached IERS-A table at {fname} '
+                     f'- using bundled tables')
+        return False
+
+    from astropy.utils import iers
+
+    try:
+        table = iers.IERS_A.open(fname)
+    except Exception:
+        logging.error(f'EarthOrientation: unable to read cached IERS-A table {fname}',
+                      exc_info=True)
+        return False
+
+    iers.earth_orientation_table.set(table)
+
+    logging.info(f'EarthOrientation: using cached IERS-A table {fname} '
+                 f'({get_cache_age(cache_dir):.1f} days old)')
+
+    return True
+
+
+def configure_offline(cache_dir=None):
+    """
+    Configure astropy so it never downloads earth orientation data.
+
+    Should be called before anything uses astropy time or coordinate
+    transforms.  Only the first call does anything.
+    """
+    global _configured
+    if _configured:
+        return True
+    _configured = True
+
+    from astropy.utils import iers
+
+    iers.conf.auto_download = False
+    iers.conf.auto_max_age = None
+
+    # only matters for an explicit refresh
+    iers.conf.remote_timeout = 10
+
+    # predictions past the end of the tables are fine for our purposes
+    if hasattr(iers.conf, 'iers_degraded_accuracy'):
+        iers.conf.iers_degraded_accuracy = 'warn'
+
+    return load_cached_table(cache_dir)
+
+
+def refresh_cache(cache_dir=None, urls=None, timeout=30):
+    """
+    Download a new IERS-A table into the cache.
+
+    This is the only place network access happens.  The new table is only
+    put in place once it has been downloaded and read successfully.
+
+    Returns
+    -------
+    bool
+        True if cache was updated.
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    if urls is None:
+        urls = IERS_A_URLS
+
+    # may be the first use of astropy IERS if no mount needed alt/az yet
+    configure_offline(cache_dir)
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    from astropy.utils import iers
+
+    for url in urls:
+        logging.info(f'EarthOrientation: downloading {url}')
+
+        fd, tmpname = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with urllib.request.urlopen(url, timeout=timeout) as resp:
+                    f.write(resp.read())
+
+            # make sure it is usable before replacing the old one
+            iers.IERS_A.open(tmpname)
+            os.replace(tmpname, get_cache_filename(cache_dir))
+        except Exception:
+            logging.error(f'EarthOrientation: unable to download {url}', exc_info=True)
+            if os.path.exists(tmpname):
+                os.unlink(tmpname)
+            continue
+
+        logging.info('EarthOrientation: IERS-A cache updated')
+        iers.IERS_A.close()
+        return load_cached_table(cache_dir)
+
+    return False
+
+
+def greenwich_sidereal_time(unix_time=None):
+    """
+    Return low precision Greenwich apparent sidereal time in hours.
+
+    Uses the USNO approximation for GMST and the leading terms of the
+    equation of the equinoxes.  UT1 is taken to be UTC.  The result is good
+    to about a second of time which is plenty for header hour angles and
+    needs no IERS tables.
+
+    Parameters
+    ----------
+    unix_time : float
+        Unix time - defaults to now.
+    """
+    if unix_time is None:
+        unix_time = time.time()
+
+    # days since J2000.0
+    d = unix_time / 86400.0 + 2440587.5 - 2451545.0
+
+    gmst = 18.697374558 + 24.06570982441908 * d
+
+    omega = math.radians(125.04 - 0.052954 * d)
+    sun_long = math.radians(280.47 + 0.98565 * d)
+    obliquity = math.radians(23.4393 - 0.0000004 * d)
+    nutation = -0.000319 * math.sin(omega) - 0.000024 * math.sin(2 * sun_long)
+
+    return (gmst + nutation * math.cos(obliquity)) % 24.0
+
+
+def local_sidereal_time(longitude, unix_time=None):
+    """
+    Return low precision local apparent sidereal time in hours.
+
+    Parameters
+    ----------
+    longitude : float
+        Site longitude in degrees, east positive.
+    unix_time : float
+        Unix time - defaults to now.
+    """
+    return (greenwich_sidereal_time(unix_time) + longitude / 15.0) % 24.0
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-8s %(message)s')
+
+    parser = argparse.ArgumentParser(description='Manage cached earth orientation data')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Download new IERS-A table')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory for cached tables')
+    args = parser.parse_args()
+
+    if args.refresh:
+        if not refresh_cache(args.cache_dir):
+            logging.error('Refresh failed!')
+
+    age = get_cache_age(args.cache_dir)
+    if age is None:
+        print('No cached IERS-A table')
+    else:
+        print(f'{get_cache_filename(args.cache_dir)} is {age:.1f} days old')
@@ -0,0 +1,245 @@
+#
+# FITS header builder
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import math
+import time
+import logging
+
+from pyastroimageview.ApplicationContainer import AppContainer
+from pyastroimageview import EarthOrientation
+
+
+def format_sexagesimal(value, sep=':', precision=0, alwayssign=False, pad=True,
+                       wrap=None):
+    """
+    Format a value in hours or degrees as a sexagesimal string.
+
+    Much faster than going through astropy Angle.to_string() and always
+    gives the same number of digits.
+
+    Parameters
+    ----------
+    value : float
+        Value in hours or degrees.
+    sep : str
+        Separator between fields.
+    precision : int
+        Number of decimal places for the seconds field.
+    alwayssign : bool
+        Include '+' for positive values.
+    pad : bool
+        Pad the leading field to two digits.
+    wrap : int
+        If given the leading field wraps at this value (24 for RA).
+
+    Returns
+    -------
+    str
+    """
+    sign = '-' if value < 0 else ('+' if alwayssign else '')
+
+    # round once in the smallest unit so carries propagate correctly
+    scale = 10 ** precision
+    total = int(round(abs(value) * 3600 * scale))
+    whole, frac = divmod(total, scale)
+    minutes, seconds = divmod(whole, 60)
+    degrees, minutes = divmod(minutes, 60)
+    if wrap is not None:
+        degrees %= wrap
+
+    lead = f'{degrees:02d}' if pad else f'{degrees}'
+    secstr = f'{seconds:02d}'
+    if precision > 0:
+        secstr += f'.{frac:0{precision}d}'
+
+    return f'{sign}{lead}{sep}{minutes:02d}{sep}{secstr}'
+
+
+class FITSHeaderBuilder:
+    """
+    Fills in the FITS header cards common to all frames.
+
+    Cards derived from the program settings (telescope, site, etc) are
+    computed once and only rebuilt when the relevant settings change.
+    Mount positions are formatted without going through astropy and the
+    hour angle uses a low precision sidereal time which needs no IERS
+    tables so filling in a header never waits on the network.
+
+    If PHD2 is connected the guiding during the exposure is summarized
+    from the guide steps PHD2Manager has collected.
+    """
+
+    # settings which the session cards depend on
+    SESSION_KEYS = ['observer_notes',
+                    'telescope_description',
+                    'telescope_focallen',
+                    'telescope_aperture',
+                    'telescope_obstruction',
+                    'location_latitude',
+                    'location_longitude']
+
+    def __init__(self, settings=None):
+        if settings is None:
+            settings = AppContainer.find('/program_settings')
+        self.settings = settings
+
+        self.session_key = None
+        self.session_cards = None
+
+        # header fill timing statistics
+        self.fill_count = 0
+        self.fill_total = 0
+        self.fill_max = 0
+        self.fill_last = 0
+
+    def get_session_cards(self):
+        """
+        Return list of (key, value) cards which are the same for every frame.
+
+        The list is rebuilt only if the settings it depends on change.
+        """
+        key = tuple(getattr(self.settings, k) for k in self.SESSION_KEYS)
+        if key == self.session_key:
+            return self.session_cards
+
+        (notes, tele_desc, focallen, aper_diam, aper_obst,
+         latitude, longitude) = key
+
+        aper_area = math.pi * (aper_diam / 2.0 * aper_diam / 2.0) \
+                            * (1 - aper_obst * aper_obst / 100.0 / 100.0)
+
+        self.session_cards = [('NOTES', notes),
+                              ('TELESCOP', tele_desc),
+                              ('FOCALLEN', focallen),
+                              ('APTDIA', aper_diam),
+                              ('APTAREA', aper_area),
+                              ('SITELAT', format_sexagesimal(latitude, sep=' ', pad=False)),
+                              ('SITELONG', format_sexagesimal(longitude, sep=' ', pad=False))]
+        self.session_key = key
+
+        logging.debug(f'FITSHeaderBuilder: new session cards {self.session_cards}')
+
+        return self.session_cards
+
+    def local_sidereal_time(self, when=None):
+        """
+        Return local sidereal time in hours for the configured site.
+
+        Parameters
+        ----------
+        when : float
+            Unix time - defaults to now.
+        """
+        return EarthOrientation.local_sidereal_time(self.settings.location_longitude,
+                                                    when)
+
+    def hour_angle(self, ra, when=None):
+        """Return hour angle in hours in the range -12 to 12"""
+        ha = (self.local_sidereal_time(when) - ra) % 24.0
+        if ha > 12:
+            ha -= 24.0
+        return ha
+
+    def fill_header(self, fits_doc, radec=None, altaz=None, notes=True,
+                    sep=':', decimal_altaz=False):
+        """
+        Fill in FITS header cards for a new frame.
+
+        Parameters
+        ----------
+        fits_doc : FITSImage
+            Image to fill in.
+        radec : tuple
+            Mount (RA hours, Dec degrees) or None if not available.
+        altaz : tuple
+            Mount (Alt, Az) in degrees or None if not available.
+        notes : bool
+            Include observer notes.
+        sep : str
+            Separator for sexagesimal RA/Dec/Alt/Az/HA strings.
+        decimal_altaz : bool
+            Write Alt/Az/HA as decimal values instead of sexagesimal.
+        """
+        t0 = time.perf_counter()
+
+        for key, val in self.get_session_cards():
+            if key == 'NOTES' and not notes:
+                continue
+            fits_doc.set_header_keyvalue(key, val)
+
+        if radec is not None:
+            ra, dec = radec
+            fits_doc.set_object_radec(format_sexagesimal(ra, sep=sep, precision=2, wrap=24),
+                                      format_sexagesimal(dec, sep=sep, precision=1,
+                                                         alwayssign=True))
+
+            ha = self.hour_angle(ra)
+            if decimal_altaz:
+                hastr = f'{ha}'
+            else:
+                hastr = format_sexagesimal(ha, sep=sep, precision=2)
+            fits_doc.set_object_hourangle(hastr)
+
+        if altaz is not None:
+            alt, az = altaz
+            if alt is None or az is None:
+                logging.warning('FITSHeaderBuilder: alt/az are None!')
+            elif decimal_altaz:
+                fits_doc.set_object_altaz(f'{alt}', f'{az}')
+            else:
+                fits_doc.set_object_altaz(format_sexagesimal(alt, sep=sep, precision=1,
+                                                             alwayssign=True),
+                                          format_sexagesimal(az, sep=sep, precision=1,
+                                                             wrap=360))
+
+        self.fill_guiding(fits_doc)
+
+        dt = time.perf_counter() - t0
+        self.fill_count += 1
+        self.fill_total += dt
+        self.fill_last = dt
+        self.fill_max = max(self.fill_max, dt)
+
+        logging.info(f'FITSHeaderBuilder: header filled in {dt*1000:.3f} ms '
+                     f'(mean {self.fill_total/self.fill_count*1000:.3f} ms '
+                     f'over {self.fill_count} frames)')
+
+    def fill_guiding(self, fits_doc):
+        """Add guiding quality cards for the exposure of fits_doc"""
+        window = getattr(fits_doc, 'exposure_window', None)
+        phd2 = AppContainer.get('/dev/phd2')
+        if window is None or phd2 is None:
+            return
+
+        # PHD2 may have gone away during the exposure but its steps are
+        # still worth recording
+        stats = phd2.get_guiding_stats(*window)
+        if stats['steps'] < 1 and not phd2.is_connected():
+            return
+
+        logging.debug(f'FITSHeaderBuilder: guiding {stats}')
+        fits_doc.set_guiding_stats(stats)
+
+    def get_fill_stats(self):
+        """Return dictionary of header fill timing in milliseconds"""
+        mean = self.fill_total / self.fill_count if self.fill_count else 0
+        return {'count': self.fill_count,
+                'last_ms': self.fill_last * 1000,
+                'mean_ms': mean * 1000,
+                'max_ms': self.fill_max * 1000}
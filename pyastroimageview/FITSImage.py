@@ -19,7 +19,13 @@
 #
 import time
 import logging
-from astropy.io import fits
+
+from pyastroimageview.ImageConversion import convert_image_data
+
+# tile compression available for save_to_file() - value is the FITS
+# ZCMPTYPE. Rice is lossless for integer data and much faster than gzip.
+FITS_COMPRESSION_TYPES = {'rice': 'RICE_1',
+                          'gzip': 'GZIP_2'}
 
 class FITSImage:
     """Not sure this is needed but putting ideas in here for now"""
@@ -33,9 +39,21 @@ class FITSImage:
             Image data in default numpy row-col format
         """
 
-        self.hdu = fits.PrimaryHDU(image)
+        # astropy.io.fits is slow to import so wait until first image
+        from astropy.io import fits
+
+        # integer data is kept as uint16 if it fits (no-op if already)
+        image = convert_image_data(image)
+
+        # uint16 is stored as BITPIX 16 with BZERO 32768 rather than
+        # being promoted to BITPIX 32 which doubles the file size
+        self.hdu = fits.PrimaryHDU(image, uint=True)
         self.hdulist = fits.HDUList([self.hdu])
 
+        # (start, end) unix times of exposure if known - used to find
+        # the guiding during the exposure
+        self.exposure_window = None
+
         # some defaults
         self.set_software_info('pyastroview')
         self.set_camera_origin(0, 0)
@@ -44,8 +62,54 @@ class FITSImage:
     def image_data(self):
         return self.hdulist[0].data
 
-    def save_to_file(self, fname, **kwargs):
-        self.hdulist.writeto(fname, **kwargs)
+    def save_to_file(self, fname, compression=None, **kwargs):
+        """Write image to a FITS file
+
+        Parameters
+        ----------
+        fname : str
+            Filename of FITS file.
+        compression : str
+            None to write an uncompressed primary HDU or one of the keys of
+            FITS_COMPRESSION_TYPES to write a tile compressed image
+            extension after an empty primary HDU (same layout as fpack).
+
+        Other keyword arguments are passed to HDUList.writeto().
+        """
+        if compression is None:
+            self.hdulist.writeto(fname, **kwargs)
+            return
+
+        from astropy.io import fits
+
+        compression_type = FITS_COMPRESSION_TYPES.get(compression)
+        if compression_type is None:
+            raise ValueError(f'Unknown FITS compression {compression}')
+
+        # default tiles are one row each which suits RICE and lets
+        # readers decompress a section of the image cheaply
+        comp_hdu = fits.CompImageHDU(self.hdu.data, header=self.hdu.header,
+                                     compression_type=compression_type)
+        fits.HDUList([fits.PrimaryHDU(), comp_hdu]).writeto(fname, **kwargs)
+
+    def save_to_xisf(self, fname, compression=None, overwrite=False):
+        """Write image to an XISF file
+
+        The FITS header is stored as FITS keywords in the XISF header.
+
+        Parameters
+        ----------
+        fname : str
+            Filename of XISF file.
+        compression : str
+            None or one of XISFWriter.XISF_COMPRESSION_CODECS.
+        overwrite : bool
+            Overwrite existing file.
+        """
+        from pyastroimageview.XISFWriter import write_xisf
+
+        write_xisf(fname, self.hdu.data, header=self.hdu.header,
+                   compression=compression, overwrite=overwrite)
 
     def set_header_keyvalue(self, key, val):
         self.hdulist[0].header[key] = val
@@ -144,6 +208,22 @@ class FITSImage:
     def set_software_info(self, swinfo):
         self.set_header_keyvalue('SWCREATE', swinfo)
 
+    def set_guiding_stats(self, stats):
+        """Add guiding quality cards from PHD2Manager.get_guiding_stats()"""
+        header = self.hdulist[0].header
+        units = stats['units']
+        header['GUIDSTEP'] = (stats['steps'], 'Guide steps during exposure')
+        header['GUIDLOST'] = (stats['star_lost'], 'Guide star lost events')
+        if stats['steps'] < 1:
+            return
+
+        header['GUIDRMS'] = (round(stats['total_rms'], 3), f'Total guiding RMS ({units})')
+        header['GUIDRARM'] = (round(stats['ra_rms'], 3), f'RA guiding RMS ({units})')
+        header['GUIDDERM'] = (round(stats['dec_rms'], 3), f'Dec guiding RMS ({units})')
+        header['GUIDRAPK'] = (round(stats['ra_peak'], 3), f'RA peak guide error ({units})')
+        header['GUIDDEPK'] = (round(stats['dec_peak'], 3), f'Dec peak guide error ({units})')
+        header['GUIDSNR'] = (round(stats['snr'], 1), 'Mean guide star SNR')
+
     def __str__(self):
         r = ''
         r += 'FITS HEADER:\n'
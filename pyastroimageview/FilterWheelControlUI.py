@@ -17,19 +17,21 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
-import os
-import time
 import logging
 
-from PyQt5 import QtCore, QtWidgets
+from PyQt5 import QtWidgets
 
 from pyastroimageview.uic.filterwheel_settings_uic import Ui_filterwheel_settings_widget
 from pyastroimageview.ApplicationContainer import AppContainer
 from pyastroimageview.DeviceConfigurationUI import device_setup_ui
+from pyastroimageview.DeviceControlUI import PanelPollSubscription
 
 
 class FilterWheelControlUI(QtWidgets.QWidget):
 
+    # device this panel controls
+    DEVICE_NAME = 'filterwheel'
+
     def __init__(self):
         super().__init__()
 
@@ -54,10 +56,13 @@ class FilterWheelControlUI(QtWidgets.QWidget):
         # we store the names from the manager for filters
         self.names = None
 
-        # polling camera status
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.filterwheel_status_poll)
-        self.timer.start(1000)
+        # filter wheel status while panel is visible
+        self.poll = PanelPollSubscription(self, 'filterwheel',
+                                          self.filterwheel_status_poll)
+
+        # devices can be connected before the panel is first shown
+        if self.filterwheel_manager.is_connected():
+            self.device_connected()
 
     def set_widget_states(self):
         connect = self.filterwheel_manager.is_connected()
@@ -69,11 +74,11 @@ class FilterWheelControlUI(QtWidgets.QWidget):
         self.ui.filterwheel_setting_move.setEnabled(connect)
         self.ui.filterwheel_setting_filter_combobox.setEnabled(connect)
 
-    def filterwheel_status_poll(self):
+    def filterwheel_status_poll(self, status):
         status_string = ''
-        if self.filterwheel_manager.is_connected():
+        if status is not None:
             status_string += 'CONNECTED'
-            if self.filterwheel_manager.is_moving():
+            if status['moving']:
                 status_string += ' MOVING'
             else:
                 status_string += ' IDLE'
@@ -82,10 +87,13 @@ class FilterWheelControlUI(QtWidgets.QWidget):
 
         self.ui.filterwheel_setting_status.setText(status_string)
 
-        if self.filterwheel_manager.is_connected():
-            pos = self.filterwheel_manager.get_position()
+        if status is not None:
+            pos = status['position']
             posstr = f'{pos:05d}'
             if pos >= 0:
+                # panel may have been built after the wheel was connected
+                if self.names is None:
+                    self.names = self.filterwheel_manager.get_names()
                 # logging.debug(f'pos = {pos}')
                 posstr += f' {self.names[pos]}'
             self.ui.filterwheel_setting_position.setText(posstr)
@@ -100,33 +108,40 @@ class FilterWheelControlUI(QtWidgets.QWidget):
 
     def filterwheel_connect(self):
         if self.settings.filterwheel_driver:
-            rc = self.filterwheel_manager.connect(self.settings.filterwheel_driver)
+            # INDI reports connected before the filter properties arrive so
+            # the callback only comes once the wheel reports a position
+            self.ui.filterwheel_setting_connect.setEnabled(False)
+            AppContainer.find('/dev').connect_device('filterwheel',
+                                                     self.filterwheel_connected)
+
+    def filterwheel_connected(self, rc):
+        if not rc:
+            self.set_widget_states()
+            QtWidgets.QMessageBox.critical(None, 'Error',
+                                           'Unable to connect to filterwheel!',
+                                           QtWidgets.QMessageBox.Ok)
+            return
 
-            # FIXME add some time so INDI stuff settles sigh
-            if os.name == 'posix':
-                time.sleep(5)
-                logging.warning('5 second delay for INDI to settle')
+        self.device_connected()
 
-            if not rc:
-                QtWidgets.QMessageBox.critical(None, 'Error',
-                                               'Unable to connect to filterwheel!',
-                                               QtWidgets.QMessageBox.Ok)
-                return
+    def device_connected(self):
+        """Set up panel from the filter wheel once it is connected"""
+        self.set_widget_states()
 
-            self.set_widget_states()
+        self.names = self.filterwheel_manager.get_names()
 
-            self.names = self.filterwheel_manager.get_names()
+        self.ui.filterwheel_setting_filter_combobox.clear()
 
-            self.ui.filterwheel_setting_filter_combobox.clear()
+        for pos, name in enumerate(self.names):
+            self.ui.filterwheel_setting_filter_combobox.insertItem(pos, name)
 
-            for pos, name in enumerate(self.names):
-                self.ui.filterwheel_setting_filter_combobox.insertItem(pos, name)
+        curpos = self.filterwheel_manager.get_position()
+        self.ui.filterwheel_setting_filter_combobox.setCurrentIndex(curpos)
 
-            curpos = self.filterwheel_manager.get_position()
-            self.ui.filterwheel_setting_filter_combobox.setCurrentIndex(curpos)
+        self.poll.refresh()
 
     def filterwheel_disconnect(self):
-        if not self.filterwheel_manager.get_lock():
+        if not self.filterwheel_manager.get_lock('filterwheel_control'):
             logging.error('FilterWheelControlUI: filterwheel_disconnect : '
                           'could not get lock!')
             QtWidgets.QMessageBox.critical(None, 'Error', 'Filterwheel is busy',
@@ -136,11 +151,12 @@ class FilterWheelControlUI(QtWidgets.QWidget):
         self.filterwheel_manager.disconnect()
         self.set_widget_states()
         self.names = None
-        self.filterwheel_manager.release_lock()
+        self.poll.refresh()
+        self.filterwheel_manager.release_lock('filterwheel_control')
 
     def filterwheel_move(self):
         # try to lock filter wheel
-        if not self.filterwheel_manager.get_lock():
+        if not self.filterwheel_manager.get_lock('filterwheel_control'):
             logging.error('start_sequence: unable to get filter lock!')
             QtWidgets.QMessageBox.critical(None, 'Error', 'Filter is busy',
                                            QtWidgets.QMessageBox.Ok)
@@ -155,4 +171,5 @@ class FilterWheelControlUI(QtWidgets.QWidget):
         print('moving to filter pos ', newpos)
 
         self.filterwheel_manager.set_position(newpos)
-        self.filterwheel_manager.release_lock()
+        self.filterwheel_manager.release_lock('filterwheel_control')
+        self.poll.refresh()
@@ -17,10 +17,20 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import time
 import logging
-from functools import wraps
 from PyQt5 import QtCore
 
+from pyastroimageview.DeviceExecutor import submit_device_call
+from pyastroimageview.DeviceLock import DeviceLock, DeviceLockMixin, checklock
+
+# seconds to wait for the wheel to stop after a move
+# FIXME should this be a setting?
+MOVE_TIMEOUT = 15
+
+# seconds between checks whether the wheel is still moving
+MOVE_POLL_INTERVAL = 0.1
+
 class FilterManagerSignals(QtCore.QObject):
     """ Signals for camera state.
 
@@ -31,37 +41,14 @@ class FilterManagerSignals(QtCore.QObject):
     lock = QtCore.pyqtSignal(bool)
 
 #class FilterWheelManager(FilterWheel):
-class FilterWheelManager:
-    def checklock(method):
-        @wraps(method)
-        def wrapped(self, *args, **kwargs):
-            if self.lock.available() != 0:
-                logging.warning(f'FilterWheelManager: {method.__name__} '
-                                'called without a lock!')
-            return method(self, *args, **kwargs)
-        return wrapped
-
+class FilterWheelManager(DeviceLockMixin):
     def __init__(self, backend):
         super().__init__(backend)
 
-        self.lock = QtCore.QSemaphore(1)
+        self.lock = DeviceLock('filterwheel')
 
         self.signals = FilterManagerSignals()
 
-    def get_lock(self):
-        logging.debug(f'filter get_lock: {self.lock.available()}')
-        rc = self.lock.tryAcquire(1)
-        if rc:
-            self.signals.lock.emit(False)
-        return rc
-
-    def release_lock(self):
-        logging.debug(f'filter release lock: {self.lock.available()}')
-        rc = self.lock.release(1)
-        if rc:
-            self.signals.lock.emit(False)
-        return rc
-
     @checklock
     def disconnect(self):
         if super().is_connected():
@@ -88,6 +75,43 @@ class FilterWheelManager:
 
         return True
 
+    def move_to_name(self, name, callback, timeout=MOVE_TIMEOUT):
+        """
+        Move filter wheel to filter name without waiting.
+
+        callback is called on the GUI thread with the future of the move
+        once the wheel has stopped - see move_and_wait() for its result.
+        """
+        return submit_device_call(self, self.move_and_wait, name, timeout,
+                                  callback=callback, timeout=timeout+5)
+
+    def move_and_wait(self, name, timeout=MOVE_TIMEOUT):
+        """
+        Move filter wheel to filter name and wait for it to stop.
+
+        Runs on the executor thread of the filter wheel.
+
+        Returns
+        -------
+        float
+            Seconds the move took - 0 if already at the filter or None if
+            the move failed or the wheel kept moving.
+        """
+        moving = name != self.get_position_name()
+        wait_start = time.monotonic()
+
+        if not self.set_position_name(name):
+            logging.error('move_and_wait: unable to move filter wheel!')
+            return None
+
+        while time.monotonic() - wait_start < timeout:
+            if not self.is_moving():
+                return time.monotonic() - wait_start if moving else 0
+            time.sleep(MOVE_POLL_INTERVAL)
+
+        logging.error('move_and_wait: filter wheel kept moving!')
+        return None
+
     # override filter names so we can support user names vs name from driver
     def get_names(self):
         return self.user_names
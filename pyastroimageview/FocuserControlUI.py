@@ -19,16 +19,20 @@
 #
 import logging
 
-from PyQt5 import QtCore, QtWidgets
+from PyQt5 import QtWidgets
 
 from pyastroimageview.uic.focuser_settings_uic import Ui_focuser_settings_widget
 
 from pyastroimageview.ApplicationContainer import AppContainer
 
 from pyastroimageview.DeviceConfigurationUI import device_setup_ui
+from pyastroimageview.DeviceControlUI import PanelPollSubscription
 
 class FocuserControlUI(QtWidgets.QWidget):
 
+    # device this panel controls
+    DEVICE_NAME = 'focuser'
+
     #def __init__(self, focuser_manager, settings):
     def __init__(self):
         super().__init__()
@@ -70,10 +74,12 @@ class FocuserControlUI(QtWidgets.QWidget):
         # FIXME need a signal connection so we can track spinboxes and save
         # requested small and large step size persistently
 
-        # polling camera status
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.focuser_status_poll)
-        self.timer.start(1000)
+        # focuser status while panel is visible
+        self.poll = PanelPollSubscription(self, 'focuser', self.focuser_status_poll)
+
+        # devices can be connected before the panel is first shown
+        if self.focuser_manager.is_connected():
+            self.device_connected()
 
     def update_manager(self):
         self.focuser_manager = AppContainer.find('/dev/focuser')
@@ -96,14 +102,14 @@ class FocuserControlUI(QtWidgets.QWidget):
         self.ui.focuser_setting_moveabs_stop.setEnabled(connect)
         self.ui.focuser_setting_moveabs_spinbox.setEnabled(connect)
 
-    def focuser_status_poll(self):
+    def focuser_status_poll(self, status):
         status_string = ''
-        if self.focuser_manager.is_connected():
+        if status is not None:
             status_string += 'CONNECTED'
-            t = self.focuser_manager.get_current_temperature()
+            t = status['temperature']
             if t is not None:
                 status_string += f' {t: 4.1f} C'
-            if self.focuser_manager.is_moving():
+            if status['moving']:
                 status_string += ' MOVING'
             else:
                 status_string += ' IDLE'
@@ -112,11 +118,11 @@ class FocuserControlUI(QtWidgets.QWidget):
 
         self.ui.focuser_setting_status.setText(status_string)
 
-        if self.focuser_manager.is_connected():
-            pos = self.focuser_manager.get_absolute_position()
+        if status is not None:
+            pos = status['position']
             self.ui.focuser_setting_position.setText(f'{int(pos):05d}')
 
-            maxpos = self.focuser_manager.get_max_absolute_position()
+            maxpos = status['max_position']
             # FIXME If focuser does not return a max pos need better way to handle!
             if maxpos is None:
                 maxpos = 65000
@@ -166,28 +172,39 @@ class FocuserControlUI(QtWidgets.QWidget):
 
     def focuser_connect(self):
         if self.settings.focuser_driver:
-            rc = self.focuser_manager.connect(self.settings.focuser_driver)
-            if not rc:
-                QtWidgets.QMessageBox.critical(None, 'Error',
-                                               'Unable to connect to focuser!',
-                                               QtWidgets.QMessageBox.Ok)
-                return
+            self.ui.focuser_setting_connect.setEnabled(False)
+            AppContainer.find('/dev').connect_device('focuser', self.focuser_connected)
 
+    def focuser_connected(self, rc):
+        if not rc:
             self.set_widget_states()
+            QtWidgets.QMessageBox.critical(None, 'Error',
+                                           'Unable to connect to focuser!',
+                                           QtWidgets.QMessageBox.Ok)
+            return
 
-            maxpos = self.focuser_manager.get_max_absolute_position()
-            # FIXME If focuser doesnt return a maximum position
-            #       need a better way to inform user!
-            if maxpos is None:
-                maxpos = 65000
-            self.ui.focuser_setting_moveabs_spinbox.setMaximum(maxpos)
+        self.device_connected()
+
+    def device_connected(self):
+        """Set up panel from the focuser once it is connected"""
+        self.set_widget_states()
+
+        maxpos = self.focuser_manager.get_max_absolute_position()
+        # FIXME If focuser doesnt return a maximum position
+        #       need a better way to inform user!
+        if maxpos is None:
+            maxpos = 65000
+        self.ui.focuser_setting_moveabs_spinbox.setMaximum(maxpos)
+
+        curpos = self.focuser_manager.get_absolute_position()
+        self.ui.focuser_setting_moveabs_spinbox.setValue(curpos)
 
-            curpos = self.focuser_manager.get_absolute_position()
-            self.ui.focuser_setting_moveabs_spinbox.setValue(curpos)
+        self.poll.refresh()
 
     def focuser_disconnect(self):
         self.focuser_manager.disconnect()
         self.set_widget_states()
+        self.poll.refresh()
 
     def focuser_move_relative(self):
         small_step = self.ui.focuser_setting_small_spinbox.value()
@@ -210,10 +227,13 @@ class FocuserControlUI(QtWidgets.QWidget):
         newpos = self.focuser_manager.get_absolute_position() + delta
         newpos = max(0, newpos)
         self.focuser_manager.move_absolute_position(newpos)
+        self.poll.refresh()
 
     def focuser_move_absolute(self):
         newpos = self.ui.focuser_setting_moveabs_spinbox.value()
         self.focuser_manager.move_absolute_position(newpos)
+        self.poll.refresh()
 
     def focuser_move_stop(self):
         self.focuser_manager.stop()
+        self.poll.refresh()
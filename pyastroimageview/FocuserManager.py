@@ -19,11 +19,15 @@
 #
 import logging
 
+from pyastroimageview.DeviceLock import DeviceLock, DeviceLockMixin
 
-class FocuserManager:
+
+class FocuserManager(DeviceLockMixin):
     def __init__(self, backend):
         super().__init__(backend)
 
+        self.lock = DeviceLock('focuser')
+
     def connect(self, driver):
         if not super().is_connected():
             try:
@@ -0,0 +1,415 @@
+#
+# Catalog of written frames
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Every frame written by a sequence or an RPC client is recorded in an
+# SQLite database along with the header cards people search on, a few
+# statistics of the image and how long it took to write.  Finding all the
+# 300s Ha frames of a target colder than -10C is then an indexed query
+# instead of opening every FITS file.
+#
+# Measured sequence overheads (download, dither settle, filter moves) are
+# kept in their own table so sequence durations can be predicted from how
+# a rig really behaves.
+#
+# Frames are added from the image writer threads so the connection is
+# shared and guarded by a lock.  The database uses write-ahead logging so
+# the command line tool can query it while the program is writing.
+#
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from pyastroimageview.ImageStatistics import ImageStatistics
+
+SCHEMA_VERSION = 2
+
+# (column, FITS keywords, type) of header cards stored in their own column
+# the first keyword present is used
+HEADER_COLUMNS = [('object', ['OBJECT'], str),
+                  ('filter', ['FILTER'], str),
+                  ('imagetyp', ['IMAGETYP'], str),
+                  ('exposure', ['EXPOSURE', 'EXPTIME'], float),
+                  ('ccd_temp', ['CCD-TEMP'], float),
+                  ('set_temp', ['SET-TEMP'], float),
+                  ('xbinning', ['XBINNING'], int),
+                  ('gain', ['CCD_GAIN', 'GAIN'], float),
+                  ('instrument', ['INSTRUME'], str),
+                  ('date_obs', ['DATE-OBS'], str)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    source TEXT,
+    output_format TEXT,
+    written REAL,
+    object TEXT,
+    filter TEXT,
+    imagetyp TEXT,
+    exposure REAL,
+    ccd_temp REAL,
+    set_temp REAL,
+    xbinning INTEGER,
+    gain REAL,
+    instrument TEXT,
+    date_obs TEXT,
+    width INTEGER,
+    height INTEGER,
+    median REAL,
+    mad REAL,
+    hfr REAL,
+    file_size INTEGER,
+    write_s REAL,
+    header TEXT
+);
+CREATE INDEX IF NOT EXISTS frames_object ON frames (object, filter, exposure);
+CREATE INDEX IF NOT EXISTS frames_filter ON frames (filter, exposure);
+CREATE INDEX IF NOT EXISTS frames_date_obs ON frames (date_obs);
+CREATE INDEX IF NOT EXISTS frames_imagetyp ON frames (imagetyp, exposure);
+CREATE INDEX IF NOT EXISTS frames_ccd_temp ON frames (ccd_temp);
+CREATE INDEX IF NOT EXISTS frames_hfr ON frames (hfr);
+CREATE TABLE IF NOT EXISTS overheads (
+    id INTEGER PRIMARY KEY,
+    rig TEXT,
+    kind TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    time REAL
+);
+CREATE INDEX IF NOT EXISTS overheads_rig_kind ON overheads (rig, kind, time);
+"""
+
+# columns returned by query() unless the header is asked for
+SUMMARY_COLUMNS = ['id', 'path', 'source', 'output_format', 'written'] \
+    + [c[0] for c in HEADER_COLUMNS] \
+    + ['width', 'height', 'median', 'mad', 'hfr', 'file_size', 'write_s']
+
+
+def _card_value(header, keywords, kind):
+    for keyword in keywords:
+        value = header.get(keyword, None)
+        if value is None:
+            continue
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _header_json(header):
+    cards = {}
+    for card in header.cards:
+        if not card.keyword or card.keyword in ('COMMENT', 'HISTORY'):
+            continue
+        value = card.value
+        if not isinstance(value, (str, int, float, bool)):
+            value = str(value)
+        cards[card.keyword] = value
+    return json.dumps(cards)
+
+
+class FrameCatalog:
+    """
+    SQLite catalog of written frames.
+
+    Parameters
+    ----------
+    path : str
+        Database filename.  It is created if needed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def add_frame(self, path, image, source=None, output_format=None,
+                  write_s=None, stats=None):
+        """
+        Record a frame which has been written.
+
+        Parameters
+        ----------
+        path : str
+            Filename the frame was written to.
+        image : FITSImage
+            The frame.
+        source : str
+            What wrote it - 'sequence' or 'rpc'.
+        output_format : str
+            Key of ImageWriter.OUTPUT_FORMATS used.
+        write_s : float
+            Seconds it took to write.
+        stats : ImageStatistics
+            Statistics of the image data if already computed.
+
+        Returns
+        -------
+        int
+            Row id of frame.
+        """
+        return self.add_header(path, image.hdulist[0].header, image.image_data(),
+                               source=source, output_format=output_format,
+                               write_s=write_s, stats=stats)
+
+    def add_file(self, path, source='import'):
+        """
+        Record an existing FITS file.
+
+        Returns
+        -------
+        int
+            Row id of frame or None if file has no image.
+        """
+        from astropy.io import fits
+
+        with fits.open(path) as hdul:
+            for hdu in hdul:
+                if hdu.is_image and hdu.data is not None:
+                    return self.add_header(path, hdu.header, hdu.data,
+                                           source=source, output_format='fits')
+        return None
+
+    def add_header(self, path, header, data, source=None, output_format=None,
+                   write_s=None, stats=None):
+        """Record a frame from its FITS header and data"""
+        path = os.path.abspath(path)
+
+        if stats is None:
+            stats = ImageStatistics(data)
+
+        try:
+            file_size = os.path.getsize(path)
+        except OSError:
+            file_size = None
+
+        row = {'path': path,
+               'source': source,
+               'output_format': output_format,
+               'written': time.time(),
+               'width': data.shape[-1],
+               'height': data.shape[-2],
+               'median': stats.median(),
+               'mad': stats.mad(),
+               'file_size': file_size,
+               'write_s': write_s,
+               'header': _header_json(header)}
+
+        for column, keywords, kind in HEADER_COLUMNS:
+            row[column] = _card_value(header, keywords, kind)
+
+        columns = ', '.join(row.keys())
+        marks = ', '.join(['?'] * len(row))
+        with self.lock:
+            cur = self.conn.execute(f'INSERT OR REPLACE INTO frames ({columns}) '
+                                    f'VALUES ({marks})', list(row.values()))
+            self.conn.commit()
+            rowid = cur.lastrowid
+
+        logging.debug(f'FrameCatalog: added {path} as {rowid}')
+
+        return rowid
+
+    def set_hfr(self, path, hfr):
+        """
+        Store the measured HFR of a frame.
+
+        Returns
+        -------
+        bool
+            False if frame isn't in the catalog.
+        """
+        with self.lock:
+            cur = self.conn.execute('UPDATE frames SET hfr=? WHERE path=?',
+                                    (hfr, os.path.abspath(path)))
+            self.conn.commit()
+            return cur.rowcount > 0
+
+    def query(self, object=None, filter=None, imagetyp=None, exposure=None,
+              min_temp=None, max_temp=None, max_hfr=None, since=None,
+              until=None, path_like=None, limit=None, with_header=False):
+        """
+        Find frames.
+
+        Only the conditions given are used.  Strings are matched exactly
+        unless they contain the SQL wildcard %.
+
+        Parameters
+        ----------
+        object, filter, imagetyp : str
+            Header values to match.
+        exposure : float
+            Exposure in seconds.
+        min_temp, max_temp : float
+            Range of sensor temperature.
+        max_hfr : float
+            Largest HFR - frames without a measured HFR are excluded.
+        since, until : str
+            Range of DATE-OBS as ISO 8601 strings - a date works too.
+        path_like : str
+            SQL LIKE pattern for path.
+        limit : int
+            Most frames to return.
+        with_header : bool
+            Include full FITS header as a dict.
+
+        Returns
+        -------
+        list
+            A dict for each frame ordered by DATE-OBS.
+        """
+        where = []
+        params = []
+
+        for column, value in [('object', object), ('filter', filter),
+                              ('imagetyp', imagetyp), ('path', path_like)]:
+            if value is None:
+                continue
+            if '%' in value or column == 'path':
+                where.append(f'{column} LIKE ?')
+            else:
+                where.append(f'{column} = ?')
+            params.append(value)
+
+        if exposure is not None:
+            where.append('exposure BETWEEN ? AND ?')
+            params += [exposure - 0.0005, exposure + 0.0005]
+        if min_temp is not None:
+            where.append('ccd_temp >= ?')
+            params.append(min_temp)
+        if max_temp is not None:
+            where.append('ccd_temp <= ?')
+            params.append(max_temp)
+        if max_hfr is not None:
+            where.append('hfr <= ?')
+            params.append(max_hfr)
+        if since is not None:
+            where.append('date_obs >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('date_obs <= ?')
+            params.append(until)
+
+        columns = SUMMARY_COLUMNS + (['header'] if with_header else [])
+        sql = f'SELECT {", ".join(columns)} FROM frames'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY date_obs, id'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        result = []
+        for row in rows:
+            frame = dict(row)
+            if with_header:
+                frame['header'] = json.loads(frame['header'])
+            result.append(frame)
+
+        return result
+
+    def summary(self):
+        """
+        Return totals per object, filter, type and exposure.
+
+        Returns
+        -------
+        list
+            A dict for each group with the number of frames and total
+            exposure.
+        """
+        sql = 'SELECT object, filter, imagetyp, exposure, COUNT(*) AS frames, ' \
+              'SUM(exposure) AS total_exposure FROM frames ' \
+              'GROUP BY object, filter, imagetyp, exposure ' \
+              'ORDER BY object, filter, imagetyp, exposure'
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql).fetchall()]
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM frames').fetchone()[0]
+
+    def remove(self, path):
+        """Remove frame from catalog - returns False if not present"""
+        with self.lock:
+            cur = self.conn.execute('DELETE FROM frames WHERE path=?',
+                                    (os.path.abspath(path),))
+            self.conn.commit()
+            return cur.rowcount > 0
+
+    def add_overhead(self, rig, kind, seconds):
+        """Record a measured overhead - kind is 'download', 'dither', etc"""
+        with self.lock:
+            self.conn.execute('INSERT INTO overheads (rig, kind, seconds, time) '
+                              'VALUES (?, ?, ?, ?)',
+                              (rig, kind, seconds, time.time()))
+            self.conn.commit()
+
+    def get_overheads(self, rig, kind, limit=200):
+        """Return most recent measured overheads of kind for rig oldest first"""
+        with self.lock:
+            rows = self.conn.execute('SELECT seconds FROM overheads '
+                                     'WHERE rig IS ? AND kind=? '
+                                     'ORDER BY time DESC LIMIT ?',
+                                     (rig, kind, int(limit))).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def prune_missing(self):
+        """
+        Remove frames whose files no longer exist.
+
+        Returns
+        -------
+        list
+            Paths removed.
+        """
+        with self.lock:
+            paths = [row[0] for row in self.conn.execute('SELECT path FROM frames')]
+
+        missing = [p for p in paths if not os.path.exists(p)]
+
+        with self.lock:
+            self.conn.executemany('DELETE FROM frames WHERE path=?',
+                                  [(p,) for p in missing])
+            self.conn.commit()
+
+        return missing
@@ -19,9 +19,6 @@
 #
 import logging
 
-from astropy import units as u
-from astropy.coordinates import Angle
-
 from PyQt5 import QtWidgets
 
 from pyastroimageview.uic.general_settings_uic import Ui_GeneralSettingsDialog
@@ -49,6 +46,10 @@ class GeneralSettingsDialog(QtWidgets.QDialog):
         self.ui.sequence_targetdir.setPlainText(target_dir)
 
     def run(self, settings):
+        # astropy is slow to import so wait until the dialog is used
+        from astropy import units as u
+        from astropy.coordinates import Angle
+
         self.ui.telescope_description.setPlainText(settings.telescope_description)
         self.ui.location_name.setPlainText(settings.location_name)
         self.ui.observer_notes.setPlainText(settings.observer_notes)
@@ -0,0 +1,196 @@
+#
+# Guide step telemetry
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# PHD2 sends a GuideStep event for every guide frame (1-10 Hz).  The steps
+# are kept in a fixed size ring buffer so the guiding during any exposure
+# can be summarized when the frame is downloaded.
+#
+# Each field is one row of a (NFIELDS, capacity) array so a column like
+# the timestamps is contiguous.  Appending writes one column and moves the
+# head so it never allocates.  Steps arrive in time order so the buffer
+# is at most two sorted runs (before and after the head) and a window is
+# found with a binary search of each.
+#
+# RMS is the standard deviation about the mean like PHD2 reports so a
+# constant offset of the guide star does not count.  Distances are in
+# guide camera pixels and converted to arcsec if the pixel scale is known.
+#
+import time
+
+import numpy as np
+
+# rows of the ring buffer
+TIME = 0
+RA_DIST = 1
+DEC_DIST = 2
+RA_PULSE = 3
+DEC_PULSE = 4
+SNR = 5
+NFIELDS = 6
+
+# sign of the guide pulse for each PHD2 direction
+PULSE_SIGN = {'West': 1, 'North': 1, 'East': -1, 'South': -1}
+
+
+class GuideStepBuffer:
+    """
+    Ring buffer of PHD2 guide steps.
+
+    Parameters
+    ----------
+    capacity : int
+        Number of steps kept - the default holds ~1.8 hours at 10 Hz.
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.data = np.zeros((NFIELDS, capacity))
+        self.head = 0
+        self.count = 0
+
+        # times of StarLost events - rare so a plain list is fine
+        self.star_lost = []
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.star_lost = []
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, ra_dist, dec_dist, ra_pulse=0.0, dec_pulse=0.0,
+               snr=0.0):
+        """
+        Add a guide step.
+
+        Parameters
+        ----------
+        timestamp : float
+            Unix time of the step.
+        ra_dist, dec_dist : float
+            Guide star offset from lock position in guide pixels.
+        ra_pulse, dec_pulse : float
+            Correction in ms - positive is West/North.
+        snr : float
+            Guide star SNR.
+        """
+        col = self.data[:, self.head]
+        col[TIME] = timestamp
+        col[RA_DIST] = ra_dist
+        col[DEC_DIST] = dec_dist
+        col[RA_PULSE] = ra_pulse
+        col[DEC_PULSE] = dec_pulse
+        col[SNR] = snr
+
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def append_event(self, event):
+        """Add a guide step from a PHD2 GuideStep event dictionary"""
+        ra_pulse = event.get('RADuration', 0) * PULSE_SIGN.get(event.get('RADirection'), 0)
+        dec_pulse = event.get('DECDuration', 0) * PULSE_SIGN.get(event.get('DECDirection'), 0)
+        self.append(event.get('Timestamp', time.time()),
+                    event.get('RADistanceRaw', 0.0),
+                    event.get('DECDistanceRaw', 0.0),
+                    ra_pulse, dec_pulse,
+                    event.get('SNR', 0.0))
+
+    def add_star_lost(self, timestamp):
+        self.star_lost.append(timestamp)
+
+        # forget events older than the oldest step kept
+        if self.count == self.capacity and len(self.star_lost) > 1000:
+            oldest = self.data[TIME, self.head]
+            self.star_lost = [t for t in self.star_lost if t >= oldest]
+
+    def window(self, start, end):
+        """
+        Return (NFIELDS, n) array of the steps with start <= time <= end.
+
+        Only the steps in the window are copied.
+        """
+        if self.count < self.capacity:
+            runs = [self.data[:, :self.count]]
+        else:
+            runs = [self.data[:, self.head:], self.data[:, :self.head]]
+
+        parts = []
+        for run in runs:
+            times = run[TIME]
+            lo = np.searchsorted(times, start, side='left')
+            hi = np.searchsorted(times, end, side='right')
+            if hi > lo:
+                parts.append(run[:, lo:hi])
+
+        if not parts:
+            return np.empty((NFIELDS, 0))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts, axis=1)
+
+    def stats(self, start, end, pixel_scale=None):
+        """
+        Summarize guiding between start and end.
+
+        Parameters
+        ----------
+        start, end : float
+            Unix times of window.
+        pixel_scale : float
+            Guide camera arcsec per pixel - distances are in pixels if None.
+
+        Returns
+        -------
+        dict
+            Number of steps, RA/Dec/total RMS, RA/Dec peak error, mean
+            absolute corrections (ms), mean SNR, number of star lost
+            events and the units of the distances.
+        """
+        steps = self.window(start, end)
+        n = steps.shape[1]
+        scale = pixel_scale if pixel_scale else 1.0
+
+        star_lost = sum(1 for t in self.star_lost if start <= t <= end)
+
+        result = {'start': start,
+                  'end': end,
+                  'steps': n,
+                  'star_lost': star_lost,
+                  'units': 'arcsec' if pixel_scale else 'pixels'}
+
+        if n == 0:
+            return result
+
+        ra = steps[RA_DIST] * scale
+        dec = steps[DEC_DIST] * scale
+        ra_rms = float(ra.std())
+        dec_rms = float(dec.std())
+
+        result.update({'ra_rms': ra_rms,
+                       'dec_rms': dec_rms,
+                       'total_rms': float(np.hypot(ra_rms, dec_rms)),
+                       'ra_peak': float(np.abs(ra).max()),
+                       'dec_peak': float(np.abs(dec).max()),
+                       'ra_pulse': float(np.abs(steps[RA_PULSE]).mean()),
+                       'dec_pulse': float(np.abs(steps[DEC_PULSE]).mean()),
+                       'snr': float(steps[SNR].mean())})
+
+        return result
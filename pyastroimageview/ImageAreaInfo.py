@@ -25,6 +25,7 @@ import pyqtgraph as pg
 from PyQt5 import QtCore, QtWidgets, QtGui
 
 from pyastroimageview.uic.imagearea_info_uic import Ui_Form
+from pyastroimageview.ImageStatistics import ImageStatistics
 
 class ImageAreaInfo(QtWidgets.QWidget):
     view_changed = QtCore.pyqtSignal(int)
@@ -136,19 +137,24 @@ class ImageAreaInfo(QtWidgets.QWidget):
         if image_doc.image_data is not None:
             logging.info('update_info: Start perc calc')
 
-            # subsample to speed up calcs
-            sub_image_data = image_doc.image_data[1::2, 1::2]
+            # percentiles and histogram come from the pixel histogram which
+            # is one pass over the data so the full frame can be used
+            stats = getattr(image_doc, 'stats', None)
+            if stats is None:
+                stats = ImageStatistics(image_doc.image_data)
+                image_doc.stats = stats
 
-            logging.info(f'image_data.shape = {image_doc.image_data.shape} sub_image_data.shape={sub_image_data.shape}')
+            logging.info(f'image_data.shape = {image_doc.image_data.shape} '
+                         f'dtype = {image_doc.image_data.dtype}')
 
             # plot between 0 and 99 percentile
             if not hasattr(image_doc, 'perc01'):
-                image_doc.perc01 = np.percentile(sub_image_data, 1)
+                image_doc.perc01 = stats.percentile(1)
             if not hasattr(image_doc, 'perc99'):
-                image_doc.perc99 = np.percentile(sub_image_data, 99)
+                image_doc.perc99 = stats.percentile(99)
             logging.info('update_info: End perc calc')
 
-            py, px = np.histogram(sub_image_data, range=(image_doc.perc01, image_doc.perc99), bins=100)
+            py, px = stats.histogram(image_doc.perc01, image_doc.perc99, bins=100)
             self.ui.pixel_histogram.plotItem.clear()
             curve = pg.PlotCurveItem(px, py, stepMode=True, fillLevel=0, brush=(0, 0, 255, 80))
             self.ui.pixel_histogram.plotItem.addItem(curve)
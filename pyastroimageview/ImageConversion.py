@@ -0,0 +1,129 @@
+#
+# Conversion of downloaded camera data
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Backends hand back image data in different forms.  ASCOM ImageArray is
+# int32 indexed [x][y] (column-major relative to how FITS and numpy want
+# it) and may still be a nested sequence, INDI gives a FITS image which is
+# already row-major but may be wider than the sensor needs.
+#
+# convert_image_data() turns any of these into a C-contiguous row-major
+# array of the narrowest unsigned type that holds the sensor bit depth.
+# Whether the data is [x][y] can't be told from its shape (a square frame
+# looks the same either way) so the caller says so with column_major
+# based on which backend the data came from.
+# The transpose and narrowing happen in a single copy into the output
+# array so a 60 MP frame doesn't need several full size temporaries.
+#
+import time
+import logging
+
+import numpy as np
+
+
+def dtype_for_bit_depth(bit_depth):
+    """
+    Return numpy dtype to store data from a sensor with the given bit depth.
+
+    Returns None if bit depth is unknown or too large to narrow.
+    """
+    if bit_depth is None:
+        return None
+    if bit_depth <= 8:
+        return np.dtype(np.uint8)
+    if bit_depth <= 16:
+        return np.dtype(np.uint16)
+    return None
+
+
+def bit_depth_from_max_adu(max_adu):
+    """Return bit depth needed to hold max_adu or None if unknown"""
+    if max_adu is None or max_adu <= 0:
+        return None
+    return int(max_adu).bit_length()
+
+
+def fits_in_dtype(data, dtype):
+    """Return True if all values of data can be stored in integer dtype"""
+    if data.size == 0:
+        return True
+    info = np.iinfo(dtype)
+    return data.min() >= info.min and data.max() <= info.max
+
+
+def convert_image_data(data, column_major=False, bit_depth=None):
+    """
+    Convert image data from a backend to a row-major array.
+
+    Parameters
+    ----------
+    data : numpy array or nested sequence
+        Image data as returned by the backend.
+    column_major : bool
+        True if data is indexed [x][y] like ASCOM ImageArray.  It is
+        then transposed whatever its shape.
+    bit_depth : int
+        Bit depth of sensor if known.  If not given integer data is
+        narrowed to uint16 only if all values fit.
+
+    Returns
+    -------
+    numpy array
+        C-contiguous array with shape (height, width).
+    """
+    t0 = time.perf_counter()
+
+    target = dtype_for_bit_depth(bit_depth)
+
+    if not isinstance(data, np.ndarray):
+        # nested sequence (ASCOM via COM) - parse straight into the
+        # narrow type if we know it and otherwise as the backend gives it
+        try:
+            data = np.array(data, dtype=target)
+        except OverflowError:
+            logging.warning(f'convert_image_data: values exceed bit depth {bit_depth}')
+            data = np.array(data)
+
+    if data.ndim != 2:
+        # color or odd shaped data is passed through untouched
+        return data
+
+    if column_major:
+        data = data.T
+
+    if target is None:
+        if data.dtype.kind in 'iu' and data.dtype.itemsize > 2 \
+           and fits_in_dtype(data, np.uint16):
+            target = np.dtype(np.uint16)
+        else:
+            target = data.dtype
+
+    if data.dtype == target and data.flags.c_contiguous:
+        return data
+
+    # one pass does both transpose and narrowing
+    out = np.empty(data.shape, dtype=target)
+    if data.dtype.kind == 'f' and target.kind in 'iu':
+        np.rint(data, out=out, casting='unsafe')
+    else:
+        np.copyto(out, data, casting='unsafe')
+
+    logging.debug(f'convert_image_data: {data.dtype} {data.shape} -> '
+                  f'{out.dtype} in {(time.perf_counter()-t0)*1000:.1f} ms')
+
+    return out
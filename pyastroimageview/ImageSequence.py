@@ -33,6 +33,41 @@ class FrameType(Enum):
         pretty = ['Bias', 'Dark', 'Flat', 'Light']
         return pretty[self.value]
 
+def dither_due(start_index, number_frames, num_dither, current_index):
+    """Returns True if a dither is due before taking frame current_index
+
+    FIXME currently we just use a modulus of the 'n frames' dither param
+    If the user somehow messes with image indexes to skip frame numbers, etc
+    then the dithering may not work out correctly but for a sequenentially
+    numbered sequence of frames it will do what we want and that is almost
+    always the use case!
+    """
+    # never before the first frame of the run
+    if num_dither < 1 or current_index <= start_index:
+        return False
+
+    num_frames = current_index - start_index
+    num_left = start_index + number_frames - current_index
+
+    if num_dither == 1:
+        return True
+    elif num_frames > 1 and num_left >= num_dither:
+        return (current_index % num_dither) == 0
+
+    return False
+
+def count_dithers(start_index, number_frames, num_dither, dither_range=None):
+    """Returns number of dithers a sequence of light frames will do
+
+    A dither before the first frame is counted if the sequence starts part
+    way into dither_range like an interleaved plan step.
+    """
+    if dither_range is None:
+        dither_range = (start_index, number_frames)
+    # no dither after the last frame
+    return sum(dither_due(*dither_range, num_dither, idx)
+               for idx in range(start_index, start_index + number_frames))
+
 class ImageSequence:
     def __init__(self, device_manager):
         self.name = 'Object'
@@ -49,11 +84,55 @@ class ImageSequence:
         self.roi = None
         self.device_manager = device_manager
         self.target_dir = ''
+        # key of ImageWriter.OUTPUT_FORMATS
+        self.output_format = 'fits'
+        # (start index, number frames) dither cadence is based on if the
+        # sequence is part of a longer run of frames like a plan step
+        self.dither_range = None
+
+    def get_settings(self):
+        """Return dictionary of the settings describing the sequence"""
+        return {'name': self.name,
+                'name_elements': self.name_elements,
+                'start_index': self.start_index,
+                'number_frames': self.number_frames,
+                'filter': self.filter,
+                'frame_type': self.frame_type.name,
+                'exposure': self.exposure,
+                'binning': self.binning,
+                'camera_gain': self.camera_gain,
+                'num_dither': self.num_dither,
+                'roi': list(self.roi) if self.roi is not None else None,
+                'target_dir': self.target_dir,
+                'output_format': self.output_format}
+
+    def set_settings(self, settings):
+        """Restore settings from get_settings() - unknown keys are ignored"""
+        for key, value in settings.items():
+            if key == 'frame_type':
+                value = FrameType[value]
+            elif key == 'roi' and value is not None:
+                value = tuple(value)
+            elif not hasattr(self, key):
+                logging.warning(f'ImageSequence: ignoring unknown setting {key}')
+                continue
+            setattr(self, key, value)
 
     def is_light_frames(self):
         """Returns True if sequence is of 'Light' frames versus calibration frames"""
         return self.frame_type == FrameType.LIGHT
 
+    def is_dither_due(self):
+        """Returns True if a dither is due before taking the current frame"""
+        if not self.is_light_frames():
+            return False
+        if self.dither_range is not None:
+            start_index, number_frames = self.dither_range
+        else:
+            start_index, number_frames = self.start_index, self.number_frames
+        return dither_due(start_index, number_frames,
+                          self.num_dither, self.current_index)
+
     def get_filename(self, start_time=None):
         """Creates of a filename for files of a sequence
 
@@ -98,9 +177,13 @@ class ImageSequence:
         if self.device_manager.camera.is_connected():
             tempc = self.device_manager.camera.get_current_temperature()
             temps = self.device_manager.camera.get_target_temperature()
+            binning = self.device_manager.camera.get_binning()
+            # None if the driver didn't answer
+            if tempc is None:
+                tempc = -15
             if temps is None:
                 temps = -15
-            binx, _ = self.device_manager.camera.get_binning()
+            binx = binning[0] if binning is not None else 1
         else:
             tempc = -15
             temps = -15
@@ -155,6 +238,8 @@ class ImageSequence:
             f'num_dither = {self.num_dither}\n' + \
             f'roi = {self.roi}\n' + \
             f'device manager = {self.device_manager}\n' + \
-            f'target dir = {self.target_dir}\n'
+            f'target dir = {self.target_dir}\n' + \
+            f'output format = {self.output_format}\n' + \
+            f'dither range = {self.dither_range}\n'
 
         return s
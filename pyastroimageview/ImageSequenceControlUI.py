@@ -19,22 +19,22 @@
 #
 import sys
 import logging
-import math
 import os.path
 import time
 
-from astropy import units as u
-from astropy.coordinates import AltAz
-from astropy.coordinates import Angle
-from astropy.coordinates import SkyCoord
-from astropy.time import Time
-
 from PyQt5 import QtWidgets, QtGui, QtCore
 
 from pyastroimageview.ApplicationContainer import AppContainer
 from pyastroimageview.CameraManager import CameraState, CameraSettings
 from pyastroimageview.CameraSetROIControlUI import CameraSetROIDialog
 from pyastroimageview.ImageSequence import ImageSequence, FrameType
+from pyastroimageview.ImageWriter import OUTPUT_FORMATS, output_filename
+from pyastroimageview.PHD2Manger import DitherState
+from pyastroimageview.SequenceJournal import SequenceJournal
+from pyastroimageview.SequencePlan import (load_plan, PlanScheduler, PlanStep,
+                                           SequencePlan, ExposureGroup, SequenceOverheads,
+                                           estimate_plan, format_schedule)
+from pyastroimageview.SequenceEstimator import DurationEstimator, format_prediction
 from pyastroimageview.uic.sequence_settings_uic import Ui_SequenceSettingsUI
 from pyastroimageview.uic.sequence_title_help_uic import Ui_SequenceTitleHelpWindow
 
@@ -73,6 +73,9 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         self.phd2_manager.signals.guiding_stop.connect(self.phd2_guiding_stop_event)
         self.phd2_manager.signals.dither_settledone.connect(self.phd2_dither_settledone_event)
         self.phd2_manager.signals.dither_timeout.connect(self.phd2_dither_timeout_event)
+        self.phd2_manager.signals.dither_failed.connect(self.phd2_dither_failed_event)
+        self.phd2_manager.signals.dither_state_changed.connect(self.phd2_dither_state_event)
+        self.phd2_manager.signals.dither_settling.connect(self.phd2_dither_settling_event)
 
         self.sequence = ImageSequence(self.device_manager)
 
@@ -84,6 +87,44 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         settings = AppContainer.find('/program_settings')
         self.sequence.name_elements = settings.sequence_elements
         self.sequence.target_dir = settings.sequence_targetdir
+        if settings.sequence_output_format in OUTPUT_FORMATS:
+            self.sequence.output_format = settings.sequence_output_format
+        for key, (desc, _, _) in OUTPUT_FORMATS.items():
+            self.ui.sequence_output_format.addItem(desc, key)
+
+        # frames are written in the background so the next exposure can
+        # start while the last one is compressed
+        self.image_writer = AppContainer.find('/image_writer')
+        self.image_writer.signals.written.connect(self.image_written)
+
+        # index of each frame submitted but not yet written keyed by filename
+        self.pending_frames = {}
+
+        # journal of running sequence so it can be resumed after a crash
+        self.journal = SequenceJournal(settings.get_sequence_journal_path())
+        # settings of sequence restored from journal until it is started
+        self.resume_settings = None
+
+        # steps of a loaded plan not run yet and the one running
+        self.plan = None
+        self.plan_steps = []
+        self.plan_step = None
+
+        # overheads are measured as frames are taken to predict end time
+        self.estimator = DurationEstimator(AppContainer.get('/frame_catalog'),
+                                           defaults=SequenceOverheads.from_settings(settings))
+        if self.device_manager.camera.is_connected():
+            self.estimator.set_rig(self.device_manager.camera.get_camera_name())
+        self.exposure_start_time = None
+        self.dither_start_time = None
+        self.prediction = None
+
+        # shown in status while waiting on a dither to settle
+        self.dither_progress = None
+
+        # set while waiting on the filter wheel - see move_filterwheel()
+        self.filter_move = None
+
         self.reset_roi()
         self.update_ui()
 
@@ -100,7 +141,9 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         self.ui.sequence_dither.valueChanged.connect(self.values_changed)
         self.ui.sequence_start.valueChanged.connect(self.values_changed)
         self.ui.sequence_filter.currentIndexChanged.connect(self.values_changed)
+        self.ui.sequence_output_format.currentIndexChanged.connect(self.values_changed)
         self.ui.sequence_start_stop.pressed.connect(self.start_sequence)
+        self.ui.sequence_plan.pressed.connect(self.load_plan)
 
         # FIXME Disabling for now since under ASCOM setting gain for ASI cameras
         #       does not seem to work reliably
@@ -131,6 +174,9 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
 
         self.show()
 
+        # offer to resume once the main window is up
+        QtCore.QTimer.singleShot(0, self.check_journal)
+
         # polling filterwheel status
 #        self.timer = QtCore.QTimer()
 #        self.timer.timeout.connect(self.filterwheel_status_poll)
@@ -156,6 +202,7 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         self.ui.sequence_dither.setEnabled(val)
         self.ui.sequence_roi_set.setEnabled(val)
         self.ui.sequence_filter.setEnabled(val)
+        self.ui.sequence_output_format.setEnabled(val)
 
     def camera_lock_handler(self, val):
         logging.debug('camera_lock_handler')
@@ -165,6 +212,8 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         self.set_widget_states()
 
         if val:
+            self.estimator.set_rig(self.device_manager.camera.get_camera_name())
+
             maxbin = self.device_manager.camera.get_max_binning()
             # FIXME need better way to handle maxbin being unavailable!
             if maxbin is None:
@@ -208,6 +257,9 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         self.set_widget_states()
 
         if val:
+            # filling in combobox changes sequence filter
+            wanted_filter = self.sequence.filter
+
             # fill in filter wheel
             filter_names = self.device_manager.filterwheel.get_names()
 
@@ -215,10 +267,15 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
             for idx, n in enumerate(filter_names, start=0):
                 self.ui.sequence_filter.insertItem(idx, n)
 
-            curpos = self.device_manager.filterwheel.get_position()
-            self.ui.sequence_filter.setCurrentIndex(curpos)
+            # keep filter of a resumed sequence
+            if wanted_filter in filter_names:
+                self.ui.sequence_filter.setCurrentIndex(filter_names.index(wanted_filter))
+            else:
+                curpos = self.device_manager.filterwheel.get_position()
+                self.ui.sequence_filter.setCurrentIndex(curpos)
 
     def binning_changed(self, newbin):
+        self.sequence.binning = newbin
         self.device_manager.camera.set_binning(newbin, newbin)
         self.reset_roi()
 
@@ -233,8 +290,9 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         if self.device_manager.camera.is_connected():
             settings = self.device_manager.camera.get_camera_settings()
 
-            maxx = int(settings.frame_width / settings.binning)
-            maxy = int(settings.frame_height / settings.binning)
+            # full frame at the binning the sequence will use
+            maxx = int(settings.frame_width / self.sequence.binning)
+            maxy = int(settings.frame_height / self.sequence.binning)
 
             self.sequence.roi = (0, 0, maxx, maxy)
 
@@ -275,7 +333,9 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
             status_string += 'DISCONNECTED'
         if status.connected:
             if self.exposure_ongoing:
-                if status.state is CameraState.EXPOSING:
+                if self.dither_progress is not None:
+                    perc_string = self.dither_progress
+                elif status.state is CameraState.EXPOSING:
                     perc = min(100, status.exposure_progress)
                     perc_string = f'EXPOSING {perc:.0f}% ' \
                                   + f'{perc/100.0 * self.sequence.exposure:.2f}s ' \
@@ -290,6 +350,8 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
             if self.exposure_ongoing:
                 stop_idx = self.sequence.start_index + self.sequence.number_frames - 1
                 status_string += f' RUNNING Frame {self.sequence.current_index}/{stop_idx}'
+                if self.prediction is not None:
+                    status_string += ' ' + format_prediction(self.prediction)
 
         self.ui.sequence_status_label.setText(status_string)
 
@@ -348,54 +410,101 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         else:
              logging.error('phd2_guiding_stop_event: ignoring based on program settings')
 
-    def phd2_dither_settledone_event(self):
-        logging.info('phd2_dither_settledone event received')
+    def phd2_dither_settledone_event(self, ok):
+        logging.info(f'phd2_dither_settledone event received - ok = {ok}')
 
-        if not self.exposure_ongoing:
-            logging.error('phd2_dither_settledone_event: no exposure ongoing ignoring')
+        if not self.exposure_ongoing or self.dither_start_time is None:
+            logging.error('phd2_dither_settledone_event: no dither ongoing ignoring')
             return
 
+        if not ok:
+            # PHD2 gave up settling
+            self.dither_failed('failed to settle')
+            return
+
+        self.dither_finished()
+
         # start next exposure
-        self.device_manager.camera.start_exposure(self.sequence.exposure)
+        self.start_exposure()
+        self.update_prediction()
 
     def phd2_dither_timeout_event(self):
         logging.info('phd2_dither_timeout event received')
+        self.dither_failed('did not settle in time')
 
-        if not self.exposure_ongoing:
-            logging.error('phd2_dither_timeout_event: no exposure ongoing ignoring')
+    def phd2_dither_failed_event(self, reason):
+        logging.info(f'phd2_dither_failed event received - {reason}')
+        self.dither_failed(reason)
+
+    def phd2_dither_state_event(self, state):
+        if self.dither_start_time is None:
             return
 
+        if state == DitherState.WAITONDITHER:
+            self.dither_progress = 'DITHERING'
+        elif state in (DitherState.DITHERED, DitherState.SETTLEBEGUN):
+            self.dither_progress = 'SETTLING'
+
+    def phd2_dither_settling_event(self, distance, settle_time, settle_total):
+        if self.dither_start_time is None:
+            return
+
+        self.dither_progress = f'SETTLING {distance:.2f}px ' \
+                               f'{settle_time:.0f}/{settle_total:.0f}s'
+
+    def dither_failed(self, reason):
+        """Abort or carry on when a dither did not settle"""
+        if not self.exposure_ongoing or self.dither_start_time is None:
+            logging.error('dither_failed: no dither ongoing ignoring')
+            return
+
+        self.dither_finished()
+
         program_settings = AppContainer.find('/program_settings')
         if program_settings is None:
             logging.error('phd2_dither_timeout_event: cannot retrieve program settings!')
             QtWidgets.QMessageBox.critical(None, 'Error',
                                            'Unknown error reading program settings in '
-                                           'phd2_dither_timeout_event - aborting!',
+                                           'dither_failed - aborting!',
                                            QtWidgets.QMessageBox.Ok)
             self.end_sequence(abort=True)
             return
 
         if program_settings.sequence_phd2_stop_ditherfail:
-            logging.error('phd2_dither_timeout_event: dither timed out - aborting')
+            logging.error(f'dither_failed: dither {reason} - aborting')
             QtWidgets.QMessageBox.critical(None,
                                            'PHD2 Dither Failed', 'PHD2 dither operation '
-                                           'did not settle in time - aborting sequence!',
+                                           f'{reason} - aborting sequence!',
                                            QtWidgets.QMessageBox.Ok)
             self.end_sequence(abort=True)
             return
         else:
-             logging.error('phd2_dither_timeout_event: ignoring based on program settings')
+            logging.error('dither_failed: ignoring based on program settings')
+
+            # carry on with next exposure
+            self.start_exposure()
+            self.update_prediction()
 
     def end_sequence(self, abort=False):
         logging.debug(f'end_sequence: abort = {abort}')
         self.exposure_ongoing = False
-        self.device_manager.camera.release_lock()
-        self.device_manager.filterwheel.release_lock()
+        self.exposure_start_time = None
+        self.dither_start_time = None
+        self.dither_progress = None
+        self.prediction = None
+        self.filter_move = None
+        self.device_manager.camera.release_lock('sequence')
+        self.device_manager.filterwheel.release_lock('sequence')
         self.set_startstop_state(True)
 
         # leave start at where this sequence finished off
         self.ui.sequence_start.setValue(self.sequence.current_index)
 
+        if self.journal.is_open():
+            self.journal.end('aborted' if abort else 'complete')
+
+        self.requeue_plan_step()
+
         if abort:
             logging.debug('end_sequence: stopping expsoure!')
             self.device_manager.camera.stop_exposure()
@@ -412,9 +521,23 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
             flag, fitsimage = result
 
             if not flag:
-                logging.warning('ImageSequenceControlUI:cam_exp_comp - result was False!')
+                # ending the sequence clears exposure_ongoing before it stops
+                # the exposure so this is a failed download
+                logging.error('ImageSequenceControlUI:cam_exp_comp - result was False!')
+                self.end_sequence(abort=True)
+                QtWidgets.QMessageBox.critical(None, 'Error',
+                                               'Unable to read image from camera - '
+                                               'sequence aborted!',
+                                               QtWidgets.QMessageBox.Ok)
                 return
 
+            # time beyond the exposure is the download overhead of the frame
+            if self.exposure_start_time is not None:
+                overhead = time.monotonic() - self.exposure_start_time - self.sequence.exposure
+                self.exposure_start_time = None
+                if overhead >= 0:
+                    self.estimator.add_sample('download', overhead)
+
             program_settings = AppContainer.find('/program_settings')
             if program_settings is None:
                 logging.error('ImageSequenceControlUI:cam_exp_comp: cannot '
@@ -434,33 +557,34 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
             logging.debug(f'start_time = {start_time}')
             outname = os.path.join(self.sequence.target_dir,
                                    self.sequence.get_filename(start_time=start_time))
+            outname = output_filename(outname, self.sequence.output_format)
             overwrite_flag = program_settings.sequence_overwritefiles
             logging.info(f'writing sequence image to {outname}')
-            try:
-                fitsimage.save_to_file(outname, overwrite=overwrite_flag)
-            except Exception as e:
-                # FIXME Doesnt stop current sequence on this error!
-                logging.error('CameraManager:connect() Exception ->', exc_info=True)
-                QtWidgets.QMessageBox.critical(None, 'Error',
-                                               'Unable to save sequence image:\n\n'
-                                               f'{outname}\n\n'
-                                               f'Error -> {str(e)}\n\n'
-                                               'Check if file already exists and '
-                                               'overwrite set to False\n\n'
-                                               'Sequence aborted!',
-                                               QtWidgets.QMessageBox.Ok)
-                logging.error('Sequence ended due to error!')
-                self.end_sequence(abort=True)
-                return
 
-            self.new_sequence_image.emit((fitsimage, self.sequence.target_dir,
-                                          self.sequence.get_filename()))
+            # errors are reported to image_written()
+            self.pending_frames[outname] = (self.sequence.current_index,
+                                            self.journal.serial, self.plan_step)
+            self.image_writer.submit(fitsimage, outname,
+                                     output_format=self.sequence.output_format,
+                                     overwrite=overwrite_flag)
+
+            # displaying the frame is left until the next exposure or the
+            # dither has been started so it overlaps with them
 
             stop_idx = self.sequence.start_index + self.sequence.number_frames
             self.sequence.current_index += 1
             logging.warning(f'new cur idx={self.sequence.current_index} '
                             f'stop at {stop_idx}')
             if self.sequence.current_index >= stop_idx:
+                self.show_sequence_image(fitsimage, outname)
+
+                if self.plan_steps:
+                    self.next_plan_step()
+                    return
+
+                if self.plan is not None:
+                    logging.info(f'Plan {self.plan.name} complete')
+                    self.set_plan(None)
                 logging.info('Sequence Complete')
                 self.end_sequence()
                 QtWidgets.QMessageBox.information(None, 'Sequence Complete!',
@@ -469,74 +593,82 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
                 return
 
             # see if we need to dither
-            # FIXME currently we just use a modulus of the 'n frames' dither param
-            # If the user somehow messes with image indexes to skip frame numbers, etc
-            # then the dithering may not work out correctly but for a sequenentially
-            # numbered sequence of frames it will do what we want and that is almost
-            # always the use case!
             logging.debug(f'ImageSequenceControlUI:cam_exp_comp -> num_dither = '
                          f'{self.sequence.num_dither}')
             if self.sequence.is_light_frames() and self.sequence.num_dither > 0:
-                num_frames = self.sequence.current_index - self.sequence.start_index
-                num_left = self.sequence.start_index + self.sequence.number_frames - self.sequence.current_index
-                logging.info(f'num_frames={num_frames} num_left={num_left} '
-                             f'curidx={self.sequence.current_index} '
+                logging.info(f'curidx={self.sequence.current_index} '
                              f'num_dither={self.sequence.num_dither}')
 
-                if self.sequence.num_dither == 1:
-                    dither_now = True
-                elif num_frames > 1 and num_left >= self.sequence.num_dither:
-                    dither_now = (self.sequence.current_index % self.sequence.num_dither) == 0
-                else:
-                    dither_now = False
-
-                if dither_now:
+                if self.sequence.is_dither_due():
                     logging.info('sequence: time to dither!')
 
-                    logging.debug(f'ImageSequenceControlUI:cam_exp_comp: '
-                                  f'dither: {program_settings.phd2_scale} '
-                                  f'{program_settings.phd2_threshold}'
-                                  f'{program_settings.phd2_starttime} '
-                                  f'{program_settings.phd2_settledtime} '
-                                  f'{program_settings.phd2_settletimeout} ')
-
-                    rc = self.phd2_manager.dither(program_settings.phd2_scale,
-                                                  program_settings.phd2_threshold,
-                                                  program_settings.phd2_starttime,
-                                                  program_settings.phd2_settledtime,
-                                                  program_settings.phd2_settletimeout)
-
-                    if not rc:
-                        # failed to get PHD2 to dither - just fall through and
-                        # start next frame after notifying user
-                        #
-                        # FIXME what is best case here?  Use the dither fail
-                        #       checkbox from general settings to guide
-                        #
-                        # how to handle?
-                        logging.error('ImageSequenceControlUI:cam_exp_comp: '
-                                      'Could not communicate with PHD2 to start a dither op')
-                        QtWidgets.QMessageBox.critical(None,
-                                                   'Error',
-                                                   'PHD2 failed to respond to '
-                                                   'dither request - dither aborted!',
-                                                   QtWidgets.QMessageBox.Ok)
-                    else:
-                        logging.info('ImageSequenceControlUI:cam_exp_comp: '
-                                     'Dither command sent to PHD2 successfully')
-
+                    if self.start_dither(program_settings):
                         # now the 'SettleDone' event should come in from PHD2 and it will be handled
-                        # and next frame started unless we get a settle timeout event instead
-
+                        # and next frame started unless the dither fails or times out instead
+                        self.show_sequence_image(fitsimage, outname)
                         return
 
             # dither wasnt required or failed(?) and we just start next frame
             # start next exposure
-            self.device_manager.camera.start_exposure(self.sequence.exposure)
+            self.start_exposure()
+            self.update_prediction()
+            self.show_sequence_image(fitsimage, outname)
         else:
             logging.warning('ImageSequenceControlUI:cam_exp_comp: no '
                             'exposure was ongoing!')
 
+    def image_written(self, filename, ok, error):
+        index, serial, step = self.pending_frames.pop(filename, (None, None, None))
+
+        # the last frame of a plan step can be written after the next step
+        # has started its own journal
+        journaled = index is not None and serial == self.journal.serial \
+            and self.journal.is_open()
+
+        if ok:
+            # only frames on disk are journaled so a resume retakes the rest
+            if journaled:
+                self.journal.frame(index, filename)
+            return
+
+        logging.error(f'image_written: unable to save {filename} -> {error}')
+
+        # frame has to be taken again when the sequence is resumed
+        if journaled:
+            self.journal.frame_failed(index, filename)
+        elif index is not None and step is not None and self.plan is not None:
+            # frame of an earlier step - take it after the running step
+            retake = PlanStep(step.group, index, 1)
+            retake.filter_change = True
+            self.plan_steps.insert(0, retake)
+            if self.plan_step is not None:
+                self.journal.update_plan(self.journal_plan())
+            else:
+                # plan is stopped so the retake is first when it starts
+                self.apply_plan_step(retake)
+            logging.info(f'image_written: {retake} requeued')
+
+        # the last frame is written after the sequence has ended
+        running = self.exposure_ongoing
+        QtWidgets.QMessageBox.critical(None, 'Error',
+                                       'Unable to save sequence image:\n\n'
+                                       f'{filename}\n\n'
+                                       f'Error -> {error}\n\n'
+                                       'Check if file already exists and '
+                                       'overwrite set to False'
+                                       + ('\n\nSequence aborted!' if running else ''),
+                                       QtWidgets.QMessageBox.Ok)
+
+        if self.exposure_ongoing:
+            logging.error('Sequence ended due to error!')
+            self.end_sequence(abort=True)
+
+        # set sequence up to retake the frame
+        if not self.exposure_ongoing and self.plan is None:
+            state = self.journal.load()
+            if state is not None and state.can_resume():
+                self.restore_from_journal(state)
+
     def start_sequence(self):
         # FIXME this sequence would probably be MUCH NICER using a lock/semaphore
         # which is a context manager so we wouldn't have so many cases of
@@ -559,25 +691,25 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
             return
 
         # try to lock camera
-        if not self.device_manager.camera.get_lock():
+        if not self.device_manager.camera.get_lock('sequence'):
             logging.error('start_sequence: unable to get camera lock!')
             QtWidgets.QMessageBox.critical(None, 'Error', 'Camera is busy',
                                            QtWidgets.QMessageBox.Ok)
             return
 
         # try to lock filter wheel
-        if not self.device_manager.filterwheel.get_lock():
+        if not self.device_manager.filterwheel.get_lock('sequence'):
             logging.error('start_sequence: unable to get filter lock!')
             QtWidgets.QMessageBox.critical(None, 'Error', 'Filter is busy!',
                                            QtWidgets.QMessageBox.Ok)
-            self.device_manager.camera.release_lock()
+            self.device_manager.camera.release_lock('sequence')
             return
 
         status = self.device_manager.camera.get_status()
         if CameraState(status.state) != CameraState.IDLE:
             logging.error('CameraControlUI: camera_expose : camera not IDLE')
-            self.device_manager.camera.release_lock()
-            self.device_manager.filterwheel.release_lock()
+            self.device_manager.camera.release_lock('sequence')
+            self.device_manager.filterwheel.release_lock('sequence')
             return
 
         # check if output directory exists!
@@ -588,8 +720,8 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
                                            f'{self.sequence.target_dir} does '
                                            'not exist!',
                                            QtWidgets.QMessageBox.Ok)
-            self.device_manager.camera.release_lock()
-            self.device_manager.filterwheel.release_lock()
+            self.device_manager.camera.release_lock('sequence')
+            self.device_manager.filterwheel.release_lock('sequence')
             return
 
         is_light_frame = self.sequence.is_light_frames()
@@ -610,8 +742,8 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
                                                         'proceed with sequence?',
                                                         QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No)
                 if choice == QtWidgets.QMessageBox.No:
-                    self.device_manager.camera.release_lock()
-                    self.device_manager.filterwheel.release_lock()
+                    self.device_manager.camera.release_lock('sequence')
+                    self.device_manager.filterwheel.release_lock('sequence')
                     return
                 else:
                     logging.info('start_sequence: User choose to start sequence '
@@ -627,8 +759,8 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
                                                         'cannot start sequence.  Change '
                                                         'settings to avoid this error.',
                                                         QtWidgets.QMessageBox.Ok)
-                self.device_manager.camera.release_lock()
-                self.device_manager.filterwheel.release_lock()
+                self.device_manager.camera.release_lock('sequence')
+                self.device_manager.filterwheel.release_lock('sequence')
                 return
 
         if is_light_frame and program_settings.sequence_mount_warn_notconnect:
@@ -639,8 +771,8 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
                                                         'proceed with sequence?',
                                                         QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No)
                 if choice == QtWidgets.QMessageBox.No:
-                    self.device_manager.camera.release_lock()
-                    self.device_manager.filterwheel.release_lock()
+                    self.device_manager.camera.release_lock('sequence')
+                    self.device_manager.filterwheel.release_lock('sequence')
                     return
                 else:
                     logging.info('start_sequence: User choose to start sequence '
@@ -660,8 +792,8 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
                                                         '\n\nProceed with sequence?',
                                                         QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No)
                 if choice == QtWidgets.QMessageBox.No:
-                    self.device_manager.camera.release_lock()
-                    self.device_manager.filterwheel.release_lock()
+                    self.device_manager.camera.release_lock('sequence')
+                    self.device_manager.filterwheel.release_lock('sequence')
                     return
                 else:
                     logging.info('start_sequence: User choose to start sequence '
@@ -670,70 +802,526 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         # we're committed now
         self.set_startstop_state(False)
 
-        # setup camera
+        # setup camera - roi of a plan step is full frame which isn't known
+        # if the camera wasn't connected when the plan was set up
+        if self.plan_steps:
+            self.reset_roi()
+        self.apply_camera_settings()
+
+        # first frame is started once the filter wheel has moved
+        self.exposure_ongoing = True
+        self.move_filterwheel(self.sequence.filter, self.start_first_frame)
+
+    def start_first_frame(self, ok):
+        """Start sequence once the filter wheel has moved to its filter"""
+        if not ok:
+            self.exposure_ongoing = False
+            QtWidgets.QMessageBox.critical(None, 'Error',
+                                           'Filter wheel not responding',
+                                           QtWidgets.QMessageBox.Ok)
+            self.device_manager.camera.release_lock('sequence')
+            self.device_manager.filterwheel.release_lock('sequence')
+            self.set_startstop_state(True)
+            return
+
+        if self.plan_steps:
+            self.plan_step = self.plan_steps.pop(0)
+            logging.info(f'start_sequence: running plan step {self.plan_step}')
+
+        self.sequence.current_index = self.sequence.start_index
+
+        if self.is_resumed_sequence():
+            logging.info('start_sequence: resuming journaled sequence at '
+                         f'{self.sequence.start_index}')
+            self.journal.resume(self.sequence.start_index)
+        else:
+            self.journal.start(self.sequence, self.journal_plan())
+        self.resume_settings = None
+
+        self.start_exposure()
+        self.update_prediction()
+
+        # SIMULATE PROGRESS IN CAMERA MANAGER INSTEAD!
+#        if not self.device_manager.camera.supports_progress():
+#            logging.info(f'starting exposure timer for {self.sequence.exposure} sec')
+#            self.exposure_timer = QtCore.QTimer()
+#            self.exposure_timer.start(self.sequence.exposure)
+
+    def apply_camera_settings(self):
+        """Set camera binning, roi and gain for the sequence"""
         settings = CameraSettings()
         settings.binning = self.sequence.binning
         settings.roi = self.sequence.roi
         settings.camera_gain = self.sequence.camera_gain
         self.device_manager.camera.set_settings(settings)
 
-        # move filter wheel
-        if not self.device_manager.filterwheel.set_position_name(self.sequence.filter):
-            logging.error('start_sequence: unable to move filter wheel!')
+    def start_exposure(self):
+        """Start exposure of current frame"""
+        self.exposure_start_time = time.monotonic()
+        self.device_manager.camera.start_exposure(self.sequence.exposure)
+
+    def start_dither(self, program_settings):
+        """
+        Ask PHD2 to dither.
+
+        Returns True if the dither was started - the sequence then continues
+        when PHD2 reports the dither settled, timed out or failed.
+        """
+        logging.debug(f'ImageSequenceControlUI:start_dither: '
+                      f'dither: {program_settings.phd2_scale} '
+                      f'{program_settings.phd2_threshold}'
+                      f'{program_settings.phd2_starttime} '
+                      f'{program_settings.phd2_settledtime} '
+                      f'{program_settings.phd2_settletimeout} ')
+
+        # set first so the dither signals emitted while sending are handled
+        self.dither_start_time = time.monotonic()
+        self.dither_progress = 'DITHERING'
+
+        rc = self.phd2_manager.dither(program_settings.phd2_scale,
+                                      program_settings.phd2_threshold,
+                                      program_settings.phd2_starttime,
+                                      program_settings.phd2_settledtime,
+                                      program_settings.phd2_settletimeout)
+
+        if not rc:
+            self.dither_start_time = None
+            self.dither_progress = None
+
+            # failed to get PHD2 to dither - just fall through and
+            # start next frame after notifying user
+            #
+            # FIXME what is best case here?  Use the dither fail
+            #       checkbox from general settings to guide
+            #
+            # how to handle?
+            logging.error('ImageSequenceControlUI:start_dither: '
+                          'Could not communicate with PHD2 to start a dither op')
+            QtWidgets.QMessageBox.critical(None,
+                                           'Error',
+                                           'PHD2 failed to respond to '
+                                           'dither request - dither aborted!',
+                                           QtWidgets.QMessageBox.Ok)
+            return False
+
+        logging.info('ImageSequenceControlUI:start_dither: '
+                     'Dither command sent to PHD2 successfully')
+
+        self.journal.dither(self.sequence.current_index - 1)
+        self.update_prediction()
+
+        return True
+
+    def dither_finished(self):
+        """Record how long the dither took to settle"""
+        self.dither_progress = None
+        if self.dither_start_time is not None:
+            self.estimator.add_sample('dither', time.monotonic() - self.dither_start_time)
+            self.dither_start_time = None
+
+    def show_sequence_image(self, fitsimage, filename):
+        """Display frame just taken - filename is where it is written"""
+        self.new_sequence_image.emit((fitsimage, self.sequence.target_dir, filename))
+
+    def remaining_steps(self):
+        """Return plan steps for frames left including the current sequence"""
+        sequence = self.sequence
+        steps = []
+        left = sequence.start_index + sequence.number_frames - sequence.current_index
+        if left > 0:
+            group = ExposureGroup(sequence.name, sequence.filter, sequence.exposure,
+                                  sequence.number_frames, frame_type=sequence.frame_type,
+                                  num_dither=sequence.num_dither,
+                                  start_index=sequence.start_index)
+            if sequence.dither_range is not None:
+                group.start_index, group.count = sequence.dither_range
+            steps.append(PlanStep(group, sequence.current_index, left))
+        return steps + self.plan_steps
+
+    def update_prediction(self):
+        """Predict when the running sequence or plan will finish"""
+        estimate = estimate_plan(self.remaining_steps())
+        elapsed = 0.0
+        if self.exposure_start_time is not None:
+            elapsed = min(self.sequence.exposure,
+                          time.monotonic() - self.exposure_start_time)
+        self.prediction = self.estimator.predict(estimate, elapsed=elapsed)
+        logging.info(f'update_prediction: {estimate["frames"]} frames left '
+                     f'{format_prediction(self.prediction)}')
+
+    def move_filterwheel(self, name, then):
+        """
+        Move filter wheel to filter name and call then(ok) once it stopped.
+
+        then isn't called if the sequence is stopped while the wheel moves.
+        """
+        token = object()
+        self.filter_move = token
+
+        def moved(future):
+            if self.filter_move is not token:
+                logging.info('move_filterwheel: sequence stopped during move')
+                return
+            self.filter_move = None
+
+            try:
+                seconds = future.result()
+            except Exception:
+                logging.error('move_filterwheel: filter wheel move failed',
+                              exc_info=True)
+                seconds = None
+
+            if seconds is not None and seconds > 0:
+                self.estimator.add_sample('filter_change', seconds)
+
+            then(seconds is not None)
+
+        self.device_manager.filterwheel.move_to_name(name, moved)
+
+    def load_plan(self):
+        """Load a plan and show its schedule before it is run"""
+        fname, _ = QtWidgets.QFileDialog.getOpenFileName(None, 'Load Sequence Plan',
+                                                         self.sequence.target_dir,
+                                                         'Plans (*.json)')
+        if len(fname) < 1:
+            if self.plan is not None:
+                choice = QtWidgets.QMessageBox.question(None, 'Sequence Plan',
+                                                        f'Clear plan "{self.plan.name}"?',
+                                                        QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No)
+                if choice == QtWidgets.QMessageBox.Yes:
+                    self.set_plan(None)
+            return
+
+        plan = load_plan(fname)
+        if plan is None or not plan.groups:
             QtWidgets.QMessageBox.critical(None, 'Error',
-                                           'Filter wheel not responding',
+                                           f'Unable to read a plan from {fname}',
                                            QtWidgets.QMessageBox.Ok)
-            self.device_manager.camera.release_lock()
-            self.device_manager.filterwheel.release_lock()
             return
 
-        # wait on filter wheel
-        # FIXME Fix hardcoded timeout!
-        wait_start = time.time()
-        filter_ok = False
-        while time.time() - wait_start < 15:
-            if not self.device_manager.filterwheel.is_moving():
-                filter_ok = True
-                break
-
-        if not filter_ok:
-            logging.error('start_sequence: unable to move filter wheel!')
+        if self.device_manager.filterwheel.is_connected():
+            filter_names = self.device_manager.filterwheel.get_names()
+            unknown = sorted({g.filter for g in plan.groups
+                              if g.filter is not None and g.filter not in filter_names})
+            if unknown:
+                logging.error(f'load_plan: filters {unknown} not in filter wheel')
+                QtWidgets.QMessageBox.critical(None, 'Error',
+                                               'The plan uses filters not in the '
+                                               f'filter wheel: {", ".join(unknown)}',
+                                               QtWidgets.QMessageBox.Ok)
+                return
+
+        steps = self.schedule_plan(plan)
+        estimate = estimate_plan(steps, self.get_overheads())
+        prediction = self.estimator.predict(estimate)
+
+        # dry run - user sees schedule and how long it will take
+        choice = QtWidgets.QMessageBox.question(None, f'Sequence Plan {plan.name}',
+                                                format_schedule(steps, estimate)
+                                                + f'\n90% range {prediction["low_s"]/3600:.2f}'
+                                                f'-{prediction["high_s"]/3600:.2f} h if '
+                                                'started now - '
+                                                + format_prediction(prediction)
+                                                + '\n\nUse this plan?',
+                                                QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No)
+        if choice == QtWidgets.QMessageBox.Yes:
+            self.set_plan(plan, steps)
+
+    def schedule_plan(self, plan):
+        """Return steps to run plan with the connected filter wheel"""
+        filter_names = None
+        current_filter = None
+        if self.device_manager.filterwheel.is_connected():
+            filter_names = self.device_manager.filterwheel.get_names()
+            current_filter = self.device_manager.filterwheel.get_position_name()
+
+        return PlanScheduler(filter_names, current_filter).schedule(plan)
+
+    def get_overheads(self):
+        """Return overheads measured on this rig"""
+        return self.estimator.overheads()
+
+    def set_plan(self, plan, steps=None):
+        """Use plan for the next start - None to go back to single sequences"""
+        self.plan = plan
+        self.plan_steps = list(steps) if steps else []
+        self.plan_step = None
+
+        if plan is None:
+            self.sequence.dither_range = None
+            logging.info('set_plan: plan cleared')
+            return
+
+        if plan.target_dir:
+            self.sequence.target_dir = plan.target_dir
+        if plan.name_elements:
+            self.sequence.name_elements = plan.name_elements
+        if plan.output_format in OUTPUT_FORMATS:
+            self.sequence.output_format = plan.output_format
+
+        logging.info(f'set_plan: {plan.name} with {len(self.plan_steps)} steps')
+
+        self.apply_plan_step(self.plan_steps[0])
+
+    def apply_plan_step(self, step):
+        """Set sequence up to take the frames of a plan step"""
+        group = step.group
+        self.sequence.name = group.target
+        self.sequence.frame_type = group.frame_type
+        self.sequence.exposure = group.exposure
+        self.sequence.binning = group.binning
+        self.sequence.num_dither = group.num_dither
+        self.sequence.start_index = step.start_index
+        self.sequence.number_frames = step.count
+        self.sequence.current_index = step.start_index
+        self.sequence.dither_range = group.dither_range()
+        # darks and bias are taken with whatever filter is in place
+        if group.filter is not None:
+            self.sequence.filter = group.filter
+
+        # binning of the group is applied with the other camera settings
+        # when the step starts
+        self.ui.sequence_binning.blockSignals(True)
+        self.ui.sequence_binning.setValue(group.binning)
+        self.ui.sequence_binning.blockSignals(False)
+        self.reset_roi()
+
+        self.update_ui()
+        idx = self.ui.sequence_filter.findText(self.sequence.filter or '')
+        if idx >= 0:
+            self.ui.sequence_filter.setCurrentIndex(idx)
+
+    def next_plan_step(self):
+        """Start next step of plan - called when a step finishes"""
+        if self.journal.is_open():
+            self.journal.end('complete')
+
+        self.plan_step = self.plan_steps.pop(0)
+        logging.info(f'next_plan_step: {self.plan_step} '
+                     f'{len(self.plan_steps)} steps left')
+
+        self.apply_plan_step(self.plan_step)
+
+        if self.plan_step.target_change and not self.confirm_target_change():
+            logging.info(f'next_plan_step: plan stopped before {self.plan_step}')
+            # journal step so the plan can be resumed after a restart too
+            self.journal.start(self.sequence, self.journal_plan())
+            # camera is idle so don't stop an exposure
+            self.exposure_ongoing = False
+            self.stop_sequence()
+            return
+
+        if self.plan_step.refocus:
+            # FIXME no autofocus yet - focus is left as is
+            logging.warning(f'next_plan_step: refocus needed before {self.plan_step}')
+
+        if self.plan_step.filter_change:
+            self.move_filterwheel(self.sequence.filter, self.start_plan_step)
+        else:
+            self.start_plan_step(True)
+
+    def start_plan_step(self, ok):
+        """Start first frame of plan step once filter wheel has moved"""
+        if not ok:
             QtWidgets.QMessageBox.critical(None, 'Error',
-                                           'Filter wheel not responding - kept moving',
+                                           'Filter wheel not responding - '
+                                           'sequence aborted!',
                                            QtWidgets.QMessageBox.Ok)
-            self.device_manager.camera.release_lock()
-            self.device_manager.filterwheel.release_lock()
+            self.end_sequence(abort=True)
             return
 
-        self.sequence.current_index = self.sequence.start_index
-        self.device_manager.camera.start_exposure(self.sequence.exposure)
+        self.apply_camera_settings()
 
-        # SIMULATE PROGRESS IN CAMERA MANAGER INSTEAD!
-#        if not self.device_manager.camera.supports_progress():
-#            logging.info(f'starting exposure timer for {self.sequence.exposure} sec')
-#            self.exposure_timer = QtCore.QTimer()
-#            self.exposure_timer.start(self.sequence.exposure)
+        self.journal.start(self.sequence, self.journal_plan())
 
-        self.exposure_ongoing = True
+        # the step boundary is a frame boundary of the group so dither
+        # like the frames were taken in one run
+        if self.sequence.is_dither_due():
+            logging.info('next_plan_step: time to dither!')
+            program_settings = AppContainer.find('/program_settings')
+            if program_settings is not None and self.start_dither(program_settings):
+                # next frame is started when PHD2 reports the dither settled
+                return
+
+        self.start_exposure()
+        self.update_prediction()
+
+    def confirm_target_change(self):
+        """
+        Ask user to point the telescope at the target of the next step.
+
+        Returns
+        -------
+        bool
+            True if the plan should carry on.
+        """
+        # FIXME no slewing yet - the plan waits for the user to move the mount
+        logging.warning(f'confirm_target_change: waiting for user to move to '
+                        f'{self.sequence.name}')
+        choice = QtWidgets.QMessageBox.question(None, 'Sequence Plan',
+                                                'The next step of the plan is '
+                                                f'for target "{self.sequence.name}".'
+                                                '\n\nPoint the telescope at the '
+                                                'target and start guiding then '
+                                                'choose Yes to continue.\n\n'
+                                                'Choose No to stop the plan here '
+                                                '- pressing Start carries on '
+                                                'with this step.',
+                                                QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No)
+        return choice == QtWidgets.QMessageBox.Yes
+
+    def journal_plan(self):
+        """Return plan for the journal of the running step or None"""
+        if self.plan is None or self.plan_step is None:
+            return None
+
+        return {'plan': self.plan.to_dict(),
+                'step': self.plan_step.to_dict(self.plan),
+                'steps': [step.to_dict(self.plan) for step in self.plan_steps]}
+
+    def requeue_plan_step(self):
+        """Put frames of a plan step which were not taken back in the plan"""
+        step = self.plan_step
+        if step is None:
+            return
+        self.plan_step = None
+
+        left = step.start_index + step.count - self.sequence.current_index
+        if left > 0:
+            remainder = PlanStep(step.group, self.sequence.current_index, left)
+            remainder.filter_change = True
+            if left == step.count:
+                # nothing taken yet so target change/refocus still to do
+                remainder.target_change = step.target_change
+                remainder.refocus = step.refocus
+            self.plan_steps.insert(0, remainder)
+            logging.info(f'requeue_plan_step: {remainder} requeued')
+
+        if self.plan_steps:
+            self.apply_plan_step(self.plan_steps[0])
 
     def stop_sequence(self):
         logging.info('Stopping sequence!')
         # release camera
+        # clear first so the failed exposure this reports isn't an error
         if self.exposure_ongoing:
-            self.device_manager.camera.stop_exposure()
             self.exposure_ongoing = False
-
-        self.device_manager.camera.release_lock()
-        self.device_manager.filterwheel.release_lock()
+            # camera is idle while the filter wheel moves
+            if self.filter_move is None:
+                self.device_manager.camera.stop_exposure()
+        self.exposure_start_time = None
+        self.dither_start_time = None
+        self.dither_progress = None
+        self.prediction = None
+        self.filter_move = None
+
+        self.device_manager.camera.release_lock('sequence')
+        self.device_manager.filterwheel.release_lock('sequence')
         self.set_startstop_state(True)
 
+        if self.journal.is_open():
+            self.journal.end('stopped')
+
         # have sequence restart at current index
         self.sequence.start_index = self.sequence.current_index
         self.ui.sequence_start.setValue(self.sequence.start_index)
 
+        self.requeue_plan_step()
+
+    def check_journal(self):
+        """Offer to resume a sequence which did not finish"""
+        state = self.journal.load()
+        if state is None or not state.can_resume():
+            return
+
+        logging.info(f'check_journal: unfinished sequence {state}')
+
+        plan_info = ''
+        if state.plan is not None:
+            plan_info = 'It is a step of plan ' \
+                        f'"{state.plan["plan"]["name"]}" with ' \
+                        f'{len(state.plan["steps"])} more steps.\n\n'
+
+        choice = QtWidgets.QMessageBox.question(None, 'Resume Sequence',
+                                                'The sequence '
+                                                f'"{state.settings["name"]}" '
+                                                'did not finish.\n\n'
+                                                f'{len(state.frames)} frames '
+                                                'were saved and '
+                                                f'{state.frames_left()} are left '
+                                                'starting at frame '
+                                                f'{state.next_index()}.\n\n'
+                                                + plan_info +
+                                                'Resume this sequence?',
+                                                QtWidgets.QMessageBox.Yes|QtWidgets.QMessageBox.No)
+        if choice == QtWidgets.QMessageBox.No:
+            logging.info('check_journal: user discarded unfinished sequence')
+            self.journal.discard()
+            return
+
+        self.restore_from_journal(state)
+
+    def is_resumed_sequence(self):
+        """Return True if sequence is still the one restored from the journal"""
+        if self.resume_settings is None:
+            return False
+
+        # camera settings like ROI are reset when the camera connects so
+        # only compare what decides which frames are taken
+        settings = self.sequence.get_settings()
+        for key in ['name', 'name_elements', 'start_index', 'number_frames',
+                    'filter', 'frame_type', 'exposure', 'target_dir']:
+            if settings[key] != self.resume_settings[key]:
+                logging.info(f'is_resumed_sequence: {key} changed from '
+                             f'{self.resume_settings[key]} to {settings[key]}')
+                return False
+
+        return True
+
+    def restore_from_journal(self, state):
+        """Set sequence up to continue where journaled sequence stopped"""
+        self.sequence.set_settings(state.settings)
+
+        if state.plan is not None:
+            self.restore_plan_from_journal(state)
+
+        # finish at the same frame as the original sequence
+        self.sequence.start_index = state.next_index()
+        self.sequence.number_frames = state.frames_left()
+        self.sequence.current_index = self.sequence.start_index
+
+        self.update_ui()
+        idx = self.ui.sequence_filter.findText(self.sequence.filter or '')
+        if idx >= 0:
+            self.ui.sequence_filter.setCurrentIndex(idx)
+
+        self.resume_settings = self.sequence.get_settings()
+
+        logging.info(f'restore_from_journal: sequence restored\n{self.sequence}')
+
+    def restore_plan_from_journal(self, state):
+        """Set plan up to carry on with the journaled step and the steps after it"""
+        try:
+            plan = SequencePlan.from_dict(state.plan['plan'])
+            step = PlanStep.from_dict(state.plan['step'], plan)
+            steps = [PlanStep.from_dict(d, plan) for d in state.plan['steps']]
+        except (ValueError, KeyError, IndexError, TypeError):
+            logging.error('restore_plan_from_journal: bad plan in journal',
+                          exc_info=True)
+            return False
+
+        # rest of the step which was running
+        remainder = PlanStep(step.group, state.next_index(), state.frames_left())
+        remainder.filter_change = True
+
+        self.set_plan(plan, [remainder] + steps)
+
+        return True
+
     def set_startstop_state(self, state):
         """Controls start/stop button state"""
         logging.debug(f'imagecontrolui: set_startstop_state: {state}')
+        self.ui.sequence_plan.setEnabled(state)
         if state:
             self.ui.sequence_start_stop.setText('Start')
             self.ui.sequence_start_stop.pressed.disconnect(self.stop_sequence)
@@ -774,6 +1362,8 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
             self.sequence.filter = self.ui.sequence_filter.currentText()
         elif self.sender() == self.ui.sequence_dither:
             self.sequence.num_dither = self.ui.sequence_dither.value()
+        elif self.sender() == self.ui.sequence_output_format:
+            self.sequence.output_format = self.ui.sequence_output_format.currentData()
         else:
             logging.error('Unknown sender is update_sequence!')
 
@@ -785,7 +1375,11 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
         self.ui.sequence_frametype.setCurrentText(self.sequence.frame_type.pretty_name())
         self.ui.sequence_number.setValue(self.sequence.number_frames)
         self.ui.sequence_start.setValue(self.sequence.start_index)
+        self.ui.sequence_dither.setValue(self.sequence.num_dither)
         self.ui.sequence_targetdir.setPlainText(self.sequence.target_dir)
+        idx = self.ui.sequence_output_format.findData(self.sequence.output_format)
+        if idx >= 0:
+            self.ui.sequence_output_format.setCurrentIndex(idx)
 
         if self.sequence.roi:
             self.ui.sequence_roi_width.setText(f'{self.sequence.roi[2]}')
@@ -819,27 +1413,6 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
     def handle_new_image(self, fits_doc):
         """Fills in FITS header data for new images"""
 
-        # FIXME maybe best handled somewhere else - it relies on lots of 'globals'
-        settings = AppContainer.find('/program_settings')
-        if settings is None:
-            logging.error('ImageSequenceControlUI:handle_new_image: unable to '
-                          'access program settings!')
-            return False
-
-        fits_doc.set_notes(settings.observer_notes)
-        fits_doc.set_telescope(settings.telescope_description)
-        fits_doc.set_focal_length(settings.telescope_focallen)
-        aper_diam = settings.telescope_aperture
-        aper_obst = settings.telescope_obstruction
-        aper_area = math.pi * (aper_diam / 2.0 * aper_diam / 2.0) \
-                            * (1-aper_obst*aper_obst / 100.0 / 100.0)
-        fits_doc.set_aperture_diameter(aper_diam)
-        fits_doc.set_aperture_area(aper_area)
-
-        lat_dms = Angle(settings.location_latitude*u.degree).to_string(unit=u.degree, sep=' ', precision=0)
-        lon_dms = Angle(settings.location_longitude*u.degree).to_string(unit=u.degree, sep=' ', precision=0)
-        fits_doc.set_site_location(lat_dms, lon_dms)
-
         # these come from camera, filter wheel and telescope drivers
         if self.device_manager.camera.is_connected():
             cam_name = self.device_manager.camera.get_camera_name()
@@ -860,37 +1433,16 @@ class ImageSequnceControlUI(QtWidgets.QWidget):
 
             fits_doc.set_filter(cur_name)
 
+        radec = None
+        altaz = None
         if self.device_manager.mount.is_connected():
-            ra, dec = self.device_manager.mount.get_position_radec()
+            radec = self.device_manager.mount.get_position_radec()
+            altaz = self.device_manager.mount.get_position_altaz()
 
-            radec = SkyCoord(ra=ra * u.hour, dec=dec * u.degree, frame='fk5')
-            rastr = radec.ra.to_string(u.hour, sep=" ", pad=True)
-            decstr = radec.dec.to_string(alwayssign=True, sep=" ", pad=True)
-            fits_doc.set_object_radec(rastr, decstr)
-
-            alt, az = self.device_manager.mount.get_position_altaz()
-            if alt is None or az is None:
-                logging.warning('imagesequi: alt/az are None!')
-            else:
-                altaz = AltAz(alt=alt * u.degree, az=az * u.degree)
-    #            altstr = altaz.alt.to_string(alwayssign=True, sep=":", pad=True)
-    #            azstr = altaz.az.to_string(alwayssign=True, sep=":", pad=True)
-                altstr = f'{altaz.alt.degree}'
-                azstr = f'{altaz.az.degree}'
-                fits_doc.set_object_altaz(altstr, azstr)
-
-            now = Time.now()
-            local_sidereal = now.sidereal_time('apparent',
-                                               longitude=settings.location_longitude * u.degree)
-            hour_angle = local_sidereal - radec.ra
-            logging.debug(f'locsid = {local_sidereal} HA={hour_angle}')
-            if hour_angle.hour > 12:
-                hour_angle = (hour_angle.hour - 24.0) * u.hourangle
-
-#            hastr = Angle(hour_angle).to_string(u.hour, sep=":", pad=True)
-            hastr = f'{Angle(hour_angle).hour}'
-            logging.debug(f'HA={hour_angle} HASTR={hastr} {type(hour_angle)}')
-            fits_doc.set_object_hourangle(hastr)
+        # sequence frames have always had alt/az/HA as decimal values
+        header_builder = AppContainer.find('/fits_header_builder')
+        header_builder.fill_header(fits_doc, radec=radec, altaz=altaz,
+                                   sep=' ', decimal_altaz=True)
 
         # controlled by user selection in camera or sequence config
         fits_doc.set_image_type(self.sequence.frame_type.pretty_name())
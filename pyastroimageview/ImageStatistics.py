@@ -0,0 +1,151 @@
+#
+# Image statistics from pixel histograms
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Frames are kept as uint16 so the median, percentiles and MAD used for
+# display and autostretch can all be read off a single 65536 bin histogram
+# of the pixel values.  This takes one pass over the data and doesn't make
+# any full size copies, where np.median() and friends sort a copy and
+# normalizing to 0-1 first makes a float64 copy four times the size of the
+# frame.
+#
+# Data which isn't 8 or 16 bit unsigned falls back to the numpy functions.
+#
+import logging
+
+import numpy as np
+
+# pixels per block when building histogram
+BINCOUNT_BLOCK = 1 << 20
+
+
+class ImageStatistics:
+    """
+    Statistics of image pixel values.
+
+    Parameters
+    ----------
+    data : numpy array
+        Image data.
+    subsample : int
+        Only use every subsample'th pixel in each direction.
+    """
+
+    def __init__(self, data, subsample=1):
+        if subsample > 1:
+            data = data[::subsample, ::subsample]
+
+        self.npixels = data.size
+
+        if data.dtype.kind == 'u' and data.dtype.itemsize <= 2:
+            self.hist = self._bincount(data, 2**(8*data.dtype.itemsize))
+            self.cumulative = np.cumsum(self.hist)
+            self.data = None
+        else:
+            logging.debug(f'ImageStatistics: no histogram for {data.dtype}')
+            self.hist = None
+            self.cumulative = None
+            self.data = data
+
+        self._median = None
+        self._mad = None
+
+    @staticmethod
+    def _bincount(data, nbins):
+        # bincount() converts its input to intp so do it in blocks of rows
+        # to avoid a temporary 4x the size of the frame
+        hist = np.zeros(nbins, dtype=np.int64)
+        if data.ndim < 2:
+            data = data.reshape(1, -1)
+        rows = max(1, BINCOUNT_BLOCK // max(1, data.shape[-1]))
+        for i in range(0, data.shape[0], rows):
+            hist += np.bincount(data[i:i+rows].ravel(), minlength=nbins)
+        return hist
+
+    def _value_at_rank(self, rank):
+        # value of the rank'th smallest pixel (0 based)
+        return int(np.searchsorted(self.cumulative, rank, side='right'))
+
+    def _interpolated(self, pos):
+        lo = int(np.floor(pos))
+        hi = int(np.ceil(pos))
+        vlo = self._value_at_rank(lo)
+        if hi == lo:
+            return float(vlo)
+        vhi = self._value_at_rank(hi)
+        return vlo + (vhi - vlo) * (pos - lo)
+
+    def median(self):
+        if self._median is None:
+            if self.hist is None:
+                self._median = float(np.median(self.data))
+            else:
+                self._median = self._interpolated((self.npixels - 1) / 2)
+        return self._median
+
+    def percentile(self, perc):
+        """Return percentile (0-100) using the same interpolation as numpy"""
+        if self.hist is None:
+            return float(np.percentile(self.data, perc))
+        return self._interpolated(perc / 100.0 * (self.npixels - 1))
+
+    def mad(self):
+        """Return median absolute deviation from the median (not scaled)"""
+        if self._mad is None:
+            med = self.median()
+            if self.hist is None:
+                self._mad = float(np.median(np.abs(self.data - med)))
+            else:
+                # histogram of deviations is the pixel histogram reordered
+                dev = np.abs(np.arange(self.hist.size) - med)
+                order = np.argsort(dev, kind='stable')
+                cumulative = np.cumsum(self.hist[order])
+                pos = (self.npixels - 1) / 2
+                lo = int(np.floor(pos))
+                hi = int(np.ceil(pos))
+                dlo = dev[order[np.searchsorted(cumulative, lo, side='right')]]
+                dhi = dev[order[np.searchsorted(cumulative, hi, side='right')]]
+                self._mad = float(dlo + (dhi - dlo) * (pos - lo))
+        return self._mad
+
+    def histogram(self, low, high, bins=100):
+        """
+        Return (counts, edges) like np.histogram(data, range=(low, high)).
+        """
+        if self.hist is None:
+            return np.histogram(self.data, range=(low, high), bins=bins)
+
+        # flat image - widen range like np.histogram
+        if high <= low:
+            low = low - 0.5
+            high = high + 0.5
+
+        edges = np.linspace(low, high, bins + 1)
+
+        values = np.arange(self.hist.size)
+        inside = (values >= low) & (values <= high)
+        vals = values[inside]
+        idx = ((vals - low) * (bins / (high - low))).astype(np.intp)
+        idx = np.minimum(idx, bins - 1)
+
+        # fix rounding at bin edges the same way np.histogram does
+        idx[vals < edges[idx]] -= 1
+        idx[(vals >= edges[idx + 1]) & (idx != bins - 1)] += 1
+
+        counts = np.bincount(idx, weights=self.hist[inside], minlength=bins)
+        return counts.astype(np.int64), edges
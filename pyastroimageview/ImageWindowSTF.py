@@ -18,12 +18,13 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import logging
-import astropy.io.fits as pyfits
 import numpy as np
 from PyQt5 import QtCore, QtWidgets, QtGui
 import pyqtgraph as pg
 
 from pyastroimageview.MTFStretchItem import MTFSliderItem
+from pyastroimageview.ImageStatistics import ImageStatistics
+from pyastroimageview.ImageConversion import convert_image_data
 
 class StarObj(QtWidgets.QGraphicsObject):
     def __init__(self, r, num=None):
@@ -144,6 +145,7 @@ class ImageWindowSTF(pg.GraphicsLayoutWidget):
         self.star_items = []
         self.star_visibility = True
         self.image_data = None
+        self.image_stats = None
 
         # follow mouse position
         self.mouse_proxy = pg.SignalProxy(self.image_item.scene().sigMouseMoved,
@@ -195,14 +197,17 @@ class ImageWindowSTF(pg.GraphicsLayoutWidget):
 
         logging.debug('loading fits file')
 
-        self.image_data = pyfits.getdata(image_file)
+        import astropy.io.fits as pyfits
+        # keep integer data at 16 bits even if file has BITPIX 32
+        self.image_data = convert_image_data(pyfits.getdata(image_file))
+        self.image_stats = None
 
         logging.debug('setting image data')
 
         self.image_item.setImage(self.image_data, autoLevels=False,
                                  levels=(0, 65535), autoRange=False)
 
-    def show_data(self, image_data):
+    def show_data(self, image_data, image_stats=None):
         # remove any existing star labels
         for item in self.star_items:
             self.view.removeItem(item)
@@ -210,6 +215,7 @@ class ImageWindowSTF(pg.GraphicsLayoutWidget):
         self.star_items = []
 
         self.image_data = image_data
+        self.image_stats = image_stats
 
 #        logging.info(f'show_data shape = {image_data.shape}')
 
@@ -270,13 +276,16 @@ class ImageWindowSTF(pg.GraphicsLayoutWidget):
         def compute_mtf(x, m):
             return ((m - 1.0) * x) / ((2.0 * m - 1.0) * x - m)
 
-        # normalize image
-        norm_image = self.image_data / 65535.0
+        # statistics come from the pixel histogram rather than normalizing
+        # the image which would make a float64 copy 4x the size of the frame
+        if self.image_stats is None:
+            self.image_stats = ImageStatistics(self.image_data)
 
-        image_median = np.median(norm_image)
+        # normalize
+        image_median = self.image_stats.median() / 65535.0
 
         # eq 24
-        mad = 1.4826 * np.median(np.abs(norm_image - image_median))
+        mad = 1.4826 * self.image_stats.mad() / 65535.0
 
         # clipping pt
         clip_pt = -2.8
@@ -0,0 +1,224 @@
+#
+# Background image writer
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Compressing a large frame takes from under a second (Rice) to many
+# seconds (gzip) so sequence frames are written by a pool of worker
+# threads instead of on the GUI thread.  The next exposure starts as soon
+# as the frame is handed over and the compression codecs release the GIL
+# so several frames can be compressed at once on a multi-core machine.
+#
+# Frames can be saved as FITS or XISF.  The result of each write is
+# reported with the written signal on the GUI thread.  If there is a frame
+# catalog each frame written is added to it.
+#
+import os
+import time
+import logging
+import threading
+from concurrent import futures
+
+from PyQt5 import QtCore
+
+from pyastroimageview.XISFWriter import XISF_COMPRESSION_CODECS, xisf_filename
+
+# output formats offered for sequences - (description, file type, compression)
+OUTPUT_FORMATS = {'fits': ('FITS', 'fits', None),
+                  'fits_rice': ('FITS (Rice)', 'fits', 'rice'),
+                  'fits_gzip': ('FITS (GZIP)', 'fits', 'gzip'),
+                  'xisf': ('XISF', 'xisf', None)}
+
+for _codec in XISF_COMPRESSION_CODECS:
+    OUTPUT_FORMATS[f'xisf_{_codec}'] = (f'XISF ({_codec})', 'xisf', _codec)
+
+DEFAULT_WRITE_THREADS = 2
+
+
+def output_filename(filename, output_format):
+    """Return filename with the extension for the output format"""
+    _, filetype, _ = OUTPUT_FORMATS[output_format]
+    if filetype == 'xisf':
+        return xisf_filename(filename)
+    return filename
+
+
+class ImageWriterSignals(QtCore.QObject):
+    """
+    Signals for finished writes.
+
+    written - Emitted with (filename, ok, error message) when a write
+              finishes.  Delivered on the GUI thread.
+    """
+    written = QtCore.pyqtSignal(str, bool, str)
+
+
+class ImageWriter:
+    """
+    Writes images to disk on worker threads.
+
+    Parameters
+    ----------
+    max_workers : int
+        Number of frames which can be written at the same time.
+    catalog : FrameCatalog
+        Catalog to record written frames in.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WRITE_THREADS, catalog=None):
+        self.max_workers = max(1, max_workers)
+        self.catalog = catalog
+        self.executor = futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                   thread_name_prefix='ImageWriter')
+        self.signals = ImageWriterSignals()
+
+        self.stats_lock = threading.Lock()
+        # filename being written by each queued write
+        self.pending_futures = {}
+        self.num_written = 0
+        self.num_failed = 0
+        self.raw_bytes = 0
+        self.file_bytes = 0
+        self.write_time = 0
+
+    def submit(self, image, filename, output_format='fits', overwrite=False,
+               source='sequence'):
+        """
+        Queue an image to be written.
+
+        Parameters
+        ----------
+        image : FITSImage
+            Image to write.  It must not be changed until the write is done.
+        filename : str
+            Output filename.
+        output_format : str
+            One of the keys of OUTPUT_FORMATS.
+        overwrite : bool
+            Overwrite existing file.
+        source : str
+            What wrote the frame - recorded in the catalog.
+
+        Returns
+        -------
+        Future
+            Result is the number of bytes written.
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f'Unknown output format {output_format}')
+
+        future = self.executor.submit(self.write, image, filename,
+                                      output_format, overwrite, source)
+        with self.stats_lock:
+            self.pending_futures[future] = filename
+        future.add_done_callback(lambda f: self._write_done(f, filename))
+        return future
+
+    def write(self, image, filename, output_format='fits', overwrite=False,
+              source=None):
+        """Write image now on the calling thread"""
+        _, filetype, compression = OUTPUT_FORMATS[output_format]
+
+        t0 = time.perf_counter()
+        if filetype == 'xisf':
+            image.save_to_xisf(filename, compression=compression, overwrite=overwrite)
+        else:
+            image.save_to_file(filename, compression=compression, overwrite=overwrite)
+        dt = time.perf_counter() - t0
+
+        nbytes = os.path.getsize(filename)
+        raw = image.image_data().nbytes
+
+        with self.stats_lock:
+            self.num_written += 1
+            self.raw_bytes += raw
+            self.file_bytes += nbytes
+            self.write_time += dt
+
+        logging.info(f'ImageWriter: wrote {filename} ({output_format}) '
+                     f'{nbytes/1e6:.1f} MB ratio {raw/max(nbytes, 1):.2f} '
+                     f'in {dt:.2f} s')
+
+        if self.catalog is not None:
+            # the frame is on disk so a catalog problem isn't a write error
+            try:
+                self.catalog.add_frame(filename, image, source=source,
+                                       output_format=output_format, write_s=dt)
+            except Exception:
+                logging.error(f'ImageWriter: unable to catalog {filename}',
+                              exc_info=True)
+
+        return nbytes
+
+    def _write_done(self, future, filename):
+        with self.stats_lock:
+            self.pending_futures.pop(future, None)
+
+        exc = future.exception()
+        if exc is not None:
+            with self.stats_lock:
+                self.num_failed += 1
+            logging.error(f'ImageWriter: writing {filename} failed', exc_info=exc)
+            self.signals.written.emit(filename, False, str(exc))
+        else:
+            self.signals.written.emit(filename, True, '')
+
+    def pending(self):
+        """Return number of writes not finished yet"""
+        with self.stats_lock:
+            return len(self.pending_futures)
+
+    def is_pending(self, filename):
+        """Return True if a write to filename is queued or running"""
+        with self.stats_lock:
+            return filename in self.pending_futures.values()
+
+    def wait(self, timeout=60):
+        """
+        Wait for queued writes to finish.
+
+        This blocks so it isn't for the GUI thread - use the written
+        signal there.
+
+        Returns
+        -------
+        bool
+            True if all writes finished.
+        """
+        with self.stats_lock:
+            fs = list(self.pending_futures)
+        _, not_done = futures.wait(fs, timeout)
+        return not not_done
+
+    def shutdown(self):
+        """Finish queued writes and stop the worker threads"""
+        npending = self.pending()
+        if npending > 0:
+            logging.info(f'ImageWriter: waiting on {npending} writes')
+        self.executor.shutdown(wait=True)
+
+    def get_stats(self):
+        """Return dictionary of write statistics"""
+        with self.stats_lock:
+            return {'written': self.num_written,
+                    'failed': self.num_failed,
+                    'pending': len(self.pending_futures),
+                    'raw_mb': self.raw_bytes / 1e6,
+                    'file_mb': self.file_bytes / 1e6,
+                    'ratio': self.raw_bytes / max(self.file_bytes, 1),
+                    'write_s': self.write_time,
+                    'mb_per_s': self.raw_bytes / 1e6 / max(self.write_time, 1e-9)}
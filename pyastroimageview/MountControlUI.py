@@ -19,28 +19,20 @@
 #
 import logging
 
-# work in offline mode for now get timeouts for IERS
-print("MountControlUI.py: DISABLED IERS AGE CHECK!")
-from astropy.utils import iers
-#conf.iers_auto_url = "https://datacenter.iers.org/data/9/finals2000A.all"
-iers.conf.iers_auto_url = "ftp://cddis.gsfc.nasa.gov/pub/products/iers/finals2000A.all"
-iers.conf.remote_timeout = 999
-
-from astropy import units as u
-from astropy.coordinates import AltAz
-from astropy.coordinates import EarthLocation
-from astropy.coordinates import SkyCoord
-from astropy.time import Time
-from astropy.time import TimezoneInfo
-
-from PyQt5 import QtCore, QtWidgets
+from PyQt5 import QtWidgets
 
 from pyastroimageview.uic.mount_settings_uic import Ui_mount_settings_widget
 from pyastroimageview.ApplicationContainer import AppContainer
 from pyastroimageview.DeviceConfigurationUI import device_setup_ui
+from pyastroimageview.DeviceControlUI import PanelPollSubscription
+from pyastroimageview.FITSHeaderBuilder import format_sexagesimal
+from pyastroimageview import EarthOrientation
 
 class MountControlUI(QtWidgets.QWidget):
 
+    # device this panel controls
+    DEVICE_NAME = 'mount'
+
     def __init__(self):
         super().__init__()
 
@@ -64,10 +56,12 @@ class MountControlUI(QtWidgets.QWidget):
 
         self.set_widget_states()
 
-        # polling camera status
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.mount_status_poll)
-        self.timer.start(1000)
+        # mount status while panel is visible
+        self.poll = PanelPollSubscription(self, 'mount', self.mount_status_poll)
+
+        # devices can be connected before the panel is first shown
+        if self.mount_manager.is_connected():
+            self.device_connected()
 
     def set_widget_states(self):
         connect = self.mount_manager.is_connected()
@@ -77,11 +71,11 @@ class MountControlUI(QtWidgets.QWidget):
         self.ui.mount_setting_connect.setEnabled(not connect)
         self.ui.mount_setting_disconnect.setEnabled(connect)
 
-    def mount_status_poll(self):
+    def mount_status_poll(self, status):
         status_string = ''
-        if self.mount_manager.is_connected():
+        if status is not None:
             status_string += 'CONNECTED'
-            if self.mount_manager.is_slewing():
+            if status['slewing']:
                 status_string += ' SLEWING'
             else:
                 status_string += ' IDLE'
@@ -90,53 +84,69 @@ class MountControlUI(QtWidgets.QWidget):
 
         self.ui.mount_setting_status.setText(status_string)
 
-        if self.mount_manager.is_connected():
-            (ra, dec) = self.mount_manager.get_position_radec()
-            radec = SkyCoord(ra=ra * u.hour, dec=dec * u.degree, frame='fk5')
-            rastr = radec.ra.to_string(u.hour, sep=":", precision=1, pad=True)
-            decstr = radec.dec.to_string(alwayssign=True, sep=":", precision=1, pad=True)
+        if status is not None:
+            (ra, dec) = status['radec']
+            rastr = format_sexagesimal(ra, sep=':', precision=1, wrap=24)
+            decstr = format_sexagesimal(dec, sep=':', precision=1, alwayssign=True)
             self.ui.mount_setting_position_ra.setText(rastr)
             self.ui.mount_setting_position_dec.setText(decstr)
 
-            (alt, az) = self.mount_manager.get_position_altaz()
+            (alt, az) = status['altaz']
 
-            if alt is not None and az is not None:
-                altaz = AltAz(alt=alt * u.degree, az=az * u.degree)
-#                logging.info(f'altaz from mount is {altaz}')
-            else:
+            if alt is None or az is None:
                 # FIXME Add code to compute alt/az when not given by mount
 #                logging.info('Alt/az not available from mount - calculating')
-
-                # FIXME we don't really force user to set lat/lon so this will give
-                #       wrong results by default!
-                site_loc = EarthLocation(lat=self.settings.location_latitude * u.degree,
-                                         lon=self.settings.location_longitude * u.degree,
-                                         height=self.settings.location_altitude * u.meter)
-
-#                logging.info(f'site_loc = {site_loc}')
-#                logging.info(f'timezeon = {self.settings.location_tz}')
-
-                tzinfo = TimezoneInfo(tzname=self.settings.location_tz)
-#                logging.info(f'tzinfo = {tzinfo}')
-
-                time = Time.now()
-                time_local = time.to_datetime(timezone=tzinfo)
-
-#                logging.info(f'time = {time} local = {time_local}')
-
-                altaz = radec.transform_to(AltAz(obstime=time_local, location=site_loc))
-#                logging.info(f'calc altaz is {altaz}')
+                alt, az = self.compute_altaz(ra, dec)
 
             # should have valid alt/az by now so display if possible
-            if altaz is not None:
-                altstr = altaz.alt.to_string(alwayssign=True, sep=":", precision=1, pad=True)
-                azstr = altaz.az.to_string(alwayssign=True, sep=":", precision=1, pad=True)
+            if alt is not None and az is not None:
+                altstr = format_sexagesimal(alt, sep=':', precision=1, alwayssign=True)
+                azstr = format_sexagesimal(az, sep=':', precision=1, alwayssign=True,
+                                           wrap=360)
                 self.ui.mount_setting_position_alt.setText(altstr)
                 self.ui.mount_setting_position_az.setText(azstr)
             else:
                 self.ui.mount_setting_position_alt.setText('N/A')
                 self.ui.mount_setting_position_az.setText('N/A')
 
+    def compute_altaz(self, ra, dec):
+        """Compute alt/az from ra/dec for mounts which don't report it"""
+
+        # astropy coordinates are slow to import so only load them
+        # if a mount actually needs it
+        EarthOrientation.configure_offline()
+
+        from astropy import units as u
+        from astropy.coordinates import AltAz
+        from astropy.coordinates import EarthLocation
+        from astropy.coordinates import SkyCoord
+        from astropy.time import Time
+        from astropy.time import TimezoneInfo
+
+        radec = SkyCoord(ra=ra * u.hour, dec=dec * u.degree, frame='fk5')
+
+        # FIXME we don't really force user to set lat/lon so this will give
+        #       wrong results by default!
+        site_loc = EarthLocation(lat=self.settings.location_latitude * u.degree,
+                                 lon=self.settings.location_longitude * u.degree,
+                                 height=self.settings.location_altitude * u.meter)
+
+#        logging.info(f'site_loc = {site_loc}')
+#        logging.info(f'timezeon = {self.settings.location_tz}')
+
+        tzinfo = TimezoneInfo(tzname=self.settings.location_tz)
+#        logging.info(f'tzinfo = {tzinfo}')
+
+        time = Time.now()
+        time_local = time.to_datetime(timezone=tzinfo)
+
+#        logging.info(f'time = {time} local = {time_local}')
+
+        altaz = radec.transform_to(AltAz(obstime=time_local, location=site_loc))
+#        logging.info(f'calc altaz is {altaz}')
+
+        return altaz.alt.degree, altaz.az.degree
+
     def set_device_label(self):
         lbl = f'{self.settings.mount_backend}/{self.settings.mount_driver}'
         self.ui.mount_driver_label.setText(lbl)
@@ -147,15 +157,25 @@ class MountControlUI(QtWidgets.QWidget):
 
     def mount_connect(self):
         if self.settings.mount_driver:
-            rc = self.mount_manager.connect(self.settings.mount_driver)
-            if not rc:
-                QtWidgets.QMessageBox.critical(None, 'Error',
-                                               'Unable to connect to mount!',
-                                               QtWidgets.QMessageBox.Ok)
-                return
+            self.ui.mount_setting_connect.setEnabled(False)
+            AppContainer.find('/dev').connect_device('mount', self.mount_connected)
 
+    def mount_connected(self, rc):
+        if not rc:
             self.set_widget_states()
+            QtWidgets.QMessageBox.critical(None, 'Error',
+                                           'Unable to connect to mount!',
+                                           QtWidgets.QMessageBox.Ok)
+            return
+
+        self.device_connected()
+
+    def device_connected(self):
+        """Set up panel once the mount is connected"""
+        self.set_widget_states()
+        self.poll.refresh()
 
     def mount_disconnect(self):
         self.mount_manager.disconnect()
         self.set_widget_states()
+        self.poll.refresh()
@@ -19,10 +19,15 @@
 #
 import logging
 
-class MountManager:
+from pyastroimageview.DeviceLock import DeviceLock, DeviceLockMixin
+
+
+class MountManager(DeviceLockMixin):
     def __init__(self, backend):
         super().__init__(backend)
 
+        self.lock = DeviceLock('mount')
+
     def connect(self, driver):
         if not super().is_connected():
             try:
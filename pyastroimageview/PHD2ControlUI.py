@@ -21,14 +21,13 @@ import sys
 import traceback
 import logging
 
-from PyQt5 import QtCore, QtWidgets
-
-from pyastroimageview.PHD2Manger import PHD2Manager
+from PyQt5 import QtWidgets
 
 from pyastroimageview.uic.phd2_settings_uic import Ui_PHD2ControlUI
 from pyastroimageview.uic.phd2_settings_dialog_uic import Ui_PHD2SettingsDialog
 
 from pyastroimageview.ApplicationContainer import AppContainer
+from pyastroimageview.DeviceControlUI import PanelPollSubscription
 
 class PHD2SettingsDialog(QtWidgets.QDialog):
     def __init__(self):
@@ -72,7 +71,8 @@ class PHD2ControlUI(QtWidgets.QWidget):
         self.ui.phd2_pause.toggled.connect(self.phd2_pause_toggled)
         self.ui.phd2_settings.pressed.connect(self.phd2_settings)
 
-        self.phd2_manager = PHD2Manager()
+        # created by main window since sequences use it too
+        self.phd2_manager = AppContainer.find('/dev/phd2')
         self.phd2_manager.signals.request.connect(self.request_event)
 #        self.phd2_manager.signals.tcperror.connect(self.tcperror)
 #        self.phd2_manager.signals.connect_close.connect(self.connect_close)
@@ -85,10 +85,8 @@ class PHD2ControlUI(QtWidgets.QWidget):
 
         self.set_widget_states()
 
-        # polling phd2 status
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.phd2_status_poll)
-        self.timer.start(5000)
+        # phd2 status while panel is visible
+        self.poll = PanelPollSubscription(self, 'phd2', self.phd2_status_poll)
 
     def set_connectdisconnect_state(self, state):
         """Controls connect/disconnect button state"""
@@ -132,17 +130,16 @@ class PHD2ControlUI(QtWidgets.QWidget):
         self.set_connectdisconnect_state(False)
         self.set_pauseunpause_state(False)
         self.set_widget_states()
+        self.poll.refresh()
         self.disconnecting = False
 
-    def phd2_status_poll(self):
-        # get appstate - will send us an event when result available
-        if self.phd2_manager.is_connected():
-            self.phd2_manager.get_appstate()
-
+    def phd2_status_poll(self, status):
+        # poller asks for appstate - will send us an event when result available
+        if status is not None:
             # status text is a bit complicated as we are overloading its use!
             # composes of two strings separated by a '|' at the moment
             # the first half is appstate and second half is dither state
-            dither_str = str(self.phd2_manager.get_dither_state())
+            dither_str = str(status['dither_state'])
             curstr = self.ui.phd2_status.text()
             fields = curstr.split('|')
             if len(fields) > 1:
@@ -151,6 +148,13 @@ class PHD2ControlUI(QtWidgets.QWidget):
                 fields.append(dither_str)
             newstr = '|'.join(fields)
             self.ui.phd2_status.setText(newstr)
+
+            # show how quickly PHD2 is answering
+            stats = self.phd2_manager.get_request_stats().get('get_app_state', {})
+            if 'mean_ms' in stats:
+                self.ui.phd2_status.setToolTip(f'PHD2 answers in {stats["mean_ms"]:.0f} ms '
+                                               f'(max {stats["max_ms"]:.0f} ms) - '
+                                               f'{stats["timeouts"]} timeouts')
         else:
             self.ui.phd2_status.setText('DISCONNECTED')
 
@@ -190,7 +194,7 @@ class PHD2ControlUI(QtWidgets.QWidget):
 
     def phd2_pause(self):
         logging.debug('phd2_pause')
-        self.phd2_manager.set_pause(True)
+        self.phd2_manager.set_pause(True).add_done_callback(self.pause_done)
         self.set_pauseunpause_state(True)
 
     def phd2_resume(self):
@@ -200,9 +204,16 @@ class PHD2ControlUI(QtWidgets.QWidget):
         f = traceback.extract_stack(stack)[-1]
         logging.debug(f'phd2_resume called from {f}')
 
-        self.phd2_manager.set_pause(False)
+        self.phd2_manager.set_pause(False).add_done_callback(self.pause_done)
         self.set_pauseunpause_state(False)
 
+    def pause_done(self, future):
+        if future.exception() is not None:
+            logging.error(f'phd2 pause/resume failed -> {future.exception()}')
+
+            # button shows what was asked for so get real state
+            self.phd2_manager.get_paused()
+
     def phd2_connect_toggled(self, state):
         logging.info(f'phd2_connect_toggled: {state}')
 
@@ -228,6 +239,7 @@ class PHD2ControlUI(QtWidgets.QWidget):
 
         self.set_connectdisconnect_state(True)
         self.set_widget_states()
+        self.poll.refresh()
         self.phd2_manager.get_paused()
 
     def phd2_disconnect(self):
@@ -238,4 +250,5 @@ class PHD2ControlUI(QtWidgets.QWidget):
 
         self.set_widget_states()
         self.set_pauseunpause_state(False)
+        self.poll.refresh()
         self.disconnecting = False
@@ -17,15 +17,113 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+#
+# Dithering is driven by the PHD2 event stream so nothing blocks the Qt
+# main loop while PHD2 moves the lock position and settles:
+#
+#   dither() sends the command and arms a start timer.  The dither has
+#   started once PHD2 sends GuidingDithered, SettleBegin or Settling.  If
+#   none arrives before the start timer expires, or PHD2 answers the
+#   command with an error, the command is resent up to DITHER_MAX_RETRIES
+#   times before dither_failed is emitted.
+#
+#   Once started the settle timer runs until SettleDone arrives.  Each
+#   state change is announced with dither_state_changed and the Settling
+#   events with dither_settling so the caller can show progress.
+#
+#   dither_settledone, dither_timeout or dither_failed ends every dither
+#   started with dither() and only one of them is emitted.
+#
+# Every request sent to PHD2 returns a concurrent.futures.Future which is
+# completed on the GUI thread when the answer arrives.  A request not
+# answered in time fails with PHD2TimeoutError so a missing answer no
+# longer leaves an entry behind forever.  The status requests the panels
+# poll (get_app_state etc) are coalesced - if one is already waiting on
+# PHD2 the caller gets the same future instead of sending another.  The
+# latency of each method is kept for get_request_stats().
+#
+# process() reads and parses every line PHD2 has sent but emits no signal
+# and completes no future itself.  These are queued and run from the event
+# loop once process() has returned.  Qt does not deliver readyRead again
+# while a slot connected to it is running, so a slot opening a modal dialog
+# from inside process() would leave every answer unread on the socket until
+# the dialog closed.  The queue is shared so notifications keep their
+# order even when a dialog opened by one of them runs the event loop.
+#
 import sys
 import json
 import time
 import logging
 from enum import Enum
+from collections import deque
+from concurrent import futures
 
-from PyQt5 import QtNetwork, QtCore, QtWidgets
+from PyQt5 import QtNetwork, QtCore
 
 from pyastroimageview.ApplicationContainer import AppContainer
+from pyastroimageview.GuideTelemetry import GuideStepBuffer
+
+# seconds to wait for PHD2 to start a dither before resending command
+DITHER_START_TIMEOUT = 3.0
+
+# times dither command is resent before giving up
+DITHER_MAX_RETRIES = 3
+
+# seconds to wait for an answer to a request
+REQUEST_TIMEOUT = 10.0
+
+# requests which only read state so callers can share one in flight
+COALESCED_METHODS = ['get_app_state', 'get_connected', 'get_paused',
+                     'get_pixel_scale']
+
+# latencies kept per method
+LATENCY_SAMPLES = 100
+
+
+class PHD2RequestError(Exception):
+    """PHD2 answered a request with an error or it could not be sent"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class PHD2TimeoutError(PHD2RequestError):
+    """PHD2 did not answer a request in time"""
+
+
+class PHD2Request:
+    """A request waiting on an answer from PHD2"""
+
+    def __init__(self, method, timeout):
+        self.method = method
+        self.future = futures.Future()
+        self.sent = time.monotonic()
+        self.deadline = self.sent + timeout
+
+
+class RequestStats:
+    """Counts and latencies of requests of one method"""
+
+    def __init__(self):
+        self.sent = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latency = deque(maxlen=LATENCY_SAMPLES)
+
+    def to_dict(self):
+        result = {'sent': self.sent,
+                  'coalesced': self.coalesced,
+                  'errors': self.errors,
+                  'timeouts': self.timeouts}
+        if self.latency:
+            latency = sorted(self.latency)
+            result.update({'mean_ms': sum(latency) / len(latency) * 1000,
+                           'p95_ms': latency[int(0.95 * (len(latency) - 1))] * 1000,
+                           'max_ms': latency[-1] * 1000})
+        return result
+
 
 class DitherState(Enum):
     """Represents state of a dither
@@ -42,6 +140,8 @@ class DitherState(Enum):
         SETTLED - settling is complete and back to guiding
         TIMEOUT - not an event from PHD2 - detected by PHD2Manager() when
                   settling did not complete in specified time
+        FAILED - not an event from PHD2 - dither never started after
+                 resending the command or connection to PHD2 was lost
     """
     IDLE = 0
     WAITONDITHER = 1
@@ -50,6 +150,12 @@ class DitherState(Enum):
     SETTLING = 4
     SETTLED = 5
     TIMEOUT = 6
+    FAILED = 7
+
+    def is_active(self):
+        """True while a dither is in progress"""
+        return self in (DitherState.WAITONDITHER, DitherState.DITHERED,
+                        DitherState.SETTLEBEGUN, DitherState.SETTLING)
 
 class PHD2ManagerSignals(QtCore.QObject):
     dither_start = QtCore.pyqtSignal()
@@ -57,6 +163,8 @@ class PHD2ManagerSignals(QtCore.QObject):
     dither_settling = QtCore.pyqtSignal(float, float, float)
     dither_settledone = QtCore.pyqtSignal(bool)
     dither_timeout = QtCore.pyqtSignal()
+    dither_failed = QtCore.pyqtSignal(str)
+    dither_state_changed = QtCore.pyqtSignal(object)
     guidestep = QtCore.pyqtSignal()
     guiding_stop = QtCore.pyqtSignal()
     paused = QtCore.pyqtSignal()
@@ -73,17 +181,58 @@ class PHD2ManagerSignals(QtCore.QObject):
     disconnected = QtCore.pyqtSignal()
 
 class PHD2Manager:
+    """
+    Connection to the PHD2 event server.
+
+    Parameters
+    ----------
+    host : str
+        Host PHD2 runs on.
+    port : int
+        PHD2 event server port.
+    """
 
-    def __init__(self):
+    def __init__(self, host='127.0.0.1', port=4400):
+        self.host = host
+        self.port = port
         self.socket = None
+
+        # requests waiting on an answer keyed by id
         self.requests = {}
         self.request_id = 0
+        # id of coalesced request in flight keyed by method
+        self.inflight = {}
+        self.request_stats = {}
         self.connected = False
         self.guiding = False
         self.dither_state = DitherState.IDLE
-        self.dither_timeout_timer = None
+        # signals and future results waiting until lines read are parsed
+        self.pending = deque()
+        # True while process() is parsing lines
+        self.reading = False
+        self.dither_params = None
+        self.dither_future = None
+        self.dither_attempts = 0
+        self.dither_settle_timeout = None
         self.signals = PHD2ManagerSignals()
 
+        # recent guide steps to summarize guiding during each frame
+        self.guide_steps = GuideStepBuffer()
+        # guide camera arcsec/pixel - None until PHD2 reports it
+        self.pixel_scale = None
+
+        self.dither_start_timer = QtCore.QTimer()
+        self.dither_start_timer.setSingleShot(True)
+        self.dither_start_timer.timeout.connect(self.dither_start_timed_out)
+
+        self.dither_timeout_timer = QtCore.QTimer()
+        self.dither_timeout_timer.setSingleShot(True)
+        self.dither_timeout_timer.timeout.connect(self.dither_timed_out)
+
+        # only runs while requests are waiting on an answer
+        self.request_timer = QtCore.QTimer()
+        self.request_timer.timeout.connect(self.expire_requests)
+
         AppContainer.register('/dev/phd2', self)
 
     def connect(self):
@@ -99,24 +248,27 @@ class PHD2Manager:
         # FIXME Does this leak sockets?  Need to investigate why
         # setting self.socket = None causes SEGV when disconnected
         # (ie PHD2 closes).
-        self.socket.connectToHost('127.0.0.1', 4400)
+        self.socket.connectToHost(self.host, self.port)
 
         logging.info('waiting')
 
         # should be quick so we connect synchronously
         if not self.socket.waitForConnected(5000):
-            logging.error('Could not connect to PHD2')
+            logging.error(f'Could not connect to PHD2 at {self.host}:{self.port}')
             self.socket = None
             return False
 
         self.connected = True
         self.guiding = False
+        self.guide_steps.clear()
 
         self.socket.readyRead.connect(self.process)
         self.socket.error.connect(self.error)
         self.socket.stateChanged.connect(self.state_changed)
         self.socket.disconnected.connect(self.disconnected)
 
+        self.get_pixel_scale()
+
         return True
 
     def disconnect(self):
@@ -132,6 +284,7 @@ class PHD2Manager:
             logging.error('Exception PHD2Manager:disconnect()!', exc_info=True)
 
         self.connected = False
+        self.fail_requests('disconnected from PHD2')
 
     def is_connected(self):
         return self.connected
@@ -139,9 +292,37 @@ class PHD2Manager:
     def get_dither_state(self):
         return self.dither_state
 
+    def poll_status(self):
+        """
+        Ask PHD2 for its app state and return current status.
+
+        Called periodically by the DevicePoller.  The app state answer is
+        delivered later through the request signal.
+        """
+        self.get_appstate()
+        return {'dither_state': self.dither_state,
+                'guiding': self.guiding}
+
     def is_guiding(self):
         return self.guiding
 
+    def get_guiding_stats(self, start, end):
+        """
+        Summarize guiding between two times.
+
+        Parameters
+        ----------
+        start, end : float
+            Unix times - usually the start and end of an exposure.
+
+        Returns
+        -------
+        dict
+            See GuideStepBuffer.stats().  Distances are in arcsec if the
+            guide camera pixel scale is known otherwise in pixels.
+        """
+        return self.guide_steps.stats(start, end, self.pixel_scale)
+
     #
     # FOR REFERENCE - I have found setting self.socket to None causes SEGV when
     #                 the other end has disconnected (like you close PHD2)
@@ -156,6 +337,8 @@ class PHD2Manager:
         logging.info('disconnected signal from socket!')
 
         self.connected = False
+        self.dither_abort('connection to PHD2 lost')
+        self.fail_requests('connection to PHD2 lost')
         self.signals.disconnected.emit()
 
     def state_changed(self, state):
@@ -166,6 +349,8 @@ class PHD2Manager:
             if self.connected:
                 self.connected = False
 #                    self.socket = None
+                self.dither_abort('connection to PHD2 lost')
+                self.fail_requests('connection to PHD2 lost')
                 self.signals.connect_close.emit(state)
 
     def error(self, socket_error):
@@ -181,92 +366,105 @@ class PHD2Manager:
             logging.error('PHD2Manager:process PHD2 not connected!')
             return False
 
-        while True:
-            resp = self.socket.readLine(2048)
-
-            if len(resp) < 1:
-                break
-
-#            logging.info(f'{resp}')
-
-            try:
-                j = json.loads(resp)
-
-#                logging.info(f'j->{j}')
-
-                # is this a resonse to a request?
-                if 'jsonrpc' in j:
-                    id = j['id']
-
-                    # match up with any outgoing requests
-                    if id in self.requests:
-                        reqtype = self.requests[id]
-
-                        # sniff to see if appstate affects guiding
-                        if reqtype == 'get_appstate':
-                            appstate = j['result']
-                            logging.debug('phd2manager: detected app_state msg with '
-                                          f'state = {appstate}')
-                            if appstate != 'Guiding' or appstate != 'LostLock':
-                                self.guiding = True
-                            else:
-                                self.guiding = False
-                            logging.debug('phd2manager: based on app_state set '
-                                          f'guiding to {self.guiding}')
-                        self.signals.request.emit(reqtype, j['result'])
-
-                        del self.requests[id]
-
-                    continue
-
-                # otherwise must be an event?
-                event = j['Event']
-
-                if event != 'GuideStep':
-                    logging.info(f'{j}')
-
-                if event == 'GuidingDithered':
-                    self.dither_state = DitherState.DITHERED
-                    self.signals.dither_start.emit()
-                elif event == 'SettleBegin':
-                    self.dither_state = DitherState.SETTLEBEGUN
-                    self.signals.dither_settlebegin.emit()
-                elif event == 'Settling':
-                    self.dither_state = DitherState.SETTLING
-                    self.signals.dither_settling.emit(j['Distance'], j['Time'], j['SettleTime'])
-                elif event == 'SettleDone':
-                    self.dither_state = DitherState.SETTLED
-                    # first stop the dither timeout countdown!
-                    if self.dither_timeout_timer is not None:
-                        self.dither_timeout_timer.stop()
-                        self.dither_timeout_timer = None
+        self.reading = True
+        try:
+            while self.socket.canReadLine():
+                self.process_line(bytes(self.socket.readLine()))
+        finally:
+            self.reading = False
 
-                    # send signal indicating the dither settled
-                    self.signals.dither_settledone.emit(j['Status'] == 0)
-                elif event == 'LoopingExposures':
-                    self.signals.looping_start.emit()
-                elif event == 'LoopingExposuresStopped':
-                    self.signals.looping_stop.emit()
-                elif event == 'Paused':
-                    self.signals.paused.emit()
-                elif event == 'Resumed':
-                    self.signals.resumed.emit()
-                elif event == 'StarLost':
-                    self.signals.starlost.emit()
-                elif event == 'GuidingStopped':
-                    self.guiding = False
-                    self.signals.guiding_stop.emit()
-                elif event == 'GuideStep':
-                    self.guiding = True
-                    self.signals.guidestep.emit()
-            except Exception:
-                # FIXME need more specific exception?
-                logging.error(f'phd2_process - exception message was {resp}!')
-                logging.error('Exception ->', exc_info=True)
-                continue
+        if self.pending:
+            QtCore.QTimer.singleShot(0, self.run_pending)
 
         return True
 
+    def notify(self, func, *args):
+        """
+        Call func(*args) outside of process().
+
+        Used for anything which can run code outside the manager like
+        emitting a signal or completing a request future.  Called right
+        away unless process() is reading lines.
+        """
+        self.pending.append((func, args))
+        if not self.reading:
+            self.run_pending()
+
+    def run_pending(self):
+        """Call queued notifications in the order they were queued"""
+        while self.pending:
+            func, args = self.pending.popleft()
+            func(*args)
+
+    def process_line(self, resp):
+        """Parse one line from PHD2 and queue the resulting notifications"""
+
+#        logging.info(f'{resp}')
+
+        try:
+            j = json.loads(resp)
+
+#            logging.info(f'j->{j}')
+
+            # is this a resonse to a request?
+            if 'jsonrpc' in j:
+                self.request_done(j)
+                return
+
+            # otherwise must be an event?
+            event = j['Event']
+
+            if event != 'GuideStep':
+                logging.info(f'{j}')
+
+            if event == 'GuidingDithered':
+                if self.dither_event(DitherState.DITHERED):
+                    self.notify(self.signals.dither_start.emit)
+            elif event == 'SettleBegin':
+                if self.dither_event(DitherState.SETTLEBEGUN):
+                    self.notify(self.signals.dither_settlebegin.emit)
+            elif event == 'Settling':
+                if self.dither_event(DitherState.SETTLING):
+                    self.notify(self.signals.dither_settling.emit, j['Distance'],
+                                j['Time'], j['SettleTime'])
+            elif event == 'SettleDone':
+                # settling also happens after PHD2 starts guiding so
+                # only a dither we started is ended here
+                if self.dither_state.is_active():
+                    self.dither_timeout_timer.stop()
+                    self.dither_start_timer.stop()
+                    self.dither_future = None
+                    self.set_dither_state(DitherState.SETTLED)
+
+                    if j['Status'] != 0:
+                        logging.warning('phd2manager: settle failed - '
+                                        f'{j.get("Error")}')
+
+                    # send signal indicating the dither settled
+                    self.notify(self.signals.dither_settledone.emit, j['Status'] == 0)
+            elif event == 'LoopingExposures':
+                self.notify(self.signals.looping_start.emit)
+            elif event == 'LoopingExposuresStopped':
+                self.notify(self.signals.looping_stop.emit)
+            elif event == 'Paused':
+                self.notify(self.signals.paused.emit)
+            elif event == 'Resumed':
+                self.notify(self.signals.resumed.emit)
+            elif event == 'StarLost':
+                self.guide_steps.add_star_lost(j.get('Timestamp', time.time()))
+                self.notify(self.signals.starlost.emit)
+            elif event == 'GuidingStopped':
+                self.guiding = False
+                self.notify(self.signals.guiding_stop.emit)
+            elif event == 'GuideStep':
+                self.guiding = True
+                self.guide_steps.append_event(j)
+                self.notify(self.signals.guidestep.emit)
+        except Exception:
+            # FIXME need more specific exception?
+            logging.error(f'phd2_process - exception message was {resp}!')
+            logging.error('Exception ->', exc_info=True)
+
     def dither(self, dither_pix, settle_pix, settle_start_time,
                settle_finish_time, settle_timeout):
         """Sends dither command to PHD2 to initiate a dither operation.
@@ -289,97 +487,193 @@ class PHD2Manager:
         success - bool
             A True return value means the command was sent successfully, otherwise there was
             a problem communicating with PHD2 and False is returned.
+
+        The call returns as soon as the command is sent.  Settling progress and the result are reported with the
+        dither_* signals as the PHD2 events arrive.
         """
 
-        cmd = {"method": "dither",
-               "params": [dither_pix, False,
-                          {"pixels": settle_pix,
-                           "time": settle_start_time,
-                           "timeout": settle_finish_time}]}
-
-        while True:
-            # reset dither state
-            self.dither_state = DitherState.IDLE
-            rc = self.__send_json_command(cmd)
-            if not rc:
-                logging.error('phd2manager:dither - sending json command failed!')
-                return False
-
-            # FIXME 20181022 Having problems under Linux gettng dither cmd
-            #                to send reliably so make sure we see a settling
-            #                event otherwise we resend?
-            #                Not ideal but seems to handle the rare times
-            #                a dither doesnt start on first try
-            logging.info('Waiting for settling to start!')
-            ts = time.time()
-            logging.debug(f'0 self.dither_state = {self.dither_state}')
-
-            while (time.time() - ts) < 3:
-#                logging.info(f'1 self.dither_state = {self.dither_state}')
-                if self.dither_state != DitherState.IDLE:
-                    logging.info('Dither started!')
-                    break
-
-                # let Qt main loop run and find events??
-                QtWidgets.QApplication.processEvents()
-                time.sleep(0.05)
-
-            if self.dither_state != DitherState.IDLE:
-                break
-            logging.warning('resending dither to PHD2!')
-
-        # start a timer for dither timeout (meaning phd2 did not settle in time)
-        self.dither_timeout_timer = QtCore.QTimer()
-        self.dither_timeout_timer.setSingleShot(True)
-        self.dither_timeout_timer.timeout.connect(self.dither_timed_out)
-        self.dither_timeout_timer.start(settle_timeout * 1000)
-        logging.info(f'dither_timeout_timer started for {settle_timeout} seconds!')
+        if self.dither_state.is_active():
+            logging.warning('phd2manager:dither - dither already in progress!')
+            return False
+
+        # FIXME 20181022 Having problems under Linux gettng dither cmd
+        #                to send reliably so if no settling event is seen
+        #                the command is resent by dither_start_timed_out()
+        self.dither_params = [dither_pix, False,
+                              {"pixels": settle_pix,
+                               "time": settle_start_time,
+                               "timeout": settle_finish_time}]
+        self.dither_settle_timeout = settle_timeout
+        self.dither_attempts = 0
+
+        if not self.send_dither():
+            self.set_dither_state(DitherState.IDLE)
+            return False
+
+        return True
+
+    def send_dither(self):
+        """Send (or resend) dither command and wait for PHD2 to start it"""
+        self.dither_attempts += 1
+        self.set_dither_state(DitherState.WAITONDITHER)
+
+        future = self.request('dither', self.dither_params)
+        if future.done():
+            logging.error('phd2manager:dither - sending json command failed!')
+            return False
+
+        self.dither_future = future
+        future.add_done_callback(self.dither_response)
+
+        logging.info(f'Waiting for settling to start (attempt {self.dither_attempts})!')
+        self.dither_start_timer.start(int(DITHER_START_TIMEOUT * 1000))
 
         return True
 
+    def dither_event(self, state):
+        """
+        Advance dither state for a dither event from PHD2.
+
+        Returns True if the event belongs to a dither in progress.
+        """
+        if not self.dither_state.is_active():
+            logging.debug(f'phd2manager: ignoring {state} - no dither in progress')
+            return False
+
+        if self.dither_state == DitherState.WAITONDITHER:
+            logging.info('Dither started!')
+            self.dither_start_timer.stop()
+
+            # start a timer for dither timeout (meaning phd2 did not settle in time)
+            self.dither_timeout_timer.start(int(self.dither_settle_timeout * 1000))
+            logging.info('dither_timeout_timer started for '
+                         f'{self.dither_settle_timeout} seconds!')
+
+        self.set_dither_state(state)
+        return True
+
+    def dither_response(self, future):
+        """Handle answer of PHD2 to the dither command"""
+        # answer to a command which has since been resent
+        if future is not self.dither_future:
+            return
+
+        self.dither_future = None
+
+        error = future.exception()
+        if error is None:
+            return
+
+        logging.error(f'phd2manager: dither command failed -> {error}')
+
+        # no answer is fine as long as the dither events arrive
+        if isinstance(error, PHD2TimeoutError):
+            return
+
+        if self.dither_state == DitherState.WAITONDITHER:
+            self.dither_start_timer.stop()
+            self.dither_retry(str(error))
+
+    def dither_start_timed_out(self):
+        if self.dither_state != DitherState.WAITONDITHER:
+            return
+
+        self.dither_retry('PHD2 did not start dither')
+
+    def dither_retry(self, reason):
+        if self.dither_attempts > DITHER_MAX_RETRIES or not self.connected:
+            self.dither_abort(f'{reason} after {self.dither_attempts} attempts')
+            return
+
+        logging.warning(f'resending dither to PHD2 ({reason})!')
+        if not self.send_dither():
+            self.dither_abort('unable to send dither command')
+
+    def dither_abort(self, reason):
+        """End dither in progress with dither_failed"""
+        if not self.dither_state.is_active():
+            return
+
+        logging.error(f'phd2manager: dither failed - {reason}')
+        self.dither_start_timer.stop()
+        self.dither_timeout_timer.stop()
+        self.dither_future = None
+        self.set_dither_state(DitherState.FAILED)
+        self.signals.dither_failed.emit(reason)
+
     def dither_timed_out(self):
+        if not self.dither_state.is_active():
+            return
+
         logging.error('phd2manager: dither_timed_out(): Dither timed out!')
-        self.dither_state = DitherState.SETTLED
+        self.set_dither_state(DitherState.TIMEOUT)
         self.signals.dither_timeout.emit()
-        self.dither_timeout_timer = None  # we'll make new one if needed
-
-    def set_pause(self, state):
-        cmd = {"method": "set_paused",
-               "params": [state, "Full"]}
 
-        return self.__send_json_command(cmd)
+    def set_dither_state(self, state):
+        if state != self.dither_state:
+            logging.debug(f'phd2manager: dither state {self.dither_state} -> {state}')
+            self.dither_state = state
+            self.notify(self.signals.dither_state_changed.emit, state)
 
-#        cmdstr = json.dumps(cmd) + '\n'
-#        logging.info(f'{bytes(cmdstr, encoding="ascii")}')
-#        self.socket.writeData(bytes(cmdstr, encoding='ascii'))
+    def set_pause(self, state):
+        return self.request('set_paused', [state, "Full"])
 
     def get_connected(self):
         """This tests if PHD2 is connected to hardware, not if the connection
         to PHD2 is active!
         """
-        self.__send_json_request('get_connected')
+        return self.request('get_connected')
 
     def get_appstate(self):
-        self.__send_json_request('get_app_state')
+        return self.request('get_app_state')
 
     def get_paused(self):
-        self.__send_json_request('get_paused')
+        return self.request('get_paused')
 
-    def __send_json_request(self, req):
-        self.requests[self.request_id] = req
-        reqdict = {}
-        reqdict['method'] = req
-        reqdict['id'] = self.request_id
-        self.request_id += 1
+    def get_pixel_scale(self):
+        return self.request('get_pixel_scale')
 
-        cmdstr = json.dumps(reqdict) + '\n'
-        if 'app_state' not in req:
-            logging.debug(f'jsonrequest->{bytes(cmdstr, encoding="ascii")}')
+    def request(self, method, params=None, timeout=REQUEST_TIMEOUT):
+        """
+        Send a request to PHD2.
+
+        Parameters
+        ----------
+        method : str
+            PHD2 JSONRPC method.
+        params : list or dict
+            Method parameters if any.
+        timeout : float
+            Seconds to wait on the answer.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Completed with the result when PHD2 answers.  Fails with
+            PHD2RequestError if PHD2 answers with an error or the request
+            could not be sent and PHD2TimeoutError if there is no answer
+            in time.  Callbacks run on the GUI thread.
+        """
+        stats = self.request_stats.setdefault(method, RequestStats())
+
+        if method in COALESCED_METHODS and method in self.inflight:
+            stats.coalesced += 1
+            return self.requests[self.inflight[method]].future
+
+        req = PHD2Request(method, timeout)
 
         if not self.connected:
-            logging.warning('__send_json_request: not connected!')
-            return False
-            return
+            logging.warning(f'PHD2Manager:request {method}: not connected!')
+            req.future.set_exception(PHD2RequestError('not connected to PHD2'))
+            return req.future
+
+        reqdict = {'method': method, 'id': self.request_id}
+        if params is not None:
+            reqdict['params'] = params
+
+        cmdstr = json.dumps(reqdict) + '\n'
+        if method not in COALESCED_METHODS:
+            logging.debug(f'jsonrequest->{bytes(cmdstr, encoding="ascii")}')
 
         # FIXME this isnt good enough - could be set to None before
         # we actually get to writing
@@ -388,35 +682,93 @@ class PHD2Manager:
             self.socket.writeData(bytes(cmdstr, encoding='ascii'))
         except Exception:
             # FIXME need more specific exception
-            logging.error(f'__send_json_request - req was {req}!')
+            logging.error(f'PHD2Manager:request - req was {reqdict}!')
             logging.error('Exception ->', exc_info=True)
-            return False
-
-        return True
+            req.future.set_exception(PHD2RequestError(f'unable to send {method}'))
+            return req.future
 
-    def __send_json_command(self, cmd):
-        cmd['id'] = self.request_id
+        self.requests[self.request_id] = req
+        if method in COALESCED_METHODS:
+            self.inflight[method] = self.request_id
         self.request_id += 1
+        stats.sent += 1
 
-        cmdstr = json.dumps(cmd) + '\n'
-        logging.debug(f'jsoncmd->{bytes(cmdstr, encoding="ascii")}')
+        if not self.request_timer.isActive():
+            self.request_timer.start(1000)
 
-        # FIXME this isnt good enough - could be set to None before
-        # we actually get to writing
-        # need locking?
-        if not self.connected:
-            logging.warning('__send_json_command: not connected!')
-            return False
+        return req.future
 
-        try:
-            self.socket.writeData(bytes(cmdstr, encoding='ascii'))
-        except Exception:
-            # FIXME need more specific exception
-            logging.error(f'__send_json_command - cmd was {cmd}!')
-            logging.error('Exception ->', exc_info=True)
-            return False
+    def request_done(self, j):
+        """Complete the request PHD2 has answered"""
+        req = self.requests.pop(j.get('id'), None)
+        if req is None:
+            logging.warning(f'PHD2Manager: answer to unknown or expired request {j}')
+            return
 
-        return True
+        method = req.method
+        if self.inflight.get(method) == j['id']:
+            del self.inflight[method]
+
+        stats = self.request_stats[method]
+        stats.latency.append(time.monotonic() - req.sent)
+
+        if 'error' in j:
+            stats.errors += 1
+            error = j['error']
+            self.notify(req.future.set_exception,
+                        PHD2RequestError(error.get('message', str(error)),
+                                         code=error.get('code')))
+            return
+
+        result = j.get('result')
+
+        # sniff to see if appstate affects guiding
+        if method == 'get_app_state':
+            logging.debug('phd2manager: detected app_state msg with '
+                          f'state = {result}')
+            self.guiding = result in ('Guiding', 'LostLock')
+            logging.debug('phd2manager: based on app_state set '
+                          f'guiding to {self.guiding}')
+        elif method == 'get_pixel_scale':
+            self.pixel_scale = result
+            logging.info(f'phd2manager: pixel scale {self.pixel_scale}')
+
+        self.notify(self.signals.request.emit, method, result)
+        self.notify(req.future.set_result, result)
+
+    def expire_requests(self):
+        """Fail requests PHD2 has not answered in time"""
+        now = time.monotonic()
+        for reqid, req in list(self.requests.items()):
+            if now < req.deadline:
+                continue
+
+            logging.error(f'PHD2Manager: no answer to {req.method} id {reqid}')
+            del self.requests[reqid]
+            if self.inflight.get(req.method) == reqid:
+                del self.inflight[req.method]
+            self.request_stats[req.method].timeouts += 1
+            req.future.set_exception(PHD2TimeoutError(f'no answer to {req.method}'))
+
+        if not self.requests:
+            self.request_timer.stop()
+
+    def fail_requests(self, reason):
+        """Fail all requests waiting on an answer"""
+        pending = list(self.requests.values())
+        self.requests = {}
+        self.inflight = {}
+        self.request_timer.stop()
+
+        for req in pending:
+            req.future.set_exception(PHD2RequestError(reason))
+
+    def get_request_stats(self):
+        """Return dictionary of request counts and latency per method"""
+        result = {method: stats.to_dict()
+                  for method, stats in self.request_stats.items()}
+        result['pending'] = len(self.requests)
+        return result
 
 
 # TESTING ONLY
@@ -432,7 +784,7 @@ def connect_phd2():
 def dither_phd2():
     global p
 
-    p.dither(1.0, 0.5, 15, 90)
+    p.dither(1.0, 0.5, 5, 15, 90)
 
 
 if __name__ == '__main__':
@@ -58,6 +58,8 @@ class ProgramSettings:
         self.filterwheel_driver = ''
         self.mount_backend = None
         self.mount_driver = ''
+        # connect all devices with a driver set when program starts
+        self.connect_devices_at_startup = False
 
         # sequence settings
         self.sequence_targetdir = ''
@@ -69,6 +71,14 @@ class ProgramSettings:
         self.sequence_warn_coolertemp = True
         self.sequence_mount_warn_notconnect = True
         self.sequence_overwritefiles = False
+        # key of ImageWriter.OUTPUT_FORMATS for new sequences
+        self.sequence_output_format = 'fits'
+        # frames which can be compressed/written at the same time
+        self.sequence_write_threads = 2
+        # database of written frames - empty means the default location
+        self.frame_catalog_path = ''
+        # journal of running sequence - empty means the default location
+        self.sequence_journal_path = ''
 
         # phd2 settings
         self.phd2_scale = 1.0
@@ -76,6 +86,20 @@ class ProgramSettings:
         self.phd2_settledtime = 10.0
         self.phd2_starttime = 5
         self.phd2_threshold = 0.5
+        # PHD2 event server - PHD2 uses port 4400 + instance number - 1
+        self.phd2_host = '127.0.0.1'
+        self.phd2_port = 4400
+
+        # ui settings
+        # titles of device control panels the user has collapsed
+        self.device_control_collapsed = []
+
+        # rpc settings
+        # asyncio transport serves RPC requests from its own thread
+        # an empty unix socket path means use the default location
+        self.rpc_async_enabled = False
+        self.rpc_async_unix_path = ''
+        self.rpc_async_port = 0
 
     def get_key(self, key):
         return self.__getattr__(key)
@@ -105,6 +129,21 @@ class ProgramSettings:
         homedir = os.path.expanduser('~')
         return os.path.join(homedir, '.config', 'pyastroimageview')
 
+    def get_rpc_socket_path(self):
+        if self.rpc_async_unix_path:
+            return self.rpc_async_unix_path
+        return os.path.join(self._get_config_dir(), 'rpc.sock')
+
+    def get_frame_catalog_path(self):
+        if self.frame_catalog_path:
+            return self.frame_catalog_path
+        return os.path.join(self._get_config_dir(), 'frames.db')
+
+    def get_sequence_journal_path(self):
+        if self.sequence_journal_path:
+            return self.sequence_journal_path
+        return os.path.join(self._get_config_dir(), 'sequence.journal')
+
     def _get_config_filename(self):
         return os.path.join(self._get_config_dir(), 'default.ini')
 
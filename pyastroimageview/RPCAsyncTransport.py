@@ -0,0 +1,259 @@
+#
+# Asyncio transport for RPC server
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+import json
+import socket
+import asyncio
+import logging
+import threading
+
+from PyQt5 import QtCore
+
+from pyastroimageview.RPCServer import RPCClientSession
+from pyastroimageview.RPCServer import JSON_PARSE_ERRCODE, JSON_INVALID_ERRCODE
+
+# longest request line accepted from a client
+MAX_LINE_LENGTH = 65536
+
+
+class RPCAsyncTransportSignals(QtCore.QObject):
+    # emitted from the transport thread - the connections are queued so the
+    # slots run in the GUI thread where the devices are accessed
+    request = QtCore.pyqtSignal(object, object)
+    disconnected = QtCore.pyqtSignal(object)
+
+
+class RPCAsyncClientSession(RPCClientSession):
+    """
+    Client session for a connection served by the asyncio transport.
+
+    Responses may be written from any thread - they are handed to the
+    event loop of the transport thread to be sent.
+    """
+
+    def __init__(self, loop, writer, session_id):
+        super().__init__(writer, session_id)
+        self.loop = loop
+
+    def write(self, data):
+        if not self.connected:
+            return
+        self.loop.call_soon_threadsafe(self._write, data)
+
+    def _write(self, data):
+        if not self.socket.is_closing():
+            self.socket.write(data)
+
+
+class RPCAsyncTransport:
+    """
+    Serves the RPC protocol from an asyncio event loop on its own thread.
+
+    Connections are accepted on a Unix domain socket (where supported) and
+    optionally a TCP port.  Reading, parsing and validating requests and
+    writing responses all happen on the transport thread so a slow client
+    doesn't hold up the GUI.  Valid requests are passed to the RPCServer
+    which queues and dispatches them on the GUI thread like requests from
+    its own QTcpServer.
+    """
+
+    def __init__(self, rpc_server, unix_path=None, port=None, max_clients=8):
+        self.rpc_server = rpc_server
+        self.unix_path = unix_path
+        self.port = port
+        self.max_clients = max_clients
+
+        self.loop = None
+        self.thread = None
+        self.servers = []
+        self.sessions = set()
+
+        # set once the listeners are up (or failed to start)
+        self.started = threading.Event()
+        self.start_ok = False
+
+        self.signals = RPCAsyncTransportSignals()
+        self.signals.request.connect(self.rpc_server.enqueue_request,
+                                     QtCore.Qt.QueuedConnection)
+        self.signals.disconnected.connect(self.rpc_server.drop_session,
+                                          QtCore.Qt.QueuedConnection)
+
+    def start(self, timeout=5):
+        """Start transport thread and wait for the listeners to be created"""
+        if self.thread is not None:
+            logging.warning('RPCAsyncTransport:start() already running!')
+            return self.start_ok
+
+        if self.unix_path and not hasattr(socket, 'AF_UNIX'):
+            logging.warning('RPCAsyncTransport: Unix domain sockets not '
+                            'supported on this platform')
+            self.unix_path = None
+
+        if not self.unix_path and not self.port:
+            logging.error('RPCAsyncTransport: no unix socket path or port configured!')
+            return False
+
+        self.started.clear()
+        self.thread = threading.Thread(target=self._run, name='RPCAsyncTransport',
+                                       daemon=True)
+        self.thread.start()
+
+        if not self.started.wait(timeout):
+            logging.error('RPCAsyncTransport: timed out starting listeners!')
+            return False
+
+        return self.start_ok
+
+    def stop(self, timeout=5):
+        """Close all listeners and client connections and stop the thread"""
+        if self.thread is None:
+            return
+
+        if self.loop is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logging.error('RPCAsyncTransport: transport thread did not exit!')
+
+        self.thread = None
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        try:
+            self.start_ok = self.loop.run_until_complete(self._start_servers())
+        except Exception:
+            logging.error('RPCAsyncTransport: error starting listeners', exc_info=True)
+            self.start_ok = False
+
+        self.started.set()
+
+        if self.start_ok:
+            self.loop.run_forever()
+
+        self.loop.close()
+        self.loop = None
+
+    async def _start_servers(self):
+        if self.unix_path:
+            # remove stale socket left by a previous run
+            if os.path.exists(self.unix_path):
+                os.unlink(self.unix_path)
+
+            server = await asyncio.start_unix_server(self._handle_client,
+                                                     path=self.unix_path,
+                                                     limit=MAX_LINE_LENGTH)
+            os.chmod(self.unix_path, 0o600)
+            self.servers.append(server)
+            logging.info(f'RPCAsyncTransport listening on {self.unix_path}')
+
+        if self.port:
+            server = await asyncio.start_server(self._handle_client,
+                                                host='127.0.0.1',
+                                                port=self.port,
+                                                limit=MAX_LINE_LENGTH)
+            self.servers.append(server)
+            logging.info(f'RPCAsyncTransport listening on 127.0.0.1:{self.port}')
+
+        return True
+
+    async def _shutdown(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
+
+        for session in list(self.sessions):
+            session.socket.close()
+
+        if self.unix_path and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
+
+        self.loop.stop()
+
+    async def _handle_client(self, reader, writer):
+        if len(self.sessions) >= self.max_clients:
+            logging.error(f'RPCAsyncTransport: refusing connection - already '
+                          f'have {len(self.sessions)} clients connected')
+            writer.close()
+            return
+
+        # TCP clients send small requests and wait for the answer so
+        # don't let Nagle hold up responses
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        session = RPCAsyncClientSession(self.loop, writer,
+                                        f'async-{self.rpc_server.new_session_id()}')
+        self.sessions.add(session)
+
+        logging.info(f'RPCAsyncTransport: new client {session}')
+
+        self.rpc_server.send_initial_message(session)
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # line exceeded MAX_LINE_LENGTH
+                    logging.error(f'RPCAsyncTransport: request too long from {session}')
+                    break
+
+                if not line:
+                    break
+
+                self._handle_line(session, line)
+
+                # let queued responses drain before reading more
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            session.connected = False
+            self.sessions.discard(session)
+            writer.close()
+            self.signals.disconnected.emit(session)
+
+            logging.info(f'RPCAsyncTransport: client {session} disconnected')
+
+    def _handle_line(self, session, line):
+        try:
+            j = json.loads(line)
+        except json.JSONDecodeError:
+            logging.error(f'RPCAsyncTransport - could not decode {line}!')
+            self.rpc_server.send_json_error_response(session, JSON_PARSE_ERRCODE,
+                                                     'JSON Decoder error')
+            return
+
+        if not isinstance(j, dict) or 'method' not in j:
+            logging.warning(f'RPCAsyncTransport: ignoring message without a method {j}')
+            return
+
+        if 'id' not in j:
+            logging.error(f'received method request of {j["method"]} but no id included - aborting!')
+            self.rpc_server.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                                     'Invalid request - no ID')
+            return
+
+        self.signals.request.emit(session, j)
@@ -20,15 +20,10 @@
 import os
 import sys
 import json
-import math
+import time
 import logging
-
-from astropy import units as u
-from astropy.coordinates import AltAz
-from astropy.coordinates import Angle
-from astropy.coordinates import FK5
-from astropy.coordinates import SkyCoord
-from astropy.time import Time
+import itertools
+from collections import deque
 
 from PyQt5 import QtNetwork, QtCore
 
@@ -56,16 +51,74 @@ else:
 class RPCServerSignals(QtCore.QObject):
     new_camera_image = QtCore.pyqtSignal(object)
 
+class RPCClientSession:
+    """
+    State for a single connected RPC client.
+
+    Each client gets its own queue of pending requests so the server can
+    interleave requests from several clients fairly instead of servicing
+    whichever client happens to write the most data.
+    """
+
+    def __init__(self, socket, session_id):
+        self.socket = socket
+        self.session_id = session_id
+        self.connected = True
+        self.connect_time = time.time()
+
+        # pending requests as (json request, time received) tuples
+        self.requests = deque()
+
+        # last image taken by this client - used by 'save_image'
+        self.current_image = None
+
+        # some simple statistics
+        self.num_requests = 0
+        self.num_errors = 0
+        self.total_queue_wait = 0
+
+    def write(self, data):
+        self.socket.write(data)
+
+    def __str__(self):
+        return f'RPCClientSession(id={self.session_id} ' \
+               f'pending={len(self.requests)} requests={self.num_requests} ' \
+               f'errors={self.num_errors})'
+
 class RPCServer:
-    def __init__(self, port=8800):
+    # maximum number of requests dispatched before returning to the
+    # Qt event loop so the GUI stays responsive under load
+    DISPATCH_BATCH = 16
+
+    def __init__(self, port=8800, max_clients=8, camera_wait_timeout=600):
         self.server = None
         self.port = port
-        self.client_sockets = []
+        self.max_clients = max_clients
+
+        # how long a 'take_image' request will wait for the camera to
+        # become available before an error is returned
+        self.camera_wait_timeout = camera_wait_timeout
+
+        # connected clients indexed by socket
+        self.sessions = {}
+        self.session_ids = itertools.count()
+
+        # sessions with pending requests in round robin order
+        self.ready_sessions = deque()
+        self.dispatch_pending = False
+
+        # 'take_image' requests waiting on the camera lock
+        # stored as (session, json request, time queued) tuples
+        self.camera_waiters = deque()
+        self.camera_waiter_timer = QtCore.QTimer()
+        self.camera_waiter_timer.timeout.connect(self.expire_camera_waiters)
+
         self.disconnected_signal_mapper = QtCore.QSignalMapper()
+        self.disconnected_signal_mapper.mapped[QtCore.QObject].connect(self.client_disconnect_event)
         self.ready_read_signal_mapper = QtCore.QSignalMapper()
+        self.ready_read_signal_mapper.mapped[QtCore.QObject].connect(self.client_readready_event)
 
         self.exposure_ongoing = False
-        self.exposure_ongoing_method_id = None
         self.exposure_frametype = 'Light'
         self.current_image = None
 
@@ -74,11 +127,14 @@ class RPCServer:
         AppContainer.register('/dev/rpcserver', self)
 
         self.device_manager = AppContainer.find('/dev')
+        self.header_builder = AppContainer.find('/fits_header_builder')
+        AppContainer.subscribe('/fits_header_builder', self.header_builder_changed)
         self.device_manager.camera.signals.exposure_complete.connect(self.camera_exposure_complete)
+        self.device_manager.camera.signals.lock.connect(self.camera_lock_changed)
 
-        # FIXME need better way to represent ongoing exposure!
+        # the client session which started the current exposure
         self.exposure_ongoing_method_id = None
-        self.exposure_ongoing_socket = None
+        self.exposure_ongoing_session = None
 
         # FOR TESTING MAINLY!
 #        self.ping_timer = QtCore.QTimer()
@@ -109,7 +165,7 @@ class RPCServer:
         # FIXME Need some error handling!
         self.server = QtNetwork.QTcpServer()
 
-        self.server.setMaxPendingConnections(1)
+        self.server.setMaxPendingConnections(self.max_clients)
 
         # FIXME make port configurable!
         # FOR TESTING ONLY CAN USE QtNetwork.QHostAddress.AnyIPv4 to listen to all interfaces
@@ -124,37 +180,79 @@ class RPCServer:
     def new_connection_event(self):
         logging.info('RPCServer:new_connection_event')
 
-        client_socket = self.server.nextPendingConnection()
-        client_socket.disconnected.connect(self.disconnected_signal_mapper.map)
-        self.disconnected_signal_mapper.setMapping(client_socket, client_socket)
-        self.disconnected_signal_mapper.mapped[QtCore.QObject].connect(self.client_disconnect_event)
+        while self.server.hasPendingConnections():
+            client_socket = self.server.nextPendingConnection()
 
-        client_socket.readyRead.connect(self.ready_read_signal_mapper.map)
-        self.ready_read_signal_mapper.setMapping(client_socket, client_socket)
-        self.ready_read_signal_mapper.mapped[QtCore.QObject].connect(self.client_readready_event)
+            if len(self.sessions) >= self.max_clients:
+                logging.error(f'RPCServer: refusing connection - already have '
+                              f'{len(self.sessions)} clients connected')
+                client_socket.disconnectFromHost()
+                client_socket.deleteLater()
+                continue
+
+            client_socket.disconnected.connect(self.disconnected_signal_mapper.map)
+            self.disconnected_signal_mapper.setMapping(client_socket, client_socket)
 
-        self.client_sockets.append(client_socket)
+            client_socket.readyRead.connect(self.ready_read_signal_mapper.map)
+            self.ready_read_signal_mapper.setMapping(client_socket, client_socket)
 
-        if not self.send_initial_message(client_socket):
-            logging.error('new_connection_event: Error sending initial message!')
+            session = RPCClientSession(client_socket, self.new_session_id())
+            self.sessions[client_socket] = session
+
+            logging.info(f'RPCServer: new client {session} - '
+                         f'{len(self.sessions)} clients connected')
+
+            if not self.send_initial_message(session):
+                logging.error('new_connection_event: Error sending initial message!')
 
         logging.info('Done')
 
     def client_disconnect_event(self, socket):
         logging.info(f'RPCServer:client_disconnect_event! socket={socket}')
 
-        if socket in self.client_sockets:
-            self.disconnected_signal_mapper.removeMappings(socket)
-            self.ready_read_signal_mapper.removeMappings(socket)
-            self.client_sockets.remove(socket)
-        else:
+        session = self.sessions.pop(socket, None)
+        if session is None:
             logging.warning('Received disconnect event for socket that wasnt in list!')
+            return
+
+        self.disconnected_signal_mapper.removeMappings(socket)
+        self.ready_read_signal_mapper.removeMappings(socket)
+        socket.deleteLater()
+
+        self.drop_session(session)
+
+        logging.info(f'RPCServer: client {session} disconnected - '
+                     f'{len(self.sessions)} clients connected')
+
+    def new_session_id(self):
+        # may be called from transport threads
+        return next(self.session_ids)
+
+    def drop_session(self, session):
+        """
+        Forget any requests still pending for a client which disconnected.
+
+        An exposure the client started is left to finish so the camera
+        lock is released normally.
+        """
+        session.connected = False
+        session.requests.clear()
+        if session in self.ready_sessions:
+            self.ready_sessions.remove(session)
+        self.camera_waiters = deque(w for w in self.camera_waiters if w[0] is not session)
 
     def client_readready_event(self, socket):
         #logging.info(f'RPCServer:client_readready_event - socket = {socket}')
 
-        while True:
-            resp = socket.readLine(2048)
+        session = self.sessions.get(socket)
+        if session is None:
+            logging.error('RPCServer: data received for unknown socket!')
+            return
+
+        # only consume complete lines - a partial request stays buffered
+        # in the socket until the rest of it arrives
+        while socket.canReadLine():
+            resp = socket.readLine()
 
             if len(resp) < 1:
                 break
@@ -162,14 +260,14 @@ class RPCServer:
             logging.info(f'client sent {resp}')
 
             try:
-                j = json.loads(resp)
+                j = json.loads(bytes(resp))
 
             except json.JSONDecodeError:
                 logging.error(f'RPCServer - exception message was {resp}!')
                 logging.error('JSONDecodeError ->', exc_info=True)
 
                 # send error code back to client
-                self.send_json_error_response(socket, JSON_PARSE_ERRCODE, 'JSON Decoder error')
+                self.send_json_error_response(session, JSON_PARSE_ERRCODE, 'JSON Decoder error')
                 continue
             except Exception:
                 logging.error(f'RPCServer - exception message was {resp}!')
@@ -178,24 +276,144 @@ class RPCServer:
 
             logging.info(f'json = {j}')
 
-            if 'method' in j:
-                method = j['method']
-                if 'id' not in j:
-                    logging.error(f'received method request of {method} but no id included - aborting!')
-                    self.send_json_error_response(socket, JSON_INVALID_ERRCODE, 'Invalid request - no ID')
-                    continue
-
-                method_id = j['id']
-                if method == 'get_camera_info':
-                    if not self.device_manager.camera.is_connected():
-                        logging.info('get_camera_info - camera not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE, 'Camera not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    resdict = {}
-                    resdict['jsonrpc'] = '2.0'
-                    resdict['id'] = method_id
+            if 'method' not in j:
+                logging.warning(f'RPCServer: ignoring message without a method {j}')
+                continue
+
+            if 'id' not in j:
+                logging.error(f'received method request of {j["method"]} but no id included - aborting!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE, 'Invalid request - no ID')
+                continue
+
+            self.enqueue_request(session, j)
+
+    def enqueue_request(self, session, j):
+        """Add a validated request to the queue for a client"""
+        if not session.connected:
+            return
+
+        if not session.requests:
+            self.ready_sessions.append(session)
+        session.requests.append((j, time.time()))
+
+        self.schedule_dispatch()
+
+    def schedule_dispatch(self):
+        """Arrange for queued requests to be handled from the event loop"""
+        if not self.dispatch_pending:
+            self.dispatch_pending = True
+            QtCore.QTimer.singleShot(0, self.dispatch_requests)
+
+    def dispatch_requests(self):
+        """
+        Handle queued requests one at a time from each client in turn.
+
+        A client sending a burst of requests only gets one serviced per
+        round so other clients are not starved.  At most DISPATCH_BATCH
+        requests are handled before returning to the event loop.
+        """
+        self.dispatch_pending = False
+
+        self.dispatch_batch()
+
+        if self.ready_sessions:
+            self.schedule_dispatch()
+
+    def dispatch_batch(self):
+        for _ in range(self.DISPATCH_BATCH):
+            if not self.ready_sessions:
+                break
+
+            session = self.ready_sessions.popleft()
+            j, queued_time = session.requests.popleft()
+
+            # still more to do for this client so back of the line
+            if session.requests:
+                self.ready_sessions.append(session)
+
+            session.num_requests += 1
+            session.total_queue_wait += time.time() - queued_time
+
+            self.safe_handle_request(session, j)
+
+    def safe_handle_request(self, session, j):
+        """Handle request and send client an error if handling it fails"""
+        try:
+            self.handle_request(session, j)
+        except Exception:
+            logging.error(f'RPCServer: exception handling request {j}', exc_info=True)
+            self.send_json_error_response(session, JSON_INTERROR_ERRCODE,
+                                          'Internal error',
+                                          msgid=j.get('id'))
+
+    def header_builder_changed(self, key, header_builder):
+        self.header_builder = header_builder
+
+    def queue_camera_waiter(self, session, j):
+        """Queue a 'take_image' request until the camera lock is available"""
+        logging.info(f'RPCServer: camera busy - queuing request {j["id"]} '
+                     f'from {session}')
+        self.camera_waiters.append((session, j, time.time()))
+        if not self.camera_waiter_timer.isActive():
+            self.camera_waiter_timer.start(1000)
+
+    def camera_lock_changed(self, locked):
+        if not locked and self.camera_waiters:
+            # don't handle waiters from inside the release_lock() call
+            QtCore.QTimer.singleShot(0, self.retry_camera_waiters)
+
+    def retry_camera_waiters(self):
+        """Hand the camera to the oldest queued 'take_image' request"""
+        while self.camera_waiters:
+            if self.device_manager.camera.lock.available() < 1:
+                # someone else grabbed the camera first - wait for next release
+                return
+
+            session, j, queued_time = self.camera_waiters.popleft()
+            if not session.connected:
+                continue
+
+            logging.info(f'RPCServer: camera available - handling queued '
+                         f'request {j["id"]} from {session} after '
+                         f'{time.time() - queued_time:.1f} seconds')
+            self.safe_handle_request(session, j)
+            return
+
+        self.camera_waiter_timer.stop()
+
+    def expire_camera_waiters(self):
+        """Return an error for requests which waited too long for the camera"""
+        now = time.time()
+        waiters = deque()
+        for session, j, queued_time in self.camera_waiters:
+            if now - queued_time > self.camera_wait_timeout:
+                logging.error(f'RPCServer: take_image request {j["id"]} from '
+                              f'{session} timed out waiting on camera lock!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Could not lock camera',
+                                              msgid=j['id'])
+            else:
+                waiters.append((session, j, queued_time))
+
+        self.camera_waiters = waiters
+        if not self.camera_waiters:
+            self.camera_waiter_timer.stop()
+
+    def handle_request(self, session, j):
+        """Handle a single JSONRPC request from a client"""
+        method = j['method']
+        method_id = j['id']
+
+        if method == 'get_camera_info':
+            if not self.device_manager.camera.is_connected():
+                logging.info('get_camera_info - camera not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE, 'Camera not connected!',
+                                              msgid=method_id)
+                return
+
+            resdict = {}
+            resdict['jsonrpc'] = '2.0'
+            resdict['id'] = method_id
 
 #                    settings = self.device_manager.camera.get_camera_settings()
 #                    setdict = {}
@@ -204,392 +422,409 @@ class RPCServer:
 #                    setdict['roi'] = settings.roi
 #                    setdict['camera_gain'] = settings.camera_gain
 
-                    # new style pyastrobackend call to get a dict
-                    setdict = self.device_manager.camera.get_settings()
-
-                    resdict['result'] = setdict
-
-                    self.__send_json_response(socket, resdict)
-                elif method == 'take_image':
-                    if not self.device_manager.camera.is_connected():
-                        logging.error('take_image - camera not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Camera not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    if 'params' not in j:
-                        logging.error('take_image - no params provided!')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - '
-                                                      'missing parameters!',
-                                                      msgid=method_id)
-                        continue
-
-                    params = j['params']
-
-                    # FIXME - convert get_camera_settings() to get_settings()!
-                    # confusing but get_camera_settings() is a legacy method
-                    # for the CameraManager object while get_settings() is
-                    # a newer Camera object method (which CameraManager inherits)
-                    #
-                    settings = self.device_manager.camera.get_camera_settings()
-                    logging.debug(f'settings = {settings}')
-
-                    exposure = params.get('exposure', None)
-                    newbin = params.get('binning', 1)
-                    newroi = params.get('roi', None)
-                    frametype = params.get('frametype', 'Light')
-                    camera_gain = params.get('camera_gain', None)
-
-                    # NOTE: frametype is a possible argument but the pyastrobackend
-                    #       API doesn't have a way to specify the frametype
-                    #       currently when taking an image so it will always
-                    #       by written out as a 'Light' frame for now
-
-                    if exposure is None:
-                        logging.error('RPCServer:take_image method request but need exposure')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - missing exposure',
-                                                      msgid=method_id)
-                        continue
-                    elif not isinstance(exposure, float) and not isinstance(exposure, int):
-                        logging.error('RPCServer:take_image method request but exposure is not float or int')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - exposure must be float or int',
-                                                      msgid=method_id)
-                        continue
-
-                    if not isinstance(newbin, int):
-                        logging.error('RPCServer:take_image method request but binning is int')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - binning must be int',
-                                                      msgid=method_id)
-                        continue
-
-                    if newroi:
-                        settings = self.device_manager.camera.get_camera_settings()
-                        try:
-                            if len(newroi) != 4:
-                                raise ValueError('roi must be a tuple of length 4')
-
-                            for v in newroi:
-                                logging.debug(f'newroi {v} is type {type(v)}')
-                                if not isinstance(v, int) and not isinstance(v, float):
-                                    raise ValueError('roi tuple elements must be int or float')
-
-                            roi_minx = newroi[0]
-                            roi_miny = newroi[1]
-                            roi_maxx = roi_minx + newroi[2]
-                            roi_maxy = roi_miny + newroi[3]
-                        except:
-                            logging.error('RPCServer:take_image method request '
-                                          'but roi is invalid', exc_info=True)
-                            self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                          'Invalid request - roi not valid',
-                                                          msgid=method_id)
-                            continue
-
-                        if roi_maxx > settings.frame_width/newbin or roi_maxy > settings.frame_height/newbin:
-                            logging.error('RPCServer:take_image method request roi '
-                                          'too large for selected binning')
-                            self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                          'Invalid request - roi '
-                                                          'too large for binning',
-                                                          msgid=method_id)
-                            continue
-
-                    if frametype not in ['Light', 'Bias', 'Dark', 'Flat']:
-                        logging.error(f'RPCServer:take_image method request invalid ]'
-                                      f'frame type {frametype}')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - frametype '
-                                                      'must be Light, Bias, Dark or Flat',
-                                                      msgid=method_id)
-                        continue
-
-                    self.exposure_frametype = frametype
-
-                    if not self.device_manager.camera.get_lock():
-                        logging.error('RPCServer: take_image - unable to get '
-                                      'camera lock!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Could not lock camera',
-                                                      msgid=method_id)
-                        continue
-
-                    logging.info(f'take_image: {exposure} {newbin} {newroi} {frametype}')
-
-                    new_settings = CameraSettings()
-                    if newbin:
-                        new_settings.binning = newbin
-
-                    if newroi is not None:
-                        new_settings.roi = newroi
-                    else:
-                        new_settings.roi = (0,
-                                            0,
-                                            settings.frame_width,
-                                            settings.frame_height)
-                        logging.debug(f'newroi was None set to {new_settings.roi}')
-
-                    new_settings.camera_gain = camera_gain
-                    self.device_manager.camera.set_settings(new_settings)
-
-                    # HACK Don't actually take exposure if doing DSS downloads
-                    if not DSS_CAMERA:
-                        self.device_manager.camera.start_exposure(exposure)
-
-                    # FIXME this is sloppy only works since only one exposure can be going on at a time
-                    self.exposure_ongoing = True
-                    self.exposure_ongoing_method_id = method_id
-                    self.exposure_ongoing_socket = socket
-
-                    # if doing DSS download grab image and call exposure complete handler
-                    #
-                    # MSF 10/31/20 - Disabled this completely as it was causing
-                    #                problems building conda packages and I
-                    #                don't use it often.
-                    #
-                    # if DSS_CAMERA:
-                    #     MAX_DSS_DOWNLOAD_PIXELS = 1024 * 1024  # largest # pixels to download
-
-                    #     if new_settings.roi[2] * new_settings.roi[3] > MAX_DSS_DOWNLOAD_PIXELS:
-                    #         logging.error('Attempt to SkyView download too large an image!')
-                    #         logging.error(f'roi = {new_settings.roi}')
-                    #         logging.error(f'MAX PIX DOWNLOAD = {MAX_DSS_DOWNLOAD_PIXELS}')
-                    #         sys.exit(1)
-
-                    #     from astroquery.skyview import SkyView
-                    #     import astropy.units as u
-
-                    #     if not self.device_manager.mount.is_connected():
-                    #         logging.error(f'DSS_CAMERA - mount not connected!')
-                    #         sys.exit(1)
-
-                    #     ra, dec = self.device_manager.mount.get_position_radec()
-                    #     logging.debug(f'mount ra/dec (hour/deg) = {ra} {dec}')
-
-                    #     # we are assuming mount coordinates are JNOW - need to precess
-                    #     radec_jnow = SkyCoord(f'{ra} {dec}', unit=(u.hour, u.deg), frame='fk5', equinox=Time.now())
-                    #     logging.debug(f'mount jnow = {radec_jnow.ra.to_string(u.hour, sep=":")} '
-                    #                   f'{radec_jnow.dec.to_string(u.deg, sep=":", alwayssign=True)}')
-
-                    #     radec_j2000 = radec_jnow.transform_to(FK5(equinox='J2000'))
-                    #     logging.debug(f'mount j2000 = {radec_j2000.ra.to_string(u.hour, sep=":")} '
-                    #                   f'{radec_j2000.dec.to_string(u.deg, sep=":", alwayssign=True)}')
-
-                    #     sv = SkyView()
-
-                    #     posstr = f'{radec_j2000.ra.degree} {radec_j2000.dec.degree}'
-                    #     pixelstr = f'{int(new_settings.roi[2])}, {int(new_settings.roi[3])}'
-                    #     width = new_settings.roi[2] * DSS_CAMERA_PIXELSCALE * new_settings.binning / 3600.0
-                    #     height = new_settings.roi[3] * DSS_CAMERA_PIXELSCALE * new_settings.binning / 3600.0
-                    #     logging.debug(f'Loading SkyView with pos={posstr} (J2000)'
-                    #                   f' pixels={pixelstr} '
-                    #                   f' height={height} '
-                    #                   f' width={width}')
-                    #     paths = sv.get_images(position=posstr,
-                    #                           coordinates='J2000',
-                    #                           survey=['DSS'],
-                    #                           pixels=pixelstr,
-                    #                           width=width * u.degree,
-                    #                           height=height * u.degree)
-                    #     logging.debug(f'paths={paths}')
-                    #     p = paths[0]
-                    #     p.writeto('a.fits', overwrite=True)
-
-                    #     from pyastroimageview.FITSImage import FITSImage
-
-                    #     pri_header = p[0].header
-                    #     fits_image = FITSImage(p[0].data)
-                    #     # must be FITS so munge into a FITSImage() object
-                    #     logging.debug('get_image_data() returned a FITS object')
-                    #     for key, val in pri_header.items():
-                    #         # Comment/history tends to cause output issues when debugging so just skip
-                    #         if key in ['COMMENT', 'HISTORY']:
-                    #             continue
-                    #         fits_image.set_header_keyvalue(key, val)
-
-                    #     self.camera_exposure_complete((True, fits_image))
-                elif method == 'abort_image':
-                    # 2019/10/07 MSF Added to allow RPC stop of exposure
-                    logging.info('RPC - aborting current exposure (if any)')
-                    self.device_manager.camera.stop_exposure()
-                    self.send_method_complete_message(socket, method_id)
-                elif method == 'save_image':
-                    if not self.current_image:
-                        logging.info('save_image - no image available!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'No image available!',
-                                                      msgid=method_id)
-                        continue
-
-                    if 'params' not in j:
-                        logging.info('save_image - no params provided!')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - '
-                                                      'missing parameters!',
-                                                      msgid=method_id)
-                        continue
-
-                    params = j['params']
-
-                    filename = params.get('filename', None)
-
-                    if filename is None or not isinstance(filename, str):
-                        logging.error('RPCServer:save_image method request '
-                                      'but need filename {filename}')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - '
-                                                      'missing filename',
-                                                      msgid=method_id)
-                        continue
-
-                    program_settings = AppContainer.find('/program_settings')
-                    if program_settings is None:
-                        logging.error('RPCServer():cam_exp_comp: unable to '
-                                      'access program settings!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Error getting program settings',
-                                                      msgid=method_id)
-                        return False
-
-                    # use settings value for overwrite if not provided
-                    overwrite_flag = program_settings.sequence_overwritefiles
-                    overwrite_flag = params.get('overwrite', overwrite_flag)
-
-                    logging.info(f'writing image to {filename}')
-                    try:
-                        self.current_image.save_to_file(filename, overwrite=overwrite_flag)
-                        self.current_image.save_to_file('save_image.fits', overwrite=True)
-                    except Exception:
-                        logging.error('RPCServer: Exception ->', exc_info=True)
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Error writing image',
-                                                      msgid=method_id)
-                        return
-
-                    # TESTING ONLY!!!
-                    # COPY a test file over to requested name so pyfocusstars3 works!
-                    # if False:
-                    #     logging.warning('#########################################')
-                    #     logging.warning('USING TEST DATA INSTEAD OF CAMERA DATA!!!')
-                    #     logging.warning('#########################################')
-                    #     from shutil import copyfile
-                    #     copyfile('INSERT_SRC_FITS_NAME_HERE', filename)
-
-                    self.send_method_complete_message(socket, method_id)
-
-                elif method == 'set_camera_gain':
-                    # FIXME Currently setting camera gain is disbled due to issues
-                    #       setting gain using ASCOM ASI driver
-                    logging.error(f'RPCServer: set_camera_gain currently unsupported')
-                    self.send_json_error_response(socket, JSON_BADMETHOD_ERRCODE,
-                                                  'set_camera_gain currently unsupported',
+            # new style pyastrobackend call to get a dict
+            setdict = self.device_manager.camera.get_settings()
+
+            resdict['result'] = setdict
+
+            self.__send_json_response(session, resdict)
+        elif method == 'take_image':
+            if not self.device_manager.camera.is_connected():
+                logging.error('take_image - camera not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Camera not connected!',
+                                              msgid=method_id)
+                return
+
+            if 'params' not in j:
+                logging.error('take_image - no params provided!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - '
+                                              'missing parameters!',
+                                              msgid=method_id)
+                return
+
+            params = j['params']
+
+            # FIXME - convert get_camera_settings() to get_settings()!
+            # confusing but get_camera_settings() is a legacy method
+            # for the CameraManager object while get_settings() is
+            # a newer Camera object method (which CameraManager inherits)
+            #
+            settings = self.device_manager.camera.get_camera_settings()
+            logging.debug(f'settings = {settings}')
+
+            exposure = params.get('exposure', None)
+            newbin = params.get('binning', 1)
+            newroi = params.get('roi', None)
+            frametype = params.get('frametype', 'Light')
+            camera_gain = params.get('camera_gain', None)
+
+            # NOTE: frametype is a possible argument but the pyastrobackend
+            #       API doesn't have a way to specify the frametype
+            #       currently when taking an image so it will always
+            #       by written out as a 'Light' frame for now
+
+            if exposure is None:
+                logging.error('RPCServer:take_image method request but need exposure')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - missing exposure',
+                                              msgid=method_id)
+                return
+            elif not isinstance(exposure, float) and not isinstance(exposure, int):
+                logging.error('RPCServer:take_image method request but exposure is not float or int')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - exposure must be float or int',
+                                              msgid=method_id)
+                return
+
+            if not isinstance(newbin, int):
+                logging.error('RPCServer:take_image method request but binning is int')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - binning must be int',
+                                              msgid=method_id)
+                return
+
+            if newroi:
+                settings = self.device_manager.camera.get_camera_settings()
+                try:
+                    if len(newroi) != 4:
+                        raise ValueError('roi must be a tuple of length 4')
+
+                    for v in newroi:
+                        logging.debug(f'newroi {v} is type {type(v)}')
+                        if not isinstance(v, int) and not isinstance(v, float):
+                            raise ValueError('roi tuple elements must be int or float')
+
+                    roi_minx = newroi[0]
+                    roi_miny = newroi[1]
+                    roi_maxx = roi_minx + newroi[2]
+                    roi_maxy = roi_miny + newroi[3]
+                except:
+                    logging.error('RPCServer:take_image method request '
+                                  'but roi is invalid', exc_info=True)
+                    self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                                  'Invalid request - roi not valid',
+                                                  msgid=method_id)
+                    return
+
+                if roi_maxx > settings.frame_width/newbin or roi_maxy > settings.frame_height/newbin:
+                    logging.error('RPCServer:take_image method request roi '
+                                  'too large for selected binning')
+                    self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                                  'Invalid request - roi '
+                                                  'too large for binning',
                                                   msgid=method_id)
                     return
 
-                    if not self.device_manager.camera.is_connected():
-                        logging.error(f'request {method} - camera not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Camera not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    if 'params' not in j:
-                        logging.info('set_camera_gain - no params provided!')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - '
-                                                      'missing parameters!',
-                                                      msgid=method_id)
-                        continue
-
-                    params = j['params']
-
-                    camera_gain = params.get('camera_gain', None)
-
-                    logging.debug(f'set_camera_gain: gain = {camera_gain}')
-
-                    if (camera_gain is None
-                        or (not isinstance(camera_gain, int)
-                            and not isinstance(camera_gain, float))):
-                        logging.error(f'RPCServer:set_camera_gain method request '
-                                      'but need gain - recvd {camera_gain}')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - camera_gain',
-                                                      msgid=method_id)
-                        continue
-
-                    rc = self.device_manager.camera.set_camera_gain(camera_gain)
-                    self.send_method_complete_message(socket, method_id)
-
-                elif method == 'set_cooler_state':
-                    if not self.device_manager.camera.is_connected():
-                        logging.error(f'request {method} - camera not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Camera not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    if 'params' not in j:
-                        logging.info('set_cooler_state - no params provided!')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - '
-                                                      'missing parameters!',
-                                                      msgid=method_id)
-                        continue
-
-                    params = j['params']
-
-                    state = params.get('cooler_state', None)
-
-                    logging.debug(f'set_cooler_state: state = {state}')
-
-                    if state is None or not isinstance(state, bool):
-                        logging.error('RPCServer:set_cooler_state method '
-                                      f'request but need state - recvd {state}')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - state',
-                                                      msgid=method_id)
-                        continue
-
-                    rc = self.device_manager.camera.set_cooler_state(state)
-                    self.send_method_complete_message(socket, method_id)
-                elif method == 'set_target_temperature':
-                    if not self.device_manager.camera.is_connected():
-                        logging.error(f'request {method} - camera not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Camera not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    if 'params' not in j:
-                        logging.info('set_target_temperature - no params provided!')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - '
-                                                      'missing parameters!',
-                                                      msgid=method_id)
-                        continue
-
-                    params = j['params']
-
-                    target = params.get('target_temperature', None)
-
-                    logging.debug(f'set_target_temperature: target = {target}')
-
-                    if (target is None
-                        or (not isinstance(target, float)
-                            and not isinstance(target, int))):
-                        logging.error('RPCServer:set_target_temperature method '
-                                      f'request but need target - recvd {target}')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - target',
-                                                      msgid=method_id)
-                        continue
-
-                    rc = self.device_manager.camera.set_target_temperature(target)
-                    self.send_method_complete_message(socket, method_id)
+            if frametype not in ['Light', 'Bias', 'Dark', 'Flat']:
+                logging.error(f'RPCServer:take_image method request invalid ]'
+                              f'frame type {frametype}')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - frametype '
+                                              'must be Light, Bias, Dark or Flat',
+                                              msgid=method_id)
+                return
+
+            if not self.device_manager.camera.get_lock('rpc'):
+                # another client (or the GUI) is using the camera so
+                # wait our turn rather than failing the request
+                logging.info('RPCServer: take_image - unable to get '
+                             'camera lock - queuing request')
+                self.queue_camera_waiter(session, j)
+                return
+
+            self.exposure_frametype = frametype
+
+            logging.info(f'take_image: {exposure} {newbin} {newroi} {frametype}')
+
+            new_settings = CameraSettings()
+            if newbin:
+                new_settings.binning = newbin
+
+            if newroi is not None:
+                new_settings.roi = newroi
+            else:
+                new_settings.roi = (0,
+                                    0,
+                                    settings.frame_width,
+                                    settings.frame_height)
+                logging.debug(f'newroi was None set to {new_settings.roi}')
+
+            new_settings.camera_gain = camera_gain
+            self.device_manager.camera.set_settings(new_settings)
+
+            # FIXME this is sloppy only works since only one exposure can be going on at a time
+            self.exposure_ongoing = True
+            self.exposure_ongoing_method_id = method_id
+            self.exposure_ongoing_session = session
+
+            # HACK Don't actually take exposure if doing DSS downloads
+            if not DSS_CAMERA:
+                self.device_manager.camera.start_exposure(exposure)
+
+            # if doing DSS download grab image and call exposure complete handler
+            #
+            # MSF 10/31/20 - Disabled this completely as it was causing
+            #                problems building conda packages and I
+            #                don't use it often.
+            #
+            # if DSS_CAMERA:
+            #     MAX_DSS_DOWNLOAD_PIXELS = 1024 * 1024  # largest # pixels to download
+
+            #     if new_settings.roi[2] * new_settings.roi[3] > MAX_DSS_DOWNLOAD_PIXELS:
+            #         logging.error('Attempt to SkyView download too large an image!')
+            #         logging.error(f'roi = {new_settings.roi}')
+            #         logging.error(f'MAX PIX DOWNLOAD = {MAX_DSS_DOWNLOAD_PIXELS}')
+            #         sys.exit(1)
+
+            #     from astroquery.skyview import SkyView
+            #     import astropy.units as u
+
+            #     if not self.device_manager.mount.is_connected():
+            #         logging.error(f'DSS_CAMERA - mount not connected!')
+            #         sys.exit(1)
+
+            #     ra, dec = self.device_manager.mount.get_position_radec()
+            #     logging.debug(f'mount ra/dec (hour/deg) = {ra} {dec}')
+
+            #     # we are assuming mount coordinates are JNOW - need to precess
+            #     radec_jnow = SkyCoord(f'{ra} {dec}', unit=(u.hour, u.deg), frame='fk5', equinox=Time.now())
+            #     logging.debug(f'mount jnow = {radec_jnow.ra.to_string(u.hour, sep=":")} '
+            #                   f'{radec_jnow.dec.to_string(u.deg, sep=":", alwayssign=True)}')
+
+            #     radec_j2000 = radec_jnow.transform_to(FK5(equinox='J2000'))
+            #     logging.debug(f'mount j2000 = {radec_j2000.ra.to_string(u.hour, sep=":")} '
+            #                   f'{radec_j2000.dec.to_string(u.deg, sep=":", alwayssign=True)}')
+
+            #     sv = SkyView()
+
+            #     posstr = f'{radec_j2000.ra.degree} {radec_j2000.dec.degree}'
+            #     pixelstr = f'{int(new_settings.roi[2])}, {int(new_settings.roi[3])}'
+            #     width = new_settings.roi[2] * DSS_CAMERA_PIXELSCALE * new_settings.binning / 3600.0
+            #     height = new_settings.roi[3] * DSS_CAMERA_PIXELSCALE * new_settings.binning / 3600.0
+            #     logging.debug(f'Loading SkyView with pos={posstr} (J2000)'
+            #                   f' pixels={pixelstr} '
+            #                   f' height={height} '
+            #                   f' width={width}')
+            #     paths = sv.get_images(position=posstr,
+            #                           coordinates='J2000',
+            #                           survey=['DSS'],
+            #                           pixels=pixelstr,
+            #                           width=width * u.degree,
+            #                           height=height * u.degree)
+            #     logging.debug(f'paths={paths}')
+            #     p = paths[0]
+            #     p.writeto('a.fits', overwrite=True)
+
+            #     from pyastroimageview.FITSImage import FITSImage
+
+            #     pri_header = p[0].header
+            #     fits_image = FITSImage(p[0].data)
+            #     # must be FITS so munge into a FITSImage() object
+            #     logging.debug('get_image_data() returned a FITS object')
+            #     for key, val in pri_header.items():
+            #         # Comment/history tends to cause output issues when debugging so just skip
+            #         if key in ['COMMENT', 'HISTORY']:
+            #             continue
+            #         fits_image.set_header_keyvalue(key, val)
+
+            #     self.camera_exposure_complete((True, fits_image))
+        elif method == 'abort_image':
+            # 2019/10/07 MSF Added to allow RPC stop of exposure
+            logging.info('RPC - aborting current exposure (if any)')
+            self.device_manager.camera.stop_exposure()
+            self.send_method_complete_message(session, method_id)
+        elif method == 'save_image':
+            image = session.current_image
+            if image is None and self.current_image is not None:
+                logging.warning(f'save_image - {session} has not taken an '
+                                f'image - using most recent image')
+                image = self.current_image
+
+            if not image:
+                logging.info('save_image - no image available!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'No image available!',
+                                              msgid=method_id)
+                return
+
+            if 'params' not in j:
+                logging.info('save_image - no params provided!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - '
+                                              'missing parameters!',
+                                              msgid=method_id)
+                return
+
+            params = j['params']
+
+            filename = params.get('filename', None)
+
+            if filename is None or not isinstance(filename, str):
+                logging.error('RPCServer:save_image method request '
+                              'but need filename {filename}')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - '
+                                              'missing filename',
+                                              msgid=method_id)
+                return
+
+            program_settings = AppContainer.find('/program_settings')
+            if program_settings is None:
+                logging.error('RPCServer():cam_exp_comp: unable to '
+                              'access program settings!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Error getting program settings',
+                                              msgid=method_id)
+                return False
+
+            # use settings value for overwrite if not provided
+            overwrite_flag = program_settings.sequence_overwritefiles
+            overwrite_flag = params.get('overwrite', overwrite_flag)
+
+            logging.info(f'writing image to {filename}')
+            try:
+                t0 = time.perf_counter()
+                image.save_to_file(filename, overwrite=overwrite_flag)
+                write_s = time.perf_counter() - t0
+                image.save_to_file('save_image.fits', overwrite=True)
+            except Exception:
+                logging.error('RPCServer: Exception ->', exc_info=True)
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Error writing image',
+                                              msgid=method_id)
+                return
+
+            catalog = AppContainer.get('/frame_catalog')
+            if catalog is not None:
+                try:
+                    catalog.add_frame(filename, image, source='rpc',
+                                      output_format='fits', write_s=write_s)
+                except Exception:
+                    logging.error('RPCServer: unable to catalog '
+                                  f'{filename}', exc_info=True)
+
+            # TESTING ONLY!!!
+            # COPY a test file over to requested name so pyfocusstars3 works!
+            # if False:
+            #     logging.warning('#########################################')
+            #     logging.warning('USING TEST DATA INSTEAD OF CAMERA DATA!!!')
+            #     logging.warning('#########################################')
+            #     from shutil import copyfile
+            #     copyfile('INSERT_SRC_FITS_NAME_HERE', filename)
+
+            self.send_method_complete_message(session, method_id)
+
+        elif method == 'set_camera_gain':
+            # FIXME Currently setting camera gain is disbled due to issues
+            #       setting gain using ASCOM ASI driver
+            logging.error(f'RPCServer: set_camera_gain currently unsupported')
+            self.send_json_error_response(session, JSON_BADMETHOD_ERRCODE,
+                                          'set_camera_gain currently unsupported',
+                                          msgid=method_id)
+            return
+
+            if not self.device_manager.camera.is_connected():
+                logging.error(f'request {method} - camera not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Camera not connected!',
+                                              msgid=method_id)
+                return
+
+            if 'params' not in j:
+                logging.info('set_camera_gain - no params provided!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - '
+                                              'missing parameters!',
+                                              msgid=method_id)
+                return
+
+            params = j['params']
+
+            camera_gain = params.get('camera_gain', None)
+
+            logging.debug(f'set_camera_gain: gain = {camera_gain}')
+
+            if (camera_gain is None
+                or (not isinstance(camera_gain, int)
+                    and not isinstance(camera_gain, float))):
+                logging.error(f'RPCServer:set_camera_gain method request '
+                              'but need gain - recvd {camera_gain}')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - camera_gain',
+                                              msgid=method_id)
+                return
+
+            rc = self.device_manager.camera.set_camera_gain(camera_gain)
+            self.send_method_complete_message(session, method_id)
+
+        elif method == 'set_cooler_state':
+            if not self.device_manager.camera.is_connected():
+                logging.error(f'request {method} - camera not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Camera not connected!',
+                                              msgid=method_id)
+                return
+
+            if 'params' not in j:
+                logging.info('set_cooler_state - no params provided!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - '
+                                              'missing parameters!',
+                                              msgid=method_id)
+                return
+
+            params = j['params']
+
+            state = params.get('cooler_state', None)
+
+            logging.debug(f'set_cooler_state: state = {state}')
+
+            if state is None or not isinstance(state, bool):
+                logging.error('RPCServer:set_cooler_state method '
+                              f'request but need state - recvd {state}')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - state',
+                                              msgid=method_id)
+                return
+
+            rc = self.device_manager.camera.set_cooler_state(state)
+            self.send_method_complete_message(session, method_id)
+        elif method == 'set_target_temperature':
+            if not self.device_manager.camera.is_connected():
+                logging.error(f'request {method} - camera not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Camera not connected!',
+                                              msgid=method_id)
+                return
+
+            if 'params' not in j:
+                logging.info('set_target_temperature - no params provided!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - '
+                                              'missing parameters!',
+                                              msgid=method_id)
+                return
+
+            params = j['params']
+
+            target = params.get('target_temperature', None)
+
+            logging.debug(f'set_target_temperature: target = {target}')
+
+            if (target is None
+                or (not isinstance(target, float)
+                    and not isinstance(target, int))):
+                logging.error('RPCServer:set_target_temperature method '
+                              f'request but need target - recvd {target}')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - target',
+                                              msgid=method_id)
+                return
+
+            rc = self.device_manager.camera.set_target_temperature(target)
+            self.send_method_complete_message(session, method_id)
 # I think this is duplicated!
 #                elif method == 'set_cooler_state':
 #                    if not self.device_manager.camera.is_connected():
@@ -616,380 +851,428 @@ class RPCServer:
 #
 #                    rc = self.device_manager.camera.set_cooler_state(state)
 #                    self.send_method_complete_message(socket, method_id)
-                elif method in ['get_current_temperature',
-                                'get_target_temperature',
-                                'get_cooler_state',
-                                'get_cooler_power',
-                                'get_camera_x_pixelsize',
-                                'get_camera_y_pixelsize',
-                                'get_camera_max_binning',
-                                'get_camera_egain',
-                                'get_camera_gain']:
-                    if not self.device_manager.camera.is_connected():
-                        logging.error(f'request {method} - camera not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Camera not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    resdict = {}
-                    resdict['jsonrpc'] = '2.0'
-                    resdict['id'] = method_id
-
-                    camera = self.device_manager.camera
-
-                    func = {
-                            'get_current_temperature': camera.get_current_temperature,
-                            'get_target_temperature': camera.get_target_temperature,
-                            'get_cooler_state': camera.get_cooler_state,
-                            'get_cooler_power': camera.get_cooler_power,
-                            'get_camera_x_pixelsize': camera.get_pixelsize,
-                            'get_camera_y_pixelsize': camera.get_pixelsize,
-                            'get_camera_max_binning': camera.get_max_binning,
-                            'get_camera_egain': camera.get_egain,
-                            'get_camera_gain': camera.get_camera_gain
-                            }
-
-                    # get value
-                    if method == 'get_camera_x_pixelsize':
-                        ret_val = func[method]()
-                        if ret_val is not None:
-                            ret_val = ret_val[0]
-                    elif method == 'get_camera_y_pixelsize':
-                        ret_val = func[method]()
-                        if ret_val is not None:
-                            ret_val = ret_val[1]
-                    else:
-                        ret_val = func[method]()
-
-                    ret_key = {
-                               'get_current_temperature': 'current_temperature',
-                               'get_target_temperature': 'target_temperature',
-                               'get_cooler_state': 'cooler_state',
-                               'get_cooler_power': 'cooler_power',
-                               'get_camera_x_pixelsize': 'camera_x_pixelsize',
-                               'get_camera_y_pixelsize': 'camera_y_pixelsize',
-                               'get_camera_max_binning': 'camera_max_binning',
-                               'get_camera_egain': 'camera_egain',
-                               'get_camera_gain': 'camera_gain'
-                              }
-                    logging.debug(f'method {method} returns '
-                                  f'{ret_key[method]} = {ret_val}')
-
-                    # normal code
-                    setdict = {ret_key[method]: ret_val}
-
-                    # rest of it
-                    resdict['result'] = setdict
-                    self.__send_json_response(socket, resdict)
-
-
-                elif method in ['focuser_get_absolute_position',
-                                'focuser_get_max_absolute_position',
-                                'focuser_get_current_temperature',
-                                'focuser_is_moving',
-                                'focuser_stop']:
-                    if not self.device_manager.focuser.is_connected():
-                        logging.error(f'request {method} - focuser not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Focuser not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    resdict = {}
-                    resdict['jsonrpc'] = '2.0'
-                    resdict['id'] = method_id
-                    focuser = self.device_manager.focuser
-                    func = {
-                            'focuser_get_absolute_position': focuser.get_absolute_position,
-                            'focuser_get_max_absolute_position': focuser.get_max_absolute_position,
-                            'focuser_get_current_temperature': focuser.get_current_temperature,
-                            'focuser_is_moving': focuser.is_moving,
-                            'focuser_stop': focuser.stop
-                            }
-
-                    # get value
-                    ret_val = func[method]()
-
-                    # strip 'focuser_' off to get return key
-                    ret_key = {
-                               'focuser_get_absolute_position': 'absolute_position',
-                               'focuser_get_max_absolute_position': 'max_absolute_position',
-                               'focuser_get_current_temperature': 'current_temperature',
-                               'focuser_is_moving': 'is_moving',
-                               'focuser_stop': 'stop'
-                              }
-
-                    logging.debug(f'method {method} returns {ret_key[method]}'
-                                  f' = {ret_val}')
-
-                    setdict = {ret_key[method] : ret_val}
-                    resdict['result'] = setdict
-                    self.__send_json_response(socket, resdict)
-                elif method == 'focuser_move_absolute_position':
-                    if not self.device_manager.focuser.is_connected():
-                        logging.error(f'request {method} - focuser not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE, 'Focuser not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    if 'params' not in j:
-                        logging.info('focuser_move_absolute_position - no params provided!')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - missing parameters!',
-                                                      msgid=method_id)
-                        continue
-
-                    params = j['params']
-                    abspos = params.get('absolute_position', None)
-                    logging.debug(f'focuser_move_absolute_position: abspos = {abspos}')
-                    if abspos is None or not isinstance(abspos, int):
-                        logging.error('RPCServer:focuser_move_absolute_position '
-                                      f'method request but need absolute position - recvd {abspos}')
-                        self.send_json_error_response(socket,
-                                                      JSON_INVALID_ERRCODE,
-                                                      'Invalid request - absolute position',
-                                                      msgid=method_id)
-                        continue
-
-                    rc = self.device_manager.focuser.move_absolute_position(abspos)
-                    self.send_method_complete_message(socket, method_id)
-
-                elif method in ['mount_can_park',
-                                'mount_at_park',
-                                'mount_pier_side',
-                                'mount_is_slewing',
-                                'mount_get_tracking']:
-                    if not self.device_manager.mount.is_connected():
-                        logging.error(f'request {method} - mount not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Mount not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    resdict = {}
-                    resdict['jsonrpc'] = '2.0'
-                    resdict['id'] = method_id
-                    mount = self.device_manager.mount
-                    func = {
-                            'mount_can_park': mount.can_park,
-                            'mount_at_park': mount.is_parked,
-                            'mount_pier_side': mount.get_pier_side,
-                            'mount_is_slewing': mount.is_slewing,
-                            'mount_get_tracking': mount.get_tracking
-                           }
-
-                    # get value
-                    ret_val = func[method]()
-
-                    # strip 'focuser_' off to get return key
-                    ret_key = {
-                               'mount_can_park': 'can_park',
-                               'mount_at_park': 'at_park',
-                               'mount_pier_side': 'pier_side',
-                               'mount_is_slewing': 'is_slewing',
-                               'mount_get_tracking': 'tracking'
-                              }
-
-                    logging.debug(f'method {method} returns {ret_key[method]} = '
-                                  f'{ret_val}')
-
-                    setdict = {ret_key[method] : ret_val}
-                    resdict['result'] = setdict
-                    self.__send_json_response(socket, resdict)
-                elif method in ['mount_abort_slew', 'mount_unpark', 'mount_park']:
-                    if not self.device_manager.mount.is_connected():
-                        logging.error(f'request {method} - mount not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Mount not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    if method == 'mount_abort_slew':
-                        rc = self.device_manager.mount.abort_slew()
-                    elif method == 'mount_unpark':
-                        rc = self.device_manager.mount.unpark()
-                    elif method == 'mount_park':
-                        rc = self.device_manager.mount.park()
-
-                    self.send_method_complete_message(socket, method_id)
-
-                elif method == 'mount_get_radec':
-                    if not self.device_manager.mount.is_connected():
-                        logging.error(f'request {method} - mount not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Mount not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    ra, dec = self.device_manager.mount.get_position_radec()
-                    setdict = {'ra': ra, 'dec': dec}
-                    resdict = {}
-                    resdict['jsonrpc'] = '2.0'
-                    resdict['id'] = method_id
-                    resdict['result'] = setdict
-                    self.__send_json_response(socket, resdict)
-
-                elif method == 'mount_get_altaz':
-                    if not self.device_manager.mount.is_connected():
-                        logging.error(f'request {method} - mount not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Mount not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    alt, az = self.device_manager.mount.get_position_altaz()
-                    setdict = {'alt': alt, 'az': az}
-                    resdict = {}
-                    resdict['jsonrpc'] = '2.0'
-                    resdict['id'] = method_id
-                    resdict['result'] = setdict
-                    self.__send_json_response(socket, resdict)
-
-                elif method in ['mount_slew_radec', 'mount_sync_radec']:
-                    if not self.device_manager.mount.is_connected():
-                        logging.error(f'request {method} - mount not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Mount not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    if 'params' not in j:
-                        logging.info(f'method {method} - no params provided!')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - missing parameters!',
-                                                      msgid=method_id)
-                        continue
-
-                    params = j['params']
-                    ra = params.get('ra', None)
-                    dec = params.get('dec', None)
-                    logging.debug(f'method {method}: ra = {ra} dec = {dec}')
-                    ra_problem = ra is None or (not isinstance(ra, int) and not isinstance(ra, float))
-                    dec_problem = dec is None or (not isinstance(dec, int) and not isinstance(dec, float))
-
-                    if ra_problem or dec_problem:
-                        logging.error(f'RPCServer:method {method}: method request '
-                                      f'but need ra/dec - recvd {ra}/{dec}')
-                        self.send_json_error_response(socket,
-                                                      JSON_INVALID_ERRCODE,
-                                                      f'Invalid request - {method}',
-                                                      msgid=method_id)
-                        continue
-
-                    if method == 'mount_slew_radec':
-                        rc = self.device_manager.mount.slew(ra, dec)
-                    elif method == 'mount_sync_radec':
-                        rc = self.device_manager.mount.sync(ra, dec)
-                    else:
-                        logging.error(f'Unknown method {method}!')
-                        sys.exit(1)
-
-                    self.send_method_complete_message(socket, method_id)
-
-                elif method == 'mount_set_tracking':
-                    if not self.device_manager.mount.is_connected():
-                        logging.error(f'request {method} - mount not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Mount not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    if 'params' not in j:
-                        logging.info(f'method {method} - no params provided!')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - missing parameters!',
-                                                      msgid=method_id)
-                        continue
-
-                    params = j['params']
-                    track = params.get('tracking', None)
-                    logging.debug(f'method {method}: tracking = {track}')
-
-                    track_problem = track is None or not isinstance(track, bool)
-                    if track_problem:
-                        logging.error(f'RPCServer:method {method}: method request '
-                                      f'but need tracking - recvd {track}')
-                        self.send_json_error_response(socket,
-                                                      JSON_INVALID_ERRCODE,
-                                                      f'Invalid request - {method}',
-                                                      msgid=method_id)
-                        continue
-
-                    rc = self.device_manager.mount.set_tracking(track)
-
-                    self.send_method_complete_message(socket, method_id)
-
-                elif method == 'filterwheel_move_position':
-                    if not self.device_manager.filterwheel.is_connected():
-                        logging.error(f'request {method} - filter wheel not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Filter wheel not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    if 'params' not in j:
-                        logging.info(f'method {method} - no params provided!')
-                        self.send_json_error_response(socket, JSON_INVALID_ERRCODE,
-                                                      'Invalid request - missing parameters!',
-                                                      msgid=method_id)
-                        continue
-
-                    params = j['params']
-                    pos = int(params.get('filter_position', None))
-                    logging.debug(f'method {method}: filter position = {pos}')
-
-                    pos_problem = pos is None or not isinstance(pos, int)
-                    if pos_problem:
-                        logging.error(f'RPCServer:method {method}: method request '
-                                      f'but need position - recvd {pos}')
-                        self.send_json_error_response(socket,
-                                                      JSON_INVALID_ERRCODE,
-                                                      f'Invalid request - {method}',
-                                                      msgid=method_id)
-                        continue
-
-                    rc = self.device_manager.filterwheel.set_position(pos)
-
-                    self.send_method_complete_message(socket, method_id)
-
-                elif method in ['filterwheel_get_position', 'filterwheel_get_filter_names']:
-                    if not self.device_manager.filterwheel.is_connected():
-                        logging.error(f'request {method} - filter wheel not connected!')
-                        self.send_json_error_response(socket, JSON_APP_ERRCODE,
-                                                      'Filter wheel not connected!',
-                                                      msgid=method_id)
-                        continue
-
-                    resdict = {}
-                    resdict['jsonrpc'] = '2.0'
-                    resdict['id'] = method_id
-
-                    wheel = self.device_manager.filterwheel
-                    func = {'filterwheel_get_position' : wheel.get_position,
-                            'filterwheel_get_filter_names': wheel.get_names}
-
-                    # get value
-                    ret_val = func[method]()
-
-                    # strip 'filterwheel_' off to get return key
-                    ret_key = {'filterwheel_get_position': 'filter_position',
-                            'filterwheel_get_filter_names': 'filter_names'}
-
-                    logging.debug(f'method {method} returns {ret_key[method]} = {ret_val}')
-
-                    setdict = {ret_key[method]: ret_val}
-                    resdict['result'] = setdict
-                    self.__send_json_response(socket, resdict)
-
-                # Unknown method requested
-                else:
-                    logging.error(f'RPCServer: unknown JSONRPC method {method}')
-                    self.send_json_error_response(socket, JSON_BADMETHOD_ERRCODE,
-                                                  'Unknown method',
+        elif method in ['get_current_temperature',
+                        'get_target_temperature',
+                        'get_cooler_state',
+                        'get_cooler_power',
+                        'get_camera_x_pixelsize',
+                        'get_camera_y_pixelsize',
+                        'get_camera_max_binning',
+                        'get_camera_egain',
+                        'get_camera_gain']:
+            if not self.device_manager.camera.is_connected():
+                logging.error(f'request {method} - camera not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Camera not connected!',
+                                              msgid=method_id)
+                return
+
+            resdict = {}
+            resdict['jsonrpc'] = '2.0'
+            resdict['id'] = method_id
+
+            camera = self.device_manager.camera
+
+            func = {
+                    'get_current_temperature': camera.get_current_temperature,
+                    'get_target_temperature': camera.get_target_temperature,
+                    'get_cooler_state': camera.get_cooler_state,
+                    'get_cooler_power': camera.get_cooler_power,
+                    'get_camera_x_pixelsize': camera.get_pixelsize,
+                    'get_camera_y_pixelsize': camera.get_pixelsize,
+                    'get_camera_max_binning': camera.get_max_binning,
+                    'get_camera_egain': camera.get_egain,
+                    'get_camera_gain': camera.get_camera_gain
+                    }
+
+            # get value
+            if method == 'get_camera_x_pixelsize':
+                ret_val = func[method]()
+                if ret_val is not None:
+                    ret_val = ret_val[0]
+            elif method == 'get_camera_y_pixelsize':
+                ret_val = func[method]()
+                if ret_val is not None:
+                    ret_val = ret_val[1]
+            else:
+                ret_val = func[method]()
+
+            ret_key = {
+                       'get_current_temperature': 'current_temperature',
+                       'get_target_temperature': 'target_temperature',
+                       'get_cooler_state': 'cooler_state',
+                       'get_cooler_power': 'cooler_power',
+                       'get_camera_x_pixelsize': 'camera_x_pixelsize',
+                       'get_camera_y_pixelsize': 'camera_y_pixelsize',
+                       'get_camera_max_binning': 'camera_max_binning',
+                       'get_camera_egain': 'camera_egain',
+                       'get_camera_gain': 'camera_gain'
+                      }
+            logging.debug(f'method {method} returns '
+                          f'{ret_key[method]} = {ret_val}')
+
+            # normal code
+            setdict = {ret_key[method]: ret_val}
+
+            # rest of it
+            resdict['result'] = setdict
+            self.__send_json_response(session, resdict)
+
+
+        elif method in ['focuser_get_absolute_position',
+                        'focuser_get_max_absolute_position',
+                        'focuser_get_current_temperature',
+                        'focuser_is_moving',
+                        'focuser_stop']:
+            if not self.device_manager.focuser.is_connected():
+                logging.error(f'request {method} - focuser not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Focuser not connected!',
+                                              msgid=method_id)
+                return
+
+            resdict = {}
+            resdict['jsonrpc'] = '2.0'
+            resdict['id'] = method_id
+            focuser = self.device_manager.focuser
+            func = {
+                    'focuser_get_absolute_position': focuser.get_absolute_position,
+                    'focuser_get_max_absolute_position': focuser.get_max_absolute_position,
+                    'focuser_get_current_temperature': focuser.get_current_temperature,
+                    'focuser_is_moving': focuser.is_moving,
+                    'focuser_stop': focuser.stop
+                    }
+
+            # get value
+            ret_val = func[method]()
+
+            # strip 'focuser_' off to get return key
+            ret_key = {
+                       'focuser_get_absolute_position': 'absolute_position',
+                       'focuser_get_max_absolute_position': 'max_absolute_position',
+                       'focuser_get_current_temperature': 'current_temperature',
+                       'focuser_is_moving': 'is_moving',
+                       'focuser_stop': 'stop'
+                      }
+
+            logging.debug(f'method {method} returns {ret_key[method]}'
+                          f' = {ret_val}')
+
+            setdict = {ret_key[method] : ret_val}
+            resdict['result'] = setdict
+            self.__send_json_response(session, resdict)
+        elif method == 'focuser_move_absolute_position':
+            if not self.device_manager.focuser.is_connected():
+                logging.error(f'request {method} - focuser not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE, 'Focuser not connected!',
+                                              msgid=method_id)
+                return
+
+            if 'params' not in j:
+                logging.info('focuser_move_absolute_position - no params provided!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - missing parameters!',
+                                              msgid=method_id)
+                return
+
+            params = j['params']
+            abspos = params.get('absolute_position', None)
+            logging.debug(f'focuser_move_absolute_position: abspos = {abspos}')
+            if abspos is None or not isinstance(abspos, int):
+                logging.error('RPCServer:focuser_move_absolute_position '
+                              f'method request but need absolute position - recvd {abspos}')
+                self.send_json_error_response(session,
+                                              JSON_INVALID_ERRCODE,
+                                              'Invalid request - absolute position',
+                                              msgid=method_id)
+                return
+
+            rc = self.device_manager.focuser.move_absolute_position(abspos)
+            self.send_method_complete_message(session, method_id)
+
+        elif method in ['mount_can_park',
+                        'mount_at_park',
+                        'mount_pier_side',
+                        'mount_is_slewing',
+                        'mount_get_tracking']:
+            if not self.device_manager.mount.is_connected():
+                logging.error(f'request {method} - mount not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Mount not connected!',
+                                              msgid=method_id)
+                return
+
+            resdict = {}
+            resdict['jsonrpc'] = '2.0'
+            resdict['id'] = method_id
+            mount = self.device_manager.mount
+            func = {
+                    'mount_can_park': mount.can_park,
+                    'mount_at_park': mount.is_parked,
+                    'mount_pier_side': mount.get_pier_side,
+                    'mount_is_slewing': mount.is_slewing,
+                    'mount_get_tracking': mount.get_tracking
+                   }
+
+            # get value
+            ret_val = func[method]()
+
+            # strip 'focuser_' off to get return key
+            ret_key = {
+                       'mount_can_park': 'can_park',
+                       'mount_at_park': 'at_park',
+                       'mount_pier_side': 'pier_side',
+                       'mount_is_slewing': 'is_slewing',
+                       'mount_get_tracking': 'tracking'
+                      }
+
+            logging.debug(f'method {method} returns {ret_key[method]} = '
+                          f'{ret_val}')
+
+            setdict = {ret_key[method] : ret_val}
+            resdict['result'] = setdict
+            self.__send_json_response(session, resdict)
+        elif method in ['mount_abort_slew', 'mount_unpark', 'mount_park']:
+            if not self.device_manager.mount.is_connected():
+                logging.error(f'request {method} - mount not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Mount not connected!',
+                                              msgid=method_id)
+                return
+
+            if method == 'mount_abort_slew':
+                rc = self.device_manager.mount.abort_slew()
+            elif method == 'mount_unpark':
+                rc = self.device_manager.mount.unpark()
+            elif method == 'mount_park':
+                rc = self.device_manager.mount.park()
+
+            self.send_method_complete_message(session, method_id)
+
+        elif method == 'mount_get_radec':
+            if not self.device_manager.mount.is_connected():
+                logging.error(f'request {method} - mount not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Mount not connected!',
+                                              msgid=method_id)
+                return
+
+            ra, dec = self.device_manager.mount.get_position_radec()
+            setdict = {'ra': ra, 'dec': dec}
+            resdict = {}
+            resdict['jsonrpc'] = '2.0'
+            resdict['id'] = method_id
+            resdict['result'] = setdict
+            self.__send_json_response(session, resdict)
+
+        elif method == 'mount_get_altaz':
+            if not self.device_manager.mount.is_connected():
+                logging.error(f'request {method} - mount not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Mount not connected!',
+                                              msgid=method_id)
+                return
+
+            alt, az = self.device_manager.mount.get_position_altaz()
+            setdict = {'alt': alt, 'az': az}
+            resdict = {}
+            resdict['jsonrpc'] = '2.0'
+            resdict['id'] = method_id
+            resdict['result'] = setdict
+            self.__send_json_response(session, resdict)
+
+        elif method in ['mount_slew_radec', 'mount_sync_radec']:
+            if not self.device_manager.mount.is_connected():
+                logging.error(f'request {method} - mount not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Mount not connected!',
+                                              msgid=method_id)
+                return
+
+            if 'params' not in j:
+                logging.info(f'method {method} - no params provided!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - missing parameters!',
+                                              msgid=method_id)
+                return
+
+            params = j['params']
+            ra = params.get('ra', None)
+            dec = params.get('dec', None)
+            logging.debug(f'method {method}: ra = {ra} dec = {dec}')
+            ra_problem = ra is None or (not isinstance(ra, int) and not isinstance(ra, float))
+            dec_problem = dec is None or (not isinstance(dec, int) and not isinstance(dec, float))
+
+            if ra_problem or dec_problem:
+                logging.error(f'RPCServer:method {method}: method request '
+                              f'but need ra/dec - recvd {ra}/{dec}')
+                self.send_json_error_response(session,
+                                              JSON_INVALID_ERRCODE,
+                                              f'Invalid request - {method}',
+                                              msgid=method_id)
+                return
+
+            if method == 'mount_slew_radec':
+                rc = self.device_manager.mount.slew(ra, dec)
+            elif method == 'mount_sync_radec':
+                rc = self.device_manager.mount.sync(ra, dec)
+            else:
+                logging.error(f'Unknown method {method}!')
+                sys.exit(1)
+
+            self.send_method_complete_message(session, method_id)
+
+        elif method == 'mount_set_tracking':
+            if not self.device_manager.mount.is_connected():
+                logging.error(f'request {method} - mount not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Mount not connected!',
+                                              msgid=method_id)
+                return
+
+            if 'params' not in j:
+                logging.info(f'method {method} - no params provided!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - missing parameters!',
+                                              msgid=method_id)
+                return
+
+            params = j['params']
+            track = params.get('tracking', None)
+            logging.debug(f'method {method}: tracking = {track}')
+
+            track_problem = track is None or not isinstance(track, bool)
+            if track_problem:
+                logging.error(f'RPCServer:method {method}: method request '
+                              f'but need tracking - recvd {track}')
+                self.send_json_error_response(session,
+                                              JSON_INVALID_ERRCODE,
+                                              f'Invalid request - {method}',
+                                              msgid=method_id)
+                return
+
+            rc = self.device_manager.mount.set_tracking(track)
+
+            self.send_method_complete_message(session, method_id)
+
+        elif method == 'filterwheel_move_position':
+            if not self.device_manager.filterwheel.is_connected():
+                logging.error(f'request {method} - filter wheel not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Filter wheel not connected!',
+                                              msgid=method_id)
+                return
+
+            if 'params' not in j:
+                logging.info(f'method {method} - no params provided!')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - missing parameters!',
+                                              msgid=method_id)
+                return
+
+            params = j['params']
+            pos = int(params.get('filter_position', None))
+            logging.debug(f'method {method}: filter position = {pos}')
+
+            pos_problem = pos is None or not isinstance(pos, int)
+            if pos_problem:
+                logging.error(f'RPCServer:method {method}: method request '
+                              f'but need position - recvd {pos}')
+                self.send_json_error_response(session,
+                                              JSON_INVALID_ERRCODE,
+                                              f'Invalid request - {method}',
+                                              msgid=method_id)
+                return
+
+            rc = self.device_manager.filterwheel.set_position(pos)
+
+            self.send_method_complete_message(session, method_id)
+
+        elif method in ['filterwheel_get_position', 'filterwheel_get_filter_names']:
+            if not self.device_manager.filterwheel.is_connected():
+                logging.error(f'request {method} - filter wheel not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'Filter wheel not connected!',
+                                              msgid=method_id)
+                return
+
+            resdict = {}
+            resdict['jsonrpc'] = '2.0'
+            resdict['id'] = method_id
+
+            wheel = self.device_manager.filterwheel
+            func = {'filterwheel_get_position' : wheel.get_position,
+                    'filterwheel_get_filter_names': wheel.get_names}
+
+            # get value
+            ret_val = func[method]()
+
+            # strip 'filterwheel_' off to get return key
+            ret_key = {'filterwheel_get_position': 'filter_position',
+                    'filterwheel_get_filter_names': 'filter_names'}
+
+            logging.debug(f'method {method} returns {ret_key[method]} = {ret_val}')
+
+            setdict = {ret_key[method]: ret_val}
+            resdict['result'] = setdict
+            self.__send_json_response(session, resdict)
+
+        elif method == 'get_guiding_stats':
+            phd2 = AppContainer.get('/dev/phd2')
+            if phd2 is None or not phd2.is_connected():
+                logging.error(f'request {method} - PHD2 not connected!')
+                self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                              'PHD2 not connected!',
+                                              msgid=method_id)
+                return
+
+            params = j.get('params', {})
+
+            # window is given by start/end times, the last image taken by
+            # the client or the last 'duration' seconds
+            now = time.time()
+            if params.get('last_image', False):
+                image = session.current_image
+                window = getattr(image, 'exposure_window', None)
+                if window is None:
+                    logging.error(f'request {method} - no image with exposure times!')
+                    self.send_json_error_response(session, JSON_APP_ERRCODE,
+                                                  'No image taken!',
                                                   msgid=method_id)
+                    return
+                start, end = window
+            else:
+                duration = params.get('duration', 60)
+                start = params.get('start', now - duration)
+                end = params.get('end', now)
+
+            if (not isinstance(start, (float, int))
+                or not isinstance(end, (float, int))):
+                logging.error(f'RPCServer:{method} method request invalid '
+                              f'window {start} {end}')
+                self.send_json_error_response(session, JSON_INVALID_ERRCODE,
+                                              'Invalid request - window',
+                                              msgid=method_id)
+                return
+
+            resdict = {}
+            resdict['jsonrpc'] = '2.0'
+            resdict['id'] = method_id
+
+            stats = phd2.get_guiding_stats(start, end)
+            stats['guiding'] = phd2.is_guiding()
+            logging.debug(f'method {method} returns {stats}')
+
+            resdict['result'] = stats
+            self.__send_json_response(session, resdict)
+
+        # Unknown method requested
+        else:
+            logging.error(f'RPCServer: unknown JSONRPC method {method}')
+            self.send_json_error_response(session, JSON_BADMETHOD_ERRCODE,
+                                          'Unknown method',
+                                          msgid=method_id)
 
-        return
 
     def camera_exposure_complete(self, result):
 
@@ -1005,14 +1288,44 @@ class RPCServer:
             logging.warning('RPCServer():cam_exp_comp - no exposure was ongoing! Ignoring...')
             return
 
-        self.device_manager.camera.release_lock()
-
         self.exposure_ongoing = False
 
+        session = self.exposure_ongoing_session
+        method_id = self.exposure_ongoing_method_id
+
+        # only release once this exposure is finished with - filling in the
+        # header can run the event loop and a queued request waiting on the
+        # lock would start its exposure right away
+        try:
+            fitsimage = self.finish_exposure(session, method_id, result)
+        except Exception:
+            logging.error('RPCServer():cam_exp_comp: exception handling image',
+                          exc_info=True)
+            self.send_json_error_response(session, JSON_INTERROR_ERRCODE,
+                                          'Internal error', msgid=method_id)
+            fitsimage = None
+        finally:
+            self.exposure_ongoing_method_id = None
+            self.exposure_ongoing_session = None
+            self.device_manager.camera.release_lock('rpc')
+
+        if fitsimage is not None:
+            self.signals.new_camera_image.emit((True, fitsimage))
+
+    def finish_exposure(self, session, method_id, result):
+        """
+        Handle result of the exposure for a 'take_image' request and tell
+        the client it is done.
+
+        Returns
+        -------
+        FITSImage
+            New image or None if the exposure failed.
+        """
         program_settings = AppContainer.find('/program_settings')
         if program_settings is None:
             logging.error('RPCServer():cam_exp_comp: unable to access program settings!')
-            return False
+            return None
 
         complete_status, fitsimage = result
 
@@ -1020,11 +1333,11 @@ class RPCServer:
             logging.warning('exposure completed with False status!')
 
             self.current_image = None
+            session.current_image = None
 
             # FIXME prob need to return an error message not complete message!
-            self.send_method_complete_message(self.exposure_ongoing_socket,
-                                              self.exposure_ongoing_method_id)
-            return
+            self.send_method_complete_message(session, method_id)
+            return None
 
         self.handle_new_image(fitsimage)
 
@@ -1036,21 +1349,18 @@ class RPCServer:
         # camera methods we instead save the frame and
         # wait for a 'Save Image' RPC request
         #
-        # Note if another frame is taken it will overwrite
-        # the in memory copy of the latest image
+        # Note if another frame is taken by the same client it will
+        # overwrite the in memory copy of the latest image
 
         self.current_image = fitsimage
+        session.current_image = fitsimage
 
-        self.send_method_complete_message(self.exposure_ongoing_socket,
-                                          self.exposure_ongoing_method_id)
+        self.send_method_complete_message(session, method_id)
 
         # used by old code that take and wrote image to disk
 #        self.out_image_filename = None
 
-        self.exposure_ongoing_method_id = None
-        self.exposure_ongoing_socket = None
-
-        self.signals.new_camera_image.emit((True, fitsimage))
+        return fitsimage
 
     # FIXME this is copied from ImageSequenceControlUI which was a copy
     # from pyastroimageview_main.py!!!!!
@@ -1060,26 +1370,6 @@ class RPCServer:
     def handle_new_image(self, fits_doc):
         """Fills in FITS header data for new images"""
 
-        # FIXME maybe best handled somewhere else - it relies on lots of 'globals'
-        settings = AppContainer.find('/program_settings')
-        if settings is None:
-            logging.error('RPCServer:handle_new_image: unable to access program settings!')
-            return False
-
-#        fits_doc.set_notes(settings.observer_notes)
-        fits_doc.set_telescope(settings.telescope_description)
-        fits_doc.set_focal_length(settings.telescope_focallen)
-        aper_diam = settings.telescope_aperture
-        aper_obst = settings.telescope_obstruction
-        aper_area = math.pi * (aper_diam / 2.0 * aper_diam / 2.0) \
-                            * (1 - aper_obst * aper_obst / 100.0 / 100.0)
-        fits_doc.set_aperture_diameter(aper_diam)
-        fits_doc.set_aperture_area(aper_area)
-
-        lat_dms = Angle(settings.location_latitude*u.degree).to_string(unit=u.degree, sep=' ', precision=0)
-        lon_dms = Angle(settings.location_longitude*u.degree).to_string(unit=u.degree, sep=' ', precision=0)
-        fits_doc.set_site_location(lat_dms, lon_dms)
-
         # these come from camera, filter wheel and telescope drivers
         if self.device_manager.camera.is_connected():
             cam_name = self.device_manager.camera.get_camera_name()
@@ -1095,31 +1385,14 @@ class RPCServer:
 
             fits_doc.set_filter(cur_name)
 
+        radec = None
+        altaz = None
         if self.device_manager.mount.is_connected():
-            ra, dec = self.device_manager.mount.get_position_radec()
-
-            radec = SkyCoord(ra=ra * u.hour, dec=dec * u.degree, frame='fk5')
-            rastr = radec.ra.to_string(u.hour, sep=":", pad=True)
-            decstr = radec.dec.to_string(alwayssign=True, sep=":", pad=True)
-            fits_doc.set_object_radec(rastr, decstr)
+            radec = self.device_manager.mount.get_position_radec()
+            altaz = self.device_manager.mount.get_position_altaz()
 
-            alt, az = self.device_manager.mount.get_position_altaz()
-            altaz = AltAz(alt=alt * u.degree, az=az * u.degree)
-            altstr = altaz.alt.to_string(alwayssign=True, sep=":", pad=True)
-            azstr = altaz.az.to_string(alwayssign=True, sep=":", pad=True)
-            fits_doc.set_object_altaz(altstr, azstr)
-
-            now = Time.now()
-            local_sidereal = now.sidereal_time('apparent',
-                                               longitude=settings.location_longitude * u.degree)
-            hour_angle = local_sidereal - radec.ra
-            logging.debug(f'locsid = {local_sidereal} HA={hour_angle}')
-            if hour_angle.hour > 12:
-                hour_angle = (hour_angle.hour - 24.0) * u.hourangle
-
-            hastr = Angle(hour_angle).to_string(u.hour, sep=":", pad=True)
-            logging.debug(f'HA={hour_angle} HASTR={hastr} {type(hour_angle)}')
-            fits_doc.set_object_hourangle(hastr)
+        self.header_builder.fill_header(fits_doc, radec=radec, altaz=altaz,
+                                        notes=False)
 
         # controlled by user selection in camera or sequence config
         # FIXME allow client to control frame type
@@ -1129,7 +1402,7 @@ class RPCServer:
         # set by application version
         fits_doc.set_software_info('pyastroimageview TEST')
 
-    def send_initial_message(self, socket):
+    def send_initial_message(self, session):
         """Send message to new client"""
         msgdict = {'Event': 'Connection',
                    'Server': 'pyastroimageview',
@@ -1139,7 +1412,7 @@ class RPCServer:
         logging.info(f'Sending initial message {msgstr}')
 
         try:
-            socket.write(bytes(msgstr, encoding='ascii'))
+            session.write(bytes(msgstr, encoding='ascii'))
         except Exception:
             logging.error(f'send_initial_message - exception - msg was {msgstr}!',
                           exc_info=True)
@@ -1147,7 +1420,7 @@ class RPCServer:
 
         return True
 
-    def send_method_complete_message(self, socket, method_id):
+    def send_method_complete_message(self, session, method_id):
         resdict = {}
         resdict['jsonrpc'] = '2.0'
         resdict['id'] = method_id
@@ -1156,9 +1429,9 @@ class RPCServer:
         setdict['complete'] = True
         resdict['result'] = setdict
 
-        self.__send_json_response(socket, resdict)
+        self.__send_json_response(session, resdict)
 
-    def __send_json_response(self, socket, cmd):
+    def __send_json_response(self, session, cmd):
         cmdstr = json.dumps(cmd) + '\n'
         logging.info(f'jsoncmd->{bytes(cmdstr, encoding="ascii")}')
 
@@ -1183,8 +1456,12 @@ class RPCServer:
 #            cmdstr = cmdstr[:ranlen]
 #            logging.debug(f'truncated cmdstr to {cmdstr}')
 
+        if not session.connected:
+            logging.warning(f'__send_json_response: {session} has disconnected!')
+            return False
+
         try:
-            socket.writeData(bytes(cmdstr, encoding='ascii'))
+            session.write(bytes(cmdstr, encoding='ascii'))
         except Exception as e:
             logging.error(f'__send_json_command - cmd was {cmd}!')
             logging.error('Exception ->', exc_info=True)
@@ -1192,8 +1469,9 @@ class RPCServer:
 
         return True
 
-    def send_json_error_response(self, socket, errcode, errmsg, msgid=None):
+    def send_json_error_response(self, session, errcode, errmsg, msgid=None):
         logging.info(f'send_json_error_response: {errcode} {errmsg} {msgid}')
+        session.num_errors += 1
         errdict = {}
         errdict['jsonrpc'] = '2.0'
         errdict['error'] = {'code': errcode, 'message': errmsg}
@@ -1202,7 +1480,7 @@ class RPCServer:
         else:
             errdict['id'] = 'null'
 
-        return self.__send_json_response(socket, errdict)
+        return self.__send_json_response(session, errdict)
 
 
 # TESTING ONLY
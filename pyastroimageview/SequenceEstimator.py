@@ -0,0 +1,190 @@
+#
+# Sequence duration estimator
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# A sequence takes longer than its exposure time - each frame has to be
+# downloaded, dithers have to settle and the filter wheel has to move.
+# How long these take depends on the rig so the sequence UI measures them
+# as it runs and the samples are kept in the frame catalog per camera.
+#
+# estimate_plan() counts how many of each overhead a schedule has.  The
+# total of n overheads of one kind is treated as normally distributed
+# with mean n*m and variance n*s^2 + n^2*s^2/k where m and s are the
+# sample mean and standard deviation of the k samples.  The second term
+# is the uncertainty of the mean itself so the bounds stay wide until
+# enough samples are collected.  Kinds with too few samples use the
+# default time with a standard deviation of half of it.
+#
+import math
+import time
+import logging
+from collections import deque
+
+from pyastroimageview.SequencePlan import SequenceOverheads
+
+# estimate_plan() count used for each kind of overhead
+OVERHEAD_COUNTS = {'download': 'frames',
+                   'save': 'frames',
+                   'dither': 'dithers',
+                   'filter_change': 'filter_changes',
+                   'refocus': 'refocuses',
+                   'target_change': 'target_changes'}
+
+# kinds measured by the sequence UI
+MEASURED_KINDS = ['download', 'dither', 'filter_change']
+
+# z for a two sided 90% interval
+DEFAULT_Z = 1.645
+
+
+class DurationEstimator:
+    """
+    Predicts sequence durations from measured overheads.
+
+    Parameters
+    ----------
+    catalog : FrameCatalog
+        Where samples are stored - None to only keep them in memory.
+    defaults : SequenceOverheads
+        Times used until enough samples are measured.
+    max_samples : int
+        Most recent samples of each kind used.
+    min_samples : int
+        Samples needed before measurements replace the default.
+    """
+
+    def __init__(self, catalog=None, defaults=None, max_samples=200, min_samples=5):
+        self.catalog = catalog
+        self.defaults = defaults if defaults is not None else SequenceOverheads()
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.rig = None
+        self.samples = {kind: deque(maxlen=max_samples) for kind in OVERHEAD_COUNTS}
+
+    def set_rig(self, rig):
+        """Switch to samples measured with rig (camera name)"""
+        self.rig = rig
+        for kind, samples in self.samples.items():
+            samples.clear()
+            if self.catalog is not None:
+                try:
+                    samples.extend(self.catalog.get_overheads(rig, kind, self.max_samples))
+                except Exception:
+                    logging.error('DurationEstimator: unable to load samples',
+                                  exc_info=True)
+
+        logging.info(f'DurationEstimator: rig {rig} samples '
+                     f'{ {k: len(v) for k, v in self.samples.items() if v} }')
+
+    def add_sample(self, kind, seconds):
+        """Record a measured overhead"""
+        if kind not in self.samples:
+            logging.error(f'DurationEstimator: unknown overhead {kind}')
+            return
+
+        self.samples[kind].append(seconds)
+        logging.debug(f'DurationEstimator: {kind} {seconds:.2f}s')
+
+        if self.catalog is not None:
+            try:
+                self.catalog.add_overhead(self.rig, kind, seconds)
+            except Exception:
+                logging.error('DurationEstimator: unable to store sample',
+                              exc_info=True)
+
+    def get_stats(self, kind):
+        """
+        Return (mean, standard deviation, number of samples) for kind.
+
+        The default with a standard deviation of half of it and 0 samples
+        is returned if there are too few samples.
+        """
+        samples = self.samples[kind]
+        n = len(samples)
+        if n < self.min_samples:
+            default = getattr(self.defaults, kind)
+            return default, default / 2, 0
+
+        mean = sum(samples) / n
+        var = sum((x - mean)**2 for x in samples) / (n - 1)
+        return mean, math.sqrt(var), n
+
+    def overheads(self):
+        """Return SequenceOverheads with measured means where available"""
+        overheads = SequenceOverheads()
+        for kind in OVERHEAD_COUNTS:
+            setattr(overheads, kind, self.get_stats(kind)[0])
+        return overheads
+
+    def predict(self, estimate, elapsed=0.0, z=DEFAULT_Z, now=None):
+        """
+        Predict remaining time of a schedule.
+
+        Parameters
+        ----------
+        estimate : dict
+            Counts from estimate_plan() of what is left to do.
+        elapsed : float
+            Seconds of the current exposure already done.
+        z : float
+            Width of bounds in standard deviations.
+        now : float
+            Time prediction is made - defaults to time.time().
+
+        Returns
+        -------
+        dict
+            Seconds remaining (total_s, low_s, high_s), end times
+            (end, end_low, end_high) and the mean of each overhead used.
+        """
+        if now is None:
+            now = time.time()
+
+        total = max(0.0, estimate['exposure_s'] - elapsed)
+        var = 0.0
+        means = {}
+        for kind, count_key in OVERHEAD_COUNTS.items():
+            n = estimate.get(count_key, 0)
+            mean, std, k = self.get_stats(kind)
+            means[kind] = mean
+            if n < 1:
+                continue
+            total += n * mean
+            var += n * std**2
+            var += (n * std)**2 / max(k, 1)
+
+        delta = z * math.sqrt(var)
+        low = max(estimate['exposure_s'] - elapsed, total - delta)
+        high = total + delta
+
+        return {'total_s': total,
+                'low_s': low,
+                'high_s': high,
+                'end': now + total,
+                'end_low': now + low,
+                'end_high': now + high,
+                'overheads': means}
+
+
+def format_prediction(prediction):
+    """Return short text like 'ends 02:35 (02:20-02:52)'"""
+    def hm(t):
+        return time.strftime('%H:%M', time.localtime(t))
+
+    return f'ends {hm(prediction["end"])} ' \
+           f'({hm(prediction["end_low"])}-{hm(prediction["end_high"])})'
@@ -0,0 +1,315 @@
+#
+# Sequence journal
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# The state of a running sequence only lives in memory so after a crash
+# or power failure the user had to work out which frames already exist.
+# The journal is an append-only file with one JSON record per line:
+#
+#   start   - sequence settings when the sequence is started and, for a
+#             step of a plan, the plan with the step and the steps left
+#   resume  - sequence was restarted from the journal
+#   frame   - a frame was written to disk (index and filename)
+#   failed  - a frame could not be written so it has to be taken again
+#   dither  - a dither was done after a frame
+#   plan    - steps left in the plan changed
+#   end     - sequence finished, was stopped or aborted
+#
+# Each record is flushed and fsync'd before returning so at most the
+# record being written is lost.  A torn last line is ignored when reading
+# and cut off before anything else is appended.  Reading the journal only
+# replays its records so resuming never scans the target directory.
+#
+# Only one sequence runs at a time so starting a new sequence replaces
+# the journal.  Each step of a plan starts a new journal which also holds
+# the steps after it so resuming a step carries on with the rest of the
+# plan.
+#
+import os
+import json
+import time
+import logging
+
+JOURNAL_VERSION = 1
+
+# end reasons which mean there is nothing left to resume
+END_COMPLETE = 'complete'
+END_DISCARDED = 'discarded'
+
+
+class JournalState:
+    """
+    Sequence state rebuilt from a journal.
+
+    Attributes
+    ----------
+    settings : dict
+        Sequence settings from ImageSequence.get_settings() at start.
+    started : float
+        Time sequence was first started.
+    plan : dict
+        For a step of a plan the plan (SequencePlan.to_dict()), the step
+        and the steps after it (PlanStep.to_dict()) or None.
+    frames : dict
+        Filename of each frame written keyed by index.
+    failed : dict
+        Filename of each frame which could not be written keyed by index.
+    dithers : int
+        Number of dithers done.
+    last_dither_index : int
+        Index of frame after which last dither was done.
+    resumes : int
+        Number of times sequence was resumed.
+    end_reason : str
+        Reason for last end record or None if sequence did not end.
+    """
+
+    def __init__(self, settings, started, plan=None):
+        self.settings = settings
+        self.started = started
+        self.plan = plan
+        self.frames = {}
+        self.failed = {}
+        self.dithers = 0
+        self.last_dither_index = None
+        self.resumes = 0
+        self.end_reason = None
+
+    def stop_index(self):
+        """Return index after the last frame of the sequence"""
+        return self.settings['start_index'] + self.settings['number_frames']
+
+    def next_index(self):
+        """Return index of first frame not written"""
+        # frames are written by several threads so they can finish out of
+        # order and a failed frame leaves a gap
+        index = self.settings['start_index']
+        while index in self.frames:
+            index += 1
+        return index
+
+    def frames_left(self):
+        return max(0, self.stop_index() - self.next_index())
+
+    def can_resume(self):
+        """Return True if the sequence has frames left and was not finished"""
+        if self.end_reason == END_DISCARDED or self.frames_left() < 1:
+            return False
+
+        # the last frames can fail to write after the sequence completed
+        return self.end_reason != END_COMPLETE or len(self.failed) > 0
+
+    def __str__(self):
+        return f'{self.settings.get("name")} {len(self.frames)} frames done ' \
+               f'next index {self.next_index()} {self.frames_left()} left ' \
+               f'{self.dithers} dithers end {self.end_reason}'
+
+
+class SequenceJournal:
+    """
+    Append-only journal of a running sequence.
+
+    Parameters
+    ----------
+    path : str
+        Journal filename.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fp = None
+
+        # changes each time a new journal is started
+        self.serial = 0
+
+    def load(self):
+        """
+        Rebuild sequence state from the journal.
+
+        Returns
+        -------
+        JournalState
+            State of the journaled sequence or None if there is none.
+        """
+        try:
+            fp = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        except OSError:
+            logging.error(f'SequenceJournal: unable to read {self.path}',
+                          exc_info=True)
+            return None
+
+        state = None
+        nrecords = 0
+        with fp:
+            for line in fp:
+                if not line.endswith(b'\n'):
+                    logging.warning('SequenceJournal: ignoring incomplete '
+                                    'last record')
+                    break
+                try:
+                    rec = json.loads(line)
+                    state = self._replay(state, rec)
+                except (ValueError, KeyError, TypeError):
+                    logging.warning('SequenceJournal: ignoring bad record '
+                                    f'{line[:80]}')
+                    continue
+                nrecords += 1
+
+        logging.debug(f'SequenceJournal: read {nrecords} records -> {state}')
+
+        return state
+
+    @staticmethod
+    def _replay(state, rec):
+        kind = rec['type']
+        if kind == 'start':
+            return JournalState(rec['sequence'], rec['time'], rec.get('plan'))
+        elif state is None:
+            pass
+        elif kind == 'frame':
+            state.frames[rec['index']] = rec['filename']
+            state.failed.pop(rec['index'], None)
+        elif kind == 'failed':
+            state.frames.pop(rec['index'], None)
+            state.failed[rec['index']] = rec['filename']
+        elif kind == 'dither':
+            state.dithers += 1
+            state.last_dither_index = rec['index']
+        elif kind == 'plan':
+            state.plan = rec['plan']
+        elif kind == 'resume':
+            state.resumes += 1
+            state.end_reason = None
+        elif kind == 'end':
+            state.end_reason = rec['reason']
+        return state
+
+    def start(self, sequence, plan=None):
+        """
+        Start journal for a new sequence replacing any existing one.
+
+        Parameters
+        ----------
+        sequence : ImageSequence
+            Sequence being started.
+        plan : dict
+            Plan the sequence is a step of - see JournalState.plan.
+        """
+        self.close()
+        self.serial += 1
+
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        # write first record to a new file so the old journal is valid
+        # until the new one is - it has to be closed before it is renamed
+        # on Windows
+        tmp_path = self.path + '.new'
+        self.fp = open(tmp_path, 'wb')
+        record = {'type': 'start', 'version': JOURNAL_VERSION,
+                  'sequence': sequence.get_settings()}
+        if plan is not None:
+            record['plan'] = plan
+        try:
+            self._append(record)
+        finally:
+            self.close()
+        os.replace(tmp_path, self.path)
+
+        self.fp = open(self.path, 'ab')
+
+    def resume(self, index):
+        """Continue journal of existing sequence starting at index"""
+        self._open_append()
+        self._append({'type': 'resume', 'index': index})
+
+    def frame(self, index, filename):
+        """Record a frame has been written"""
+        self._append({'type': 'frame', 'index': index, 'filename': filename})
+
+    def frame_failed(self, index, filename):
+        """Record a frame could not be written"""
+        self._append({'type': 'failed', 'index': index, 'filename': filename})
+
+    def dither(self, index):
+        """Record a dither after frame index"""
+        self._append({'type': 'dither', 'index': index})
+
+    def update_plan(self, plan):
+        """Record the steps of the plan changed - see JournalState.plan"""
+        self._append({'type': 'plan', 'plan': plan})
+
+    def end(self, reason):
+        """Record sequence ended - reason is 'complete', 'stopped', 'aborted'"""
+        self._append({'type': 'end', 'reason': reason})
+
+    def discard(self):
+        """Mark journaled sequence as not to be resumed"""
+        if os.path.exists(self.path):
+            self._open_append()
+            self.end(END_DISCARDED)
+        self.close()
+
+    def is_open(self):
+        return self.fp is not None
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def _open_append(self):
+        self.close()
+
+        # cut off any torn last record so the next record starts on its
+        # own line
+        good = 0
+        try:
+            with open(self.path, 'rb') as fp:
+                for line in fp:
+                    if not line.endswith(b'\n'):
+                        break
+                    good += len(line)
+        except FileNotFoundError:
+            pass
+
+        self.fp = open(self.path, 'ab')
+        if self.fp.tell() != good:
+            logging.warning(f'SequenceJournal: truncating {self.path} to {good}')
+            self.fp.truncate(good)
+            self.fp.seek(good)
+
+    def _append(self, record):
+        if self.fp is None:
+            logging.error(f'SequenceJournal: not open - dropping {record}')
+            return False
+
+        record['time'] = time.time()
+        try:
+            self.fp.write(json.dumps(record).encode() + b'\n')
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+        except OSError:
+            logging.error('SequenceJournal: unable to write record',
+                          exc_info=True)
+            return False
+
+        return True
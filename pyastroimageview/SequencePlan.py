@@ -0,0 +1,500 @@
+#
+# Sequence plans
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# An ImageSequence is one filter, one exposure and one frame type.  A plan
+# is a list of exposure groups for one or more targets, for example
+# 60 x 120s L and 20 x 120s each of R, G and B for M31 then 30 x 300s Ha
+# for NGC 7000.  The plan is stored as JSON:
+#
+#   {"name": "Autumn", "target_dir": "/data/2019-10-12",
+#    "interleave": true, "block_frames": 5, "parfocal": false,
+#    "groups": [{"target": "M31", "filter": "L", "exposure": 120,
+#                "count": 60, "num_dither": 3}, ...]}
+#
+# The scheduler turns a plan into the steps actually run - each step is a
+# number of frames of one group which the sequence UI runs as an ordinary
+# ImageSequence.  Targets are done in the order they appear since only
+# the user knows when each is well placed.  For each target:
+#
+#   - light frames are done first, then flats and then darks/bias which
+#     don't need the sky
+#   - filters are visited in filter wheel order starting with the filter
+#     already in place
+#   - when interleaving, frames are taken in rotations of block_frames of
+#     each filter so every filter gets even coverage of the night.  Every
+#     other rotation is reversed so the last filter of one rotation is the
+#     first of the next which saves a filter move and refocus per rotation
+#   - a refocus is needed on each new target and, unless the filters are
+#     parfocal, after each filter change
+#   - dithering follows the frame index within the whole group so short
+#     interleaved steps still dither every num_dither frames
+#
+# estimate_plan() does a dry run of the steps to estimate how long the
+# plan takes.
+#
+import json
+import math
+import logging
+from collections import OrderedDict
+
+from pyastroimageview.ImageSequence import FrameType, count_dithers
+
+DEFAULT_BLOCK_FRAMES = 5
+
+
+class ExposureGroup:
+    """
+    Frames of one target, filter, frame type and exposure.
+
+    Attributes
+    ----------
+    target : str
+        Object name - used as the sequence base name.
+    filter : str
+        Filter name or None if filter doesn't matter (darks/bias).
+    frame_type : FrameType
+        Type of frames.
+    exposure : float
+        Exposure in seconds.
+    count : int
+        Number of frames.
+    binning : int
+        Binning.
+    num_dither : int
+        Dither every num_dither frames (0 for no dithering).
+    start_index : int
+        Index of first frame.
+    """
+
+    def __init__(self, target, filter, exposure, count,
+                 frame_type=FrameType.LIGHT, binning=1, num_dither=0,
+                 start_index=1):
+        self.target = target
+        self.filter = filter
+        self.frame_type = frame_type
+        self.exposure = exposure
+        self.count = count
+        self.binning = binning
+        self.num_dither = num_dither
+        self.start_index = start_index
+
+    @classmethod
+    def from_dict(cls, d):
+        ftype = d.get('frame_type', 'Light')
+        for frame_type in FrameType:
+            if ftype in (frame_type.name, frame_type.pretty_name()):
+                break
+        else:
+            raise ValueError(f'Unknown frame type {ftype}')
+
+        if frame_type in (FrameType.LIGHT, FrameType.FLAT) and not d.get('filter'):
+            raise ValueError(f'{frame_type.pretty_name()} group for '
+                             f'{d.get("target")} needs a filter')
+
+        group = cls(d.get('target', 'Object'), d.get('filter', None),
+                    float(d['exposure']), int(d['count']),
+                    frame_type=frame_type,
+                    binning=int(d.get('binning', 1)),
+                    num_dither=int(d.get('num_dither', 0)),
+                    start_index=int(d.get('start_index', 1)))
+
+        if group.count < 1 or group.exposure < 0:
+            raise ValueError(f'Bad count/exposure for {group}')
+
+        return group
+
+    def to_dict(self):
+        return {'target': self.target,
+                'filter': self.filter,
+                'frame_type': self.frame_type.pretty_name(),
+                'exposure': self.exposure,
+                'count': self.count,
+                'binning': self.binning,
+                'num_dither': self.num_dither,
+                'start_index': self.start_index}
+
+    def is_light_frames(self):
+        return self.frame_type == FrameType.LIGHT
+
+    def dither_range(self):
+        """Return (start index, number frames) for the dither cadence"""
+        # the group is split into steps when interleaving so dithering
+        # follows the index within the whole group
+        return (self.start_index, self.count)
+
+    def __str__(self):
+        return f'{self.target} {self.frame_type.pretty_name()} ' \
+               f'{self.filter or "-"} {self.count}x{self.exposure:g}s'
+
+
+class SequencePlan:
+    """
+    Ordered list of exposure groups with settings shared by all of them.
+
+    Attributes
+    ----------
+    name : str
+        Name of plan.
+    groups : list
+        ExposureGroup objects.
+    target_dir : str
+        Directory for frames - empty to use the sequence setting.
+    name_elements : str
+        Filename template - empty to use the sequence setting.
+    output_format : str
+        Key of ImageWriter.OUTPUT_FORMATS - empty to use the sequence setting.
+    interleave : bool
+        Rotate through filters instead of finishing each in turn.
+    block_frames : int
+        Frames of each filter per rotation when interleaving.
+    parfocal : bool
+        Filters are parfocal so a filter change doesn't need a refocus.
+    """
+
+    def __init__(self, name='Plan', groups=None):
+        self.name = name
+        self.groups = groups if groups is not None else []
+        self.target_dir = ''
+        self.name_elements = ''
+        self.output_format = ''
+        self.interleave = True
+        self.block_frames = DEFAULT_BLOCK_FRAMES
+        self.parfocal = True
+
+    @classmethod
+    def from_dict(cls, d):
+        plan = cls(d.get('name', 'Plan'),
+                   [ExposureGroup.from_dict(g) for g in d.get('groups', [])])
+        plan.target_dir = d.get('target_dir', '')
+        plan.name_elements = d.get('name_elements', '')
+        plan.output_format = d.get('output_format', '')
+        plan.interleave = bool(d.get('interleave', True))
+        plan.block_frames = max(1, int(d.get('block_frames', DEFAULT_BLOCK_FRAMES)))
+        plan.parfocal = bool(d.get('parfocal', True))
+        return plan
+
+    def to_dict(self):
+        return {'name': self.name,
+                'target_dir': self.target_dir,
+                'name_elements': self.name_elements,
+                'output_format': self.output_format,
+                'interleave': self.interleave,
+                'block_frames': self.block_frames,
+                'parfocal': self.parfocal,
+                'groups': [g.to_dict() for g in self.groups]}
+
+    def total_frames(self):
+        return sum(g.count for g in self.groups)
+
+
+def load_plan(fname):
+    """
+    Read a plan from a JSON file.
+
+    Returns
+    -------
+    SequencePlan
+        Plan or None if it could not be read.
+    """
+    try:
+        with open(fname) as f:
+            plan = SequencePlan.from_dict(json.load(f))
+    except Exception:
+        logging.error(f'load_plan: unable to read plan {fname}', exc_info=True)
+        return None
+
+    logging.info(f'load_plan: {fname} {len(plan.groups)} groups '
+                 f'{plan.total_frames()} frames')
+
+    return plan
+
+
+def save_plan(plan, fname):
+    try:
+        with open(fname, 'w') as f:
+            json.dump(plan.to_dict(), f, indent=2)
+    except OSError:
+        logging.error(f'save_plan: unable to write plan {fname}', exc_info=True)
+        return False
+
+    return True
+
+
+class PlanStep:
+    """
+    Frames of one group run as a single ImageSequence.
+
+    Attributes
+    ----------
+    group : ExposureGroup
+        Group frames belong to.
+    start_index : int
+        Index of first frame.
+    count : int
+        Number of frames.
+    filter_change : bool
+        Filter wheel moves before this step.
+    refocus : bool
+        A refocus is needed before this step.
+    target_change : bool
+        First step of a new target.
+    """
+
+    def __init__(self, group, start_index, count):
+        self.group = group
+        self.start_index = start_index
+        self.count = count
+        self.filter_change = False
+        self.refocus = False
+        self.target_change = False
+
+    @classmethod
+    def from_dict(cls, d, plan):
+        step = cls(plan.groups[d['group']], int(d['start_index']), int(d['count']))
+        step.filter_change = bool(d.get('filter_change', False))
+        step.refocus = bool(d.get('refocus', False))
+        step.target_change = bool(d.get('target_change', False))
+        return step
+
+    def to_dict(self, plan):
+        """Return dictionary of step - group is stored as its index in plan"""
+        return {'group': plan.groups.index(self.group),
+                'start_index': self.start_index,
+                'count': self.count,
+                'filter_change': self.filter_change,
+                'refocus': self.refocus,
+                'target_change': self.target_change}
+
+    def __str__(self):
+        flags = ''.join([' [target]' if self.target_change else '',
+                         ' [filter]' if self.filter_change else '',
+                         ' [refocus]' if self.refocus else ''])
+        return f'{self.group.target} {self.group.frame_type.pretty_name()} ' \
+               f'{self.group.filter or "-"} {self.group.exposure:g}s ' \
+               f'#{self.start_index}-{self.start_index + self.count - 1}{flags}'
+
+
+class PlanScheduler:
+    """
+    Orders the frames of a plan.
+
+    Parameters
+    ----------
+    filter_names : list
+        Filter names in wheel order.  Filters not in the list are visited
+        after the others in alphabetical order.
+    current_filter : str
+        Filter in place when the plan starts.
+    """
+
+    def __init__(self, filter_names=None, current_filter=None):
+        self.filter_names = list(filter_names) if filter_names else []
+        self.current_filter = current_filter
+
+    def schedule(self, plan):
+        """
+        Return list of PlanStep to run the plan.
+        """
+        targets = OrderedDict()
+        for group in plan.groups:
+            targets.setdefault(group.target, []).append(group)
+
+        blocks = []
+        current = self.current_filter
+        for groups in targets.values():
+            lights = [g for g in groups if g.frame_type == FrameType.LIGHT]
+            flats = [g for g in groups if g.frame_type == FrameType.FLAT]
+            others = [g for g in groups if g.frame_type not in (FrameType.LIGHT,
+                                                               FrameType.FLAT)]
+
+            lights = self._order_by_filter(lights, current)
+            if plan.interleave:
+                blocks += self._interleave(lights, plan.block_frames)
+            else:
+                blocks += [(g, g.count) for g in lights]
+            if lights:
+                current = blocks[-1][0].filter
+
+            flats = self._order_by_filter(flats, current)
+            blocks += [(g, g.count) for g in flats]
+            if flats:
+                current = flats[-1].filter
+
+            # shortest first so a cut short night still gets some of each
+            blocks += [(g, g.count) for g in sorted(others, key=lambda g: g.exposure)]
+
+        return self._make_steps(blocks, plan.parfocal)
+
+    def _filter_key(self, name):
+        if name in self.filter_names:
+            return (0, self.filter_names.index(name), '')
+        return (1, 0, name or '')
+
+    def _order_by_filter(self, groups, current):
+        """Sort groups into wheel order starting with the current filter"""
+        groups = sorted(groups, key=lambda g: (self._filter_key(g.filter), g.exposure))
+        for i, g in enumerate(groups):
+            if g.filter == current:
+                return groups[i:] + groups[:i]
+        return groups
+
+    @staticmethod
+    def _interleave(groups, block_frames):
+        """Return (group, count) blocks rotating through groups"""
+        if not groups:
+            return []
+
+        # each group is spread evenly over the rotations so groups with
+        # fewer frames are not finished early in the night
+        nrot = max(math.ceil(g.count / block_frames) for g in groups)
+        blocks = []
+        for r in range(nrot):
+            order = groups if r % 2 == 0 else groups[::-1]
+            for g in order:
+                n = (r + 1) * g.count // nrot - r * g.count // nrot
+                if n > 0:
+                    blocks.append((g, n))
+        return blocks
+
+    def _make_steps(self, blocks, parfocal):
+        steps = []
+        next_index = {}
+        current_filter = self.current_filter
+        current_target = None
+        for group, count in blocks:
+            if steps and steps[-1].group is group:
+                steps[-1].count += count
+                next_index[id(group)] += count
+                continue
+
+            start = next_index.get(id(group), group.start_index)
+            next_index[id(group)] = start + count
+            step = PlanStep(group, start, count)
+
+            if group.filter is not None and group.filter != current_filter:
+                step.filter_change = True
+                current_filter = group.filter
+
+            if group.target != current_target and group.is_light_frames():
+                step.target_change = True
+                current_target = group.target
+
+            if group.is_light_frames():
+                step.refocus = step.target_change or (step.filter_change and not parfocal)
+
+            steps.append(step)
+
+        return steps
+
+
+class SequenceOverheads:
+    """
+    Time in seconds spent on things other than exposing.
+
+    Attributes
+    ----------
+    download : float
+        Download of each frame.
+    save : float
+        Time the sequence waits on saving each frame.  Frames are written
+        in the background so this is normally 0.
+    dither : float
+        Each dither including settling.
+    filter_change : float
+        Each filter wheel move.
+    refocus : float
+        Each refocus.
+    target_change : float
+        Slew and guider restart for each new target.
+    """
+
+    def __init__(self, download=5.0, save=0.0, dither=15.0, filter_change=5.0,
+                 refocus=120.0, target_change=120.0):
+        self.download = download
+        self.save = save
+        self.dither = dither
+        self.filter_change = filter_change
+        self.refocus = refocus
+        self.target_change = target_change
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Use PHD2 settle settings for the dither time"""
+        overheads = cls()
+        overheads.dither = settings.phd2_starttime + settings.phd2_settledtime
+        return overheads
+
+
+def estimate_plan(steps, overheads=None):
+    """
+    Dry run of a schedule.
+
+    Parameters
+    ----------
+    steps : list
+        PlanStep objects from PlanScheduler.schedule().
+    overheads : SequenceOverheads
+        Times to use - defaults if not given.
+
+    Returns
+    -------
+    dict
+        Frames, counts of each overhead and seconds of exposure, overhead
+        and total.
+    """
+    if overheads is None:
+        overheads = SequenceOverheads()
+
+    result = {'frames': 0, 'dithers': 0, 'filter_changes': 0, 'refocuses': 0,
+              'target_changes': 0, 'exposure_s': 0.0}
+
+    for step in steps:
+        group = step.group
+        result['frames'] += step.count
+        result['exposure_s'] += step.count * group.exposure
+        if group.is_light_frames():
+            result['dithers'] += count_dithers(step.start_index, step.count,
+                                               group.num_dither,
+                                               group.dither_range())
+        result['filter_changes'] += step.filter_change
+        result['refocuses'] += step.refocus
+        result['target_changes'] += step.target_change
+
+    result['overhead_s'] = result['frames'] * (overheads.download + overheads.save) \
+        + result['dithers'] * overheads.dither \
+        + result['filter_changes'] * overheads.filter_change \
+        + result['refocuses'] * overheads.refocus \
+        + result['target_changes'] * overheads.target_change
+    result['total_s'] = result['exposure_s'] + result['overhead_s']
+
+    return result
+
+
+def format_schedule(steps, estimate):
+    """Return text describing steps and their estimate"""
+    lines = [str(step) for step in steps]
+    lines.append('')
+    lines.append(f'{estimate["frames"]} frames  '
+                 f'{estimate["filter_changes"]} filter changes  '
+                 f'{estimate["refocuses"]} refocuses  '
+                 f'{estimate["dithers"]} dithers')
+    lines.append(f'exposure {estimate["exposure_s"]/3600:.2f} h + '
+                 f'overhead {estimate["overhead_s"]/3600:.2f} h = '
+                 f'{estimate["total_s"]/3600:.2f} h')
+    return '\n'.join(lines)
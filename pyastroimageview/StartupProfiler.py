@@ -0,0 +1,188 @@
+#
+# Startup profiler
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Records how long each module takes to import and how long each step of
+# creating the main window takes so slow startup can be tracked down.
+#
+# Enabled by passing --profile-startup to pyastroimageview_main.py or by
+# setting the environment variable PYASTROIMAGEVIEW_PROFILE_STARTUP=1.
+#
+import os
+import sys
+import time
+import logging
+from contextlib import contextmanager
+
+PROFILE_ENV_VAR = 'PYASTROIMAGEVIEW_PROFILE_STARTUP'
+PROFILE_ARG = '--profile-startup'
+
+
+class _TimedLoader:
+    """Wraps a module loader to time executing the module"""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._leave(module.__name__)
+
+            # put back the real loader so nothing else sees the wrapper
+            module.__loader__ = self._loader
+            if getattr(module, '__spec__', None) is not None:
+                module.__spec__.loader = self._loader
+
+
+class _TimedFinder:
+    """Meta path finder which wraps loaders found by the other finders"""
+
+    def __init__(self, profiler):
+        self._profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, self._profiler)
+                return spec
+
+        return None
+
+
+class StartupProfiler:
+    """
+    Collects module import times and named startup section times.
+
+    Import times are cumulative (including modules imported by the module)
+    and self (excluding them).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start_time = None
+        self.finder = None
+
+        # module name -> (cumulative, self) seconds
+        self.imports = {}
+
+        # stack of child time accumulated for modules being imported
+        self.import_stack = []
+
+        # time spent in outermost imports
+        self.import_time = 0
+
+        # list of (name, seconds) in order run
+        self.sections = []
+
+    @staticmethod
+    def requested(argv=None):
+        """Return True if startup profiling was asked for"""
+        if argv is None:
+            argv = sys.argv
+        return PROFILE_ARG in argv or bool(os.environ.get(PROFILE_ENV_VAR))
+
+    def start(self):
+        if self.enabled:
+            return
+
+        self.enabled = True
+        self.start_time = time.perf_counter()
+        self.finder = _TimedFinder(self)
+        sys.meta_path.insert(0, self.finder)
+
+    def stop(self):
+        if self.finder is not None and self.finder in sys.meta_path:
+            sys.meta_path.remove(self.finder)
+        self.finder = None
+
+    def _enter(self):
+        self.import_stack.append([time.perf_counter(), 0.0])
+
+    def _leave(self, name):
+        start, child_time = self.import_stack.pop()
+        elapsed = time.perf_counter() - start
+        self.imports[name] = (elapsed, elapsed - child_time)
+        if self.import_stack:
+            self.import_stack[-1][1] += elapsed
+        else:
+            self.import_time += elapsed
+
+    @contextmanager
+    def section(self, name):
+        """Time a named block of startup code"""
+        if not self.enabled:
+            yield
+            return
+
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections.append((name, time.perf_counter() - t0))
+
+    def report(self, top=25):
+        """Log the slowest imports and all sections and stop profiling"""
+        if not self.enabled:
+            return None
+
+        self.stop()
+
+        total = time.perf_counter() - self.start_time
+        lines = [f'Startup profile - {total:.3f} s total until first event loop pass',
+                 '',
+                 f'Slowest {top} imports (cumulative / self seconds):']
+
+        ranked = sorted(self.imports.items(), key=lambda x: x[1][0], reverse=True)
+        for name, (cumul, own) in ranked[:top]:
+            lines.append(f'  {cumul:8.3f} {own:8.3f}  {name}')
+
+        lines.append(f'  {len(self.imports)} modules imported taking '
+                     f'{self.import_time:.3f} s')
+
+        lines.append('')
+        lines.append('Startup sections (seconds):')
+        for name, elapsed in self.sections:
+            lines.append(f'  {elapsed:8.3f}  {name}')
+
+        reportstr = '\n'.join(lines)
+
+        logging.info(reportstr)
+
+        self.enabled = False
+
+        return reportstr
+
+
+# one instance for the whole program so it can be started before
+# anything else is imported
+startup_profiler = StartupProfiler()
@@ -0,0 +1,363 @@
+#
+# XISF image writer
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Writes monolithic XISF 1.0 files as read by PixInsight - see
+#
+#    http://pixinsight.com/doc/docs/XISF-1.0-spec/XISF-1.0-spec.html
+#
+# A file is the signature, the length of the XML header, the header and
+# then the image as an attached data block.  FITS header cards are stored
+# as FITSKeyword elements and the common ones are also stored as the
+# equivalent XISF properties.
+#
+# The pixel data is streamed to the file in blocks of rows so no full size
+# copy of the frame is made even when it is byte shuffled and compressed.
+# Since the compressed size isn't known until the data is written, space
+# for the largest possible header is reserved in front of the data block
+# and the real header is written last.
+#
+# zlib compression is always available.  lz4 needs the lz4 module and is
+# written as one subblock per block of rows.
+#
+import os
+import zlib
+import time
+import struct
+import logging
+from xml.etree import ElementTree
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+XISF_SIGNATURE = b'XISF0100'
+XISF_NAMESPACE = 'http://www.pixinsight.com/xisf'
+
+# data blocks start on a multiple of this
+BLOCK_ALIGNMENT = 4096
+
+# bytes of uncompressed data handled at a time
+STREAM_BLOCK_SIZE = 4 * 1024 * 1024
+
+XISF_COMPRESSION_CODECS = ['zlib'] + (['lz4'] if lz4 is not None else [])
+
+SAMPLE_FORMATS = {np.dtype(np.uint8): 'UInt8',
+                  np.dtype(np.uint16): 'UInt16',
+                  np.dtype(np.uint32): 'UInt32',
+                  np.dtype(np.float32): 'Float32',
+                  np.dtype(np.float64): 'Float64'}
+
+# FITS keywords which describe the FITS data layout not the image
+STRUCTURAL_KEYWORDS = ['SIMPLE', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2',
+                       'EXTEND', 'BZERO', 'BSCALE']
+
+# FITS keyword -> (XISF property id, type)
+FITS_TO_XISF_PROPERTIES = {'OBJECT': ('Observation:Object:Name', 'String'),
+                           'EXPOSURE': ('Instrument:ExposureTime', 'Float32'),
+                           'FILTER': ('Instrument:Filter:Name', 'String'),
+                           'INSTRUME': ('Instrument:Camera:Name', 'String'),
+                           'CCD-TEMP': ('Instrument:Sensor:Temperature', 'Float32'),
+                           'XPIXSZ': ('Instrument:Sensor:XPixelSize', 'Float32'),
+                           'YPIXSZ': ('Instrument:Sensor:YPixelSize', 'Float32')}
+
+
+def _format_fits_value(value):
+    if isinstance(value, bool):
+        return 'T' if value else 'F'
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def _header_cards(header):
+    """Return list of (keyword, value, comment) to store from FITS header"""
+    cards = []
+    if header is None:
+        return cards
+
+    for card in header.cards:
+        if card.keyword in STRUCTURAL_KEYWORDS or not card.keyword:
+            continue
+        cards.append((card.keyword, card.value, card.comment))
+
+    return cards
+
+
+def _make_header(width, height, sample_format, bounds, cards, location,
+                 compression, subblocks):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             f'<xisf version="1.0" xmlns="{XISF_NAMESPACE}" '
+             'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+             'xsi:schemaLocation="http://www.pixinsight.com/xisf '
+             'http://pixinsight.com/xisf/xisf-1.0.xsd">']
+
+    attrs = f'geometry="{width}:{height}:1" sampleFormat="{sample_format}" '
+    if bounds is not None:
+        attrs += f'bounds="{bounds[0]!r}:{bounds[1]!r}" '
+    attrs += f'colorSpace="Gray" location="{location}"'
+    if compression:
+        attrs += f' compression="{compression}"'
+    if subblocks:
+        attrs += f' subblocks="{subblocks}"'
+    lines.append(f'<Image {attrs}>')
+
+    for keyword, value, comment in cards:
+        if keyword in FITS_TO_XISF_PROPERTIES and value is not None:
+            propid, proptype = FITS_TO_XISF_PROPERTIES[keyword]
+            lines.append(f'<Property id="{propid}" type="{proptype}" '
+                         f'value={quoteattr(str(value))}/>')
+
+    for keyword, value, comment in cards:
+        lines.append(f'<FITSKeyword name={quoteattr(keyword)} '
+                     f'value={quoteattr(_format_fits_value(value))} '
+                     f'comment={quoteattr(comment)}/>')
+
+    lines.append('</Image>')
+
+    created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    lines.append('<Metadata>')
+    lines.append(f'<Property id="XISF:CreationTime" type="TimePoint" value="{created}"/>')
+    lines.append('<Property id="XISF:CreatorApplication" type="String" '
+                 'value="pyastroimageview"/>')
+    lines.append('</Metadata>')
+    lines.append('</xisf>')
+
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _rows_per_piece(data, shuffle):
+    rows = max(1, STREAM_BLOCK_SIZE // max(1, data[0].nbytes))
+    if shuffle:
+        rows = max(1, rows // data.dtype.itemsize)
+    return rows
+
+
+def _iter_pieces(data, shuffle):
+    """
+    Yield the bytes of the data block in pieces of about STREAM_BLOCK_SIZE.
+
+    Data is little endian and if shuffle is True the bytes are reordered so
+    all the first bytes of each sample come first, then the second bytes...
+    Only a block of rows is copied at a time.
+    """
+    itemsize = data.dtype.itemsize
+    le_dtype = data.dtype.newbyteorder('<')
+    rows = _rows_per_piece(data, shuffle)
+
+    if shuffle:
+        for byte in range(itemsize):
+            for i in range(0, data.shape[0], rows):
+                chunk = np.ascontiguousarray(data[i:i+rows], dtype=le_dtype)
+                yield np.ascontiguousarray(chunk.view(np.uint8)[..., byte::itemsize])
+    else:
+        for i in range(0, data.shape[0], rows):
+            # a view if data is already little endian and contiguous
+            yield np.ascontiguousarray(data[i:i+rows], dtype=le_dtype)
+
+
+def write_xisf(fname, data, header=None, compression=None, shuffle=True,
+               level=6, overwrite=False):
+    """
+    Write an image to a monolithic XISF file.
+
+    Parameters
+    ----------
+    fname : str
+        Output filename.
+    data : numpy array
+        2D image data.
+    header : astropy.io.fits.Header
+        FITS header to store as FITS keywords and XISF properties.
+    compression : str
+        None or one of XISF_COMPRESSION_CODECS.
+    shuffle : bool
+        Byte shuffle compressed data - improves compression of 16 bit data.
+    level : int
+        zlib compression level.
+    overwrite : bool
+        Overwrite existing file.
+
+    Returns
+    -------
+    int
+        Size of file in bytes.
+    """
+    if data.ndim != 2:
+        raise ValueError(f'Only 2D images can be written as XISF not {data.shape}')
+
+    sample_format = SAMPLE_FORMATS.get(np.dtype(data.dtype.newbyteorder('=')))
+    if sample_format is None:
+        raise ValueError(f'Cannot write {data.dtype} data as XISF')
+
+    if compression is not None and compression not in XISF_COMPRESSION_CODECS:
+        raise ValueError(f'Unknown or unavailable XISF compression {compression}')
+
+    height, width = data.shape
+    itemsize = data.dtype.itemsize
+    nbytes = data.size * itemsize
+    cards = _header_cards(header)
+
+    shuffle = shuffle and compression is not None and itemsize > 1
+    if compression is None:
+        codec = None
+    else:
+        codec = f'{compression}+sh:{nbytes}:{itemsize}' if shuffle \
+            else f'{compression}:{nbytes}'
+
+    # floating point images must give the range of their values
+    bounds = None
+    if data.dtype.kind == 'f':
+        bounds = (float(np.nanmin(data)), float(np.nanmax(data)))
+
+    # room for the largest header - every number at its longest
+    maxsize = 2 * nbytes + 1024
+    worst_subblocks = None
+    if compression == 'lz4':
+        rows = _rows_per_piece(data, shuffle)
+        npieces = (height + rows - 1) // rows * (itemsize if shuffle else 1)
+        worst_subblocks = ':'.join([f'{maxsize},{maxsize}'] * npieces)
+    worst = _make_header(width, height, sample_format, bounds, cards,
+                         f'attachment:{maxsize}:{maxsize}', codec, worst_subblocks)
+    data_pos = (16 + len(worst) + BLOCK_ALIGNMENT - 1) // BLOCK_ALIGNMENT * BLOCK_ALIGNMENT
+
+    t0 = time.perf_counter()
+
+    f = open(fname, 'wb' if overwrite else 'xb')
+    try:
+        f.write(b'\0' * data_pos)
+
+        subblocks = []
+        if compression is None:
+            for piece in _iter_pieces(data, shuffle=False):
+                f.write(memoryview(piece).cast('B'))
+        elif compression == 'zlib':
+            comp = zlib.compressobj(level)
+            for piece in _iter_pieces(data, shuffle):
+                f.write(comp.compress(memoryview(piece).cast('B')))
+            f.write(comp.flush())
+        else:
+            for piece in _iter_pieces(data, shuffle):
+                block = lz4.block.compress(memoryview(piece).cast('B'),
+                                           store_size=False)
+                f.write(block)
+                subblocks.append(f'{len(block)},{piece.nbytes}')
+
+        size = f.tell() - data_pos
+
+        xml = _make_header(width, height, sample_format, bounds, cards,
+                           f'attachment:{data_pos}:{size}', codec,
+                           ':'.join(subblocks) if subblocks else None)
+
+        if 16 + len(xml) > data_pos:
+            # shouldn't happen as the space reserved is for the worst case
+            raise RuntimeError(f'write_xisf: header {len(xml)} bytes does not fit')
+
+        f.seek(0)
+        f.write(XISF_SIGNATURE + struct.pack('<II', len(xml), 0))
+        f.write(xml)
+        f.close()
+    except:
+        # don't leave a partial file behind
+        f.close()
+        os.unlink(fname)
+        raise
+
+    filesize = data_pos + size
+
+    logging.debug(f'write_xisf: {fname} {compression} {nbytes/1e6:.1f} MB -> '
+                  f'{size/1e6:.1f} MB in {time.perf_counter()-t0:.2f} s')
+
+    return filesize
+
+
+def read_xisf(fname):
+    """
+    Read an image written by write_xisf().
+
+    Returns
+    -------
+    (numpy array, list)
+        Image data and list of (keyword, value, comment) for the FITS
+        keywords.
+    """
+    with open(fname, 'rb') as f:
+        if f.read(8) != XISF_SIGNATURE:
+            raise ValueError(f'{fname} is not an XISF file')
+        hlen, _ = struct.unpack('<II', f.read(8))
+        root = ElementTree.fromstring(f.read(hlen))
+
+        ns = {'xisf': XISF_NAMESPACE}
+        image = root.find('xisf:Image', ns)
+
+        width, height, channels = [int(x) for x in image.get('geometry').split(':')]
+        dtype = {v: k for k, v in SAMPLE_FORMATS.items()}[image.get('sampleFormat')]
+        dtype = dtype.newbyteorder('<')
+
+        _, pos, size = image.get('location').split(':')
+        f.seek(int(pos))
+        block = f.read(int(size))
+
+    compression = image.get('compression')
+    if compression:
+        parts = compression.split(':')
+        codec = parts[0]
+        usize = int(parts[1])
+        shuffled = codec.endswith('+sh')
+        codec = codec.replace('+sh', '')
+
+        subblocks = image.get('subblocks')
+        if subblocks:
+            sizes = [tuple(int(x) for x in s.split(',')) for s in subblocks.split(':')]
+        else:
+            sizes = [(len(block), usize)]
+
+        pieces = []
+        offset = 0
+        for csize, piece_usize in sizes:
+            cblock = block[offset:offset+csize]
+            offset += csize
+            if codec == 'zlib':
+                pieces.append(zlib.decompress(cblock))
+            elif codec == 'lz4':
+                if lz4 is None:
+                    raise ValueError('lz4 module needed to read this file')
+                pieces.append(lz4.block.decompress(cblock, uncompressed_size=piece_usize))
+            else:
+                raise ValueError(f'Unsupported XISF compression {codec}')
+        block = b''.join(pieces)
+
+        if shuffled:
+            itemsize = int(parts[2])
+            block = np.frombuffer(block, dtype=np.uint8).reshape(itemsize, -1).T.tobytes()
+
+    data = np.frombuffer(block, dtype=dtype).reshape(height, width)
+
+    keywords = [(e.get('name'), e.get('value'), e.get('comment'))
+                for e in image.findall('xisf:FITSKeyword', ns)]
+
+    return data, keywords
+
+
+def xisf_filename(fname):
+    """Return fname with its extension replaced by .xisf"""
+    return os.path.splitext(fname)[0] + '.xisf'
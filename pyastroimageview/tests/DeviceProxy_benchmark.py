@@ -0,0 +1,121 @@
+#
+# Micro-benchmark for DeviceProxy/BackendProxy call overhead
+#
+# Times the device calls made by the focuser/filter wheel/mount status
+# polls and by filling in a FITS header, once directly on the simulated
+# device managers and once through the proxies the rest of the program
+# uses.  The difference is the per-call cost of the proxy.  The method
+# lookups alone are timed too since the calls themselves are noisy.
+#
+# Driver calls normally run on the device executor threads.  That is
+# turned off here so only the proxy overhead is measured.
+#
+# Example:
+#
+#    python DeviceProxy_benchmark.py --number 100000
+#
+import sys
+import json
+import timeit
+import logging
+import argparse
+
+from PyQt5 import QtCore
+
+from pyastroimageview.ApplicationContainer import AppContainer
+from pyastroimageview.ProgramSettings import ProgramSettings
+from pyastroimageview.tests.SimulatedDevices import SimulatedDeviceManager
+
+# device calls made by each path
+POLL_CALLS = [('focuser', 'get_absolute_position'),
+              ('focuser', 'get_current_temperature'),
+              ('focuser', 'is_moving'),
+              ('filterwheel', 'get_position'),
+              ('filterwheel', 'is_moving'),
+              ('mount', 'get_position_radec'),
+              ('mount', 'get_position_altaz'),
+              ('mount', 'is_slewing')]
+
+HEADER_CALLS = [('camera', 'is_connected'),
+                ('camera', 'get_camera_name'),
+                ('camera', 'get_pixelsize'),
+                ('camera', 'get_target_temperature'),
+                ('camera', 'get_current_temperature'),
+                ('filterwheel', 'is_connected'),
+                ('filterwheel', 'get_position_name'),
+                ('focuser', 'is_connected'),
+                ('focuser', 'get_absolute_position'),
+                ('mount', 'is_connected'),
+                ('mount', 'get_position_radec'),
+                ('mount', 'get_position_altaz')]
+
+
+def get_target(proxy):
+    return object.__getattribute__(proxy, '_obj')
+
+
+def time_calls(devices, calls, number, lookup_only=False):
+    """Return mean microseconds to make all calls once"""
+    def run():
+        for name, method in calls:
+            getattr(devices[name], method)()
+
+    def lookup():
+        for name, method in calls:
+            getattr(devices[name], method)
+
+    fn = lookup if lookup_only else run
+
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=20000,
+                        help='Times to run each path')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    app = QtCore.QCoreApplication(sys.argv)
+
+    AppContainer.register('/program_settings', ProgramSettings())
+
+    device_manager = SimulatedDeviceManager()
+
+    names = ['camera', 'focuser', 'filterwheel', 'mount']
+    proxies = {name: getattr(device_manager, name) for name in names}
+    direct = {name: get_target(proxy) for name, proxy in proxies.items()}
+
+    for dev in direct.values():
+        dev.device_executor = None
+
+    report = {}
+    for path, calls in [('poll', POLL_CALLS), ('header', HEADER_CALLS)]:
+        direct_us = time_calls(direct, calls, args.number)
+        proxy_us = time_calls(proxies, calls, args.number)
+        report[path] = {'calls': len(calls),
+                        'direct_us': direct_us,
+                        'proxy_us': proxy_us,
+                        'overhead_per_call_us': (proxy_us - direct_us) / len(calls)}
+
+        # just the method lookup which is the part the proxy adds
+        direct_us = time_calls(direct, calls, args.number, lookup_only=True)
+        proxy_us = time_calls(proxies, calls, args.number, lookup_only=True)
+        report[path]['lookup_overhead_per_call_us'] = (proxy_us - direct_us) / len(calls)
+
+    backend = device_manager.camera_backend
+    backends = {'direct': {'camera': get_target(backend)},
+                'proxy': {'camera': backend}}
+    report['backend'] = {f'{kind}_us': time_calls(devs, [('camera', 'isConnected')],
+                                                  args.number)
+                         for kind, devs in backends.items()}
+
+    device_manager.stop_executors()
+    del app
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
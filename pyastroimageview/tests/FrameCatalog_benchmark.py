@@ -0,0 +1,124 @@
+#
+# Benchmark of frame catalog inserts and queries
+#
+# Fills a temporary catalog with synthetic frames spread over several
+# targets, filters, exposures and nights then times the queries the
+# catalog tool makes.  Each query is repeated and the median time used.
+#
+# Example:
+#
+#    python FrameCatalog_benchmark.py --frames 50000 --output catalog.json
+#
+import os
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+from astropy.io import fits
+
+from pyastroimageview.FrameCatalog import FrameCatalog
+from pyastroimageview.ImageStatistics import ImageStatistics
+
+OBJECTS = ['NGC 7000', 'M 31', 'IC 1805', 'SH2-157', 'M 101', 'NGC 6992',
+           'M 42', 'IC 434', 'M 33', 'NGC 281']
+FILTERS = ['L', 'R', 'G', 'B', 'Ha', 'OIII', 'SII']
+EXPOSURES = [60.0, 120.0, 180.0, 300.0, 600.0]
+TYPES = ['Light'] * 8 + ['Dark', 'Flat']
+
+
+def make_header(i, rng):
+    header = fits.Header()
+    header['OBJECT'] = OBJECTS[rng.integers(len(OBJECTS))]
+    header['FILTER'] = FILTERS[rng.integers(len(FILTERS))]
+    header['IMAGETYP'] = TYPES[rng.integers(len(TYPES))]
+    header['EXPOSURE'] = EXPOSURES[rng.integers(len(EXPOSURES))]
+    header['CCD-TEMP'] = float(rng.normal(-10, 2))
+    header['SET-TEMP'] = -10.0
+    header['XBINNING'] = 1
+    header['CCD_GAIN'] = 200.0
+    header['INSTRUME'] = 'ZWO ASI1600MM Pro'
+    night = 1 + i // 200
+    header['DATE-OBS'] = f'2019-{1 + (night // 28) % 12:02d}-{1 + night % 28:02d}' \
+                         f'T{i % 24:02d}:{i % 60:02d}:00.000'
+    return header
+
+
+def time_query(catalog, repeat, **kwargs):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        frames = catalog.query(**kwargs)
+        times.append(time.perf_counter() - t0)
+    return len(frames), statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=20000,
+                        help='Number of frames to put in catalog')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Times to repeat each query')
+    parser.add_argument('--output', help='Write JSON report to this file')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 65535, size=(64, 64), dtype=np.uint16)
+    stats = ImageStatistics(data)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        catalog = FrameCatalog(os.path.join(tmpdir, 'frames.db'))
+
+        t0 = time.perf_counter()
+        for i in range(args.frames):
+            catalog.add_header(os.path.join(tmpdir, f'frame{i:06d}.fits'),
+                               make_header(i, rng), data, source='sequence',
+                               output_format='fits', write_s=0.5, stats=stats)
+            if i % 3 == 0:
+                catalog.set_hfr(os.path.join(tmpdir, f'frame{i:06d}.fits'),
+                                float(rng.uniform(1.5, 4.0)))
+        insert_s = time.perf_counter() - t0
+
+        queries = {
+            'object_filter_exposure': dict(object='NGC 7000', filter='Ha',
+                                           exposure=300),
+            'object_filter_exposure_temp': dict(object='NGC 7000', filter='Ha',
+                                                exposure=300, min_temp=-12,
+                                                max_temp=-8),
+            'object_wildcard': dict(object='NGC%'),
+            'darks_by_exposure': dict(imagetyp='Dark', exposure=300),
+            'one_night': dict(since='2019-03-05', until='2019-03-06'),
+            'good_hfr': dict(object='M 31', max_hfr=2.0),
+            'path': dict(path_like=os.path.join(tmpdir, 'frame0123%')),
+        }
+
+        report = {'frames': args.frames,
+                  'insert_s': insert_s,
+                  'inserts_per_s': args.frames / insert_s,
+                  'db_mb': os.path.getsize(catalog.path) / 1e6,
+                  'queries': {}}
+
+        for name, kwargs in queries.items():
+            nframes, ms = time_query(catalog, args.repeat, **kwargs)
+            report['queries'][name] = {'frames': nframes, 'ms': ms}
+
+        t0 = time.perf_counter()
+        groups = catalog.summary()
+        report['summary'] = {'groups': len(groups),
+                             'ms': (time.perf_counter() - t0) * 1000}
+
+        catalog.close()
+
+    reportstr = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(reportstr + '\n')
+
+    print(reportstr)
+
+
+if __name__ == '__main__':
+    main()
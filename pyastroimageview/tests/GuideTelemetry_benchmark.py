@@ -0,0 +1,112 @@
+#
+# Benchmark of the guide step ring buffer
+#
+# Fills a GuideStepBuffer with synthetic PHD2 GuideStep events (wrapping
+# it several times) and times appending events and summarizing the
+# guiding during exposures of several lengths.  The RMS is checked
+# against a plain Python computation over a list of the same steps.
+#
+# Example:
+#
+#    python GuideTelemetry_benchmark.py --rate 10 --hours 4 --output guide.json
+#
+import json
+import math
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+from pyastroimageview.GuideTelemetry import GuideStepBuffer
+
+
+def make_events(n, rate, rng, t0):
+    ra = rng.normal(0, 0.4, n)
+    dec = rng.normal(0, 0.3, n)
+    snr = rng.normal(40, 5, n)
+    events = []
+    for i in range(n):
+        events.append({'Event': 'GuideStep',
+                       'Timestamp': t0 + i / rate,
+                       'RADistanceRaw': float(ra[i]),
+                       'DECDistanceRaw': float(dec[i]),
+                       'RADuration': abs(int(ra[i] * 300)),
+                       'RADirection': 'West' if ra[i] > 0 else 'East',
+                       'DECDuration': abs(int(dec[i] * 300)),
+                       'DECDirection': 'North' if dec[i] > 0 else 'South',
+                       'SNR': float(snr[i])})
+    return events
+
+
+def python_rms(steps, start, end):
+    ra = [s['RADistanceRaw'] for s in steps if start <= s['Timestamp'] <= end]
+    dec = [s['DECDistanceRaw'] for s in steps if start <= s['Timestamp'] <= end]
+    ra_rms = statistics.pstdev(ra)
+    dec_rms = statistics.pstdev(dec)
+    return math.hypot(ra_rms, dec_rms)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=float, default=10, help='Guide steps per second')
+    parser.add_argument('--hours', type=float, default=4, help='Hours of guiding')
+    parser.add_argument('--capacity', type=int, default=65536, help='Buffer capacity')
+    parser.add_argument('--exposures', default='30,300,1800',
+                        help='Exposure lengths (s) to summarize')
+    parser.add_argument('--repeat', type=int, default=50, help='Repeats of each query')
+    parser.add_argument('--output', help='Write JSON report to this file')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n = int(args.rate * args.hours * 3600)
+    t0 = 1.5e9
+    events = make_events(n, args.rate, rng, t0)
+
+    buf = GuideStepBuffer(args.capacity)
+    t = time.perf_counter()
+    for event in events:
+        buf.append_event(event)
+    append_s = time.perf_counter() - t
+
+    report = {'steps': n,
+              'capacity': args.capacity,
+              'append_us': append_s / n * 1e6,
+              'buffer_mb': buf.data.nbytes / 1e6,
+              'exposures': {}}
+
+    tend = events[-1]['Timestamp']
+    kept = events[-args.capacity:]
+    for exposure in [float(x) for x in args.exposures.split(',')]:
+        # window straddling the wrap point of the buffer is the worst case
+        end = tend - (n % args.capacity) / args.rate / 2
+        start = end - exposure
+
+        times = []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            stats = buf.stats(start, end)
+            times.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        ref = python_rms(kept, start, end)
+        python_s = time.perf_counter() - t
+
+        report['exposures'][f'{exposure:g}s'] = {
+            'steps': stats['steps'],
+            'stats_ms': statistics.median(times) * 1000,
+            'python_ms': python_s * 1000,
+            'total_rms': stats.get('total_rms'),
+            'rms_error': abs(stats.get('total_rms', 0) - ref)}
+
+    reportstr = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(reportstr + '\n')
+
+    print(reportstr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#
+# Benchmark for converting downloaded camera data
+#
+# Makes synthetic int32 frames indexed [x][y] like ASCOM ImageArray and
+# times turning them into row-major uint16 arrays:
+#
+#   two_pass  - narrow with astype() then make the transpose contiguous
+#   one_pass  - convert_image_data() which does both in one copy
+#
+# The time to parse a nested sequence (ImageArray as it comes over COM) is
+# also measured for the smaller frames with --nested.
+#
+# Example:
+#
+#    python ImageConversion_benchmark.py --sizes 16,26,36,60 --output conv.json
+#
+import json
+import time
+import argparse
+
+import numpy as np
+
+from pyastroimageview.ImageConversion import convert_image_data
+
+# sensor sizes roughly matching common cameras
+SENSORS = {16: (4656, 3520),
+           26: (6248, 4176),
+           36: (7376, 4928),
+           60: (9576, 6388)}
+
+
+def make_frame(width, height, seed=0):
+    """Return int32 frame indexed [x][y] with 16 bit values"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 65535, size=(width, height), dtype=np.int32)
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, result
+
+
+def two_pass(data):
+    return np.ascontiguousarray(data.astype(np.uint16).T)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='16,26,36,60',
+                        help='Sensor sizes in MP to test (16, 26, 36, 60)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--nested', action='store_true',
+                        help='Also time parsing nested sequences (16 MP only)')
+    parser.add_argument('--output', help='Write JSON report to this file')
+    args = parser.parse_args()
+
+    report = {}
+    for mp in [int(x) for x in args.sizes.split(',')]:
+        width, height = SENSORS[mp]
+        data = make_frame(width, height)
+        in_mb = data.nbytes / 1e6
+
+        entry = {'width': width, 'height': height, 'input_mb': in_mb}
+
+        t_two, out_two = best_time(lambda: two_pass(data), args.repeat)
+        t_one, out_one = best_time(lambda: convert_image_data(data,
+                                                              column_major=True,
+                                                              bit_depth=16),
+                                   args.repeat)
+
+        assert out_one.shape == (height, width)
+        assert out_one.flags.c_contiguous
+        assert np.array_equal(out_one, out_two)
+
+        entry['output_mb'] = out_one.nbytes / 1e6
+        entry['two_pass_ms'] = t_two * 1000
+        entry['one_pass_ms'] = t_one * 1000
+        entry['one_pass_mb_s'] = in_mb / t_one
+        entry['speedup'] = t_two / t_one
+
+        if args.nested and mp == 16:
+            nested = data.tolist()
+            t_int32, _ = best_time(lambda: np.array(nested), 1)
+            t_conv, _ = best_time(lambda: convert_image_data(nested,
+                                                             column_major=True,
+                                                             bit_depth=16), 1)
+            entry['nested_to_int32_ms'] = t_int32 * 1000
+            entry['nested_convert_ms'] = t_conv * 1000
+            del nested
+
+        report[f'{mp}MP'] = entry
+        # free before the next size
+        data = out_one = out_two = None
+
+    reportstr = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(reportstr + '\n')
+
+    print(reportstr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#
+# Benchmark of peak memory used handling one frame
+#
+# Makes a synthetic int32 frame like ASCOM ImageArray delivers and runs
+# it through what happens to a new camera image - ingest, median for the
+# image document, autostretch and the percentiles/histogram for the info
+# panel - measuring peak memory with tracemalloc:
+#
+#   old  - frame kept as int32 and analysed with numpy which sorts copies
+#          and normalizes to a float64 copy for autostretch
+#   new  - convert_image_data() to uint16 and ImageStatistics()
+#
+# The input frame itself is not counted.
+#
+# Example:
+#
+#    python ImageMemory_benchmark.py --sizes 16,60 --output mem.json
+#
+import json
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from pyastroimageview.ImageConversion import convert_image_data
+from pyastroimageview.ImageStatistics import ImageStatistics
+
+# sensor sizes roughly matching common cameras
+SENSORS = {16: (4656, 3520),
+           26: (6248, 4176),
+           36: (7376, 4928),
+           60: (9576, 6388)}
+
+
+def make_frame(width, height, seed=0):
+    """Return int32 frame indexed [x][y] with 16 bit values"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 65535, size=(width, height), dtype=np.int32)
+
+
+def old_path(raw):
+    image = np.ascontiguousarray(raw.T)
+
+    median = np.median(image)
+
+    norm_image = image / 65535.0
+    norm_median = np.median(norm_image)
+    mad = 1.4826 * np.median(np.abs(norm_image - norm_median))
+    norm_image = None
+
+    sub_image = image[1::2, 1::2]
+    perc01 = np.percentile(sub_image, 1)
+    perc99 = np.percentile(sub_image, 99)
+    np.histogram(sub_image, range=(perc01, perc99), bins=100)
+
+    return image, median, mad
+
+
+def new_path(raw):
+    image = convert_image_data(raw, column_major=True, bit_depth=16)
+
+    stats = ImageStatistics(image)
+    median = stats.median()
+    mad = 1.4826 * stats.mad() / 65535.0
+
+    perc01 = stats.percentile(1)
+    perc99 = stats.percentile(99)
+    stats.histogram(perc01, perc99, bins=100)
+
+    return image, median, mad
+
+
+def measure(fn, raw):
+    """Return (peak MB, retained MB, seconds, result) for fn(raw)"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    result = fn(raw)
+    dt = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1e6, current / 1e6, dt, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='16,60',
+                        help='Sensor sizes in MP to test (16, 26, 36, 60)')
+    parser.add_argument('--output', help='Write JSON report to this file')
+    args = parser.parse_args()
+
+    report = {}
+    for mp in [int(x) for x in args.sizes.split(',')]:
+        width, height = SENSORS[mp]
+        raw = make_frame(width, height)
+
+        entry = {'width': width, 'height': height, 'input_mb': raw.nbytes / 1e6}
+
+        for name, fn in [('old', old_path), ('new', new_path)]:
+            peak, kept, dt, result = measure(fn, raw)
+            entry[name] = {'peak_mb': peak,
+                           'retained_mb': kept,
+                           'frame_dtype': str(result[0].dtype),
+                           'ms': dt * 1000,
+                           'median': result[1],
+                           'mad': result[2]}
+            result = None
+
+        assert entry['old']['median'] == entry['new']['median']
+        assert abs(entry['old']['mad'] - entry['new']['mad']) < 1e-9
+
+        entry['peak_ratio'] = entry['old']['peak_mb'] / entry['new']['peak_mb']
+
+        report[f'{mp}MP'] = entry
+        raw = None
+
+    reportstr = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(reportstr + '\n')
+
+    print(reportstr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#
+# Benchmark for writing compressed FITS and XISF frames
+#
+# Makes a synthetic uint16 star field (sky background with read noise and
+# gaussian stars) and writes a batch of frames with each output format
+# through an ImageWriter, like a sequence does.  Reports the write speed
+# in MB/s of image data, the compression ratio and checks that the first
+# frame reads back unchanged.
+#
+# Frames are written by --threads workers at once so the MB/s shows how
+# well compression scales with cores.
+#
+# Example:
+#
+#    python ImageWriter_benchmark.py --size 26 --frames 4 --threads 4
+#
+import os
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from astropy.io import fits
+
+from pyastroimageview.FITSImage import FITSImage
+from pyastroimageview.ImageWriter import ImageWriter, OUTPUT_FORMATS, output_filename
+from pyastroimageview.XISFWriter import read_xisf
+
+# sensor sizes roughly matching common cameras
+SENSORS = {16: (4656, 3520),
+           26: (6248, 4176),
+           36: (7376, 4928),
+           60: (9576, 6388)}
+
+
+def make_star_field(width, height, nstars=2000, sky=1000, noise=15, seed=0):
+    """Return uint16 frame of gaussian stars on a noisy sky background"""
+    rng = np.random.default_rng(seed)
+    image = rng.normal(sky, noise, size=(height, width))
+
+    r = 6
+    yy, xx = np.mgrid[-r:r+1, -r:r+1]
+    for _ in range(nstars):
+        y = rng.integers(r, height - r)
+        x = rng.integers(r, width - r)
+        flux = rng.uniform(100, 40000)
+        sigma = rng.uniform(1.0, 2.5)
+        image[y-r:y+r+1, x-r:x+r+1] += flux * np.exp(-(xx**2 + yy**2) / (2 * sigma**2))
+
+    return np.clip(image, 0, 65535).astype(np.uint16)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=26,
+                        help='Sensor size in MP (16, 26, 36, 60)')
+    parser.add_argument('--frames', type=int, default=4,
+                        help='Frames to write for each format')
+    parser.add_argument('--threads', type=int, default=2,
+                        help='Frames written at the same time')
+    parser.add_argument('--formats', default=','.join(OUTPUT_FORMATS.keys()),
+                        help='Output formats to test')
+    parser.add_argument('--dir', help='Directory for output files (default temp dir)')
+    parser.add_argument('--output', help='Write JSON report to this file')
+    args = parser.parse_args()
+
+    width, height = SENSORS[args.size]
+    data = make_star_field(width, height)
+
+    image = FITSImage(data)
+    image.set_object('BENCHMARK')
+
+    report = {'width': width, 'height': height, 'frames': args.frames,
+              'threads': args.threads, 'cpus': os.cpu_count(),
+              'frame_mb': data.nbytes / 1e6, 'formats': {}}
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as outdir:
+        for output_format in args.formats.split(','):
+            writer = ImageWriter(args.threads)
+
+            fnames = [output_filename(os.path.join(outdir, f'{output_format}-{i}.fits'),
+                                      output_format)
+                      for i in range(args.frames)]
+
+            t0 = time.perf_counter()
+            fs = [writer.submit(image, fname, output_format=output_format, overwrite=True)
+                  for fname in fnames]
+            nbytes = sum(f.result() for f in fs)
+            wall = time.perf_counter() - t0
+
+            writer.shutdown()
+
+            if OUTPUT_FORMATS[output_format][1] == 'xisf':
+                readback, keywords = read_xisf(fnames[0])
+                assert ('OBJECT', "'BENCHMARK'") in [k[:2] for k in keywords]
+                assert np.array_equal(readback, data)
+            else:
+                with fits.open(fnames[0]) as hdul:
+                    assert np.array_equal(hdul[-1].data, data)
+                    assert hdul[-1].header['OBJECT'] == 'BENCHMARK'
+
+            stats = writer.get_stats()
+            raw_mb = data.nbytes * args.frames / 1e6
+            report['formats'][output_format] = {
+                'file_mb': nbytes / args.frames / 1e6,
+                'ratio': data.nbytes * args.frames / nbytes,
+                'wall_s': wall,
+                'mb_per_s': raw_mb / wall,
+                'mean_frame_s': stats['write_s'] / args.frames}
+
+            for fname in fnames:
+                os.unlink(fname)
+
+    reportstr = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(reportstr + '\n')
+
+    print(reportstr)
+
+
+if __name__ == '__main__':
+    main()
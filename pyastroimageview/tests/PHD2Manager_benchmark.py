@@ -0,0 +1,172 @@
+#
+# Benchmark of PHD2Manager against the PHD2 simulator
+#
+# Runs PHD2Simulator on a free port and connects a PHD2Manager to it.
+#
+# First PHD2 sends GuideStep events at each rate and the CPU time used
+# by the main (Qt) thread handling them is measured per second and per
+# event.
+#
+# Then a number of dithers are run back to back and the time from
+# calling dither() to the dither_settledone signal is compared with the
+# shortest time the simulated PHD2 could settle in.  Dithers the simulator
+# drops or never settles can be injected to check they are retried or
+# reported.
+#
+# Example:
+#
+#    python PHD2Manager_benchmark.py --rates 1,5,10,50 --dithers 10 --dither-drop 0.2 --output phd2.json
+#
+import json
+import time
+import argparse
+import statistics
+
+from PyQt5 import QtCore
+
+from pyastroimageview.PHD2Manger import PHD2Manager
+from pyastroimageview.tests.PHD2Simulator import PHD2Simulator
+
+
+def run_loop(seconds, quit_signals=()):
+    """Run Qt event loop for seconds or until one of quit_signals fires"""
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(int(seconds * 1000), loop.quit)
+    for signal in quit_signals:
+        signal.connect(loop.quit)
+    loop.exec_()
+    for signal in quit_signals:
+        signal.disconnect(loop.quit)
+
+
+def guide_step_load(sim, phd2, rate, duration):
+    steps = []
+    phd2.signals.guidestep.connect(lambda: steps.append(1))
+
+    sim.set_rate(rate)
+    # let the new rate take effect
+    run_loop(0.5)
+    steps.clear()
+
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    run_loop(duration)
+    cpu = time.thread_time() - cpu
+    wall = time.perf_counter() - wall
+
+    phd2.signals.guidestep.disconnect()
+
+    n = len(steps)
+    return {'rate': rate,
+            'steps': n,
+            'steps_per_s': n / wall,
+            'cpu_ms_per_s': cpu / wall * 1000,
+            'cpu_us_per_step': cpu / n * 1e6 if n else None}
+
+
+def dither_round_trips(phd2, args):
+    results = []
+    done = []
+    phd2.signals.dither_settledone.connect(lambda ok: done.append('settled' if ok else 'settle_failed'))
+    phd2.signals.dither_timeout.connect(lambda: done.append('timeout'))
+    phd2.signals.dither_failed.connect(lambda reason: done.append('failed'))
+
+    quit_signals = [phd2.signals.dither_settledone, phd2.signals.dither_timeout,
+                    phd2.signals.dither_failed]
+
+    for i in range(args.dithers):
+        done.clear()
+        t = time.perf_counter()
+        if not phd2.dither(args.dither_pixels, args.settle_pixels, args.settle_time,
+                           args.settle_timeout, args.settle_timeout + 10):
+            results.append(('not_sent', 0.0, 0))
+            continue
+
+        run_loop(args.settle_timeout + 15, quit_signals)
+        results.append((done[0] if done else 'no_answer',
+                        time.perf_counter() - t, phd2.dither_attempts))
+
+        # guide a little between dithers like between exposures
+        run_loop(0.2)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rates', default='1,5,10,50', help='GuideStep rates (Hz) to measure')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds at each rate')
+    parser.add_argument('--dithers', type=int, default=5, help='Number of dithers')
+    parser.add_argument('--dither-rate', type=float, default=5,
+                        help='GuideStep rate (Hz) while dithering')
+    parser.add_argument('--dither-pixels', type=float, default=3.0, help='Dither (pixels)')
+    parser.add_argument('--settle-pixels', type=float, default=1.5, help='Settle distance (pixels)')
+    parser.add_argument('--settle-time', type=float, default=1.0, help='Settle time (s)')
+    parser.add_argument('--settle-timeout', type=float, default=5.0, help='Settle timeout (s)')
+    parser.add_argument('--dither-delay', type=float, default=0.2,
+                        help='Simulated delay before PHD2 starts dither (s)')
+    parser.add_argument('--response-delay', type=float, default=0.0,
+                        help='Simulated delay before PHD2 answers requests (s)')
+    parser.add_argument('--dither-drop', type=float, default=0.0,
+                        help='Probability simulated PHD2 drops a dither')
+    parser.add_argument('--settle-fail', type=float, default=0.0,
+                        help='Probability simulated PHD2 never settles')
+    parser.add_argument('--output', help='Write JSON report to this file')
+    args = parser.parse_args()
+
+    app = QtCore.QCoreApplication([])
+
+    sim = PHD2Simulator(port=0, dither_delay=args.dither_delay,
+                        response_delay=args.response_delay,
+                        dither_drop=args.dither_drop, settle_fail=args.settle_fail)
+    sim.start()
+
+    phd2 = PHD2Manager(port=sim.port)
+    if not phd2.connect():
+        raise SystemExit('Could not connect to simulator')
+
+    report = {'guide_steps': [], 'dither': {}}
+
+    for rate in [float(x) for x in args.rates.split(',')]:
+        report['guide_steps'].append(guide_step_load(sim, phd2, rate, args.duration))
+
+    sim.set_rate(args.dither_rate)
+    run_loop(0.5)
+
+    results = dither_round_trips(phd2, args)
+    settled = [t for status, t, _ in results if status == 'settled']
+
+    # a dither can finish no sooner than PHD2 starts it and the star has
+    # been in range for the settle time
+    minimum = args.dither_delay + args.response_delay + args.settle_time
+
+    outcomes = {}
+    for status, _, _ in results:
+        outcomes[status] = outcomes.get(status, 0) + 1
+
+    report['dither'] = {
+        'dithers': len(results),
+        'outcomes': outcomes,
+        'resends': sum(max(0, attempts - 1) for _, _, attempts in results),
+        'simulated_min_s': minimum,
+        'settled_median_s': statistics.median(settled) if settled else None,
+        'settled_max_s': max(settled) if settled else None,
+        'overhead_median_s': statistics.median(settled) - minimum if settled else None,
+        'requests': phd2.get_request_stats(),
+        'simulator': dict(sim.counts)}
+
+    phd2.disconnect()
+    sim.stop()
+    app.processEvents()
+
+    reportstr = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(reportstr + '\n')
+
+    print(reportstr)
+
+
+if __name__ == '__main__':
+    main()
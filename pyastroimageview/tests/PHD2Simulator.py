@@ -0,0 +1,452 @@
+#
+# PHD2 event server simulator
+#
+# Stands in for PHD2 so PHD2Manager and the sequence dithering can be run
+# without a guide camera or mount.  It speaks the PHD2 event server
+# protocol - one JSON object per line - answering the JSONRPC requests
+# pyastroimageview makes and sending the events a guiding PHD2 sends:
+#
+#   GuideStep at a fixed rate with gaussian guide errors
+#   GuidingDithered, SettleBegin, Settling and SettleDone for a dither with
+#   the distance shrinking each guide frame until it has stayed within the
+#   settle distance for the settle time (or the settle timeout passes)
+#   StarLost, GuidingStopped, Paused and Resumed when scripted
+#
+# Faults can be injected - a delay before each answer, dithers which are
+# answered but never started and dithers which never settle.
+#
+# Runs in its own thread so a test can drive it from Python, or standalone
+# with an optional script of timed actions:
+#
+#    python PHD2Simulator.py --port 4400 --rate 5 --script night.json
+#
+# where night.json is a list like
+#
+#    [{"at": 30, "action": "star_lost"},
+#     {"at": 60, "action": "set_rate", "value": 10},
+#     {"at": 90, "action": "set_faults", "value": {"settle_fail": 0.5}}]
+#
+import json
+import math
+import time
+import heapq
+import queue
+import random
+import select
+import socket
+import logging
+import argparse
+import itertools
+import threading
+
+PHD2_VERSION = '2.6.9'
+
+# JSONRPC error codes PHD2 uses
+ERR_METHOD_NOT_FOUND = -32601
+ERR_APP = 1
+
+
+class PHD2Simulator(threading.Thread):
+    """
+    Simulated PHD2 event server.
+
+    Parameters
+    ----------
+    host, port : str, int
+        Address to listen on - port 0 picks a free port (see self.port).
+    rate : float
+        Guide steps per second.
+    rms : float
+        RMS guide error per axis in guide pixels.
+    pixel_scale : float
+        Guide camera arcsec per pixel returned by get_pixel_scale.
+    response_delay : float
+        Seconds before each request is answered.
+    dither_delay : float
+        Seconds between answering a dither and PHD2 moving the lock position.
+    settle_decay : float
+        Fraction of the dither offset left after each guide frame.
+    dither_drop : float
+        Probability a dither is answered but never started.
+    settle_fail : float
+        Probability a dither never settles and times out.
+    seed : int
+        Random seed so runs can be repeated.
+    """
+
+    def __init__(self, host='127.0.0.1', port=4400, rate=2.0, rms=0.4,
+                 pixel_scale=1.5, response_delay=0.0, dither_delay=0.2,
+                 settle_decay=0.5, dither_drop=0.0, settle_fail=0.0, seed=0):
+        super().__init__(name='PHD2Simulator', daemon=True)
+
+        self.rate = rate
+        self.rms = rms
+        self.pixel_scale = pixel_scale
+        self.response_delay = response_delay
+        self.dither_delay = dither_delay
+        self.settle_decay = settle_decay
+        self.dither_drop = dither_drop
+        self.settle_fail = settle_fail
+        self.rng = random.Random(seed)
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(4)
+        self.host, self.port = self.server.getsockname()
+
+        self.clients = {}
+        self.running = False
+
+        # (time, seq, callable) run by the server thread
+        self.timed = []
+        self.seq = itertools.count()
+        # callables queued from other threads
+        self.actions = queue.Queue()
+
+        self.guiding = True
+        self.paused = False
+        self.frame = 0
+        self.guide_start = time.time()
+        self.next_step = None
+        self.offset = (0.0, 0.0)
+        self.settle = None
+
+        self.counts = {'events': 0, 'guide_steps': 0, 'requests': 0,
+                       'dithers': 0, 'dithers_dropped': 0,
+                       'settled': 0, 'settle_failed': 0}
+
+    #
+    # control - safe to call from any thread
+    #
+    def call(self, func, *args, delay=0.0):
+        """Run func(*args) on the simulator thread after delay seconds"""
+        self.actions.put((delay, func, args))
+
+    def star_lost(self):
+        self.call(self._star_lost)
+
+    def stop_guiding(self):
+        self.call(self._set_guiding, False)
+
+    def start_guiding(self):
+        self.call(self._set_guiding, True)
+
+    def set_rate(self, rate):
+        self.call(setattr, self, 'rate', rate)
+
+    def set_faults(self, **faults):
+        """Change response_delay, dither_delay, dither_drop or settle_fail"""
+        for key, val in faults.items():
+            self.call(setattr, self, key, val)
+
+    def load_script(self, actions):
+        """
+        Schedule actions from a list of dictionaries with the time 'at'
+        (seconds from now), the 'action' name and an optional 'value'.
+        """
+        funcs = {'star_lost': self.star_lost,
+                 'stop_guiding': self.stop_guiding,
+                 'start_guiding': self.start_guiding,
+                 'pause': lambda: self.call(self._set_paused, True),
+                 'resume': lambda: self.call(self._set_paused, False),
+                 'set_rate': self.set_rate,
+                 'set_faults': lambda value: self.set_faults(**value),
+                 'disconnect': lambda: self.call(self._disconnect_all)}
+
+        for item in actions:
+            func = funcs[item['action']]
+            args = (item['value'],) if 'value' in item else ()
+            threading.Timer(item['at'], func, args).start()
+
+    def stop(self):
+        self.running = False
+        self.join(5)
+
+    #
+    # server thread
+    #
+    def run(self):
+        self.running = True
+        self.next_step = time.monotonic()
+
+        while self.running:
+            now = time.monotonic()
+            wait = 0.05
+            if self.guiding and not self.paused:
+                wait = min(wait, self.next_step - now)
+            if self.timed:
+                wait = min(wait, self.timed[0][0] - now)
+
+            readable, _, _ = select.select([self.server] + list(self.clients), [], [],
+                                           max(0.0, wait))
+            for sock in readable:
+                if sock is self.server:
+                    self._accept()
+                else:
+                    self._read(sock)
+
+            while not self.actions.empty():
+                delay, func, args = self.actions.get()
+                self._schedule(delay, func, *args)
+
+            now = time.monotonic()
+            while self.timed and self.timed[0][0] <= now:
+                _, _, func, args = heapq.heappop(self.timed)
+                func(*args)
+
+            if self.guiding and not self.paused and now >= self.next_step:
+                self._guide_step()
+                # don't try to catch up if we fell behind
+                self.next_step = max(self.next_step + 1.0 / self.rate, now)
+
+        for sock in list(self.clients):
+            sock.close()
+        self.server.close()
+
+    def _schedule(self, delay, func, *args):
+        heapq.heappush(self.timed, (time.monotonic() + delay, next(self.seq), func, args))
+
+    def _accept(self):
+        sock, addr = self.server.accept()
+        logging.info(f'PHD2Simulator: client {addr}')
+        self.clients[sock] = b''
+        self._send(sock, {'Event': 'Version', 'PHDVersion': PHD2_VERSION,
+                          'PHDSubver': '', 'OverlapSupport': True, 'MsgVersion': 1})
+        self._send(sock, {'Event': 'AppState', 'State': self._app_state()})
+
+    def _disconnect_all(self):
+        for sock in list(self.clients):
+            sock.close()
+        self.clients = {}
+
+    def _read(self, sock):
+        try:
+            data = sock.recv(4096)
+        except OSError:
+            data = b''
+
+        if not data:
+            self.clients.pop(sock, None)
+            sock.close()
+            return
+
+        buf = self.clients[sock] + data
+        *lines, self.clients[sock] = buf.split(b'\n')
+        for line in lines:
+            if line.strip():
+                self._request(sock, json.loads(line))
+
+    def _send(self, sock, msg):
+        if 'Event' in msg:
+            msg['Timestamp'] = time.time()
+            msg['Host'] = 'simulator'
+            msg['Inst'] = 1
+            self.counts['events'] += 1
+        try:
+            sock.sendall(json.dumps(msg).encode() + b'\r\n')
+        except OSError:
+            self.clients.pop(sock, None)
+
+    def _event(self, name, **fields):
+        msg = dict(fields, Event=name)
+        for sock in list(self.clients):
+            self._send(sock, dict(msg))
+
+    def _app_state(self):
+        if self.paused:
+            return 'Paused'
+        if not self.guiding:
+            return 'Stopped'
+        return 'Guiding'
+
+    def _request(self, sock, j):
+        self.counts['requests'] += 1
+        method = j.get('method')
+        params = j.get('params', [])
+
+        result = None
+        error = None
+        if method == 'get_app_state':
+            result = self._app_state()
+        elif method == 'get_connected':
+            result = True
+        elif method == 'get_paused':
+            result = self.paused
+        elif method == 'get_pixel_scale':
+            result = self.pixel_scale
+        elif method == 'set_paused':
+            paused = params[0] if isinstance(params, list) else params['paused']
+            self._set_paused(paused)
+            result = 0
+        elif method == 'dither':
+            if not self.guiding or self.paused:
+                error = (ERR_APP, 'cannot dither when not guiding')
+            elif self.settle is not None:
+                error = (ERR_APP, 'cannot dither while settling')
+            else:
+                self._start_dither(params)
+                result = 0
+        else:
+            error = (ERR_METHOD_NOT_FOUND, 'method not found')
+
+        if error is None:
+            answer = {'jsonrpc': '2.0', 'result': result, 'id': j.get('id')}
+        else:
+            code, message = error
+            answer = {'jsonrpc': '2.0', 'error': {'code': code, 'message': message},
+                      'id': j.get('id')}
+
+        if self.response_delay > 0:
+            self._schedule(self.response_delay, self._send, sock, answer)
+        else:
+            self._send(sock, answer)
+
+    def _set_paused(self, paused):
+        if paused != self.paused:
+            self.paused = paused
+            self._event('Paused' if paused else 'Resumed')
+
+    def _set_guiding(self, guiding):
+        if guiding == self.guiding:
+            return
+        self.guiding = guiding
+        self.settle = None
+        if guiding:
+            self.guide_start = time.time()
+            self._event('StartGuiding')
+        else:
+            self._event('GuidingStopped')
+
+    def _star_lost(self):
+        self.frame += 1
+        self._event('StarLost', Frame=self.frame, Time=time.time() - self.guide_start,
+                    StarMass=0, SNR=0, AvgDist=0, ErrorCode=1,
+                    Status='Star lost - low SNR')
+
+    def _start_dither(self, params):
+        if isinstance(params, dict):
+            amount = params.get('amount', 1.0)
+            settle = params.get('settle', {})
+        else:
+            amount, settle = params[0], params[2] if len(params) > 2 else {}
+
+        self.counts['dithers'] += 1
+        if self.rng.random() < self.dither_drop:
+            logging.info('PHD2Simulator: dropping dither')
+            self.counts['dithers_dropped'] += 1
+            return
+
+        # claim the settle now so a second dither is refused
+        self.settle = {'pixels': settle.get('pixels', 1.5),
+                       'time': settle.get('time', 10),
+                       'timeout': settle.get('timeout', 60),
+                       'fail': self.rng.random() < self.settle_fail,
+                       'start': None,
+                       'in_range': None,
+                       'frames': 0}
+        self._schedule(self.dither_delay, self._move_lock, amount)
+
+    def _move_lock(self, amount):
+        if self.settle is None:
+            return
+
+        angle = self.rng.uniform(0, 2 * math.pi)
+        self.offset = (amount * math.cos(angle), amount * math.sin(angle))
+        self.settle['start'] = time.monotonic()
+        self._event('GuidingDithered', dx=self.offset[0], dy=self.offset[1])
+        self._event('SettleBegin')
+
+    def _guide_step(self):
+        self.frame += 1
+
+        settle = self.settle
+        if settle is not None and settle['start'] is not None and not settle['fail']:
+            self.offset = (self.offset[0] * self.settle_decay,
+                           self.offset[1] * self.settle_decay)
+
+        ra = self.offset[0] + self.rng.gauss(0, self.rms)
+        dec = self.offset[1] + self.rng.gauss(0, self.rms)
+        ra_pulse = int(abs(ra) * 300)
+        dec_pulse = int(abs(dec) * 300)
+        self._event('GuideStep', Frame=self.frame, Time=time.time() - self.guide_start,
+                    Mount='Simulator', dx=ra, dy=dec,
+                    RADistanceRaw=ra, DECDistanceRaw=dec,
+                    RADistanceGuide=ra * 0.7, DECDistanceGuide=dec * 0.7,
+                    RADuration=ra_pulse, RADirection='East' if ra > 0 else 'West',
+                    DECDuration=dec_pulse, DECDirection='South' if dec > 0 else 'North',
+                    StarMass=12000, SNR=self.rng.gauss(40, 3), HFD=2.1,
+                    AvgDist=math.hypot(ra, dec))
+        self.counts['guide_steps'] += 1
+
+        if settle is not None and settle['start'] is not None:
+            self._settle_step(settle, math.hypot(ra, dec))
+
+    def _settle_step(self, settle, distance):
+        now = time.monotonic()
+        settle['frames'] += 1
+
+        if distance < settle['pixels']:
+            if settle['in_range'] is None:
+                settle['in_range'] = now
+        else:
+            settle['in_range'] = None
+
+        in_range = 0 if settle['in_range'] is None else now - settle['in_range']
+        self._event('Settling', Distance=distance, Time=in_range,
+                    SettleTime=settle['time'], StarLocked=True)
+
+        if in_range >= settle['time']:
+            self.settle = None
+            self.counts['settled'] += 1
+            self._event('SettleDone', Status=0, TotalFrames=settle['frames'],
+                        DroppedFrames=0)
+        elif now - settle['start'] > settle['timeout']:
+            self.settle = None
+            self.counts['settle_failed'] += 1
+            self._event('SettleDone', Status=1,
+                        Error='timed-out waiting for guider to settle',
+                        TotalFrames=settle['frames'], DroppedFrames=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated PHD2 event server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4400)
+    parser.add_argument('--rate', type=float, default=2.0, help='Guide steps per second')
+    parser.add_argument('--rms', type=float, default=0.4, help='Guide error RMS (pixels)')
+    parser.add_argument('--response-delay', type=float, default=0.0,
+                        help='Delay before answering requests (s)')
+    parser.add_argument('--dither-delay', type=float, default=0.2,
+                        help='Delay before dither starts (s)')
+    parser.add_argument('--dither-drop', type=float, default=0.0,
+                        help='Probability a dither never starts')
+    parser.add_argument('--settle-fail', type=float, default=0.0,
+                        help='Probability a dither never settles')
+    parser.add_argument('--script', help='JSON file of timed actions')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
+
+    sim = PHD2Simulator(args.host, args.port, rate=args.rate, rms=args.rms,
+                        response_delay=args.response_delay,
+                        dither_delay=args.dither_delay,
+                        dither_drop=args.dither_drop,
+                        settle_fail=args.settle_fail, seed=args.seed)
+    if args.script:
+        with open(args.script) as f:
+            sim.load_script(json.load(f))
+
+    logging.info(f'PHD2Simulator listening on {sim.host}:{sim.port}')
+    sim.start()
+    try:
+        while sim.is_alive():
+            time.sleep(10)
+            logging.info(f'PHD2Simulator: {sim.counts}')
+    except KeyboardInterrupt:
+        sim.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+#
+# Load benchmark for RPCServer
+#
+# Starts an RPCServer against simulated devices and runs a number of client
+# threads issuing a mix of requests.  Throughput, latency percentiles and
+# error rates are printed as JSON so runs can be compared.  A client which
+# dies (for example its connection is refused) counts as an error.
+#
+# Example:
+#
+#    python RPCServer_load_benchmark.py --clients 8 --requests 200 --output base.json
+#
+import os
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from PyQt5 import QtCore
+
+from pyastroimageview.ApplicationContainer import AppContainer
+from pyastroimageview.ProgramSettings import ProgramSettings
+from pyastroimageview.FITSHeaderBuilder import FITSHeaderBuilder
+from pyastroimageview.RPCServer import RPCServer
+from pyastroimageview.RPCAsyncTransport import RPCAsyncTransport
+from pyastroimageview.tests.SimulatedDevices import SimulatedDeviceManager
+
+# relative weights of each kind of request in the default mix
+DEFAULT_MIX = 'info=4,image=1,mount=3,focuser=2'
+
+
+class LoadTestClient(threading.Thread):
+    """Client thread which sends requests and waits for each response"""
+
+    def __init__(self, client_id, args, results, output_dir):
+        super().__init__(name=f'LoadTestClient-{client_id}', daemon=True)
+        self.client_id = client_id
+        self.args = args
+        self.results = results
+        self.output_dir = output_dir
+        self.rng = random.Random(args.seed + client_id)
+        self.next_id = 0
+        self.sock = None
+        self.sockfile = None
+        # exception which ended the client early
+        self.failure = None
+
+        self.mix = []
+        for item in args.mix.split(','):
+            name, weight = item.split('=')
+            self.mix.append((name.strip(), float(weight)))
+
+    def connect(self):
+        if self.args.transport == 'unix':
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(self.args.unix_path)
+        else:
+            port = self.args.port
+            if self.args.transport == 'asynctcp':
+                port = self.args.async_port
+            self.sock = socket.create_connection(('127.0.0.1', port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.sockfile = self.sock.makefile('rb')
+
+    def request(self, method, params=None):
+        """Send request and return (latency, error) once answered"""
+        msgid = self.next_id
+        self.next_id += 1
+
+        req = {'method': method, 'id': msgid}
+        if params is not None:
+            req['params'] = params
+
+        t0 = time.perf_counter()
+        self.sock.sendall(bytes(json.dumps(req) + '\n', encoding='ascii'))
+
+        while True:
+            line = self.sockfile.readline()
+            if not line:
+                raise ConnectionError('server closed connection')
+
+            j = json.loads(line)
+            if j.get('id') == msgid:
+                break
+
+        latency = time.perf_counter() - t0
+        error = 'error' in j
+        self.results.append((method, latency, error))
+
+        return j
+
+    def run_info(self):
+        self.request('get_camera_info')
+
+    def run_image(self):
+        self.request('take_image', {'exposure': self.args.exposure,
+                                    'binning': 1})
+        fname = os.path.join(self.output_dir, f'client{self.client_id}.fits')
+        self.request('save_image', {'filename': fname, 'overwrite': True})
+
+    def run_mount(self):
+        method = self.rng.choice(['mount_get_radec', 'mount_get_altaz',
+                                  'mount_is_slewing', 'mount_get_tracking'])
+        self.request(method)
+
+    def run_focuser(self):
+        if self.rng.random() < 0.2:
+            pos = self.rng.randint(1000, 10000)
+            self.request('focuser_move_absolute_position',
+                         {'absolute_position': pos})
+        else:
+            self.request(self.rng.choice(['focuser_get_absolute_position',
+                                          'focuser_is_moving']))
+
+    def run(self):
+        try:
+            self.run_requests()
+        except Exception as e:
+            logging.error(f'{self.name} failed', exc_info=True)
+            self.failure = f'{type(e).__name__}: {e}'
+
+    def run_requests(self):
+        self.connect()
+
+        # initial connection event
+        self.sockfile.readline()
+
+        names = [m[0] for m in self.mix]
+        weights = [m[1] for m in self.mix]
+
+        for _ in range(self.args.requests):
+            kind = self.rng.choices(names, weights)[0]
+            getattr(self, f'run_{kind}')()
+
+        self.sock.close()
+
+
+def summarize(latencies):
+    lat = np.array(latencies) * 1000.0
+    return {'count': len(lat),
+            'mean_ms': float(lat.mean()),
+            'p50_ms': float(np.percentile(lat, 50)),
+            'p95_ms': float(np.percentile(lat, 95)),
+            'p99_ms': float(np.percentile(lat, 99)),
+            'max_ms': float(lat.max())}
+
+
+def make_report(args, results, elapsed, failures):
+    by_method = defaultdict(list)
+    errors = defaultdict(int)
+    for method, latency, error in results:
+        by_method[method].append(latency)
+        if error:
+            errors[method] += 1
+
+    report = {'config': {'clients': args.clients,
+                         'requests_per_client': args.requests,
+                         'mix': args.mix,
+                         'transport': args.transport,
+                         'exposure': args.exposure,
+                         'device_latency': args.device_latency},
+              'elapsed_s': elapsed,
+              'total_requests': len(results),
+              'throughput_rps': len(results) / elapsed if elapsed > 0 else 0,
+              'errors': sum(errors.values()) + len(failures),
+              'error_rate': (sum(errors.values()) + len(failures))
+                            / max(len(results) + len(failures), 1),
+              'client_failures': failures,
+              'latency': summarize([r[1] for r in results]) if results else {},
+              'methods': {}}
+
+    for method, lat in sorted(by_method.items()):
+        stats = summarize(lat)
+        stats['errors'] = errors[method]
+        stats['error_rate'] = errors[method] / len(lat)
+        report['methods'][method] = stats
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RPCServer load test')
+    parser.add_argument('--clients', type=int, default=4,
+                        help='Number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='Requests per client')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='Weights for info, image, mount and focuser requests')
+    parser.add_argument('--exposure', type=float, default=0.01,
+                        help='Exposure length for take_image requests')
+    parser.add_argument('--device-latency', type=float, default=0,
+                        help='Seconds each simulated driver call takes')
+    parser.add_argument('--camera-poll', type=int, default=50,
+                        help='Camera status poll interval in ms while exposing')
+    parser.add_argument('--transport', choices=['tcp', 'unix', 'asynctcp'],
+                        default='tcp', help='How clients connect to server')
+    parser.add_argument('--port', type=int, default=18800)
+    parser.add_argument('--async-port', type=int, default=18801)
+    parser.add_argument('--unix-path', default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write JSON report to this file')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.ERROR,
+                        format='%(asctime)s %(levelname)-8s %(message)s')
+
+    app = QtCore.QCoreApplication(sys.argv)
+
+    settings = ProgramSettings()
+    AppContainer.register('/program_settings', settings)
+    AppContainer.register('/fits_header_builder', FITSHeaderBuilder(settings))
+
+    device_manager = SimulatedDeviceManager(call_latency=args.device_latency)
+    device_manager.poller.set_intervals('camera', fast=args.camera_poll)
+
+    server = RPCServer(port=args.port, max_clients=args.clients)
+    server.listen()
+
+    output_dir = tempfile.TemporaryDirectory()
+
+    transport = None
+    if args.transport in ['unix', 'asynctcp']:
+        if args.unix_path is None:
+            args.unix_path = os.path.join(output_dir.name, 'rpc.sock')
+        transport = RPCAsyncTransport(server,
+                                      unix_path=args.unix_path if args.transport == 'unix' else None,
+                                      port=args.async_port if args.transport == 'asynctcp' else None,
+                                      max_clients=args.clients)
+        if not transport.start():
+            logging.error('Unable to start async transport!')
+            sys.exit(1)
+
+    results = []
+    clients = [LoadTestClient(i, args, results, output_dir.name)
+               for i in range(args.clients)]
+
+    t0 = time.perf_counter()
+    for client in clients:
+        client.start()
+
+    # clients block on sockets so just watch for them all to finish
+    def check_done():
+        if not any(c.is_alive() for c in clients):
+            app.quit()
+
+    done_timer = QtCore.QTimer()
+    done_timer.timeout.connect(check_done)
+    done_timer.start(20)
+
+    app.exec_()
+    elapsed = time.perf_counter() - t0
+
+    if transport is not None:
+        transport.stop()
+
+    failures = [c.failure for c in clients if c.failure is not None]
+    report = make_report(args, results, elapsed, failures)
+    report['poller'] = device_manager.poller.get_stats()
+    report['executors'] = device_manager.get_executor_stats()
+    report['locks'] = device_manager.get_lock_stats()
+    reportstr = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(reportstr + '\n')
+
+    print(reportstr)
+
+    output_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#
+# Calibration check of the sequence duration estimator
+#
+# Simulates a rig whose download and dither times follow skewed
+# distributions, trains a DurationEstimator on a number of measured
+# samples and then checks how often the real duration of simulated
+# sequences falls inside the predicted bounds and how far the predicted
+# end is off.  Compares with the fixed default overheads.
+#
+# Example:
+#
+#    python SequenceEstimator_calibration.py --samples 5,20,100 --output cal.json
+#
+import json
+import random
+import argparse
+import statistics
+
+from pyastroimageview.SequencePlan import SequenceOverheads
+from pyastroimageview.SequenceEstimator import DurationEstimator
+
+
+def download_time(rng):
+    # mostly ~3s with the occasional slow USB transfer
+    return rng.gauss(3.0, 0.3) + (rng.expovariate(1 / 4.0) if rng.random() < 0.05 else 0)
+
+
+def dither_time(rng):
+    # settle time has a long tail
+    return 8.0 + rng.gammavariate(2.0, 6.0)
+
+
+def filter_time(rng):
+    return rng.uniform(2.0, 6.0)
+
+
+def simulate(rng, estimate):
+    """Return simulated duration of what estimate counts"""
+    return estimate['exposure_s'] \
+        + sum(download_time(rng) for _ in range(estimate['frames'])) \
+        + sum(dither_time(rng) for _ in range(estimate['dithers'])) \
+        + sum(filter_time(rng) for _ in range(estimate['filter_changes']))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', default='5,20,100',
+                        help='Number of training samples of each overhead')
+    parser.add_argument('--frames', type=int, default=60, help='Frames per sequence')
+    parser.add_argument('--exposure', type=float, default=120, help='Exposure (s)')
+    parser.add_argument('--dither', type=int, default=3, help='Dither every n frames')
+    parser.add_argument('--trials', type=int, default=500, help='Sequences simulated')
+    parser.add_argument('--output', help='Write JSON report to this file')
+    args = parser.parse_args()
+
+    estimate = {'frames': args.frames,
+                'dithers': args.frames // args.dither,
+                'filter_changes': 4,
+                'refocuses': 0,
+                'target_changes': 0,
+                'exposure_s': args.frames * args.exposure}
+
+    rng = random.Random(0)
+    report = {'estimate': estimate, 'results': {}}
+
+    for nsamples in [0] + [int(x) for x in args.samples.split(',')]:
+        errors = []
+        inside = 0
+        widths = []
+        for trial in range(args.trials):
+            estimator = DurationEstimator(defaults=SequenceOverheads(), min_samples=5)
+            for _ in range(nsamples):
+                estimator.add_sample('download', download_time(rng))
+                estimator.add_sample('dither', dither_time(rng))
+                estimator.add_sample('filter_change', filter_time(rng))
+
+            prediction = estimator.predict(estimate, now=0)
+            actual = simulate(rng, estimate)
+
+            errors.append(prediction['total_s'] - actual)
+            widths.append(prediction['high_s'] - prediction['low_s'])
+            inside += prediction['low_s'] <= actual <= prediction['high_s']
+
+        name = 'defaults' if nsamples == 0 else f'{nsamples}_samples'
+        report['results'][name] = {
+            'mean_error_s': statistics.mean(errors),
+            'mean_abs_error_s': statistics.mean(abs(e) for e in errors),
+            'bound_width_s': statistics.mean(widths),
+            'coverage': inside / args.trials}
+
+    reportstr = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(reportstr + '\n')
+
+    print(reportstr)
+
+
+if __name__ == '__main__':
+    main()
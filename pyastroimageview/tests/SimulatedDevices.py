@@ -0,0 +1,349 @@
+#
+# Simulated devices for testing without hardware
+#
+# These implement the parts of the pyastrobackend device API used by
+# pyastroimageview so the real device managers can be layered on top of
+# them exactly as they are for an ASCOM/INDI/Alpaca backend.
+#
+import time
+import logging
+
+import numpy as np
+
+from pyastroimageview.CameraManager import CameraState
+from pyastroimageview.DeviceManager import DeviceManager
+
+
+class SimulatedDevice:
+    """Common code for simulated devices"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.connected = False
+
+    def _delay(self):
+        # model time spent talking to a real driver
+        if self.backend.call_latency > 0:
+            time.sleep(self.backend.call_latency)
+
+    def has_chooser(self):
+        return False
+
+    def connect(self, driver):
+        self._delay()
+        self.connected = True
+        return True
+
+    def disconnect(self):
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+
+class SimulatedCamera(SimulatedDevice):
+    def __init__(self, backend):
+        super().__init__(backend)
+
+        self.width = 1024
+        self.height = 768
+        self.binning = 1
+        self.roi = (0, 0, self.width, self.height)
+        self.camera_gain = 100
+        self.target_temperature = -10.0
+        self.cooler_state = False
+
+        self.exposure_length = None
+        self.exposure_start = None
+
+        # noise frame is generated once so readout cost is just the copy
+        rng = np.random.default_rng(0)
+        self.noise = rng.integers(900, 1100, size=(self.height, self.width),
+                                  dtype=np.uint16)
+
+    def get_camera_name(self):
+        return 'Simulated Camera'
+
+    def get_settings(self):
+        self._delay()
+        return {'binning': self.binning,
+                'framesize': (self.width, self.height),
+                'roi': self.roi,
+                'camera_gain': self.camera_gain}
+
+    def get_state(self):
+        if self.exposure_start is None:
+            return CameraState.IDLE.value
+        return CameraState.EXPOSING.value
+
+    def start_exposure(self, expose):
+        self._delay()
+        self.exposure_length = expose
+        self.exposure_start = time.time()
+        return True
+
+    def stop_exposure(self):
+        self.exposure_start = None
+        return True
+
+    def check_exposure(self):
+        if self.exposure_start is None:
+            return False
+        return time.time() - self.exposure_start >= self.exposure_length
+
+    def supports_progress(self):
+        return True
+
+    def get_exposure_progress(self):
+        if self.exposure_start is None:
+            return 0
+        elapsed = time.time() - self.exposure_start
+        return min(100.0, 100.0 * elapsed / max(self.exposure_length, 1e-6))
+
+    def get_image_data(self):
+        self._delay()
+        self.exposure_start = None
+        xorg, yorg, w, h = self.roi
+        return self.noise[yorg:yorg+h, xorg:xorg+w].copy()
+
+    def get_pixelsize(self):
+        return 3.8, 3.8
+
+    def get_egain(self):
+        return 1.0
+
+    def get_camera_gain(self):
+        return self.camera_gain
+
+    def set_camera_gain(self, gain):
+        self.camera_gain = gain
+        return True
+
+    def get_camera_offset(self):
+        return None
+
+    def get_camera_usbbandwidth(self):
+        return None
+
+    def get_current_temperature(self):
+        self._delay()
+        return self.target_temperature if self.cooler_state else 20.0
+
+    def get_target_temperature(self):
+        return self.target_temperature
+
+    def set_target_temperature(self, temp):
+        self.target_temperature = temp
+        return True
+
+    def get_cooler_state(self):
+        return self.cooler_state
+
+    def set_cooler_state(self, state):
+        self.cooler_state = state
+        return True
+
+    def get_cooler_power(self):
+        return 50.0 if self.cooler_state else 0.0
+
+    def get_binning(self):
+        return self.binning, self.binning
+
+    def set_binning(self, binx, biny):
+        self.binning = binx
+        return True
+
+    def get_max_binning(self):
+        return 4
+
+    def get_min_max_exposure(self):
+        return 0.001, 3600.0
+
+    def get_size(self):
+        return self.width, self.height
+
+    def get_frame(self):
+        return self.roi
+
+    def set_frame(self, minx, miny, width, height):
+        self.roi = (minx, miny, width, height)
+        return True
+
+
+class SimulatedFocuser(SimulatedDevice):
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.position = 5000
+
+    def get_absolute_position(self):
+        self._delay()
+        return self.position
+
+    def get_max_absolute_position(self):
+        return 50000
+
+    def move_absolute_position(self, abspos):
+        self._delay()
+        self.position = abspos
+        return True
+
+    def get_current_temperature(self):
+        return 10.0
+
+    def is_moving(self):
+        self._delay()
+        return False
+
+    def stop(self):
+        return True
+
+
+class SimulatedFilterWheel(SimulatedDevice):
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.position = 0
+
+    def get_position(self):
+        self._delay()
+        return self.position
+
+    def set_position(self, pos):
+        self._delay()
+        self.position = pos
+        return True
+
+    def get_position_name(self):
+        return self.get_names()[self.position]
+
+    def set_position_name(self, name):
+        return self.set_position(self.get_names().index(name))
+
+    def get_names(self):
+        return ['L', 'R', 'G', 'B', 'Ha', 'OIII', 'SII', 'Dark']
+
+    def is_moving(self):
+        return False
+
+
+class SimulatedMount(SimulatedDevice):
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.ra = 5.5
+        self.dec = -5.0
+        self.tracking = True
+        self.parked = False
+
+    def get_position_radec(self):
+        self._delay()
+        return self.ra, self.dec
+
+    def get_position_altaz(self):
+        self._delay()
+        return 45.0, 180.0
+
+    def slew(self, ra, dec):
+        self._delay()
+        self.ra = ra
+        self.dec = dec
+        return True
+
+    def sync(self, ra, dec):
+        return self.slew(ra, dec)
+
+    def abort_slew(self):
+        return True
+
+    def is_slewing(self):
+        self._delay()
+        return False
+
+    def get_tracking(self):
+        return self.tracking
+
+    def set_tracking(self, track):
+        self.tracking = track
+        return True
+
+    def can_park(self):
+        return True
+
+    def is_parked(self):
+        return self.parked
+
+    def park(self):
+        self.parked = True
+        return True
+
+    def unpark(self):
+        self.parked = False
+        return True
+
+    def get_pier_side(self):
+        return 'EAST'
+
+
+class SimulatedBackend:
+    """
+    Stand in for a pyastrobackend backend object.
+
+    Parameters
+    ----------
+    call_latency : float
+        Seconds each simulated driver call should take.
+    """
+
+    def __init__(self, call_latency=0):
+        self.call_latency = call_latency
+
+    def name(self):
+        return 'SIMULATED'
+
+    def connect(self):
+        return True
+
+    def isConnected(self):
+        return True
+
+    def newCamera(self):
+        return SimulatedCamera(self)
+
+    def newFocuser(self):
+        return SimulatedFocuser(self)
+
+    def newFilterWheel(self):
+        return SimulatedFilterWheel(self)
+
+    def newMount(self):
+        return SimulatedMount(self)
+
+
+class SimulatedDeviceManager(DeviceManager):
+    """
+    DeviceManager with all devices simulated and connected.
+
+    Expects '/program_settings' to have been registered already just like
+    the normal DeviceManager.
+
+    Parameters
+    ----------
+    call_latency : float
+        Seconds each simulated driver call should take.
+    """
+
+    def __init__(self, call_latency=0):
+        self.call_latency = call_latency
+
+        super().__init__()
+
+        self.connect_backends()
+
+        for name in self.executors:
+            setattr(self.settings, f'{name}_driver', 'Simulator')
+
+        self.connect_devices()
+
+        logging.info('SimulatedDeviceManager: all devices connected '
+                     f'{self.get_connect_times()}')
+
+    def get_backend(self, backend_name):
+        return SimulatedBackend(self.call_latency)
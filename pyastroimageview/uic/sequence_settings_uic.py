@@ -247,6 +247,11 @@ class Ui_SequenceSettingsUI(object):
         self.horizontalLayout.setObjectName("horizontalLayout")
         spacerItem1 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.horizontalLayout.addItem(spacerItem1)
+        self.sequence_plan = QtWidgets.QPushButton(SequenceSettingsUI)
+        self.sequence_plan.setMinimumSize(QtCore.QSize(0, 35))
+        self.sequence_plan.setMaximumSize(QtCore.QSize(16777215, 35))
+        self.sequence_plan.setObjectName("sequence_plan")
+        self.horizontalLayout.addWidget(self.sequence_plan)
         self.sequence_start_stop = QtWidgets.QPushButton(SequenceSettingsUI)
         self.sequence_start_stop.setMinimumSize(QtCore.QSize(0, 35))
         self.sequence_start_stop.setMaximumSize(QtCore.QSize(16777215, 35))
@@ -266,6 +271,12 @@ class Ui_SequenceSettingsUI(object):
         self.sequence_camera_gain.setMaximum(300)
         self.sequence_camera_gain.setObjectName("sequence_camera_gain")
         self.gridLayout.addWidget(self.sequence_camera_gain, 12, 3, 1, 1)
+        self.label_20 = QtWidgets.QLabel(SequenceSettingsUI)
+        self.label_20.setObjectName("label_20")
+        self.gridLayout.addWidget(self.label_20, 12, 5, 1, 1)
+        self.sequence_output_format = QtWidgets.QComboBox(SequenceSettingsUI)
+        self.sequence_output_format.setObjectName("sequence_output_format")
+        self.gridLayout.addWidget(self.sequence_output_format, 12, 6, 1, 1)
 
         self.retranslateUi(SequenceSettingsUI)
         QtCore.QMetaObject.connectSlotsByName(SequenceSettingsUI)
@@ -273,7 +284,8 @@ class Ui_SequenceSettingsUI(object):
         SequenceSettingsUI.setTabOrder(self.sequence_elements, self.sequence_elements_help)
         SequenceSettingsUI.setTabOrder(self.sequence_elements_help, self.sequence_targetdir)
         SequenceSettingsUI.setTabOrder(self.sequence_targetdir, self.sequence_select_targetdir)
-        SequenceSettingsUI.setTabOrder(self.sequence_select_targetdir, self.sequence_start_stop)
+        SequenceSettingsUI.setTabOrder(self.sequence_select_targetdir, self.sequence_plan)
+        SequenceSettingsUI.setTabOrder(self.sequence_plan, self.sequence_start_stop)
 
     def retranslateUi(self, SequenceSettingsUI):
         _translate = QtCore.QCoreApplication.translate
@@ -309,8 +321,10 @@ class Ui_SequenceSettingsUI(object):
         self.sequence_roi_set.setText(_translate("SequenceSettingsUI", "..."))
         self.sequence_elements_help.setText(_translate("SequenceSettingsUI", "?"))
         self.sequence_preview.setText(_translate("SequenceSettingsUI", "TextLabel"))
+        self.sequence_plan.setText(_translate("SequenceSettingsUI", "Plan..."))
         self.sequence_start_stop.setText(_translate("SequenceSettingsUI", "Start"))
         self.label_17.setText(_translate("SequenceSettingsUI", "Dither"))
         self.sequence_status_label.setText(_translate("SequenceSettingsUI", "TextLabel"))
         self.label_19.setText(_translate("SequenceSettingsUI", "Camera Gain"))
+        self.label_20.setText(_translate("SequenceSettingsUI", "Output"))
 
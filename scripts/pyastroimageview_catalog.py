@@ -0,0 +1,183 @@
+#!/usr/bin/python
+#
+# pyastroimageview frame catalog tool
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Query the catalog of frames written by pyastroimageview.
+#
+# Examples:
+#
+#    pyastroimageview_catalog.py summary
+#    pyastroimageview_catalog.py query --object 'NGC 7000' --filter Ha \
+#                                      --exposure 300 --max-temp -9
+#    pyastroimageview_catalog.py add /data/2019-10-12/*.fits
+#    pyastroimageview_catalog.py prune
+#
+import sys
+import json
+import time
+import argparse
+import logging
+
+from pyastroimageview.ProgramSettings import ProgramSettings
+from pyastroimageview.FrameCatalog import FrameCatalog
+
+# columns shown for each frame by query unless --json is used
+QUERY_COLUMNS = [('date_obs', 'DATE-OBS', 19),
+                 ('object', 'OBJECT', 16),
+                 ('filter', 'FILTER', 6),
+                 ('imagetyp', 'TYPE', 10),
+                 ('exposure', 'EXP', 7),
+                 ('ccd_temp', 'TEMP', 6),
+                 ('hfr', 'HFR', 5),
+                 ('path', 'PATH', 0)]
+
+
+def format_value(value, width):
+    if value is None:
+        s = '-'
+    elif isinstance(value, float):
+        s = f'{value:.1f}'
+    else:
+        s = str(value)
+
+    if width:
+        return f'{s[:width]:{width}s}'
+    return s
+
+
+def print_table(rows, columns):
+    print(' '.join(format_value(title, width) for _, title, width in columns))
+    for row in rows:
+        print(' '.join(format_value(row[key], width) for key, _, width in columns))
+
+
+def cmd_query(catalog, args):
+    t0 = time.perf_counter()
+    frames = catalog.query(object=args.object, filter=args.filter,
+                           imagetyp=args.type, exposure=args.exposure,
+                           min_temp=args.min_temp, max_temp=args.max_temp,
+                           max_hfr=args.max_hfr, since=args.since,
+                           until=args.until, path_like=args.path,
+                           limit=args.limit, with_header=args.header)
+    dt = time.perf_counter() - t0
+
+    if args.json:
+        print(json.dumps(frames, indent=2))
+    else:
+        print_table(frames, QUERY_COLUMNS)
+        total = sum(f['exposure'] or 0 for f in frames)
+        print(f'{len(frames)} frames {total/3600:.2f} hours ({dt*1000:.1f} ms)')
+
+
+def cmd_summary(catalog, args):
+    groups = catalog.summary()
+
+    if args.json:
+        print(json.dumps(groups, indent=2))
+    else:
+        print_table(groups, [('object', 'OBJECT', 16),
+                             ('filter', 'FILTER', 6),
+                             ('imagetyp', 'TYPE', 10),
+                             ('exposure', 'EXP', 7),
+                             ('frames', 'FRAMES', 6),
+                             ('total_exposure', 'TOTAL', 0)])
+
+
+def cmd_add(catalog, args):
+    rc = 0
+    for fname in args.files:
+        try:
+            rowid = catalog.add_file(fname)
+        except Exception as e:
+            logging.error(f'Unable to add {fname}: {e}')
+            rc = 1
+            continue
+
+        if rowid is None:
+            logging.warning(f'{fname} has no image data')
+        else:
+            print(f'Added {fname}')
+    return rc
+
+
+def cmd_prune(catalog, args):
+    for path in catalog.prune_missing():
+        print(f'Removed {path}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the frame catalog')
+    parser.add_argument('--db', help='Catalog database (default from settings)')
+    parser.add_argument('--debug', action='store_true', help='Show debug output')
+    subparsers = parser.add_subparsers(dest='command')
+
+    query = subparsers.add_parser('query', help='List matching frames')
+    query.add_argument('--object', help='OBJECT - %% is a wildcard')
+    query.add_argument('--filter', help='FILTER - %% is a wildcard')
+    query.add_argument('--type', help='IMAGETYP - %% is a wildcard')
+    query.add_argument('--exposure', type=float, help='Exposure in seconds')
+    query.add_argument('--min-temp', type=float, help='Lowest sensor temperature')
+    query.add_argument('--max-temp', type=float, help='Highest sensor temperature')
+    query.add_argument('--max-hfr', type=float, help='Largest measured HFR')
+    query.add_argument('--since', help='Earliest DATE-OBS (eg. 2019-10-12)')
+    query.add_argument('--until', help='Latest DATE-OBS')
+    query.add_argument('--path', help='SQL LIKE pattern for path')
+    query.add_argument('--limit', type=int, help='Most frames to list')
+    query.add_argument('--header', action='store_true',
+                       help='Include full header (with --json)')
+    query.add_argument('--json', action='store_true', help='Output JSON')
+
+    summary = subparsers.add_parser('summary',
+                                    help='Totals by object/filter/exposure')
+    summary.add_argument('--json', action='store_true', help='Output JSON')
+
+    add = subparsers.add_parser('add', help='Add existing FITS files')
+    add.add_argument('files', nargs='+', help='FITS files')
+
+    subparsers.add_parser('prune', help='Remove frames whose file is gone')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format='%(levelname)-8s %(message)s')
+
+    if args.command is None:
+        parser.print_help()
+        return 1
+
+    dbpath = args.db
+    if dbpath is None:
+        settings = ProgramSettings()
+        settings.read()
+        dbpath = settings.get_frame_catalog_path()
+
+    catalog = FrameCatalog(dbpath)
+    try:
+        commands = {'query': cmd_query,
+                    'summary': cmd_summary,
+                    'add': cmd_add,
+                    'prune': cmd_prune}
+        return commands[args.command](catalog, args) or 0
+    finally:
+        catalog.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,6 +24,13 @@
 # Copyright 2018 Michael Fulbright <mike.fulbright@pobox.com>
 #
 
+import sys
+
+# start profiler before anything slow is imported
+from pyastroimageview.StartupProfiler import startup_profiler
+if startup_profiler.requested():
+    startup_profiler.start()
+
 import logging
 from queue import Empty as QueueEmpty
 from multiprocessing import Queue
@@ -38,12 +45,11 @@ from multiprocessing import Queue
 
 # Alpaca camera env override!!
 import os
-import math
-import sys
 import time
 import json
 import subprocess
 import shlex
+import threading
 
 from pyastrobackend.BackendConfig import get_backend_for_os
 BACKEND = get_backend_for_os()
@@ -52,18 +58,7 @@ from datetime import datetime
 
 import numpy as np
 
-import astropy
-print("pyastroimageview_main.py: DISABLED IERS AGE CHECK!")
-from astropy.utils import iers
-#conf.iers_auto_url = "https://datacenter.iers.org/data/9/finals2000A.all"
-iers.conf.iers_auto_url = "ftp://cddis.gsfc.nasa.gov/pub/products/iers/finals2000A.all"
-iers.conf.remote_timeout = 999
-
-from astropy.time import Time
-from astropy import units as u
-from astropy.coordinates import AltAz
-from astropy.coordinates import Angle
-from astropy.coordinates import SkyCoord
+from pyastroimageview import EarthOrientation
 
 from PyQt5 import QtCore, QtWidgets, QtGui
 
@@ -71,11 +66,14 @@ from PyQt5 import QtCore, QtWidgets, QtGui
 # need to work out a better solution using HFD code in hfdfocus?
 #from pystarutils.measurehfrserver import MeasureHFRServer
 
-from hfdfocus.measure_hfr_server import MeasureHFRClientStdin
-from hfdfocus.MultipleStarFitHFD import StarFitResult
+# hfdfocus is only needed once an image is analyzed so it is imported
+# when needed instead of here
 
 from pyastroimageview.DeviceManager import DeviceManager
 from pyastroimageview.ImageWindowSTF import ImageWindowSTF
+from pyastroimageview.ImageStatistics import ImageStatistics
+from pyastroimageview.ImageWriter import ImageWriter
+from pyastroimageview.FrameCatalog import FrameCatalog
 from pyastroimageview.ImageAreaInfo import ImageAreaInfo
 from pyastroimageview.CameraControlUI import CameraControlUI
 from pyastroimageview.FocuserControlUI import FocuserControlUI
@@ -86,7 +84,10 @@ from pyastroimageview.ProgramSettings import ProgramSettings
 from pyastroimageview.ImageSequenceControlUI import ImageSequnceControlUI
 from pyastroimageview.GeneralSettingsUI import GeneralSettingsDialog
 from pyastroimageview.PHD2ControlUI import PHD2ControlUI
+from pyastroimageview.PHD2Manger import PHD2Manager
+from pyastroimageview.FITSHeaderBuilder import FITSHeaderBuilder
 from pyastroimageview.RPCServer import RPCServer
+from pyastroimageview.RPCAsyncTransport import RPCAsyncTransport
 
 import pyastroimageview.uic.icons
 
@@ -138,6 +139,8 @@ class MeasureHFRWorker(QtCore.QRunnable):
         logging.info(f'stars = {result}')
 
         # convert result dict to a StarFitResult object
+        from hfdfocus.MultipleStarFitHFD import StarFitResult
+
         rdict = json.loads(result)
         status = rdict.get('Result')
         sdict = rdict.get('Value')
@@ -222,6 +225,8 @@ class MeasureHFRWorkerStdin(QtCore.QThread):
 
 
         # convert result dict to a StarFitResult object
+        from hfdfocus.MultipleStarFitHFD import StarFitResult
+
         rdict = json.loads(result)
         status = rdict.get('Result')
         sdict = rdict.get('Value')
@@ -248,6 +253,8 @@ class MeasureHFRWorkerStdin(QtCore.QThread):
 
 
 class MainWindow(QtGui.QMainWindow):
+    earth_orientation_refreshed = QtCore.pyqtSignal(bool)
+
     class ImageDocument:
         """Represents a loaded image and any analysis/metadata
         """
@@ -260,6 +267,8 @@ class MainWindow(QtGui.QMainWindow):
                 Result from hfr measurement analysis
             image_data : numpy 2D array
                 Image data
+            stats : ImageStatistics
+                Statistics of image data
             image_width : ImageWindowSTF
                 Widget containing the image display
             """
@@ -267,6 +276,7 @@ class MainWindow(QtGui.QMainWindow):
             self.median = None
             self.hfr_result = None
             self.image_data = None
+            self.stats = None
             self.image_widget = None
             self.fits = None
 
@@ -312,6 +322,8 @@ class MainWindow(QtGui.QMainWindow):
         #self.hfr_client.start()
         #self.hfr_client = None
         self.hfr_cur_widget = None  # when doing a calc set to where result should go
+        self.hfr_cur_path = None  # frame catalog path of image being measured
+        self.hfr_wait_filename = None  # sequence frame waiting to be written
         logging.info(f'HFR client started {self.hfr_client}')
 
         self.resize(560, 380)
@@ -320,8 +332,9 @@ class MainWindow(QtGui.QMainWindow):
         # container (or global variable in uglier terms) for stuff we want to reference all over
 
         # program settings
-        self.settings = ProgramSettings()
-        settings_ok = self.settings.read()
+        with startup_profiler.section('ProgramSettings'):
+            self.settings = ProgramSettings()
+            settings_ok = self.settings.read()
 
         if not settings_ok:
             logging.error('No settings found!')
@@ -329,6 +342,27 @@ class MainWindow(QtGui.QMainWindow):
 
         AppContainer.register('/program_settings', self.settings)
 
+        self.header_builder = FITSHeaderBuilder(self.settings)
+        AppContainer.register('/fits_header_builder', self.header_builder)
+
+        # sequence frames are compressed and written on these threads
+        try:
+            self.frame_catalog = FrameCatalog(self.settings.get_frame_catalog_path())
+        except Exception:
+            logging.error('Unable to open frame catalog - frames will not '
+                          'be cataloged!', exc_info=True)
+            self.frame_catalog = None
+        AppContainer.register('/frame_catalog', self.frame_catalog)
+
+        self.image_writer = ImageWriter(self.settings.sequence_write_threads,
+                                        catalog=self.frame_catalog)
+        AppContainer.register('/image_writer', self.image_writer)
+        self.image_writer.signals.written.connect(self.hfr_frame_written)
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.image_writer.shutdown)
+        if self.frame_catalog is not None:
+            # connected after writer so queued frames are cataloged first
+            QtWidgets.QApplication.instance().aboutToQuit.connect(self.frame_catalog.close)
+
         # FIXME I don't like how this is working out:
         #  - I have to pass settings into everything that accesses it (some ppl
         #    would consider this good design though)
@@ -339,9 +373,11 @@ class MainWindow(QtGui.QMainWindow):
         #
         #  I don't have any ideas at the moment how to make this cleaner
 
-        self.device_manager = DeviceManager()
-        logging.info('Connecting to backend')
-        rc = self.device_manager.connect_backends()
+        with startup_profiler.section('DeviceManager'):
+            self.device_manager = DeviceManager()
+            logging.info('Connecting to backend')
+            rc = self.device_manager.connect_backends()
+            QtWidgets.QApplication.instance().aboutToQuit.connect(self.device_manager.stop_executors)
         if not rc:
             logging.error('Failed to connect to backend!')
             logging.error('Make sure any device servers (eg. INDI/Alpaca) are running.')
@@ -353,22 +389,26 @@ class MainWindow(QtGui.QMainWindow):
 #        self.filterwheel_control_ui = FilterWheelControlUI(self.device_manager.filterwheel, self.settings)
 #        self.mount_control_ui = MountControlUI(self.device_manager.mount, self.settings)
 
-        self.camera_control_ui = CameraControlUI()
-        self.camera_control_ui.new_camera_image.connect(self.new_camera_image)
-        self.focuser_control_ui = FocuserControlUI()
-        self.filterwheel_control_ui = FilterWheelControlUI()
-        self.mount_control_ui = MountControlUI()
-        self.phd2_control_ui = PHD2ControlUI()
-
-        self.device_control_ui = DeviceControlUI()
-        self.device_control_ui.add_ui_element(self.camera_control_ui, 'Camera Control')
-        self.device_control_ui.add_ui_element(self.filterwheel_control_ui, 'Filter Wheel Control')
-        self.device_control_ui.add_ui_element(self.focuser_control_ui, 'Focuser Control')
-        self.device_control_ui.add_ui_element(self.mount_control_ui, 'Mount Control')
-        self.device_control_ui.add_ui_element(self.phd2_control_ui, 'PHD2 Control')
-
-        self.sequence_control_ui = ImageSequnceControlUI()
-        self.sequence_control_ui.new_sequence_image.connect(self.new_sequence_image)
+        # registers itself as /dev/phd2 for the sequence and PHD2 panel
+        self.phd2_manager = PHD2Manager(self.settings.phd2_host, self.settings.phd2_port)
+        self.device_manager.poller.add_entry('phd2', self.phd2_manager.poll_status,
+                                             is_connected=self.phd2_manager.is_connected,
+                                             fast=5000, slow=5000)
+
+        # device panels are only built the first time they are shown
+        self.camera_control_ui = None
+        with startup_profiler.section('DeviceControlUI'):
+            self.device_control_ui = DeviceControlUI()
+            panel = self.device_control_ui.add_ui_element(CameraControlUI, 'Camera Control')
+            panel.built.connect(self.camera_control_ui_built)
+            self.device_control_ui.add_ui_element(FilterWheelControlUI, 'Filter Wheel Control')
+            self.device_control_ui.add_ui_element(FocuserControlUI, 'Focuser Control')
+            self.device_control_ui.add_ui_element(MountControlUI, 'Mount Control')
+            self.device_control_ui.add_ui_element(PHD2ControlUI, 'PHD2 Control')
+
+        with startup_profiler.section('ImageSequenceControlUI'):
+            self.sequence_control_ui = ImageSequnceControlUI()
+            self.sequence_control_ui.new_sequence_image.connect(self.new_sequence_image)
 
         # FIXME YUCK Trying to get all windows to raise if any clicked on
         QtGui.QApplication.instance().focusWindowChanged.connect(self.focus_window_changed)
@@ -378,9 +418,23 @@ class MainWindow(QtGui.QMainWindow):
         # start RPC server
 
         # FIXME Bad place for this???
-        self.RPC_Server_Instance = RPCServer()
-        self.RPC_Server_Instance.listen()
-        self.RPC_Server_Instance.signals.new_camera_image.connect(self.new_camera_image)
+        with startup_profiler.section('RPCServer'):
+            self.RPC_Server_Instance = RPCServer()
+            self.RPC_Server_Instance.listen()
+            self.RPC_Server_Instance.signals.new_camera_image.connect(self.new_camera_image)
+
+        self.RPC_Async_Transport = None
+        if self.settings.rpc_async_enabled:
+            self.RPC_Async_Transport = RPCAsyncTransport(self.RPC_Server_Instance,
+                                                         unix_path=self.settings.get_rpc_socket_path(),
+                                                         port=self.settings.rpc_async_port)
+            if not self.RPC_Async_Transport.start():
+                logging.error('Unable to start RPC async transport!')
+            QtWidgets.QApplication.instance().aboutToQuit.connect(self.RPC_Async_Transport.stop)
+
+    def camera_control_ui_built(self, camera_control_ui):
+        self.camera_control_ui = camera_control_ui
+        self.camera_control_ui.new_camera_image.connect(self.new_camera_image)
 
     def focus_window_changed(self, win):
         logging.debug('focus_window_changed: ignoring event')
@@ -425,6 +479,17 @@ class MainWindow(QtGui.QMainWindow):
         settings_action = QtGui.QAction(QtGui.QIcon(':/gear.png'), "Settings", self)
         settings_action.triggered.connect(self.edit_settings)
         tool_menu.addAction(settings_action)
+
+        connect_action = QtGui.QAction('Connect All Devices', self)
+        connect_action.setStatusTip('Connect all devices which have a driver set')
+        connect_action.triggered.connect(self.connect_all_devices)
+        tool_menu.addAction(connect_action)
+
+        iers_action = QtGui.QAction('Refresh Earth Orientation Data', self)
+        iers_action.setStatusTip('Download latest IERS tables (needs network)')
+        iers_action.triggered.connect(self.refresh_earth_orientation)
+        tool_menu.addAction(iers_action)
+        self.earth_orientation_refreshed.connect(self.earth_orientation_refresh_done)
         file_toolbar.addAction(settings_action)
 
         view_menu = self.menuBar().addMenu("&View")
@@ -460,6 +525,39 @@ class MainWindow(QtGui.QMainWindow):
         dlg = GeneralSettingsDialog()
         dlg.run(self.settings)
 
+    def connect_all_devices(self):
+        self.status.showMessage('Connecting devices...')
+
+        self.device_control_ui.connect_devices(self.all_devices_connected)
+
+    def all_devices_connected(self, results):
+        failed = [name for name, rc in results.items() if not rc]
+        if not results:
+            self.status.showMessage('No device drivers have been set', 5000)
+        elif failed:
+            self.status.showMessage(f'Unable to connect {", ".join(failed)}', 5000)
+            QtWidgets.QMessageBox.critical(None, 'Error',
+                                           f'Unable to connect to {", ".join(failed)}!',
+                                           QtWidgets.QMessageBox.Ok)
+        else:
+            self.status.showMessage(f'Connected {", ".join(results)} - '
+                                    f'{self.device_manager.format_connect_times()}', 5000)
+
+    def refresh_earth_orientation(self):
+        self.status.showMessage('Downloading earth orientation data...')
+
+        # download can take a while so don't hold up the GUI
+        def run():
+            self.earth_orientation_refreshed.emit(EarthOrientation.refresh_cache())
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def earth_orientation_refresh_done(self, rc):
+        if rc:
+            self.status.showMessage('Earth orientation data updated', 5000)
+        else:
+            self.status.showMessage('Unable to download earth orientation data', 5000)
+
     def new_camera_image(self, result):
         complete_status, fits_doc = result
 
@@ -479,7 +577,7 @@ class MainWindow(QtGui.QMainWindow):
     def new_sequence_image(self, result):
         logging.debug(f'new_sequence_image: {result}')
 
-        fits_doc, filename, target_dir = result
+        fits_doc, target_dir, filename = result
 
         # FIXME This does alot of stuff handled in sequence manager now!
         # need to simplify
@@ -534,11 +632,12 @@ class MainWindow(QtGui.QMainWindow):
         # and have method to expose raw image data than using an attribute
         imgdoc.fits = fits_doc
         imgdoc.image_data = fits_doc.image_data()
-        imgdoc.median = np.median(imgdoc.image_data)
+        imgdoc.stats = ImageStatistics(imgdoc.image_data)
+        imgdoc.median = imgdoc.stats.median()
 
 #        logging.info(f'{imgdoc.image_data.shape}  {fits_doc.image_data().shape}')
 
-        imgdoc.image_widget.show_data(imgdoc.image_data)
+        imgdoc.image_widget.show_data(imgdoc.image_data, imgdoc.stats)
 
         logging.info('find_tab_for_new_image: DONE')
 
@@ -585,35 +684,27 @@ class MainWindow(QtGui.QMainWindow):
         imgdoc.fits = fits_doc
         imgdoc.image_data = fits_doc.image_data()
 
+        logging.info(f'handle_new_image: frame {imgdoc.image_data.shape} '
+                     f'{imgdoc.image_data.dtype} '
+                     f'{imgdoc.image_data.nbytes/1e6:.1f} MB')
+
         try:
-            imgdoc.median = np.median(imgdoc.image_data)
+            imgdoc.stats = ImageStatistics(imgdoc.image_data)
+            imgdoc.median = imgdoc.stats.median()
         except:
             logging.error(f'Error computing media!', exc_info=True)
+            imgdoc.stats = None
             imgdoc.median = 0
 
 #        logging.info(f'{imgdoc.image_data.shape}  {fits_doc.image_data().shape}')
 
-        imgdoc.image_widget.show_data(imgdoc.image_data)
+        imgdoc.image_widget.show_data(imgdoc.image_data, imgdoc.stats)
 
         logging.info(f'FITS: {imgdoc.fits}')
 
         # FIXME this doesn't belong here
 
         # these are controlled by the app and will be set by user in options
-        imgdoc.fits.set_notes(self.settings.observer_notes)
-        imgdoc.fits.set_telescope(self.settings.telescope_description)
-        imgdoc.fits.set_focal_length(self.settings.telescope_focallen)
-        aper_diam = self.settings.telescope_aperture
-        aper_obst = self.settings.telescope_obstruction
-        aper_area = math.pi * (aper_diam / 2.0 * aper_diam / 2.0) \
-                            * (1 - aper_obst * aper_obst / 100.0 / 100.0)
-        imgdoc.fits.set_aperture_diameter(aper_diam)
-        imgdoc.fits.set_aperture_area(aper_area)
-
-        lat_dms = Angle(self.settings.location_latitude*u.degree).to_string(unit=u.degree, sep=' ', precision=0)
-        lon_dms = Angle(self.settings.location_longitude*u.degree).to_string(unit=u.degree, sep=' ', precision=0)
-        imgdoc.fits.set_site_location(lat_dms, lon_dms)
-
         # these come from camera, filter wheel and telescope drivers
         if self.device_manager.camera.is_connected():
             cam_name = self.device_manager.camera.get_camera_name()
@@ -625,34 +716,14 @@ class MainWindow(QtGui.QMainWindow):
 
             imgdoc.fits.set_filter(cur_name)
 
+        radec = None
+        altaz = None
         if self.device_manager.mount.is_connected():
-            ra, dec = self.device_manager.mount.get_position_radec()
-
-            radec = SkyCoord(ra=ra * u.hour, dec=dec * u.degree, frame='fk5')
-            rastr = radec.ra.to_string(u.hour, sep=":", pad=True)
-            decstr = radec.dec.to_string(alwayssign=True, sep=":", pad=True)
-            imgdoc.fits.set_object_radec(rastr, decstr)
+            radec = self.device_manager.mount.get_position_radec()
+            altaz = self.device_manager.mount.get_position_altaz()
 
-            alt, az = self.device_manager.mount.get_position_altaz()
-            if alt is None or az is None:
-                logging.warning('imagesequi: alt/az are None!')
-            else:
-                altaz = AltAz(alt=alt * u.degree, az=az * u.degree)
-                altstr = altaz.alt.to_string(alwayssign=True, sep=":", pad=True)
-                azstr = altaz.az.to_string(alwayssign=True, sep=":", pad=True)
-                imgdoc.fits.set_object_altaz(altstr, azstr)
-
-            now = Time.now()
-            local_sidereal = now.sidereal_time('apparent',
-                                               longitude=self.settings.location_longitude * u.degree)
-            hour_angle = local_sidereal - radec.ra
-            logging.debug(f'locsid = {local_sidereal} HA={hour_angle}')
-            if hour_angle.hour > 12:
-                hour_angle = (hour_angle.hour - 24.0)*u.hourangle
-
-            hastr = Angle(hour_angle).to_string(u.hour, sep=":", pad=True)
-#            logging.info(f'HA={hour_angle} HASTR={hastr} {type(hour_angle)}')
-            imgdoc.fits.set_object_hourangle(hastr)
+        # these are controlled by the app and will be set by user in options
+        self.header_builder.fill_header(imgdoc.fits, radec=radec, altaz=altaz)
 
         # controlled by user selection in camera or sequence config
         imgdoc.fits.set_image_type('Light frame')
@@ -694,7 +765,9 @@ class MainWindow(QtGui.QMainWindow):
         newdoc.filename = filename
         newdoc.image_widget = image_widget
         newdoc.image_data = image_widget.image_data
-        newdoc.median = np.median(newdoc.image_data)
+        newdoc.stats = ImageStatistics(newdoc.image_data)
+        newdoc.median = newdoc.stats.median()
+        image_widget.image_stats = newdoc.stats
 
         self.image_documents[image_widget] = newdoc
         self.image_area_ui.set_current_view_index(tab_index)
@@ -721,7 +794,46 @@ class MainWindow(QtGui.QMainWindow):
 
             filename = 'camera-temp.fits'
             imgdoc.fits.save_to_file(filename, overwrite=True)
+            self.hfr_cur_path = None
+        elif not filename.lower().endswith(('.fits', '.fit')):
+            # star fitting only reads FITS so measure a FITS copy of a
+            # XISF sequence frame
+            imgdoc = self.image_documents[self.hfr_cur_widget]
+
+            self.hfr_cur_path = filename
+            filename = 'sequence-temp.fits'
+            imgdoc.fits.save_to_file(filename, overwrite=True)
+        else:
+            if not os.path.isfile(filename):
+                # sequence frame may still be queued to be written - it is
+                # measured by hfr_frame_written() once it is
+                if self.image_writer.is_pending(filename):
+                    logging.info(f'measure_hfr: waiting for {filename} to be written')
+                    self.hfr_wait_filename = filename
+                    return
+
+                logging.error(f'measure_hfr: {filename} was not written!')
+                self.hfr_cur_widget = None
+                return
+            self.hfr_cur_path = filename
+
+        self.start_measure_hfr(filename)
+
+    def hfr_frame_written(self, filename, ok, error):
+        if filename != self.hfr_wait_filename:
+            return
+
+        self.hfr_wait_filename = None
+
+        if not ok:
+            logging.error(f'hfr_frame_written: {filename} was not written!')
+            self.hfr_cur_widget = None
+            return
 
+        self.hfr_cur_path = filename
+        self.start_measure_hfr(filename)
+
+    def start_measure_hfr(self, filename):
         # FIXME make measure hfr params configurable
         if self.hfr_client is None:
             logging.warning('MeasureHFRServer is DISABLED so image will not be analyzed!')
@@ -776,6 +888,13 @@ class MainWindow(QtGui.QMainWindow):
         self.image_area_ui.update_info(self.image_documents[self.hfr_cur_widget])
         self.hfr_cur_widget = None
 
+        # record HFR if frame was written by us
+        if self.frame_catalog is not None and self.hfr_cur_path is not None:
+            try:
+                self.frame_catalog.set_hfr(self.hfr_cur_path, float(np.median(stars.star_r)))
+            except Exception:
+                logging.error('Unable to store HFR in frame catalog', exc_info=True)
+
     def _measure_hfr_complete(self, result):
         logging.info('measure_hfr complete')
 
@@ -837,7 +956,15 @@ if __name__ == '__main__':
 #    app.setStyleSheet("QWidget {background-color: #9faeaa}")
 #    app.setStyle(DiagnosticStyle())
 
-    mainwin = MainWindow()
+    with startup_profiler.section('MainWindow'):
+        mainwin = MainWindow()
+
+    # report once the window is up and the event loop is running
+    QtCore.QTimer.singleShot(0, startup_profiler.report)
+
+    # devices are connected together once the windows are up
+    if mainwin.settings.connect_devices_at_startup:
+        QtCore.QTimer.singleShot(0, mainwin.connect_all_devices)
 
     if (sys.flags.interactive != 1) or not hasattr(QtCore, 'PYQT_VERSION'):
         QtGui.QApplication.instance().exec_()
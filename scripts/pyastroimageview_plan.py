@@ -0,0 +1,121 @@
+#!/usr/bin/python
+#
+# pyastroimageview sequence plan dry run
+#
+# Copyright 2019 Michael Fulbright
+#
+#
+#    pyastroimageview is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Show the schedule of a sequence plan and estimate how long it takes
+# without any devices.
+#
+# Example:
+#
+#    pyastroimageview_plan.py autumn.json --filters L,R,G,B,Ha,OIII,SII \
+#                             --current-filter L
+#
+# With --rig the overheads measured with that camera are read from the
+# frame catalog and the end time is given with 90% bounds:
+#
+#    pyastroimageview_plan.py autumn.json --rig 'ZWO ASI1600MM Pro'
+#
+import sys
+import json
+import argparse
+import logging
+
+from pyastroimageview.SequencePlan import (load_plan, PlanScheduler,
+                                           SequenceOverheads, estimate_plan,
+                                           format_schedule)
+from pyastroimageview.SequenceEstimator import DurationEstimator, format_prediction
+from pyastroimageview.FrameCatalog import FrameCatalog
+from pyastroimageview.ProgramSettings import ProgramSettings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dry run of a sequence plan')
+    parser.add_argument('plan', help='Plan JSON file')
+    parser.add_argument('--filters', help='Filter names in wheel order '
+                                          '(comma separated)')
+    parser.add_argument('--current-filter', help='Filter in place at start')
+    parser.add_argument('--interleave', choices=['yes', 'no'],
+                        help='Override interleave setting of plan')
+    parser.add_argument('--block-frames', type=int,
+                        help='Override frames per filter per rotation')
+    parser.add_argument('--download', type=float, default=5.0,
+                        help='Download time per frame (s)')
+    parser.add_argument('--dither', type=float, default=15.0,
+                        help='Time per dither including settling (s)')
+    parser.add_argument('--filter-change', type=float, default=5.0,
+                        help='Time per filter change (s)')
+    parser.add_argument('--refocus', type=float, default=120.0,
+                        help='Time per refocus (s)')
+    parser.add_argument('--rig', help='Use overheads measured with this camera')
+    parser.add_argument('--db', help='Frame catalog with measured overheads '
+                                     '(default from settings)')
+    parser.add_argument('--json', action='store_true', help='Output JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)-8s %(message)s')
+
+    plan = load_plan(args.plan)
+    if plan is None:
+        return 1
+
+    if args.interleave is not None:
+        plan.interleave = args.interleave == 'yes'
+    if args.block_frames is not None:
+        plan.block_frames = max(1, args.block_frames)
+
+    filter_names = args.filters.split(',') if args.filters else None
+    steps = PlanScheduler(filter_names, args.current_filter).schedule(plan)
+
+    overheads = SequenceOverheads(download=args.download, dither=args.dither,
+                                  filter_change=args.filter_change,
+                                  refocus=args.refocus)
+
+    catalog = None
+    if args.rig is not None:
+        dbpath = args.db
+        if dbpath is None:
+            settings = ProgramSettings()
+            settings.read()
+            dbpath = settings.get_frame_catalog_path()
+        catalog = FrameCatalog(dbpath)
+
+    estimator = DurationEstimator(catalog, defaults=overheads)
+    estimator.set_rig(args.rig)
+    if catalog is not None:
+        catalog.close()
+
+    estimate = estimate_plan(steps, estimator.overheads())
+    prediction = estimator.predict(estimate)
+
+    if args.json:
+        print(json.dumps({'steps': [str(step) for step in steps],
+                          'estimate': estimate,
+                          'prediction': prediction}, indent=2))
+    else:
+        print(format_schedule(steps, estimate))
+        print(f'90% range {prediction["low_s"]/3600:.2f}-'
+              f'{prediction["high_s"]/3600:.2f} h - '
+              f'{format_prediction(prediction)} if started now')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -80,7 +80,9 @@ setup(
 
     entry_points={},
 
-    scripts=['scripts/pyastroimageview_main.py'],
+    scripts=['scripts/pyastroimageview_main.py',
+             'scripts/pyastroimageview_catalog.py',
+             'scripts/pyastroimageview_plan.py'],
 
     project_urls={  # Optional
 #        'Bug Reports': 'https://github.com/pypa/sampleproject/issues',